@@ -0,0 +1,830 @@
+'''
+Array based directed graph that can replace the `networkx.DiGraph` inside a `hytra.core.hypothesesgraph.HypothesesGraph`.
+
+Nodes are mapped to consecutive integer indices, arcs are stored as arrays of source and target node indices
+with CSR (outgoing) and CSC (incoming) adjacency arrays that are rebuilt lazily, and all node and arc attributes are
+stored column-wise. Energies (`features`, `appearanceFeatures`, ...) live in dense float matrices.
+Instead of one dictionary per node, per arc and per adjacency list, this needs only a few bytes per element.
+
+`CompactDiGraph` provides the subset of the networkx 1.x `DiGraph` API used throughout hytra, e.g.
+`graph.node[n]['traxel']`, `graph.edge[u][v]['features']`, `add_edge`, `out_edges`, `in_degree` or `remove_node`.
+'''
+
+import copy
+import itertools
+import logging
+import numpy as np
+import networkx as nx
+
+
+def getLogger():
+    ''' logger to be used in this module '''
+    return logging.getLogger(__name__)
+
+
+class _Missing(object):
+    ''' marker for attributes that are not set, which stays unique when copying or pickling graphs '''
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
+    def __reduce__(self):
+        return '_missing'
+
+_missing = _Missing()
+
+
+def _grow(array, minSize):
+    ''' return `array` enlarged (by doubling) such that it holds at least `minSize` entries along the first axis '''
+    if len(array) >= minSize:
+        return array
+    newArray = np.zeros((max(minSize, 2 * len(array), 16),) + array.shape[1:], dtype=array.dtype)
+    newArray[:len(array)] = array
+    return newArray
+
+
+class DenseColumn(object):
+    '''
+    Stores one attribute of many elements as rows of a dense float matrix. Values that are not floating point,
+    or do not have the same shape as the first value that was inserted, are kept in a dictionary instead.
+    '''
+
+    def __init__(self):
+        self.shape = None
+        self.values = None
+        self.present = np.zeros(0, dtype=bool)
+        self.others = {}
+
+    def _fits(self, array):
+        return array.dtype == np.float64 and (self.shape is None or array.shape == self.shape)
+
+    def _reserve(self, size):
+        self.present = _grow(self.present, size)
+        self.values = _grow(self.values, size)
+
+    def set(self, index, value):
+        array = np.asarray(value)
+        if not self._fits(array):
+            self.others[index] = value
+            if index < len(self.present):
+                self.present[index] = False
+            return
+        if self.shape is None:
+            self.shape = array.shape
+            self.values = np.zeros((0, int(np.prod(self.shape))), dtype=np.float64)
+        self._reserve(index + 1)
+        self.values[index] = array.ravel()
+        self.present[index] = True
+        self.others.pop(index, None)
+
+    def setRows(self, indices, values):
+        values = np.asarray(values)
+        if len(indices) == 0:
+            return
+        if not self._fits(values[0]):
+            for i, v in zip(indices, values):
+                self.set(i, v)
+            return
+        if self.shape is None:
+            self.shape = values.shape[1:]
+            self.values = np.zeros((0, int(np.prod(self.shape))), dtype=np.float64)
+        indices = np.asarray(indices)
+        self._reserve(indices.max() + 1)
+        self.values[indices] = values.reshape(len(indices), -1)
+        self.present[indices] = True
+        for i in indices.tolist():
+            self.others.pop(i, None)
+
+    def get(self, index):
+        if index < len(self.present) and self.present[index]:
+            return self.values[index].reshape(self.shape).tolist()
+        return self.others.get(index, _missing)
+
+    def getRows(self, indices, default):
+        indices = np.asarray(indices, dtype=np.int64)
+        result = [default] * len(indices)
+        present = np.zeros(len(indices), dtype=bool)
+        inRange = indices < len(self.present)
+        present[inRange] = self.present[indices[inRange]]
+        if np.any(present):
+            rows = self.values[indices[present]].reshape((-1,) + self.shape).tolist()
+            for i, row in itertools.izip(np.where(present)[0].tolist(), rows):
+                result[i] = row
+        if len(self.others) > 0:
+            for i in np.where(~present)[0].tolist():
+                result[i] = self.others.get(indices[i], default)
+        return result
+
+    def delete(self, index):
+        if index < len(self.present):
+            self.present[index] = False
+        self.others.pop(index, None)
+
+
+class ObjectColumn(object):
+    '''
+    Stores one attribute of many elements as python list.
+    '''
+
+    def __init__(self):
+        self.values = []
+
+    def set(self, index, value):
+        if index >= len(self.values):
+            self.values.extend([_missing] * (index + 1 - len(self.values)))
+        self.values[index] = value
+
+    def setRows(self, indices, values):
+        for i, v in zip(indices, values):
+            self.set(i, v)
+
+    def get(self, index):
+        if index < len(self.values):
+            return self.values[index]
+        return _missing
+
+    def getRows(self, indices, default):
+        values = self.values
+        numValues = len(values)
+        result = [values[i] if i < numValues else _missing for i in indices]
+        return [default if v is _missing else v for v in result]
+
+    def delete(self, index):
+        if index < len(self.values):
+            self.values[index] = _missing
+
+
+class AttributeTable(object):
+    '''
+    Column-wise storage of the attributes of all nodes (or arcs) of a graph, addressed by the element's index.
+    The attributes named in `denseAttributes` are stored in `DenseColumn`s, all others in `ObjectColumn`s.
+    '''
+
+    def __init__(self, denseAttributes=()):
+        self._denseAttributes = set(denseAttributes)
+        self._columns = {}
+        self._columnNames = []
+
+    def _getColumn(self, name, create=False):
+        column = self._columns.get(name, None)
+        if column is None and create:
+            column = DenseColumn() if name in self._denseAttributes else ObjectColumn()
+            self._columns[name] = column
+            self._columnNames.append(name)
+        return column
+
+    def get(self, index, name):
+        column = self._getColumn(name)
+        value = _missing if column is None else column.get(index)
+        if value is _missing:
+            raise KeyError(name)
+        return value
+
+    def set(self, index, name, value):
+        self._getColumn(name, create=True).set(index, value)
+
+    def setRows(self, indices, name, values):
+        self._getColumn(name, create=True).setRows(indices, values)
+
+    def getRows(self, indices, name, default):
+        column = self._getColumn(name)
+        if column is None:
+            return [default] * len(indices)
+        return column.getRows(indices, default)
+
+    def delete(self, index, name):
+        if not self.contains(index, name):
+            raise KeyError(name)
+        self._columns[name].delete(index)
+
+    def contains(self, index, name):
+        column = self._getColumn(name)
+        return column is not None and column.get(index) is not _missing
+
+    def names(self, index):
+        return [name for name in self._columnNames if self._columns[name].get(index) is not _missing]
+
+    def clear(self, index):
+        for column in self._columns.values():
+            column.delete(index)
+
+
+class AttributeView(object):
+    '''
+    Dictionary-like access to the attributes of a single node or arc, as `networkx` provides with `graph.node[n]`.
+    '''
+    __slots__ = ['_table', '_index']
+
+    def __init__(self, table, index):
+        self._table = table
+        self._index = index
+
+    def __getitem__(self, name):
+        return self._table.get(self._index, name)
+
+    def __setitem__(self, name, value):
+        self._table.set(self._index, name, value)
+
+    def __delitem__(self, name):
+        self._table.delete(self._index, name)
+
+    def __contains__(self, name):
+        return self._table.contains(self._index, name)
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self.keys())
+
+    def __eq__(self, other):
+        return dict(self.items()) == dict(other.items())
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __repr__(self):
+        return repr(dict(self.items()))
+
+    def get(self, name, default=None):
+        if name in self:
+            return self[name]
+        return default
+
+    def setdefault(self, name, default=None):
+        if name not in self:
+            self[name] = default
+        return self[name]
+
+    def update(self, other=None, **kwargs):
+        if other is not None:
+            for k, v in other.items():
+                self[k] = v
+        for k, v in kwargs.items():
+            self[k] = v
+
+    def keys(self):
+        return self._table.names(self._index)
+
+    def values(self):
+        return [self[k] for k in self.keys()]
+
+    def items(self):
+        return [(k, self[k]) for k in self.keys()]
+
+    def iteritems(self):
+        return iter(self.items())
+
+    def copy(self):
+        return dict(self.items())
+
+
+class NodeView(object):
+    '''
+    Dictionary-like access to the attributes of all nodes, as `networkx` provides with `graph.node`.
+    '''
+
+    def __init__(self, graph):
+        self._graph = graph
+
+    def __getitem__(self, n):
+        return AttributeView(self._graph._nodeAttributes, self._graph._nodeIndices[n])
+
+    def __contains__(self, n):
+        return n in self._graph._nodeIndices
+
+    def __iter__(self):
+        return self._graph.nodes_iter()
+
+    def __len__(self):
+        return self._graph.number_of_nodes()
+
+    def get(self, n, default=None):
+        if n in self:
+            return self[n]
+        return default
+
+    def keys(self):
+        return self._graph.nodes()
+
+    def values(self):
+        return [self[n] for n in self._graph.nodes_iter()]
+
+    def items(self):
+        return list(self.iteritems())
+
+    def iteritems(self):
+        return ((n, self[n]) for n in self._graph.nodes_iter())
+
+
+class AdjacencyView(object):
+    '''
+    Dictionary-like access to the arcs of all nodes, as `networkx` provides with `graph.edge` (or `graph.succ`)
+    and `graph.pred`. Indexing it with a node gives a `NeighborView`.
+    '''
+
+    def __init__(self, graph, outgoing):
+        self._graph = graph
+        self._outgoing = outgoing
+
+    def __getitem__(self, n):
+        return NeighborView(self._graph, self._graph._nodeIndices[n], self._outgoing)
+
+    def __contains__(self, n):
+        return n in self._graph._nodeIndices
+
+    def __iter__(self):
+        return self._graph.nodes_iter()
+
+    def __len__(self):
+        return self._graph.number_of_nodes()
+
+    def keys(self):
+        return self._graph.nodes()
+
+    def items(self):
+        return list(self.iteritems())
+
+    def iteritems(self):
+        return ((n, self[n]) for n in self._graph.nodes_iter())
+
+
+class NeighborView(object):
+    '''
+    Dictionary-like access to the arcs of one node, from neighboring node to the arc's `AttributeView`
+    '''
+
+    def __init__(self, graph, nodeIndex, outgoing):
+        self._graph = graph
+        self._nodeIndex = nodeIndex
+        self._outgoing = outgoing
+
+    def _edgeIndex(self, neighbor):
+        neighborIndex = self._graph._nodeIndices.get(neighbor, None)
+        if neighborIndex is None:
+            return -1
+        if self._outgoing:
+            return self._graph._findEdge(self._nodeIndex, neighborIndex)
+        return self._graph._findEdge(neighborIndex, self._nodeIndex)
+
+    def __getitem__(self, neighbor):
+        edgeIndex = self._edgeIndex(neighbor)
+        if edgeIndex < 0:
+            raise KeyError(neighbor)
+        return AttributeView(self._graph._edgeAttributes, edgeIndex)
+
+    def __contains__(self, neighbor):
+        return self._edgeIndex(neighbor) >= 0
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self._graph._incidentEdges(self._nodeIndex, self._outgoing))
+
+    def keys(self):
+        edges = self._graph._incidentEdges(self._nodeIndex, self._outgoing)
+        neighbors = self._graph._edgeTargets[edges] if self._outgoing else self._graph._edgeSources[edges]
+        return [self._graph._nodeKeys[i] for i in neighbors.tolist()]
+
+    def items(self):
+        return [(n, self[n]) for n in self.keys()]
+
+    def iteritems(self):
+        return iter(self.items())
+
+
+class CompactDiGraph(object):
+    '''
+    Directed graph with array based storage and the `networkx.DiGraph` (1.x) interface used by hytra.
+
+    Nodes are kept in the order they were inserted, and so are arcs when iterating over all of them.
+    Looking up an arc, or the arcs of a node, uses sorted and CSR/CSC-ordered arrays of all arcs
+    that are rebuilt once enough arcs have been added since the last time.
+    '''
+
+    denseNodeAttributes = ['features', 'appearanceFeatures', 'disappearanceFeatures', 'divisionFeatures']
+    denseEdgeAttributes = ['features']
+
+    def __init__(self):
+        self._nodeIndices = {}
+        self._nodeKeys = []
+        self._nodeAttributes = AttributeTable(self.denseNodeAttributes)
+        self._inDegrees = np.zeros(0, dtype=np.int64)
+        self._outDegrees = np.zeros(0, dtype=np.int64)
+
+        self._numEdgeSlots = 0
+        self._numEdges = 0
+        self._edgeSources = np.zeros(0, dtype=np.int64)
+        self._edgeTargets = np.zeros(0, dtype=np.int64)
+        self._edgeAlive = np.zeros(0, dtype=bool)
+        self._edgeAttributes = AttributeTable(self.denseEdgeAttributes)
+
+        # index over the first `_numIndexedEdges` arcs: sorted (source, target) keys, CSR and CSC
+        self._numIndexedEdges = 0
+        self._sortedEdgeKeys = np.zeros(0, dtype=np.int64)
+        self._sortedEdgeIndices = np.zeros(0, dtype=np.int64)
+        self._outPointers = np.zeros(1, dtype=np.int64)
+        self._outEdges = np.zeros(0, dtype=np.int64)
+        self._inPointers = np.zeros(1, dtype=np.int64)
+        self._inEdges = np.zeros(0, dtype=np.int64)
+        # arcs added after the index was built
+        self._pendingEdges = {}
+        self._pendingOutEdges = {}
+        self._pendingInEdges = {}
+
+    # ----------------------------------------------------------------------------------------
+    # networkx-like views
+
+    @property
+    def node(self):
+        return NodeView(self)
+
+    @property
+    def edge(self):
+        return AdjacencyView(self, outgoing=True)
+
+    @property
+    def adj(self):
+        return AdjacencyView(self, outgoing=True)
+
+    @property
+    def succ(self):
+        return AdjacencyView(self, outgoing=True)
+
+    @property
+    def pred(self):
+        return AdjacencyView(self, outgoing=False)
+
+    # ----------------------------------------------------------------------------------------
+    # internal helpers
+
+    @staticmethod
+    def _edgeKey(sourceIndex, targetIndex):
+        return (int(sourceIndex) << 32) + int(targetIndex)
+
+    @staticmethod
+    def _edgeKeys(sourceIndices, targetIndices):
+        return (np.asarray(sourceIndices, dtype=np.int64) << 32) + targetIndices
+
+    def _addNodeIndex(self, n):
+        index = self._nodeIndices.get(n, None)
+        if index is None:
+            index = len(self._nodeKeys)
+            self._nodeIndices[n] = index
+            self._nodeKeys.append(n)
+            self._inDegrees = _grow(self._inDegrees, index + 1)
+            self._outDegrees = _grow(self._outDegrees, index + 1)
+        return index
+
+    def _getNodeIndex(self, n):
+        try:
+            return self._nodeIndices[n]
+        except KeyError:
+            raise nx.NetworkXError("The node {} is not in the graph.".format(n))
+
+    def _findEdge(self, sourceIndex, targetIndex):
+        ''' **returns** the index of the arc between the two nodes, or -1 if it does not exist '''
+        key = self._edgeKey(sourceIndex, targetIndex)
+        edgeIndex = self._pendingEdges.get(key, None)
+        if edgeIndex is not None:
+            return edgeIndex
+        position = np.searchsorted(self._sortedEdgeKeys, key)
+        if position < len(self._sortedEdgeKeys) and self._sortedEdgeKeys[position] == key:
+            edgeIndex = self._sortedEdgeIndices[position]
+            if self._edgeAlive[edgeIndex]:
+                return int(edgeIndex)
+        return -1
+
+    def _findEdges(self, sourceIndices, targetIndices):
+        ''' vectorized version of `_findEdge` '''
+        keys = self._edgeKeys(sourceIndices, targetIndices)
+        result = -np.ones(len(keys), dtype=np.int64)
+        if len(self._sortedEdgeKeys) > 0:
+            positions = np.minimum(np.searchsorted(self._sortedEdgeKeys, keys), len(self._sortedEdgeKeys) - 1)
+            edgeIndices = self._sortedEdgeIndices[positions]
+            found = np.logical_and(self._sortedEdgeKeys[positions] == keys, self._edgeAlive[edgeIndices])
+            result[found] = edgeIndices[found]
+        if len(self._pendingEdges) > 0:
+            pending = np.array([self._pendingEdges.get(k, -1) for k in keys.tolist()], dtype=np.int64)
+            result = np.where(pending >= 0, pending, result)
+        return result
+
+    def _rebuildIndex(self):
+        ''' sort all arcs for lookup and build the CSR and CSC adjacency arrays '''
+        numNodes = len(self._nodeKeys)
+        edges = np.where(self._edgeAlive[:self._numEdgeSlots])[0]
+        sources = self._edgeSources[edges]
+        targets = self._edgeTargets[edges]
+
+        keys = self._edgeKeys(sources, targets)
+        order = np.argsort(keys, kind='mergesort')
+        self._sortedEdgeKeys = keys[order]
+        self._sortedEdgeIndices = edges[order]
+
+        order = np.argsort(sources, kind='mergesort')
+        self._outEdges = edges[order]
+        self._outPointers = np.concatenate([[0], np.cumsum(np.bincount(sources, minlength=numNodes))])
+        order = np.argsort(targets, kind='mergesort')
+        self._inEdges = edges[order]
+        self._inPointers = np.concatenate([[0], np.cumsum(np.bincount(targets, minlength=numNodes))])
+
+        self._numIndexedEdges = self._numEdgeSlots
+        self._pendingEdges = {}
+        self._pendingOutEdges = {}
+        self._pendingInEdges = {}
+
+    def _maybeRebuildIndex(self):
+        if len(self._pendingEdges) > max(1024, self._numIndexedEdges // 4):
+            self._rebuildIndex()
+
+    def _incidentEdges(self, nodeIndex, outgoing):
+        ''' **returns** an array of the indices of all arcs leaving (or entering) the given node '''
+        pointers, indexedEdges, pendingEdges = (self._outPointers, self._outEdges, self._pendingOutEdges) if outgoing \
+            else (self._inPointers, self._inEdges, self._pendingInEdges)
+        if nodeIndex + 1 < len(pointers):
+            edges = indexedEdges[pointers[nodeIndex]:pointers[nodeIndex + 1]]
+            edges = edges[self._edgeAlive[edges]]
+        else:
+            edges = np.zeros(0, dtype=np.int64)
+        if nodeIndex in pendingEdges:
+            pending = np.array(pendingEdges[nodeIndex], dtype=np.int64)
+            edges = np.concatenate([edges, pending[self._edgeAlive[pending]]])
+        return edges
+
+    def _nodesOf(self, nbunch):
+        if nbunch is None:
+            return self.nodes_iter()
+        if nbunch in self:
+            return [nbunch]
+        return [n for n in nbunch if n in self._nodeIndices]
+
+    # ----------------------------------------------------------------------------------------
+    # nodes
+
+    def add_node(self, n, attr_dict=None, **attr):
+        index = self._addNodeIndex(n)
+        if attr_dict is not None:
+            attr = dict(attr_dict, **attr)
+        for k, v in attr.iteritems():
+            self._nodeAttributes.set(index, k, v)
+
+    def add_nodes_from(self, nodes, **attr):
+        for n in nodes:
+            if isinstance(n, tuple) and len(n) == 2 and isinstance(n[1], dict):
+                newAttr = dict(attr)
+                newAttr.update(n[1])
+                self.add_node(n[0], **newAttr)
+            else:
+                self.add_node(n, **attr)
+
+    def remove_node(self, n):
+        index = self._getNodeIndex(n)
+        for e in np.concatenate([self._incidentEdges(index, True), self._incidentEdges(index, False)]).tolist():
+            if self._edgeAlive[e]:
+                self._removeEdgeIndex(e)
+        self._nodeAttributes.clear(index)
+        del self._nodeIndices[n]
+        self._nodeKeys[index] = _missing
+
+    def has_node(self, n):
+        return n in self._nodeIndices
+
+    def __contains__(self, n):
+        try:
+            return n in self._nodeIndices
+        except TypeError:
+            return False
+
+    def __iter__(self):
+        return self.nodes_iter()
+
+    def __len__(self):
+        return len(self._nodeIndices)
+
+    def number_of_nodes(self):
+        return len(self._nodeIndices)
+
+    def nodes_iter(self, data=False):
+        if data:
+            return ((n, AttributeView(self._nodeAttributes, i)) for i, n in enumerate(self._nodeKeys) if n is not _missing)
+        return (n for n in self._nodeKeys if n is not _missing)
+
+    def nodes(self, data=False):
+        return list(self.nodes_iter(data))
+
+    # ----------------------------------------------------------------------------------------
+    # arcs
+
+    def add_edge(self, u, v, attr_dict=None, **attr):
+        sourceIndex = self._addNodeIndex(u)
+        targetIndex = self._addNodeIndex(v)
+        edgeIndex = self._findEdge(sourceIndex, targetIndex)
+        if edgeIndex < 0:
+            edgeIndex = self._numEdgeSlots
+            self._numEdgeSlots += 1
+            self._numEdges += 1
+            self._edgeSources = _grow(self._edgeSources, self._numEdgeSlots)
+            self._edgeTargets = _grow(self._edgeTargets, self._numEdgeSlots)
+            self._edgeAlive = _grow(self._edgeAlive, self._numEdgeSlots)
+            self._edgeSources[edgeIndex] = sourceIndex
+            self._edgeTargets[edgeIndex] = targetIndex
+            self._edgeAlive[edgeIndex] = True
+            self._outDegrees[sourceIndex] += 1
+            self._inDegrees[targetIndex] += 1
+            self._pendingEdges[self._edgeKey(sourceIndex, targetIndex)] = edgeIndex
+            self._pendingOutEdges.setdefault(sourceIndex, []).append(edgeIndex)
+            self._pendingInEdges.setdefault(targetIndex, []).append(edgeIndex)
+        if attr_dict is not None:
+            attr = dict(attr_dict, **attr)
+        for k, val in attr.iteritems():
+            self._edgeAttributes.set(edgeIndex, k, val)
+        self._maybeRebuildIndex()
+
+    def add_edges_from(self, ebunch, attr_dict=None, **attr):
+        if attr_dict is not None:
+            attr = dict(attr_dict, **attr)
+        ebunch = list(ebunch)
+        if len(ebunch) == 0:
+            return
+        sources = np.array([self._addNodeIndex(e[0]) for e in ebunch], dtype=np.int64)
+        targets = np.array([self._addNodeIndex(e[1]) for e in ebunch], dtype=np.int64)
+
+        # arcs that are new, where duplicates within ebunch get the same new arc in order of first appearance
+        edgeIndices = self._findEdges(sources, targets)
+        new = np.where(edgeIndices < 0)[0]
+        if len(new) > 0:
+            _, first, inverse = np.unique(self._edgeKeys(sources[new], targets[new]), return_index=True, return_inverse=True)
+            rankOfFirst = np.empty(len(first), dtype=np.int64)
+            rankOfFirst[np.argsort(first, kind='mergesort')] = np.arange(len(first))
+            edgeIndices[new] = self._numEdgeSlots + rankOfFirst[inverse]
+            newEdges = new[np.sort(first)]
+
+            start = self._numEdgeSlots
+            self._numEdgeSlots += len(newEdges)
+            self._numEdges += len(newEdges)
+            self._edgeSources = _grow(self._edgeSources, self._numEdgeSlots)
+            self._edgeTargets = _grow(self._edgeTargets, self._numEdgeSlots)
+            self._edgeAlive = _grow(self._edgeAlive, self._numEdgeSlots)
+            self._edgeSources[start:self._numEdgeSlots] = sources[newEdges]
+            self._edgeTargets[start:self._numEdgeSlots] = targets[newEdges]
+            self._edgeAlive[start:self._numEdgeSlots] = True
+            np.add.at(self._outDegrees, sources[newEdges], 1)
+            np.add.at(self._inDegrees, targets[newEdges], 1)
+
+            if len(self._pendingEdges) + len(newEdges) > max(1024, self._numIndexedEdges // 4):
+                self._rebuildIndex()
+            else:
+                for e, s, t in zip(range(start, self._numEdgeSlots), sources[newEdges].tolist(), targets[newEdges].tolist()):
+                    self._pendingEdges[self._edgeKey(s, t)] = e
+                    self._pendingOutEdges.setdefault(s, []).append(e)
+                    self._pendingInEdges.setdefault(t, []).append(e)
+
+        # attributes, where later entries of ebunch override earlier ones
+        edgeIndices = edgeIndices.tolist()
+        attributes = {}
+        for i, e in enumerate(ebunch):
+            if len(e) == 3:
+                for k, v in e[2].iteritems():
+                    attributes.setdefault(k, ([], []))
+                    attributes[k][0].append(edgeIndices[i])
+                    attributes[k][1].append(v)
+        for k, v in attr.iteritems():
+            self._edgeAttributes.setRows(edgeIndices, k, [v] * len(edgeIndices))
+        for k, (indices, values) in attributes.iteritems():
+            for i, v in zip(indices, values):
+                self._edgeAttributes.set(i, k, v)
+
+    def add_path(self, nodes, **attr):
+        nodes = list(nodes)
+        self.add_edges_from(zip(nodes[:-1], nodes[1:]), **attr)
+
+    def _removeEdgeIndex(self, edgeIndex):
+        sourceIndex = self._edgeSources[edgeIndex]
+        targetIndex = self._edgeTargets[edgeIndex]
+        self._edgeAlive[edgeIndex] = False
+        self._numEdges -= 1
+        self._outDegrees[sourceIndex] -= 1
+        self._inDegrees[targetIndex] -= 1
+        self._pendingEdges.pop(self._edgeKey(sourceIndex, targetIndex), None)
+        self._edgeAttributes.clear(edgeIndex)
+
+    def remove_edge(self, u, v):
+        edgeIndex = -1
+        if u in self._nodeIndices and v in self._nodeIndices:
+            edgeIndex = self._findEdge(self._nodeIndices[u], self._nodeIndices[v])
+        if edgeIndex < 0:
+            raise nx.NetworkXError("The edge {}-{} is not in the graph".format(u, v))
+        self._removeEdgeIndex(edgeIndex)
+
+    def has_edge(self, u, v):
+        if u not in self._nodeIndices or v not in self._nodeIndices:
+            return False
+        return self._findEdge(self._nodeIndices[u], self._nodeIndices[v]) >= 0
+
+    def number_of_edges(self, u=None, v=None):
+        if u is None:
+            return self._numEdges
+        return int(self.has_edge(u, v))
+
+    def _edgeTuples(self, edges, data):
+        keys = self._nodeKeys
+        if data:
+            return [(keys[s], keys[t], AttributeView(self._edgeAttributes, e)) for s, t, e in
+                    zip(self._edgeSources[edges].tolist(), self._edgeTargets[edges].tolist(), edges.tolist())]
+        return [(keys[s], keys[t]) for s, t in zip(self._edgeSources[edges].tolist(), self._edgeTargets[edges].tolist())]
+
+    def edges_iter(self, nbunch=None, data=False):
+        if nbunch is None:
+            edges = np.where(self._edgeAlive[:self._numEdgeSlots])[0]
+            return iter(self._edgeTuples(edges, data))
+        return self.out_edges_iter(nbunch, data)
+
+    def edges(self, nbunch=None, data=False):
+        return list(self.edges_iter(nbunch, data))
+
+    def out_edges_iter(self, nbunch=None, data=False):
+        if nbunch is None:
+            return self.edges_iter(data=data)
+        return iter([e for n in self._nodesOf(nbunch)
+                     for e in self._edgeTuples(self._incidentEdges(self._nodeIndices[n], True), data)])
+
+    def in_edges_iter(self, nbunch=None, data=False):
+        if nbunch is None:
+            return self.edges_iter(data=data)
+        return iter([e for n in self._nodesOf(nbunch)
+                     for e in self._edgeTuples(self._incidentEdges(self._nodeIndices[n], False), data)])
+
+    def out_edges(self, nbunch=None, data=False):
+        return list(self.out_edges_iter(nbunch, data))
+
+    def in_edges(self, nbunch=None, data=False):
+        return list(self.in_edges_iter(nbunch, data))
+
+    def successors(self, n):
+        return self.edge[n].keys()
+
+    def predecessors(self, n):
+        return self.pred[n].keys()
+
+    def successors_iter(self, n):
+        return iter(self.successors(n))
+
+    def predecessors_iter(self, n):
+        return iter(self.predecessors(n))
+
+    def out_degree(self, nbunch=None):
+        if nbunch in self:
+            return int(self._outDegrees[self._nodeIndices[nbunch]])
+        return dict((n, int(self._outDegrees[self._nodeIndices[n]])) for n in self._nodesOf(nbunch))
+
+    def in_degree(self, nbunch=None):
+        if nbunch in self:
+            return int(self._inDegrees[self._nodeIndices[nbunch]])
+        return dict((n, int(self._inDegrees[self._nodeIndices[n]])) for n in self._nodesOf(nbunch))
+
+    def degree(self, nbunch=None):
+        if nbunch in self:
+            return self.in_degree(nbunch) + self.out_degree(nbunch)
+        return dict((n, self.in_degree(n) + self.out_degree(n)) for n in self._nodesOf(nbunch))
+
+    def copy(self):
+        return copy.deepcopy(self)
+
+    # ----------------------------------------------------------------------------------------
+    # bulk access, not part of the networkx API
+
+    def setNodeAttributes(self, nodes, name, values):
+        '''
+        Set the attribute `name` of all given `nodes` at once. If the attribute is stored densely,
+        `values` can be a numpy array with one row per node.
+        '''
+        self._nodeAttributes.setRows([self._nodeIndices[n] for n in nodes], name, values)
+
+    def setEdgeAttributes(self, edges, name, values):
+        '''
+        Set the attribute `name` of all given `edges` (list of (source, target) tuples) at once. If the attribute is stored densely,
+        `values` can be a numpy array with one row per arc.
+        '''
+        self._edgeAttributes.setRows(self._getEdgeIndices(edges), name, values)
+
+    def getNodeAttributes(self, nodes, name, default=None):
+        '''
+        **returns** a list with the attribute `name` of all given `nodes`, or `default` for nodes that do not have it
+        '''
+        return self._nodeAttributes.getRows([self._nodeIndices[n] for n in nodes], name, default)
+
+    def getEdgeAttributes(self, edges, name, default=None):
+        '''
+        **returns** a list with the attribute `name` of all given `edges` (list of (source, target) tuples),
+        or `default` for arcs that do not have it
+        '''
+        return self._edgeAttributes.getRows(self._getEdgeIndices(edges), name, default)
+
+    def _getEdgeIndices(self, edges):
+        indices = self._findEdges([self._nodeIndices[u] for u, _ in edges], [self._nodeIndices[v] for _, v in edges])
+        if np.any(indices < 0):
+            raise KeyError("Not all edges are in the graph")
+        return indices
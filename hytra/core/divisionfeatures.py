@@ -1,5 +1,7 @@
 import numpy as np
 import math
+import scipy.ndimage
+from sklearn.neighbors import KDTree
 
 def dotproduct(v1, v2):
     return sum((a*b) for a, b in zip(v1, v2))
@@ -21,6 +23,35 @@ def angle(v1, v2):
     return (radians*180)/math.pi
 
 
+def dotproductBatch(v1, v2):
+    ''' row-wise version of `dotproduct`, summing up the products in the same order '''
+    result = v1[:, 0] * v2[:, 0]
+    for i in range(1, v1.shape[1]):
+        result = result + v1[:, i] * v2[:, i]
+    return result
+
+
+def angleBatch(v1, v2):
+    ''' row-wise version of `angle` for two arrays of vectors '''
+    lengths = np.sqrt(dotproductBatch(v1, v1)) * np.sqrt(dotproductBatch(v2, v2))
+    radians = np.zeros(len(v1))
+    valid = lengths != 0
+    with np.errstate(invalid='ignore'):
+        radians[valid] = np.arccos(dotproductBatch(v1[valid], v2[valid]) / lengths[valid])
+    # math.acos raises an exception outside of [-1, 1], where angle() falls back to 0
+    radians[np.isnan(radians)] = 0
+    return (radians*180)/math.pi
+
+
+def roundHalfAwayFromZero(values):
+    ''' rounds like python's builtin `round`, as opposed to `np.round` which rounds half to even '''
+    values = np.asarray(values, dtype=np.float64)
+    absValues = np.abs(values)
+    rounded = np.floor(absValues)
+    rounded += (absValues - rounded) >= 0.5
+    return np.copysign(rounded, values)
+
+
 
 ##### Feature base class #######
 
@@ -42,6 +73,21 @@ class Feature( object ):
     def compute(self, feats_cur, feats_next, **kwargs):
         raise NotImplementedError('Feature not fully implemented yet.')
 
+    def computeBatch(self, feats_cur, feats_next, num_next):
+        '''
+        Compute the feature for many objects at once.
+
+        **Parameters:**
+
+        * `feats_cur`: array of shape (numObjects, featDim) with the feature of the objects in the current frame
+        * `feats_next`: array of shape (numObjects, n_best, featDim) with the feature of the closest objects in the next frame,
+          where only the first `num_next[i]` entries of row `i` are valid
+        * `num_next`: number of valid next objects per object
+
+        **returns** an array of shape (numObjects, dim()) with the same values as calling `compute` for every object
+        '''
+        raise NotImplementedError('Feature not fully implemented yet.')
+
     def getName(self):
         return self.name
 
@@ -65,6 +111,13 @@ class ParentChildrenRatio( Feature ):
                 result[i] = self.default_value
         return result
 
+    def computeBatch(self, feats_cur, feats_next, num_next):
+        with np.errstate(divide='ignore', invalid='ignore'):
+            result = (feats_cur / (feats_next[:, 0] + feats_next[:, 1])).astype(np.float64)
+        result[np.isnan(result)] = self.default_value
+        result[num_next < 2] = self.default_value
+        return result
+
     def dim(self):
         return self.dimensionality * self.feat_dim
 
@@ -83,6 +136,14 @@ class ChildrenRatio( Feature ):
                 ratio[i] = 1./ratio[i]
         return ratio
 
+    def computeBatch(self, feats_cur, feats_next, num_next):
+        with np.errstate(divide='ignore', invalid='ignore'):
+            ratio = feats_next[:, 0] / feats_next[:, 1]
+            ratio[np.isnan(ratio)] = self.default_value
+            ratio = np.where(ratio > 1, 1. / ratio, ratio).astype(np.float64)
+        ratio[num_next < 2] = self.default_value
+        return ratio
+
     def dim(self):
         return self.dimensionality * self.feat_dim
 
@@ -117,6 +178,19 @@ class ParentChildrenAngle( Feature ):
 
         return max(angles)
 
+    def computeBatch(self, feats_cur, feats_next, num_next):
+        result = np.ones(len(feats_cur)) * self.default_value
+        maxAngles = np.ones(len(feats_cur)) * -np.inf
+        scales = np.array(self.scales[0:feats_cur.shape[1]])
+        for idx in range(feats_next.shape[1]):
+            v1 = (feats_next[:, idx] - feats_cur) * scales
+            for idx2 in range(idx + 1, feats_next.shape[1]):
+                v2 = (feats_next[:, idx2] - feats_cur) * scales
+                valid = num_next > idx2
+                maxAngles[valid] = np.maximum(maxAngles[valid], angleBatch(v1[valid], v2[valid]))
+        result[num_next >= 2] = maxAngles[num_next >= 2]
+        return result.reshape(-1, 1)
+
 
 
 
@@ -126,6 +200,9 @@ class ParentIdentity( Feature ):
     def compute(self, feats_cur, feats_next, **kwargs):
         return feats_cur
 
+    def computeBatch(self, feats_cur, feats_next, num_next):
+        return feats_cur
+
 
 class FeatureManager( object ):
     
@@ -138,7 +215,7 @@ class FeatureManager( object ):
                    
     def __init__(self, scales = [1.0, 1.0, 1.0], n_best = 3, com_name_cur='RegionCenter',
                     com_name_next = 'RegionCenter', size_name='Count', delim='_', template_size=50, ndim=2,
-                    size_filter = 4, squared_distance_default = 9999):
+                    size_filter = 4, squared_distance_default = 9999, vectorized=True):
         self.scales = scales[0:ndim]
         self.n_best = n_best
         self.com_name_cur = com_name_cur
@@ -149,6 +226,7 @@ class FeatureManager( object ):
         self.ndim = ndim
         self.size_filter = size_filter
         self.squared_distance_default = squared_distance_default
+        self.vectorized = vectorized
 
     def _getBestSquaredDistances(self, com_cur, coms_next, size_filter = None, sizes_next = [], default_value = 9999):
         ''' returns the squared distances to the objects in the neighborhood of com_curr, optionally with size filter '''
@@ -172,15 +250,13 @@ class FeatureManager( object ):
         return result
  
 
-    def computeFeatures_at(self, feats_cur, feats_next, img_next, feat_names, label_image_filename=None):
+    def _initializeResult(self, feats_cur, feat_names):
         '''
-        **Parameters:**
-    
-        * if `label_image_filename` is given, it is used to filter the objects from the feature dictionaries 
-          that belong to that label image only (in the JST setting) 
-        ''' 
+        Set up the feature classes for the requested `feat_names` and a result dictionary filled with default values.
 
-#        n_labels = feats_cur.values()[0].shape[0]
+        **returns** a tuple of the result dictionary, the feature classes by name, and the set of
+        region feature names that are needed from the next frame
+        '''
         result = {}
         
         # find available features
@@ -210,6 +286,28 @@ class FeatureManager( object ):
             name = 'SquaredDistances_' + str(idx)
             result[name] = np.ones((feats_cur.values()[0].shape[0], 1)) * self.squared_distance_default
 
+        return result, feat_classes, vigra_feat_names
+
+    def computeFeatures_at(self, feats_cur, feats_next, img_next, feat_names, label_image_filename=None):
+        '''
+        Compute the division features of all objects in `feats_cur`, considering those objects of the next frame
+        that have pixels in a window of `template_size` around the object's center.
+
+        **Parameters:**
+    
+        * if `label_image_filename` is given, it is used to filter the objects from the feature dictionaries 
+          that belong to that label image only (in the JST setting) 
+        '''
+        if self.vectorized:
+            return self._computeFeaturesVectorized_at(feats_cur, feats_next, img_next, feat_names, label_image_filename)
+        return self._computeFeaturesPerObject_at(feats_cur, feats_next, img_next, feat_names, label_image_filename)
+
+    def _computeFeaturesPerObject_at(self, feats_cur, feats_next, img_next, feat_names, label_image_filename=None):
+        '''
+        Reference implementation of `computeFeatures_at` that looks at the neighborhood of every object separately
+        '''
+        result, feat_classes, vigra_feat_names = self._initializeResult(feats_cur, feat_names)
+
         # construct mapping which we only need if label_image_filename was given and the features 'filename' and 'id' exist
         if label_image_filename is not None and 'filename' in feats_next and 'id' in feats_next: 
             global_indices_current_label_image_only = [l for l, f in enumerate(feats_next['filename']) if f == label_image_filename] 
@@ -285,6 +383,165 @@ class FeatureManager( object ):
 
         return result
 
+    def _findNeighborCandidates(self, coms_cur, feats_next, img_next, label_image_filename=None):
+        '''
+        Find all pairs of an object at `coms_cur` and an object of the next frame that has at least one pixel
+        in the `template_size` window around the rounded center of the current object. This is the same
+        neighborhood `_computeFeaturesPerObject_at` cuts out of `img_next`, but it is computed for all objects at once
+        from the bounding boxes of the next frame's objects and a KD-tree query.
+
+        **returns** three arrays describing all pairs, sorted by current object and label in `img_next`:
+        the index into `coms_cur`, the index of the next object in `feats_next`, and whether the next object passes the size filter
+        '''
+        empty = (np.zeros(0, dtype=int), np.zeros(0, dtype=int), np.zeros(0, dtype=bool))
+        if feats_next is None or img_next is None or len(coms_cur) == 0:
+            return empty
+
+        num_dims = coms_cur.shape[1]
+        bounding_boxes = scipy.ndimage.find_objects(img_next)
+        labels = np.array([l + 1 for l, s in enumerate(bounding_boxes) if s is not None], dtype=int)
+        if len(labels) == 0:
+            return empty
+        lower = np.array([[s.start for s in bounding_boxes[l - 1][:num_dims]] for l in labels])
+        upper = np.array([[s.stop for s in bounding_boxes[l - 1][:num_dims]] for l in labels])
+
+        # if 'id' in features, map the labels first -- because labels refer to image object ids, 
+        # whereas the features are the union of objects from several segmentations
+        if 'id' in feats_next:
+            local_to_global_index_map = dict([(feats_next['id'][l], l) for l, f in enumerate(feats_next['filename']) if f == label_image_filename])
+            indices = np.array([local_to_global_index_map[l] for l in labels], dtype=int)
+        else:
+            indices = labels
+        sizes = np.asarray(feats_next[self.size_name]).reshape(len(feats_next[self.size_name]), -1)[indices, 0]
+        if self.size_filter is None:
+            passes_size_filter = np.zeros(len(labels), dtype=bool)
+        else:
+            passes_size_filter = sizes >= self.size_filter
+
+        # windows around the rounded centers, clipped like slicing the label image would do
+        shape = np.array(img_next.shape[:num_dims])
+        centers = roundHalfAwayFromZero(coms_cur)
+        start = np.trunc(np.maximum(centers - self.template_size/2, 0))
+        stop = np.trunc(np.minimum(centers + self.template_size/2, shape))
+        stop = np.where(stop < 0, np.maximum(stop + shape, 0), stop)
+        start = np.minimum(start, shape)
+
+        # candidates are all bounding boxes that intersect the window
+        box_half_sizes = (upper - lower) / 2.0
+        window_half_sizes = np.maximum(stop - start, 0) / 2.0
+        tree = KDTree((upper + lower) / 2.0, metric='chebyshev')
+        neighbors = tree.query_radius((stop + start) / 2.0, r=box_half_sizes.max() + window_half_sizes.max())
+        pair_cur = np.repeat(np.arange(len(coms_cur)), [len(n) for n in neighbors])
+        pair_next = np.concatenate(neighbors).astype(int)
+        intersects = np.all(np.logical_and(lower[pair_next] < stop[pair_cur], upper[pair_next] > start[pair_cur]), axis=1)
+        pair_cur = pair_cur[intersects]
+        pair_next = pair_next[intersects]
+
+        # objects that are not entirely inside the window need a look at their pixels
+        partial = np.where(np.any(np.logical_or(lower[pair_next] < start[pair_cur], upper[pair_next] > stop[pair_cur]), axis=1))[0]
+        has_pixels_in_window = np.ones(len(pair_cur), dtype=bool)
+        for i in partial:
+            c, n = pair_cur[i], pair_next[i]
+            roi = [slice(int(max(lower[n, d], start[c, d])), int(min(upper[n, d], stop[c, d]))) for d in range(num_dims)]
+            has_pixels_in_window[i] = np.any(img_next[tuple(roi)] == labels[n])
+        pair_cur = pair_cur[has_pixels_in_window]
+        pair_next = pair_next[has_pixels_in_window]
+
+        order = np.lexsort((labels[pair_next], pair_cur))
+        pair_cur = pair_cur[order]
+        pair_next = pair_next[order]
+        return pair_cur, indices[pair_next], passes_size_filter[pair_next]
+
+    def _computeFeaturesVectorized_at(self, feats_cur, feats_next, img_next, feat_names, label_image_filename=None):
+        '''
+        Vectorized implementation of `computeFeatures_at` that processes all objects of the frame with array operations
+        '''
+        result, feat_classes, vigra_feat_names = self._initializeResult(feats_cur, feat_names)
+
+        coms_cur = np.asarray(feats_cur[self.com_name_cur])
+        coms_cur = coms_cur.reshape(len(coms_cur), -1)
+        objects = np.arange(1, len(coms_cur))
+        if label_image_filename is not None and 'filename' in feats_cur:
+            # in the JST context, only look at objects from a given segmentation hypotheses set
+            objects = objects[np.array([feats_cur['filename'][o] == label_image_filename for o in objects], dtype=bool)]
+
+        pair_cur, pair_next, passes_size_filter = self._findNeighborCandidates(coms_cur[objects], feats_next, img_next, label_image_filename)
+
+        if len(pair_cur) > 0:
+            coms_next = np.asarray(feats_next[self.com_name_next])
+            coms_next = coms_next.reshape(len(coms_next), -1)
+            differences = coms_next[pair_next] - coms_cur[objects][pair_cur] * np.array(self.scales)
+            distances = np.sqrt(dotproductBatch(differences, differences))
+            # the nearest objects are found by a stable sort of the candidates in the order
+            # in which _computeFeaturesPerObject_at iterates over them
+            candidate_order = np.arange(len(pair_cur))
+            candidate_order = self._resolveDistanceTies(pair_cur, pair_next, passes_size_filter, distances, candidate_order)
+            candidates = np.where(passes_size_filter)[0]
+            candidates = candidates[np.lexsort((candidate_order[candidates], distances[candidates], pair_cur[candidates]))]
+        else:
+            distances = np.zeros(0)
+            candidates = np.zeros(0, dtype=int)
+
+        # rank of every candidate within its object, to select the n best
+        num_candidates = np.bincount(pair_cur[candidates], minlength=len(objects))
+        first_candidate = np.cumsum(num_candidates) - num_candidates
+        rank = np.arange(len(candidates)) - first_candidate[pair_cur[candidates]]
+        best = rank < self.n_best
+        best_next = -np.ones((len(objects), self.n_best), dtype=int)
+        best_next[pair_cur[candidates[best]], rank[best]] = pair_next[candidates[best]]
+        best_distances = np.ones((len(objects), self.n_best), dtype=np.float32) * np.float32(self.squared_distance_default)
+        best_distances[pair_cur[candidates[best]], rank[best]] = distances[candidates[best]]
+        num_next = np.minimum(num_candidates, self.n_best)
+
+        # first add squared distances
+        for idx in range(self.n_best):
+            name = 'SquaredDistances_' + str(idx)
+            result[name][objects, 0] = best_distances[:, idx]
+
+        # add all other features
+        for name, feat_class in feat_classes.items():
+            f_cur = np.asarray(feats_cur[feat_class.feats_name])
+            f_cur = f_cur.reshape(len(f_cur), -1)[objects]
+            if feats_next is not None and len(objects) > 0:
+                f_next = np.asarray(feats_next[feat_class.feats_name])
+                f_next = f_next.reshape(len(f_next), -1)[np.maximum(best_next, 0)]
+            else:
+                f_next = np.zeros((len(objects), self.n_best, f_cur.shape[1]), dtype=f_cur.dtype)
+            result[name][objects] = feat_class.computeBatch(f_cur, f_next, num_next)
+
+        # return only valid labels
+        valid_indices = np.concatenate([[0], objects]).astype(int)
+        for feature_name in result:
+            result[feature_name] = result[feature_name][valid_indices]
+
+        return result
+
+    def _resolveDistanceTies(self, pair_cur, pair_next, passes_size_filter, distances, candidate_order):
+        '''
+        `_computeFeaturesPerObject_at` visits the neighbors of an object in the iteration order of a python dictionary,
+        which decides between neighbors at exactly the same distance. Reproduce that order for the few objects
+        where such a tie affects the selection of the n best neighbors.
+        '''
+        candidates = np.where(passes_size_filter)[0]
+        candidates = candidates[np.lexsort((distances[candidates], pair_cur[candidates]))]
+        same_distance = np.logical_and(pair_cur[candidates][1:] == pair_cur[candidates][:-1],
+                                       distances[candidates][1:] == distances[candidates][:-1])
+        if not np.any(same_distance):
+            return candidate_order
+
+        num_candidates = np.bincount(pair_cur[candidates], minlength=pair_cur.max() + 1)
+        first_candidate = np.cumsum(num_candidates) - num_candidates
+        rank = np.arange(len(candidates)) - first_candidate[pair_cur[candidates]]
+        tied_objects = np.unique(pair_cur[candidates][1:][np.logical_and(same_distance, rank[:-1] < self.n_best)])
+
+        candidate_order = candidate_order.copy()
+        for o in tied_objects:
+            pairs = np.where(pair_cur == o)[0]
+            dict_order = dict.fromkeys(pair_next[pairs].tolist()).keys()
+            position = dict((n, i) for i, n in enumerate(dict_order))
+            candidate_order[pairs] = [position[n] for n in pair_next[pairs].tolist()]
+        return candidate_order
+
 if __name__ == '__main__':
     import vigra
     import numpy as np
@@ -13,6 +13,14 @@ class FieldOfView:
         self.__lowerBound = np.array([lt, lx, ly, lz])
         self.__upperBound = np.array([ut, ux, uy, uz])
 
+    def lower_bound(self):
+        """ lower bounds of t,x,y,z as numpy array """
+        return self.__lowerBound.copy()
+
+    def upper_bound(self):
+        """ upper bounds of t,x,y,z as numpy array """
+        return self.__upperBound.copy()
+
     def __dot(self, v1, v2):
         return v1[0]*v2[0] + v1[1]*v2[1] + v1[2]*v2[2]
 
@@ -39,6 +47,12 @@ class FieldOfView:
         w = q - p1
         return np.abs(self.__dot(w,normal))
 
+    def __abs_distances(self, p1, p2, p3, qs):
+        """ same as `__abs_distance`, but for a (N,3) array of query points """
+        normal = self.__hesse_normal(p2 - p1, p3 - p1)
+        w = qs - p1
+        return np.abs(w[:, 0] * normal[0] + w[:, 1] * normal[1] + w[:, 2] * normal[2])
+
     def spatial_distance_to_border(self, t, x, y, z, relative=False):
         """
         distance to 6 cuboid planes, in the 2D case where Z=0,
@@ -82,4 +96,41 @@ class FieldOfView:
             ds[4] /= ((zub - self.__lowerBound[3])) # / 2)
             ds[5] /= ((zub - self.__lowerBound[3])) # / 2)
         # return *min_element(ds, ds+vlen)
-        return np.min(ds[:vlen])
\ No newline at end of file
+        return np.min(ds[:vlen])
+    def spatial_distances_to_border(self, coordinates, relative=False):
+        """
+        Vectorized version of `spatial_distance_to_border` for a (N,3) array of x,y,z coordinates,
+        returns an array with the distance of each point to the border of the field of view.
+        """
+        coordinates = np.asarray(coordinates, dtype=np.float64).reshape(-1, 3)
+        zub = 1.0 # 2D case
+        vlen = 4
+
+        if self.__upperBound[3] - self.__lowerBound[3] > 0: # 3D case
+            zub = self.__upperBound[3]
+            vlen = 6
+
+        c1 = np.array([self.__lowerBound[1], self.__lowerBound[2], self.__lowerBound[3]])
+        c2 = np.array([self.__upperBound[1], self.__lowerBound[2], self.__lowerBound[3]])
+        c3 = np.array([self.__upperBound[1], self.__upperBound[2], self.__lowerBound[3]])
+        c4 = np.array([self.__lowerBound[1], self.__upperBound[2], self.__lowerBound[3]])
+        c5 = np.array([self.__lowerBound[1], self.__lowerBound[2], zub])
+        c6 = np.array([self.__upperBound[1], self.__lowerBound[2], zub])
+        c8 = np.array([self.__lowerBound[1], self.__upperBound[2], zub])
+
+        ds = np.zeros((coordinates.shape[0], 6))
+        ds[:, 0] = self.__abs_distances(c1, c2, c5, coordinates)
+        ds[:, 1] = self.__abs_distances(c2, c3, c6, coordinates)
+        ds[:, 2] = self.__abs_distances(c4, c3, c8, coordinates)
+        ds[:, 3] = self.__abs_distances(c1, c4, c5, coordinates)
+        ds[:, 4] = self.__abs_distances(c1, c2, c4, coordinates)
+        ds[:, 5] = self.__abs_distances(c5, c6, c8, coordinates)
+
+        if relative:
+            ds[:, 0] /= (self.__upperBound[2] - self.__lowerBound[2])
+            ds[:, 1] /= (self.__upperBound[1] - self.__lowerBound[1])
+            ds[:, 2] /= (self.__upperBound[2] - self.__lowerBound[2])
+            ds[:, 3] /= (self.__upperBound[1] - self.__lowerBound[1])
+            ds[:, 4] /= (zub - self.__lowerBound[3])
+            ds[:, 5] /= (zub - self.__lowerBound[3])
+        return np.min(ds[:, :vlen], axis=1)
@@ -0,0 +1,162 @@
+'''
+Binary, column-wise storage of hypotheses graph models, results and weights in HDF5 files,
+as an alternative to our JSON format that is much faster to read and write and needs less memory.
+
+`writeToHDF5` and `readFromHDF5` convert the same python dictionaries that are stored in JSON files.
+Every top-level entry is stored depending on its contents:
+
+* lists of dictionaries (e.g. `segmentationHypotheses`, `linkingHypotheses` or `detectionResults`) become a group
+  with one column per key. Numeric values of the same shape are stored as one dataset `values` (with a boolean
+  dataset `present` if not all elements have that key), all others are stored JSON encoded in a dataset `json`.
+* the `traxelToUniqueId` mapping becomes a group with the three integer columns `timestep`, `traxelId` and `uuid`.
+* lists of lists of integers (e.g. `exclusions`) are stored as concatenated `values` with `offsets`.
+* everything else (e.g. `settings`) is stored as JSON encoded string dataset.
+'''
+
+import os
+import gc
+import json
+import logging
+import contextlib
+import h5py
+import numpy as np
+from hytra.core.traxelindex import TraxelIndex
+
+
+def getLogger():
+    ''' logger to be used in this module '''
+    return logging.getLogger(__name__)
+
+def isHDF5Filename(filename):
+    ''' **returns** whether the filename has an HDF5 extension (`.h5` or `.hdf5`) '''
+    return os.path.splitext(filename)[1].lower() in ['.h5', '.hdf5']
+
+
+def _isInteger(value):
+    return isinstance(value, (int, long, np.integer)) and not isinstance(value, (bool, np.bool_))
+
+
+def _isTable(value):
+    return isinstance(value, list) and len(value) > 0 and all(isinstance(v, dict) for v in value)
+
+
+def _isRagged(value):
+    return isinstance(value, list) and len(value) > 0 and \
+        all(isinstance(v, (list, tuple)) and all(_isInteger(x) for x in v) for v in value)
+
+
+def _writeTable(group, table):
+    group.attrs['type'] = 'table'
+    group.attrs['length'] = len(table)
+    keys = set()
+    for entry in table:
+        keys.update(entry.keys())
+
+    for key in sorted(keys):
+        column = group.create_group(key)
+        present = np.array([key in entry for entry in table], dtype=bool)
+        values = [entry[key] for entry in table if key in entry]
+        try:
+            array = np.array(values)
+        except ValueError:
+            array = None
+        if array is not None and array.dtype.kind in 'biuf' and array.shape[0] == len(values):
+            column.create_dataset('values', data=array)
+        else:
+            column.create_dataset('json', data=[json.dumps(v) for v in values], dtype=h5py.special_dtype(vlen=str))
+        if not np.all(present):
+            column.create_dataset('present', data=present)
+
+
+def _readTable(group):
+    table = [{} for _ in range(group.attrs['length'])]
+    for key, column in group.iteritems():
+        if 'values' in column:
+            values = column['values'][...].tolist()
+        else:
+            values = [json.loads(v) for v in column['json'][...]]
+        if 'present' in column:
+            indices = np.where(column['present'][...])[0].tolist()
+        else:
+            indices = range(len(table))
+        key = str(key)
+        for i, v in zip(indices, values):
+            table[i][key] = v
+    return table
+
+
+def _writeTraxelToUniqueId(group, traxelIdPerTimestepToUniqueIdMap):
+    group.attrs['type'] = 'traxelToUniqueId'
+    traxelIndex = TraxelIndex.fromTraxelToUniqueIdMap(traxelIdPerTimestepToUniqueIdMap)
+    group.create_dataset('timestep', data=traxelIndex.timesteps)
+    group.create_dataset('traxelId', data=traxelIndex.traxelIds)
+    group.create_dataset('uuid', data=traxelIndex.uuids)
+
+
+def readTraxelIndex(filename):
+    '''
+    **returns** the `hytra.core.traxelindex.TraxelIndex` of a model stored in HDF5, without reading anything else
+    '''
+    with h5py.File(filename, 'r') as f:
+        group = f['traxelToUniqueId']
+        return TraxelIndex(group['timestep'][...], group['traxelId'][...], group['uuid'][...])
+
+
+def _readTraxelToUniqueId(group):
+    return TraxelIndex(group['timestep'][...], group['traxelId'][...], group['uuid'][...]).toTraxelToUniqueIdMap()
+
+
+def _writeRagged(group, lists):
+    group.attrs['type'] = 'ragged'
+    group.create_dataset('values', data=np.array([x for l in lists for x in l], dtype=np.int64))
+    group.create_dataset('offsets', data=np.cumsum([0] + [len(l) for l in lists]).astype(np.int64))
+
+
+def _readRagged(group):
+    values = group['values'][...].tolist()
+    offsets = group['offsets'][...].tolist()
+    return [values[start:stop] for start, stop in zip(offsets[:-1], offsets[1:])]
+
+
+@contextlib.contextmanager
+def _garbageCollectionDisabled():
+    ''' creating millions of small containers triggers the cyclic garbage collector over and over again '''
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
+
+
+def writeToHDF5(filename, dictionary):
+    '''
+    Write a dictionary (model, result or weights) to a column-wise HDF5 file, see the module documentation.
+    '''
+    with h5py.File(filename, 'w') as f:
+        for key, value in dictionary.iteritems():
+            if key == 'traxelToUniqueId' and isinstance(value, dict):
+                _writeTraxelToUniqueId(f.create_group(key), value)
+            elif _isTable(value):
+                _writeTable(f.create_group(key), value)
+            elif _isRagged(value):
+                _writeRagged(f.create_group(key), value)
+            else:
+                dataset = f.create_dataset(key, data=json.dumps(value), dtype=h5py.special_dtype(vlen=str))
+                dataset.attrs['type'] = 'json'
+
+
+def readFromHDF5(filename):
+    '''
+    Read a dictionary (model, result or weights) from a column-wise HDF5 file written by `writeToHDF5`.
+    '''
+    readers = {'table': _readTable,
+               'traxelToUniqueId': _readTraxelToUniqueId,
+               'ragged': _readRagged,
+               'json': lambda dataset: json.loads(dataset[()])}
+    dictionary = {}
+    with h5py.File(filename, 'r') as f, _garbageCollectionDisabled():
+        for key, item in f.iteritems():
+            dictionary[str(key)] = readers[item.attrs['type']](item)
+    return dictionary
@@ -1,12 +1,18 @@
 import logging
 import copy
+import itertools
 import networkx as nx
 import numpy as np
 from sklearn.neighbors import KDTree
 import hytra.core.jsongraph
-from hytra.core.jsongraph import negLog, listify
+from hytra.core.jsongraph import negLog, negLogArray, listify
+from hytra.core.traxelstore import TraxelView
+from hytra.core.compactgraph import CompactDiGraph
+from hytra.core.traxelindex import TraxelIndex
 from hytra.util.progressbar import ProgressBar
 
+# default graph backend of newly created hypotheses graphs, see `HypothesesGraph.__init__`
+useCompactGraph = False
 
 def getLogger():
     ''' logger to be used in this module '''
@@ -36,6 +42,34 @@ def getTraxelFeatureVector(traxel, featureName, maxNumDimensions=3):
     return result
 
 
+def getTraxelFeatureMatrix(traxels, featureName, maxNumDimensions=None, missingValue=None):
+    """
+    Extract the feature vectors of a list of traxels, stacked into a matrix with one row per traxel.
+    Uses the columns of the `hytra.core.traxelstore.TraxelStore` directly if all traxels are views into the same store.
+
+    Traxels without the feature get a row filled with `missingValue`, or raise an exception if that is `None`.
+    """
+    if len(traxels) > 0 and all(isinstance(t, TraxelView) for t in traxels):
+        store = traxels[0]._store
+        if all(t._store is store for t in traxels):
+            return store.gatherFeatureRows([t.Timestep for t in traxels],
+                                           [t.Id for t in traxels],
+                                           featureName,
+                                           maxNumDimensions,
+                                           missingValue)
+
+    rows = []
+    for traxel in traxels:
+        if missingValue is not None and featureName not in traxel.Features:
+            rows.append(None)
+        elif maxNumDimensions is None:
+            rows.append(np.asarray(traxel.Features[featureName], dtype=np.float64).flatten())
+        else:
+            rows.append(getTraxelFeatureVector(traxel, featureName, maxNumDimensions))
+    numColumns = max([len(r) for r in rows if r is not None] + [maxNumDimensions or 1])
+    return np.array([r if r is not None else [missingValue] * numColumns for r in rows], dtype=np.float64)
+
+
 class NodeMap(object):
     """
     To access per node features of the hypotheses graph,
@@ -50,12 +84,87 @@ class NodeMap(object):
         return self.__graph.node[key][self.__attributeName]
 
 
+class TrackletIndex(object):
+    """
+    Compact index from the nodes of a tracklet graph to the traxels they contain.
+    The traxels of all tracklets are stored consecutively in one list,
+    the tracklet with index `i` consists of `traxels[offsets[i]:offsets[i+1]]`.
+    """
+
+    def __init__(self, traxels, offsets):
+        self.traxels = traxels
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, trackletIndex):
+        return Tracklet(self, trackletIndex)
+
+    def traxelsOf(self, trackletIndex):
+        ''' **returns** the list of traxels in the tracklet with the given index '''
+        return self.traxels[self.offsets[trackletIndex]:self.offsets[trackletIndex + 1]]
+
+
+class Tracklet(object):
+    """
+    Read-only list of the traxels of one tracklet, which is a view into a `TrackletIndex`.
+    It is stored as `'tracklet'` attribute of the nodes of tracklet graphs. Copies are plain lists.
+    """
+    __slots__ = ('_index', '_start', '_stop')
+
+    def __init__(self, trackletIndex, position):
+        self._index = trackletIndex
+        self._start = int(trackletIndex.offsets[position])
+        self._stop = int(trackletIndex.offsets[position + 1])
+
+    def __len__(self):
+        return self._stop - self._start
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            return [self[i] for i in range(*key.indices(len(self)))]
+        if key < 0:
+            key += len(self)
+        if key < 0 or key >= len(self):
+            raise IndexError("tracklet index out of range")
+        return self._index.traxels[self._start + key]
+
+    def __iter__(self):
+        return iter(self._index.traxels[self._start:self._stop])
+
+    def __eq__(self, other):
+        try:
+            return list(self) == list(other)
+        except TypeError:
+            return False
+
+    def __ne__(self, other):
+        return not self == other
+
+    __hash__ = None
+
+    def __repr__(self):
+        return repr(list(self))
+
+    def __copy__(self):
+        return list(self)
+
+    def __deepcopy__(self, memo):
+        return copy.deepcopy(list(self), memo)
+
+    def __reduce__(self):
+        return (list, (list(self),))
+
+
 class HypothesesGraph(object):
     """
     Replacement for pgmlink's hypotheses graph,
     with a similar API so it can be used as drop-in replacement.
 
-    Internally it uses [networkx](http://networkx.github.io/) to construct the graph.
+    Internally it uses [networkx](http://networkx.github.io/) to construct the graph,
+    or a `hytra.core.compactgraph.CompactDiGraph` with the same interface that stores nodes, arcs and energies
+    in arrays, which needs much less memory for large graphs.
 
     Use the insertEnergies() method to populate the nodes and arcs with the energies for different
     configurations (according to DPCT's JSON style'), derived from given probability generation functions.
@@ -65,8 +174,19 @@ class HypothesesGraph(object):
     Nodes also get a unique ID assigned once they are added to the graph.
     """
 
-    def __init__(self):
-        self._graph = nx.DiGraph()
+    def __init__(self, compactGraph=None):
+        '''
+        **Parameters:**
+
+        * `compactGraph`: use the array based `CompactDiGraph` instead of a `networkx.DiGraph`.
+          If `None`, the module wide default `useCompactGraph` is used.
+        '''
+        if compactGraph is None:
+            compactGraph = useCompactGraph
+        if compactGraph:
+            self._graph = CompactDiGraph()
+        else:
+            self._graph = nx.DiGraph()
         self.withTracklets = False
         self._nextNodeUuid = 0
 
@@ -109,6 +229,23 @@ class HypothesesGraph(object):
         return [objectIdList[index] for distance, index in zip(distances[0], neighbors[0]) if
                 distance < maxNeighborDist]
 
+    def _findNearestNeighborsBatch(self, kdtreeObjectPair, centers, numNeighbors, maxNeighborDist):
+        """
+        Batched version of `_findNearestNeighbors`, which queries the kdtree for all `centers` at once.
+
+        **returns** two arrays, the indices into `centers` and the indices into the object id list of the kdtree
+        of all neighbors less than maxNeighborDist away
+        """
+        kdtree, objectIdList = kdtreeObjectPair
+        if len(centers) == 0 or len(objectIdList) == 0:
+            return np.zeros(0, dtype=int), np.zeros(0, dtype=int)
+        if len(objectIdList) <= numNeighbors:
+            return np.repeat(np.arange(len(centers)), len(objectIdList)), np.tile(np.arange(len(objectIdList)), len(centers))
+        distances, neighbors = kdtree.query(centers, k=numNeighbors, return_distance=True)
+        closeEnough = distances < maxNeighborDist
+        queryIndices = np.repeat(np.arange(len(centers))[:, np.newaxis], numNeighbors, axis=1)
+        return queryIndices[closeEnough], neighbors[closeEnough]
+
     def _extractCenter(self, traxel):
         try:
             # python traxelstore
@@ -134,8 +271,19 @@ class HypothesesGraph(object):
     def _buildFrameKdTree(self, traxelDict):
         """
         Collect the centers of all traxels and their ids of this frame's traxels.
-        Then build a kdtree and return (kdtree, listOfObjectIdsInFrame), where the second argument
-        is needed to decode the object id of the nearest neighbors in _findNearestNeighbors().
+        Then build a kdtree and return ((kdtree, listOfObjectIdsInFrame), centers), where the second entry of the pair
+        is needed to decode the object id of the nearest neighbors in _findNearestNeighbors(). The kdtree is `None`
+        if the frame does not contain any objects.
+        """
+        objectIdList, centers = self._getFrameCenters(traxelDict)
+        if len(objectIdList) == 0:
+            return (None, objectIdList), centers
+        return (KDTree(centers, metric='euclidean'), objectIdList), centers
+
+    def _getFrameCenters(self, traxelDict):
+        """
+        **returns** the list of object ids of this frame's traxels (without background), 
+        and an array with the center of each of these traxels in its rows
         """
         objectIdList = []
         features = []
@@ -145,7 +293,7 @@ class HypothesesGraph(object):
             objectIdList.append(obj)
             features.append(list(self._extractCenter(traxel)))
 
-        return (KDTree(features, metric='euclidean'), objectIdList)
+        return objectIdList, np.array(features)
 
     def _addNodesForFrame(self, frame, traxelDict):
         """
@@ -175,55 +323,52 @@ class HypothesesGraph(object):
         assert (probabilityGenerator is not None)
         assert (len(probabilityGenerator.TraxelsPerFrame) > 0)
 
-        def checkNodeWhileAddingLinks(frame, obj):
-            if (frame, obj) not in self._graph:
-                getLogger().warning("Adding node ({}, {}) when setting up links".format(frame, obj))
-
         kdTreeNextFrame = None
         numFrames = len(probabilityGenerator.TraxelsPerFrame.keys())
         progressBar = ProgressBar(stop=numFrames)
         progressBar.show(0)
         for frame in range(numFrames - 1):
             if frame > 0:
-                kdTreeThisFrame = kdTreeNextFrame
+                kdTreeThisFrame, centersThisFrame = kdTreeNextFrame, centersNextFrame
             else:
-                kdTreeThisFrame = self._buildFrameKdTree(probabilityGenerator.TraxelsPerFrame[frame])
+                kdTreeThisFrame, centersThisFrame = self._buildFrameKdTree(probabilityGenerator.TraxelsPerFrame[frame])
                 self._addNodesForFrame(frame, probabilityGenerator.TraxelsPerFrame[frame])
 
-            kdTreeNextFrame = self._buildFrameKdTree(probabilityGenerator.TraxelsPerFrame[frame + 1])
+            kdTreeNextFrame, centersNextFrame = self._buildFrameKdTree(probabilityGenerator.TraxelsPerFrame[frame + 1])
             self._addNodesForFrame(frame + 1, probabilityGenerator.TraxelsPerFrame[frame + 1])
-
-            # find forward links
-            for obj, traxel in probabilityGenerator.TraxelsPerFrame[frame].iteritems():
-                divisionPreservingNumNearestNeighbors = numNearestNeighbors
-                if divisionPreservingNumNearestNeighbors < 2 \
-                        and withDivisions \
-                        and self._traxelMightDivide(traxel, divisionThreshold):
-                    divisionPreservingNumNearestNeighbors = 2
-                neighbors = self._findNearestNeighbors(kdTreeNextFrame,
-                                                       traxel,
-                                                       divisionPreservingNumNearestNeighbors,
-                                                       maxNeighborDist)
-                for n in neighbors:
-                    checkNodeWhileAddingLinks(frame, obj)
-                    checkNodeWhileAddingLinks(frame + 1, n)
-                    self._graph.add_edge((frame, obj), (frame + 1, n))
-                    self._graph.edge[frame, obj][frame + 1, n]['src'] = self._graph.node[(frame, obj)]['id']
-                    self._graph.edge[frame, obj][frame + 1, n]['dest'] = self._graph.node[(frame + 1, n)]['id']
+            objectIdsThisFrame = kdTreeThisFrame[1]
+            objectIdsNextFrame = kdTreeNextFrame[1]
+
+            # find forward links, where traxels that might divide need at least two successors
+            mightDivide = np.zeros(len(objectIdsThisFrame), dtype=bool)
+            if numNearestNeighbors < 2 and withDivisions:
+                traxels = probabilityGenerator.TraxelsPerFrame[frame]
+                mightDivide = np.array([self._traxelMightDivide(traxels[obj], divisionThreshold) for obj in objectIdsThisFrame],
+                                       dtype=bool)
+            links = []
+            for queryIndices, numNeighbors in [(np.where(~mightDivide)[0], numNearestNeighbors),
+                                               (np.where(mightDivide)[0], 2)]:
+                sources, targets = self._findNearestNeighborsBatch(kdTreeNextFrame,
+                                                                   centersThisFrame[queryIndices],
+                                                                   numNeighbors,
+                                                                   maxNeighborDist)
+                links.append((queryIndices[sources], targets))
 
             # find backward links
             if forwardBackwardCheck:
-                for obj, traxel in probabilityGenerator.TraxelsPerFrame[frame + 1].iteritems():
-                    neighbors = self._findNearestNeighbors(kdTreeThisFrame,
-                                                           traxel,
-                                                           numNearestNeighbors,
-                                                           maxNeighborDist)
-                    for n in neighbors:
-                        checkNodeWhileAddingLinks(frame, n)
-                        checkNodeWhileAddingLinks(frame + 1, obj)
-                        self._graph.add_edge((frame, n), (frame + 1, obj))
-                        self._graph.edge[frame, n][frame + 1, obj]['src'] = self._graph.node[(frame, n)]['id']
-                        self._graph.edge[frame, n][frame + 1, obj]['dest'] = self._graph.node[(frame + 1, obj)]['id']
+                targets, sources = self._findNearestNeighborsBatch(kdTreeThisFrame,
+                                                                   centersNextFrame,
+                                                                   numNearestNeighbors,
+                                                                   maxNeighborDist)
+                links.append((sources, targets))
+
+            # union of all links, encoded as one index per pair of objects
+            linkKeys = np.unique(np.concatenate([s * len(objectIdsNextFrame) + t for s, t in links]).astype(np.int64))
+            sources = [objectIdsThisFrame[i] for i in (linkKeys // len(objectIdsNextFrame)).tolist()]
+            targets = [objectIdsNextFrame[i] for i in (linkKeys % len(objectIdsNextFrame)).tolist()]
+            nodes = self._graph.node
+            self._graph.add_edges_from(((frame, s), (frame + 1, t), {'src': nodes[(frame, s)]['id'], 'dest': nodes[(frame + 1, t)]['id']})
+                                       for s, t in zip(sources, targets))
             progressBar.show()
         progressBar.show()
 
@@ -233,41 +378,64 @@ class HypothesesGraph(object):
         incoming/outgoing transition are contracted into one node in the graph.
         The returned graph will have `withTracklets` set to `True`!
 
-        The `'tracklet'` node map contains a list of traxels that each node represents.
+        The `'tracklet'` node map contains a list of traxels that each node represents,
+        in form of a `Tracklet` view into one `TrackletIndex` shared by all nodes.
+        The contracted graph is built in a single pass, without copying the traxel graph first.
         '''
         getLogger().info("generating tracklet graph...")
         tracklet_graph = copy.copy(self)
-        tracklet_graph._graph = tracklet_graph._graph.copy()
+        tracklet_graph._graph = self._graph.__class__()
         tracklet_graph.withTracklets = True
         tracklet_graph.referenceTraxelGraph = self
 
-        # initialize tracklet map to contain a list of only one traxel per node
-        for node in tracklet_graph._graph.nodes_iter():
-            tracklet_graph._graph.node[node]['tracklet'] = [tracklet_graph._graph.node[node]['traxel']]
-            del tracklet_graph._graph.node[node]['traxel']
-
-        # set up a list of links that indicates whether the target's in- and source's out-degree
-        # are one, meaning the edge can be contracted
-        links_to_be_contracted = []
-        node_remapping = {}
-        for edge in tracklet_graph._graph.edges_iter():
-            if tracklet_graph._graph.out_degree(edge[0]) == 1 and tracklet_graph._graph.in_degree(edge[1]) == 1:
-                links_to_be_contracted.append(edge)
-                for i in [0, 1]:
-                    node_remapping[edge[i]] = edge[i]
-
-        # apply edge contraction
-        for edge in links_to_be_contracted:
-            src = node_remapping[edge[0]]
-            dest = node_remapping[edge[1]]
-            tracklet_graph._graph.node[src]['tracklet'].extend(tracklet_graph._graph.node[dest]['tracklet'])
-            # duplicate out arcs with new source
-            for out_edge in tracklet_graph._graph.out_edges(dest):
-                tracklet_graph._graph.add_edge(src, out_edge[1])
-            # adjust node remapping to point to new source for all contracted traxels
-            for t in tracklet_graph._graph.node[dest]['tracklet']:
-                node_remapping[(t.Timestep, t.Id)] = src
-            tracklet_graph._graph.remove_node(dest)
+        nodes = self._graph.nodes()
+        edges = self._graph.edges()
+        nodeIndices = dict(itertools.izip(nodes, itertools.count()))
+        sources = np.array([nodeIndices[e[0]] for e in edges], dtype=np.int64)
+        targets = np.array([nodeIndices[e[1]] for e in edges], dtype=np.int64)
+
+        # a link can be contracted if the source's out- and the target's in-degree are one,
+        # which decomposes the graph into chains of nodes that become the tracklets
+        outDegrees = np.bincount(sources, minlength=len(nodes))
+        inDegrees = np.bincount(targets, minlength=len(nodes))
+        contract = np.logical_and(outDegrees[sources] == 1, inDegrees[targets] == 1)
+
+        # find the first node (head) of every chain and the position of each node in its chain by pointer jumping
+        heads = np.arange(len(nodes), dtype=np.int64)
+        heads[targets[contract]] = sources[contract]
+        positions = (heads != np.arange(len(nodes))).astype(np.int64)
+        while True:
+            nextHeads = heads[heads]
+            if np.array_equal(nextHeads, heads):
+                break
+            positions += positions[heads]
+            heads = nextHeads
+
+        # traxels of all tracklets, ordered by tracklet (in order of the head nodes) and by position inside the chain
+        headNodes = np.where(heads == np.arange(len(nodes)))[0]
+        trackletOfHead = -np.ones(len(nodes), dtype=np.int64)
+        trackletOfHead[headNodes] = np.arange(len(headNodes))
+        trackletOfNode = trackletOfHead[heads]
+        order = np.lexsort((positions, trackletOfNode))
+        offsets = np.zeros(len(headNodes) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum(np.bincount(trackletOfNode, minlength=len(headNodes)))
+        traxels = self._getNodeAttributes(nodes, 'traxel')
+        trackletIndex = TrackletIndex([traxels[i] for i in order.tolist()], offsets)
+
+        # the contracted graph keeps the attributes of the head nodes, and all links that were not contracted,
+        # which always start at the last node of a chain and end at the head of another one
+        newNodes = []
+        for t, n in enumerate(headNodes.tolist()):
+            attributes = dict((k, copy.deepcopy(v)) for k, v in self._graph.node[nodes[n]].items() if k != 'traxel')
+            attributes['tracklet'] = trackletIndex[t]
+            newNodes.append((nodes[n], attributes))
+        tracklet_graph._graph.add_nodes_from(newNodes)
+
+        keep = np.where(~contract)[0]
+        heads = heads.tolist()
+        tracklet_graph._graph.add_edges_from(
+            (nodes[heads[s]], nodes[t], copy.deepcopy(dict(self._graph.edge[nodes[s]][nodes[t]].items())))
+            for s, t in itertools.izip(sources[keep].tolist(), targets[keep].tolist()))
 
         getLogger().info("tracklet graph has {} nodes and {} edges (before {},{})".format(
             tracklet_graph.countNodes(), tracklet_graph.countArcs(), self.countNodes(), self.countArcs()))
@@ -285,7 +453,8 @@ class HypothesesGraph(object):
                        detectionProbabilityFunc,
                        transitionProbabilityFunc,
                        boundaryCostMultiplierFunc,
-                       divisionProbabilityFunc):
+                       divisionProbabilityFunc,
+                       batched=False):
         '''
         Insert energies for detections, divisions and links into the hypotheses graph, 
         by transforming the probabilities for certain
@@ -311,7 +480,18 @@ class HypothesesGraph(object):
         * `boundaryCostMultiplierFunc`: should take a traxel and return a scalar multiplier between 0 and 1 for the
          appearance/disappearance cost that depends on the traxel's distance to the spacial and time boundary
         * `divisionProbabilityFunc`: should take a traxel and return its division probabilities ([probNoDiv, probDiv])
+        * `batched`: if `True`, all functions above are called only once with a list of traxels
+         (or two lists of source and destination traxels for the transitions) and must return one row per traxel
+         (or per pair) as numpy array, see `_insertEnergiesBatched`
         '''
+        if batched:
+            self._insertEnergiesBatched(maxNumObjects,
+                                        detectionProbabilityFunc,
+                                        transitionProbabilityFunc,
+                                        boundaryCostMultiplierFunc,
+                                        divisionProbabilityFunc)
+            return
+
         numElements = self._graph.number_of_nodes() + self._graph.number_of_edges()
         progressBar = ProgressBar(stop=numElements)
 
@@ -368,7 +548,161 @@ class HypothesesGraph(object):
             self._graph.edge[a[0]][a[1]]['features'] = features
 
             progressBar.show()
-        
+
+    def _insertEnergiesBatched(self,
+                               maxNumObjects,
+                               detectionProbabilityFunc,
+                               transitionProbabilityFunc,
+                               boundaryCostMultiplierFunc,
+                               divisionProbabilityFunc):
+        '''
+        Same as `insertEnergies`, but every probability function is only invoked once for all traxels (or links)
+        of the graph, and the energies are computed on whole arrays. The results are identical to the per-node version.
+
+        ** Parameters: **
+
+        * `maxNumObjects`: the max number of objects per detections
+        * `detectionProbabilityFunc`: should take a list of N traxels and return a (N, maxNumObjects+1) array
+         of detection probabilities
+        * `transitionProbabilityFunc`: should take two lists of M source and destination traxels
+         and return a (M, maxNumObjects+1) array of link probabilities
+        * `boundaryCostMultiplierFunc`: should take a list of N traxels and return an array of N multipliers
+        * `divisionProbabilityFunc`: should take a list of N traxels and return a (N, 2) array of
+         division probabilities ([probNoDiv, probDiv]), where rows containing `NaN` mean that there is no division
+        '''
+        nodes = self._graph.nodes()
+        edges = self._graph.edges()
+        progressBar = ProgressBar(stop=2)
+
+        if not self.withTracklets:
+            traxelsPerNode = [[t] for t in self._getNodeAttributes(nodes, 'traxel')]
+        else:
+            traxelsPerNode = self._getNodeAttributes(nodes, 'tracklet')
+
+        if len(nodes) > 0:
+            firstTraxels = [traxels[0] for traxels in traxelsPerNode]
+            lastTraxels = [traxels[-1] for traxels in traxelsPerNode]
+
+            # accumulate the energies of all contained traxels (and the links between them) per node,
+            # in the same order as the per-node version does
+            allTraxels = []
+            contributionNodes = []
+            contributionIndices = []
+            linkSources = []
+            linkTargets = []
+            for nodeIdx, traxels in enumerate(traxelsPerNode):
+                for i, t in enumerate(traxels):
+                    contributionNodes.append(nodeIdx)
+                    contributionIndices.append(len(allTraxels))
+                    allTraxels.append(t)
+                    if i > 0:
+                        contributionNodes.append(nodeIdx)
+                        contributionIndices.append(-1 - len(linkSources))
+                        linkSources.append(traxels[i - 1])
+                        linkTargets.append(t)
+
+            contributions = negLogArray(detectionProbabilityFunc(allTraxels)).reshape(len(allTraxels), -1)
+            if len(linkSources) > 0:
+                linkEnergies = negLogArray(transitionProbabilityFunc(linkSources, linkTargets)).reshape(len(linkSources), -1)
+                contributions = np.vstack([contributions, linkEnergies])
+            # links were marked by negative indices, they are stored after all detections
+            contributionIndices = np.array(contributionIndices, dtype=np.int64)
+            isLink = contributionIndices < 0
+            contributionIndices[isLink] = len(allTraxels) - 1 - contributionIndices[isLink]
+
+            detectionFeatures = np.zeros((len(nodes), maxNumObjects + 1))
+            np.add.at(detectionFeatures, np.array(contributionNodes), contributions[contributionIndices])
+
+            divisionFeatures = negLogArray(divisionProbabilityFunc(lastTraxels)).reshape(len(nodes), -1)
+            hasDivision = np.logical_not(np.isnan(divisionFeatures).any(axis=1))
+
+            appearanceMultipliers = np.asarray(boundaryCostMultiplierFunc(firstTraxels), dtype=np.float64).tolist()
+            disappearanceMultipliers = np.asarray(boundaryCostMultiplierFunc(lastTraxels), dtype=np.float64).tolist()
+
+            if isinstance(self._graph, CompactDiGraph):
+                # write all energies at once into the dense matrices of the graph
+                self._graph.setNodeAttributes(nodes, 'features', detectionFeatures[..., np.newaxis])
+                self._graph.setNodeAttributes([n for n, d in zip(nodes, hasDivision) if d],
+                                              'divisionFeatures',
+                                              divisionFeatures[hasDivision][..., np.newaxis])
+                for name, multipliers in [('appearanceFeatures', appearanceMultipliers),
+                                          ('disappearanceFeatures', disappearanceMultipliers)]:
+                    boundaryFeatures = np.zeros((len(nodes), maxNumObjects + 1, 1))
+                    boundaryFeatures[:, 1:, 0] = np.array(multipliers)[:, np.newaxis]
+                    self._graph.setNodeAttributes(nodes, name, boundaryFeatures)
+                self._graph.setNodeAttributes(nodes, 'timestep',
+                                              [[f.Timestep, l.Timestep] for f, l in zip(firstTraxels, lastTraxels)])
+            else:
+                detectionFeatures = detectionFeatures[..., np.newaxis].tolist()
+                divisionFeatures = divisionFeatures[..., np.newaxis].tolist()
+                for i, n in enumerate(nodes):
+                    nodeAttributes = self._graph.node[n]
+                    nodeAttributes['features'] = detectionFeatures[i]
+                    if hasDivision[i]:
+                        nodeAttributes['divisionFeatures'] = divisionFeatures[i]
+                    nodeAttributes['appearanceFeatures'] = listify([0.0] + [appearanceMultipliers[i]] * maxNumObjects)
+                    nodeAttributes['disappearanceFeatures'] = listify([0.0] + [disappearanceMultipliers[i]] * maxNumObjects)
+                    nodeAttributes['timestep'] = [firstTraxels[i].Timestep, lastTraxels[i].Timestep]
+        progressBar.show()
+
+        if len(edges) > 0:
+            nodeToTraxels = dict(itertools.izip(nodes, traxelsPerNode))
+            nodeToId = dict(itertools.izip(nodes, self._getNodeAttributes(nodes, 'id')))
+            srcTraxels = [nodeToTraxels[a[0]][-1] for a in edges]
+            destTraxels = [nodeToTraxels[a[1]][0] for a in edges]
+
+            transitionFeatures = negLogArray(transitionProbabilityFunc(srcTraxels, destTraxels)).reshape(len(edges), -1)
+            if isinstance(self._graph, CompactDiGraph):
+                self._graph.setEdgeAttributes(edges, 'src', [nodeToId[a[0]] for a in edges])
+                self._graph.setEdgeAttributes(edges, 'dest', [nodeToId[a[1]] for a in edges])
+                self._graph.setEdgeAttributes(edges, 'features', transitionFeatures[..., np.newaxis])
+            else:
+                transitionFeatures = transitionFeatures[..., np.newaxis].tolist()
+                for i, a in enumerate(edges):
+                    edgeAttributes = self._graph.edge[a[0]][a[1]]
+                    edgeAttributes['src'] = nodeToId[a[0]]
+                    edgeAttributes['dest'] = nodeToId[a[1]]
+                    edgeAttributes['features'] = transitionFeatures[i]
+        progressBar.show()
+
+    def _getNodeAttributes(self, nodes, name, default=None):
+        '''
+        **returns** a list with the attribute `name` of all given `nodes`, or `default` for nodes that do not have it.
+        Reads whole columns at once if the graph is a `CompactDiGraph`.
+        '''
+        if isinstance(self._graph, CompactDiGraph):
+            return self._graph.getNodeAttributes(nodes, name, default)
+        return [self._graph.node[n].get(name, default) for n in nodes]
+
+    def _getEdgeAttributes(self, edges, name, default=None):
+        '''
+        **returns** a list with the attribute `name` of all given `edges`, or `default` for arcs that do not have it.
+        '''
+        if isinstance(self._graph, CompactDiGraph):
+            return self._graph.getEdgeAttributes(edges, name, default)
+        return [self._graph.edge[u][v].get(name, default) for u, v in edges]
+
+    def _setNodeAttributes(self, nodes, name, values):
+        '''
+        Set the attribute `name` of all given `nodes` to the respective entry of `values`.
+        Writes whole columns at once if the graph is a `CompactDiGraph`.
+        '''
+        if isinstance(self._graph, CompactDiGraph):
+            self._graph.setNodeAttributes(nodes, name, values)
+        else:
+            for n, value in itertools.izip(nodes, values):
+                self._graph.node[n][name] = value
+
+    def _setEdgeAttributes(self, edges, name, values):
+        '''
+        Set the attribute `name` of all given `edges` to the respective entry of `values`.
+        '''
+        if isinstance(self._graph, CompactDiGraph):
+            self._graph.setEdgeAttributes(edges, name, values)
+        else:
+            for (u, v), value in itertools.izip(edges, values):
+                self._graph.edge[u][v][name] = value
+
     def getMappingsBetweenUUIDsAndTraxels(self):
         '''
         Extract the mapping from UUID to traxel and vice versa from the networkx graph.
@@ -380,32 +714,37 @@ class HypothesesGraph(object):
         * `uuidToTraxelMap`: a dictionary with keys = int(uuid), values = list(of timestep-Id-tuples (int(Timestep), int(Id)))
         '''
 
-        uuidToTraxelMap = {}
-        traxelIdPerTimestepToUniqueIdMap = {}
-
-        for n in self._graph.nodes_iter():
-            uuid = self._graph.node[n]['id']
-            traxels = []
-            if self.withTracklets:
-                traxels = self._graph.node[n]['tracklet']
-            else:
-                traxels = [self._graph.node[n]['traxel']]
-            uuidToTraxelMap[uuid] = [(t.Timestep, t.Id) for t in traxels]
-
-            for t in uuidToTraxelMap[uuid]:
-                traxelIdPerTimestepToUniqueIdMap.setdefault(str(t[0]), {})[str(t[1])] = uuid
+        traxelIndex = self.getTraxelIndex()
+        return traxelIndex.toTraxelToUniqueIdMap(), traxelIndex.toUuidToTraxelMap()
 
-        # sort the list of traxels per UUID by their timesteps
-        for v in uuidToTraxelMap.values():
-            v.sort(key=lambda timestepIdTuple: timestepIdTuple[0])
-
-        return traxelIdPerTimestepToUniqueIdMap, uuidToTraxelMap
+    def getTraxelIndex(self):
+        '''
+        **returns** a `hytra.core.traxelindex.TraxelIndex` mapping between the UUIDs of all nodes and their traxels,
+        which answers lookups for many traxels or UUIDs at once
+        '''
+        return TraxelIndex(*self._getTraxelUuidArrays(self._graph.nodes()))
 
-    def toTrackingGraph(self, noFeatures=False):
+    def _getTraxelUuidArrays(self, nodes):
         '''
-        Create a dictionary representation of this graph which can be passed to the solvers directly.
-        The resulting graph (=model) is wrapped within a `hytra.jsongraph.JsonTrackingGraph` structure for convenience.
-        If `noFeatures` is `True`, then only the structure of the graph will be exported.
+        **returns** three arrays `(timesteps, traxelIds, uuids)` describing all traxels of the given `nodes`,
+        sorted by timestep and traxel id
+        '''
+        if self.withTracklets:
+            traxelsPerNode = self._getNodeAttributes(nodes, 'tracklet')
+        else:
+            traxelsPerNode = [[t] for t in self._getNodeAttributes(nodes, 'traxel')]
+        counts = [len(traxels) for traxels in traxelsPerNode]
+        timesteps = np.fromiter((t.Timestep for traxels in traxelsPerNode for t in traxels), dtype=np.int64)
+        traxelIds = np.fromiter((t.Id for traxels in traxelsPerNode for t in traxels), dtype=np.int64)
+        uuids = np.repeat(np.array(self._getNodeAttributes(nodes, 'id'), dtype=np.int64), counts)
+        order = np.lexsort((traxelIds, timesteps))
+        return timesteps[order], traxelIds[order], uuids[order]
+
+    def _getTrackingGraphModel(self, noFeatures=False, chunkSize=10000):
+        '''
+        Create the dictionary representation of this graph (see `toTrackingGraph`), where the hypotheses and exclusions
+        are generators and the `traxelToUniqueId` mapping is a `hytra.core.jsongraph.StreamedDict`.
+        Their entries are produced for `chunkSize` nodes or arcs at a time while the model is written or consumed.
         '''
         requiredNodeAttribs = ['id']
         requiredLinkAttribs = ['src', 'dest']
@@ -414,32 +753,73 @@ class HypothesesGraph(object):
             requiredNodeAttribs.append('features')
             requiredLinkAttribs.append('features')
 
-        def translateNodeToDict(n):
-            result = {}
-            attrs = self._graph.node[n]
-            for k in ['id', 'features', 'appearanceFeatures', 'disappearanceFeatures', 'divisionFeatures', 'timestep']:
-                if k in attrs:
-                    result[k] = attrs[k]
-                elif k in requiredNodeAttribs:
-                    raise ValueError('Cannot use graph nodes without assigned ID and features, run insertEnergies() first')
-            return result
-
-        def translateLinkToDict(l):
-            result = {}
-            attrs = self._graph.edge[l[0]][l[1]]
-            for k in ['src', 'dest', 'features']:
-                if k in attrs:
-                    result[k] = attrs[k]
-                elif k in requiredLinkAttribs:
-                    raise ValueError('Cannot use graph links without source, target, and features, run insertEnergies() first')
-            return result
-
-        traxelIdPerTimestepToUniqueIdMap, _ = self.getMappingsBetweenUUIDsAndTraxels()
-        model = {
-            'segmentationHypotheses':[translateNodeToDict(n) for n in self._graph.nodes_iter()],
-            'linkingHypotheses':[translateLinkToDict(e) for e in self._graph.edges_iter()],
+        missing = object()
+
+        def translateToDicts(attributeLists, requiredAttribs, errorMessage):
+            # attributeLists holds one (name, list of values of all elements) pair per attribute
+            results = [{} for _ in range(len(attributeLists[0][1]))]
+            for k, values in attributeLists:
+                for result, value in itertools.izip(results, values):
+                    if value is not missing:
+                        result[k] = value
+                    elif k in requiredAttribs:
+                        raise ValueError(errorMessage)
+            return results
+
+        def iterHypotheses(elements, getAttributes, keys, requiredAttribs, errorMessage):
+            for start in range(0, len(elements), chunkSize):
+                chunk = elements[start:start + chunkSize]
+                for result in translateToDicts([(k, getAttributes(chunk, k, missing)) for k in keys],
+                                               requiredAttribs,
+                                               errorMessage):
+                    yield result
+
+        nodes = self._graph.nodes()
+        edges = self._graph.edges()
+        traxelIndex = TraxelIndex(*self._getTraxelUuidArrays(nodes))
+
+        def findUuids(timestep, ids):
+            try:
+                return traxelIndex.uuidOf(timestep, ids).tolist()
+            except KeyError:
+                raise KeyError("Conflicting traxels of timestep {} are not part of the graph".format(timestep))
+
+        def iterExclusions():
+            if self.withTracklets:
+                traxels = [tracklet[0] for tracklet in self._getNodeAttributes(nodes, 'tracklet')]
+            else:
+                traxels = self._getNodeAttributes(nodes, 'traxel')
+            exclusions = set([])
+            for traxel in traxels:
+                if traxel.conflictingTraxelIds is not None:
+                    if self.withTracklets:
+                        getLogger().error("Exclusion constraints do not work with tracklets yet!")
+
+                    conflictingIds = findUuids(traxel.Timestep, traxel.conflictingTraxelIds)
+                    myId = findUuids(traxel.Timestep, [traxel.Id])[0]
+                    for ci in conflictingIds:
+                        # insert pairwise exclusion constraints only, and always put the lower id first
+                        exclusion = (min(ci, myId), max(ci, myId))
+                        if exclusion not in exclusions:
+                            exclusions.add(exclusion)
+                            yield list(exclusion)
+
+        return {
+            'segmentationHypotheses':iterHypotheses(
+                nodes,
+                self._getNodeAttributes,
+                ['id', 'features', 'appearanceFeatures', 'disappearanceFeatures', 'divisionFeatures', 'timestep'],
+                requiredNodeAttribs,
+                'Cannot use graph nodes without assigned ID and features, run insertEnergies() first'),
+            'linkingHypotheses':iterHypotheses(
+                edges,
+                self._getEdgeAttributes,
+                ['src', 'dest', 'features'],
+                requiredLinkAttribs,
+                'Cannot use graph links without source, target, and features, run insertEnergies() first'),
             'divisionHypotheses':[],
-            'traxelToUniqueId':traxelIdPerTimestepToUniqueIdMap,
+            'traxelToUniqueId':hytra.core.jsongraph.StreamedDict(traxelIndex.iterTraxelToUniqueIdItems()),
+            'exclusions':iterExclusions(),
             'settings':{'statesShareWeights':True,
                         'allowPartialMergerAppearance':False,
                         'requireSeparateChildrenOfDivision':True,
@@ -449,61 +829,76 @@ class HypothesesGraph(object):
                        }
             }
 
-        # extract exclusion sets:
-        exclusions = set([])
-        for n in self._graph.nodes_iter():
-            if self.withTracklets:
-                traxel = self._graph.node[n]['tracklet'][0]
-            else:
-                traxel = self._graph.node[n]['traxel']
-            
-            if traxel.conflictingTraxelIds is not None:
-                if self.withTracklets:
-                    getLogger().error("Exclusion constraints do not work with tracklets yet!")
-                
-                conflictingIds = [traxelIdPerTimestepToUniqueIdMap[str(traxel.Timestep)][str(i)] for i in traxel.conflictingTraxelIds]
-                myId = traxelIdPerTimestepToUniqueIdMap[str(traxel.Timestep)][str(traxel.Id)]
-                for ci in conflictingIds:
-                    # insert pairwise exclusion constraints only, and always put the lower id first
-                    if ci < myId:
-                        exclusions.add((ci, myId))
-                    else:
-                        exclusions.add((myId, ci))
+    def toTrackingGraph(self, noFeatures=False):
+        '''
+        Create a dictionary representation of this graph which can be passed to the solvers directly.
+        The resulting graph (=model) is wrapped within a `hytra.jsongraph.JsonTrackingGraph` structure for convenience.
+        If `noFeatures` is `True`, then only the structure of the graph will be exported.
 
-        model['exclusions'] = [list(t) for t in exclusions]
+        Use `writeTrackingGraph` to save the model to JSON without building it in memory.
+        '''
+        model = self._getTrackingGraphModel(noFeatures)
+        model['segmentationHypotheses'] = list(model['segmentationHypotheses'])
+        model['linkingHypotheses'] = list(model['linkingHypotheses'])
+        model['traxelToUniqueId'] = dict(model['traxelToUniqueId'].items)
+        model['exclusions'] = list(model['exclusions'])
 
         # TODO: this recomputes the uuidToTraxelMap even though we have it already...
         trackingGraph = hytra.core.jsongraph.JsonTrackingGraph(model=model)
         return trackingGraph
 
+    def writeTrackingGraph(self, filename, noFeatures=False, compact=False):
+        '''
+        Write the dictionary representation of this graph (see `toTrackingGraph`) to a JSON file,
+        streaming detections, links and exclusions to disk while they are created.
+        With `compact=True` the JSON file is written without indentation and whitespace.
+        If the filename ends with `.h5` or `.hdf5`, the binary format of `hytra.core.hdf5graph` is used instead.
+        '''
+        hytra.core.jsongraph.writeToFile(filename, self._getTrackingGraphModel(noFeatures), compact=compact)
+
     def insertSolution(self, resultDictionary):
         '''
         Add solution values to nodes and arcs from dictionary representation of solution.
         The resulting graph (=model) gets an additional property "value" that represents the number of objects inside a detection/arc
         Additionally a division indicator is saved in the node property "divisionValue".
         '''
-        _, uuidToTraxelMap = self.getMappingsBetweenUUIDsAndTraxels()
+        traxelIndex = self.getTraxelIndex()
 
         if self.withTracklets:
             traxelgraph = self.referenceTraxelGraph
         else:
             traxelgraph = self
 
-        for detection in resultDictionary["detectionResults"]:
-            traxels = uuidToTraxelMap[detection["id"]]
-            for traxel in traxels:
-                traxelgraph._graph.node[traxel]['value'] = detection["value"]
-            for internal_edge in zip(traxels,traxels[1:]):
-                traxelgraph._graph.edge[internal_edge[0]][internal_edge[1]]['value'] = detection["value"]
-
-        if "linkingResults" in resultDictionary and resultDictionary["linkingResults"] is not None: 
-            for link in resultDictionary["linkingResults"]:
-                source, dest = uuidToTraxelMap[link["src"]][-1], uuidToTraxelMap[link["dest"]][0]
-                traxelgraph._graph.edge[source][dest]['value'] = link["value"]
-
-        if "divisionResults" in resultDictionary and resultDictionary["divisionResults"] is not None:
-            for division in resultDictionary["divisionResults"]:
-                traxelgraph._graph.node[uuidToTraxelMap[division["id"]][-1]]['divisionValue'] = division["value"]
+        def toTraxels(timesteps, traxelIds):
+            return zip(timesteps.tolist(), traxelIds.tolist())
+
+        detections = resultDictionary["detectionResults"]
+        if len(detections) > 0:
+            values = [detection["value"] for detection in detections]
+            timesteps, traxelIds, counts = traxelIndex.traxelsOf([detection["id"] for detection in detections])
+            traxels = toTraxels(timesteps, traxelIds)
+            detectionOfTraxel = np.repeat(np.arange(len(detections)), counts)
+            traxelgraph._setNodeAttributes(traxels, 'value', [values[d] for d in detectionOfTraxel.tolist()])
+
+            # arcs between consecutive traxels of the same tracklet
+            internal = np.flatnonzero(detectionOfTraxel[1:] == detectionOfTraxel[:-1])
+            traxelgraph._setEdgeAttributes([(traxels[i], traxels[i + 1]) for i in internal.tolist()],
+                                           'value',
+                                           [values[d] for d in detectionOfTraxel[internal].tolist()])
+
+        if "linkingResults" in resultDictionary and resultDictionary["linkingResults"] is not None \
+                and len(resultDictionary["linkingResults"]) > 0:
+            links = resultDictionary["linkingResults"]
+            sources = toTraxels(*traxelIndex.lastTraxelOf([link["src"] for link in links]))
+            targets = toTraxels(*traxelIndex.firstTraxelOf([link["dest"] for link in links]))
+            traxelgraph._setEdgeAttributes(zip(sources, targets), 'value', [link["value"] for link in links])
+
+        if "divisionResults" in resultDictionary and resultDictionary["divisionResults"] is not None \
+                and len(resultDictionary["divisionResults"]) > 0:
+            divisions = resultDictionary["divisionResults"]
+            traxelgraph._setNodeAttributes(toTraxels(*traxelIndex.lastTraxelOf([division["id"] for division in divisions])),
+                                           'divisionValue',
+                                           [division["value"] for division in divisions])
 
     def getSolutionDictionary(self):
         '''
@@ -547,6 +942,117 @@ class HypothesesGraph(object):
 
         return resultDictionary
 
+    def _getSolutionValues(self, nodes, arcs):
+        '''
+        **returns** the values of the given nodes and arcs in the inserted solution (0 if there is none),
+        which are looked up in the `referenceTraxelGraph` for tracklet graphs
+        '''
+        if self.withTracklets:
+            trackletNodes = list(set(nodes) | set(n for arc in arcs for n in arc))
+            tracklets = self._getNodeAttributes(trackletNodes, 'tracklet')
+            firstTraxel = dict((n, (t[0].Timestep, t[0].Id)) for n, t in itertools.izip(trackletNodes, tracklets))
+            lastTraxel = dict((n, (t[-1].Timestep, t[-1].Id)) for n, t in itertools.izip(trackletNodes, tracklets))
+            traxelgraph = self.referenceTraxelGraph
+            nodes = [firstTraxel[n] for n in nodes]
+            arcs = [(lastTraxel[u], firstTraxel[v]) for u, v in arcs]
+        else:
+            traxelgraph = self
+        nodeValues = [v or 0 for v in traxelgraph._getNodeAttributes(nodes, 'value', 0)]
+        arcValues = [v or 0 for v in traxelgraph._getEdgeAttributes(arcs, 'value', 0)]
+        return nodeValues, arcValues
+
+    def retrack(self, weights, modifiedNodes, modifiedArcs=(), numFrames=2, solver=None, convexify=None,
+                updateLineage=True):
+        '''
+        Track again after a few nodes or arcs were modified (e.g. their energies were corrected by a curator),
+        without solving the whole graph again. Only the nodes that are at most `numFrames` arcs away from the
+        modified ones are solved again, the rest of the inserted solution is kept fixed.
+        See `hytra.core.incrementaltracking` for details.
+
+        **Parameters:**
+
+        * `weights`: weight dictionary to use for solving
+        * `modifiedNodes`: list of the modified nodes, e.g. `[(timestep, id)]`
+        * `modifiedArcs`: list of the modified arcs, e.g. `[((timestep, id), (timestep + 1, id))]`
+        * `numFrames`: size of the neighborhood of the modified nodes and arcs that is solved again
+        * `solver`: function that solves a model with given weights,
+          defaults to `hytra.core.slidingwindowtracking.flowSolver`
+        * `convexify`: convexify the costs of the affected region, which the flow solver needs.
+          Defaults to `True` for the flow solver and to `False` for custom solvers
+        * `updateLineage`: recompute the lineages of the affected nodes if `computeLineage` was run before
+
+        **returns** the list of affected nodes
+        '''
+        import hytra.core.incrementaltracking as incrementaltracking
+        solver, convexify = incrementaltracking.resolveSolver(solver, convexify)
+
+        seeds = list(modifiedNodes) + [n for arc in modifiedArcs for n in arc]
+
+        def neighborsOf(n):
+            # conflicting detections are neighbors as well, such that their exclusion can be resolved either way
+            conflicts = []
+            if not self.withTracklets:
+                conflicts = [(n[0], c) for c in self._graph.node[n]['traxel'].conflictingTraxelIds or []
+                             if self.hasNode((n[0], c))]
+            return itertools.chain(self._graph.predecessors_iter(n), self._graph.successors_iter(n), conflicts)
+
+        region = incrementaltracking.findRegion([n for n in seeds if self.hasNode(n)], neighborsOf, numFrames)
+        if len(region) == 0:
+            return []
+        nodes = list(region)
+        uuids = self._getNodeAttributes(nodes, 'id')
+        uuidOfNode = dict(itertools.izip(nodes, uuids))
+
+        innerArcs = [(u, v) for u, v in self._graph.out_edges(nodes) if v in region]
+        boundaryArcs = [(u, v) for u, v in self._graph.out_edges(nodes) if v not in region] + \
+                       [(u, v) for u, v in self._graph.in_edges(nodes) if u not in region]
+        _, boundaryValues = self._getSolutionValues([], boundaryArcs)
+        boundaryLinks = [(uuidOfNode[v], True, value) if v in region else (uuidOfNode[u], False, value)
+                         for (u, v), value in itertools.izip(boundaryArcs, boundaryValues)]
+
+        missing = object()
+        detections = [{'id': uuid} for uuid in uuids]
+        for key in ['features', 'appearanceFeatures', 'disappearanceFeatures', 'divisionFeatures']:
+            for detection, value in itertools.izip(detections, self._getNodeAttributes(nodes, key, missing)):
+                if value is not missing:
+                    detection[key] = value
+        links = [{'src': uuidOfNode[u], 'dest': uuidOfNode[v], 'features': features}
+                 for (u, v), features in itertools.izip(innerArcs, self._getEdgeAttributes(innerArcs, 'features'))]
+
+        # conflicts with active traxels outside of the region prevent detections inside
+        exclusions = set()
+        forcedInactive = set()
+        if not self.withTracklets:
+            for n, traxel in itertools.izip(nodes, self._getNodeAttributes(nodes, 'traxel')):
+                conflicts = [(n[0], c) for c in traxel.conflictingTraxelIds or [] if self.hasNode((n[0], c))]
+                outside = [c for c in conflicts if c not in region]
+                if any(value > 0 for value in self._getSolutionValues(outside, [])[0]):
+                    forcedInactive.add(uuidOfNode[n])
+                for c in conflicts:
+                    if c in region:
+                        exclusions.add((min(uuidOfNode[n], uuidOfNode[c]), max(uuidOfNode[n], uuidOfNode[c])))
+
+        getLogger().debug("Re-tracking {} of {} nodes".format(len(nodes), self.countNodes()))
+        previousValues = self._getSolutionValues(nodes, innerArcs)
+        regionResult = incrementaltracking.solveRegion(solver, weights, detections, links, boundaryLinks,
+                                                       sorted(exclusions), forcedInactive, None, convexify)
+        self.insertSolution(regionResult)
+
+        if updateLineage:
+            # only lineages that contain nodes or arcs whose value changed need new ids
+            nodeValues, arcValues = self._getSolutionValues(nodes, innerArcs)
+            changed = set(n for n, old, new in itertools.izip(nodes, previousValues[0], nodeValues) if old != new)
+            changed.update(n for arc, old, new in itertools.izip(innerArcs, previousValues[1], arcValues)
+                           if old != new for n in arc)
+            changed = list(changed)
+            traxelgraph = self.referenceTraxelGraph if self.withTracklets else self
+            if self.withTracklets:
+                changed = [(t.Timestep, t.Id) for tracklet in self._getNodeAttributes(changed, 'tracklet')
+                           for t in tracklet]
+            if len(changed) > 0 and 'lineageId' in traxelgraph._graph.node[changed[0]]:
+                self.updateLineage(changed)
+        return nodes
+
     def countIncomingObjects(self, node):
         '''
         Once a solution was written to the graph, this returns the number of
@@ -578,76 +1084,175 @@ class HypothesesGraph(object):
     def computeLineage(self, firstTrackId=2, firstLineageId=2):
         """
         computes lineage and track id for every node in the graph
-        """
 
-        update_queue = []
-        # start lineages / tracks at 2, because 0 means background=black, 1 means misdetection in ilastik
-        max_lineage_id = firstLineageId
-        max_track_id = firstTrackId
+        Tracks start at active nodes without incoming objects that have outgoing objects (we do not allow
+        tracks of length 1 for now). Starting from there, the lineage and track IDs are propagated along
+        active arcs (`value > 0`), and every division starts a new track for each of its children.
+        Nodes that are not part of any track get `None` as lineage and track ID.
 
+        The active arcs are extracted once as arrays, so that the propagation only needs to walk integer
+        node indices: chains of nodes with a single active outgoing arc are followed directly, and only
+        divisions and mergers splitting up are put on the stack.
+        """
+        # start lineages / tracks at 2, because 0 means background=black, 1 means misdetection in ilastik
         if self.withTracklets:
             traxelgraph = self.referenceTraxelGraph
         else:
             traxelgraph = self
 
-        # find start of lineages
-        for n in traxelgraph.nodeIterator():
-            if traxelgraph.countIncomingObjects(n)[0] == 0 \
-                and 'value' in traxelgraph._graph.node[n] \
-                and traxelgraph._graph.node[n]['value'] > 0 \
-                and traxelgraph.countOutgoingObjects(n)[0] > 0: # we do not allow tracks of length 1 for now
-                # found start of a track
-                update_queue.append((n,max_lineage_id,max_track_id))
-                max_lineage_id += 1
-                max_track_id   += 1
-            else:
-                traxelgraph._graph.node[n]["lineageId"] = None
-                traxelgraph._graph.node[n]["trackId"] = None
-
-
-        while len(update_queue) > 0:
-            current_node,lineage_id,track_id = update_queue.pop()
+        nodes = list(traxelgraph.nodeIterator())
+        nodeIndices = dict(itertools.izip(nodes, itertools.count()))
+        if isinstance(traxelgraph._graph, CompactDiGraph):
+            arcs = list(traxelgraph.arcIterator())
+            arcValues = traxelgraph._getEdgeAttributes(arcs, 'value', None)
+            sources = [nodeIndices[u] for u, _ in arcs]
+            targets = [nodeIndices[v] for _, v in arcs]
+        else:
+            # a single pass over the adjacency dictionaries
+            sources, targets, arcValues = [], [], []
+            for u, neighbors in traxelgraph._graph.adjacency_iter():
+                sourceIndex = nodeIndices[u]
+                for v, data in neighbors.iteritems():
+                    sources.append(sourceIndex)
+                    targets.append(nodeIndices[v])
+                    arcValues.append(data.get('value', None))
+        self._propagateLineage(traxelgraph, nodes, sources, targets, arcValues, firstTrackId, firstLineageId)
+
+    def updateLineage(self, nodes):
+        """
+        Recompute lineage and track ids after the solution of the given nodes (of the traxel graph) has changed,
+        e.g. by `retrack`, without touching the lineages that contain none of them. Requires `computeLineage` first.
 
-            # if we did not run merger resolving, it can happen that we reach a node several times,
-            # and would propagate the new lineage+track IDs to all descendants again! We simply
-            # stop propagating in that case and just use the lineageID that reached the node first.
-            if traxelgraph._graph.node[current_node].get("lineageId", None) is not None and \
-                traxelgraph._graph.node[current_node].get("trackId", None) is not None:
-                getLogger().debug("Several tracks are merging here, stopping a later one")
+        The affected lineages are all lineages of the given nodes, extended along active arcs of the new solution.
+        They get new lineage and track ids, which are larger than all ids that were used so far.
+        """
+        if self.withTracklets:
+            traxelgraph = self.referenceTraxelGraph
+        else:
+            traxelgraph = self
+        graph = traxelgraph._graph
+
+        allNodes = list(traxelgraph.nodeIterator())
+        lineageIds = traxelgraph._getNodeAttributes(allNodes, 'lineageId', None)
+        trackIds = traxelgraph._getNodeAttributes(allNodes, 'trackId', None)
+        lineageOfNode = dict(itertools.izip(allNodes, lineageIds))
+        nodesOfLineage = {}
+        for n, lineageId in itertools.izip(allNodes, lineageIds):
+            if lineageId is not None:
+                nodesOfLineage.setdefault(lineageId, []).append(n)
+
+        affectedNodes = set()
+        affectedLineages = set()
+        stack = list(nodes)
+        while len(stack) > 0:
+            n = stack.pop()
+            if n in affectedNodes:
                 continue
-
-            # set a new trackID
-            traxelgraph._graph.node[current_node]["lineageId"] = lineage_id
-            traxelgraph._graph.node[current_node]["trackId"] = track_id
-
-            numberOfOutgoingObject, numberOfOutgoingEdges = traxelgraph.countOutgoingObjects(current_node)
-            
-            if (numberOfOutgoingObject != numberOfOutgoingEdges):
-                getLogger().warning("running lineage computation on unresolved graphs depends on a race condition")
-
-            if 'divisionValue' in traxelgraph._graph.node[current_node] and traxelgraph._graph.node[current_node]['divisionValue']:
-                assert(traxelgraph.countOutgoingObjects(current_node)[1] == 2)
-                traxelgraph._graph.node[current_node]['children'] = []
-                for a in traxelgraph._graph.out_edges(current_node):
-                    if 'value' in traxelgraph._graph.edge[current_node][a[1]] and \
-                     traxelgraph._graph.edge[current_node][a[1]]['value'] > 0:
-                        traxelgraph._graph.node[current_node]['children'].append(a[1])
-                        traxelgraph._graph.node[a[1]]['parent'] = current_node
-                        update_queue.append((traxelgraph.target(a),
-                                            lineage_id,
-                                            max_track_id))
-                        max_track_id += 1
-            else:
-                if traxelgraph.countOutgoingObjects(current_node)[1] > 1:
-                    getLogger().debug('Found merger splitting into several objects, propagating lineage and track to all descendants!')
-
-                for a in traxelgraph._graph.out_edges(current_node): 
-                    if 'value' in traxelgraph._graph.edge[current_node][a[1]] and \
-                     traxelgraph._graph.edge[current_node][a[1]]['value'] > 0:
-                        update_queue.append((traxelgraph.target(a),
-                                            lineage_id,
-                                            track_id))
-                
+            affectedNodes.add(n)
+            lineageId = lineageOfNode.get(n, None)
+            if lineageId is not None and lineageId not in affectedLineages:
+                affectedLineages.add(lineageId)
+                stack.extend(nodesOfLineage[lineageId])
+            for u, v in itertools.chain(graph.in_edges(n), graph.out_edges(n)):
+                if graph.edge[u][v].get('value', 0) > 0:
+                    stack.append(v if u == n else u)
+
+        nodes = list(affectedNodes)
+        for n in nodes:
+            for key in ['children', 'parent']:
+                if key in graph.node[n]:
+                    del graph.node[n][key]
+        arcs = [(u, v) for u, v in graph.out_edges(nodes) if v in affectedNodes]
+        nodeIndices = dict(itertools.izip(nodes, itertools.count()))
+        firstLineageId = max([l for l in lineageIds if l is not None] + [1]) + 1
+        firstTrackId = max([t for t in trackIds if t is not None] + [1]) + 1
+        self._propagateLineage(traxelgraph,
+                               nodes,
+                               [nodeIndices[u] for u, _ in arcs],
+                               [nodeIndices[v] for _, v in arcs],
+                               traxelgraph._getEdgeAttributes(arcs, 'value', None),
+                               firstTrackId,
+                               firstLineageId)
+        getLogger().debug("Updated {} lineages with {} nodes".format(len(affectedLineages), len(nodes)))
+
+    def _propagateLineage(self, traxelgraph, nodes, sources, targets, arcValues, firstTrackId, firstLineageId):
+        """
+        Assign lineage and track ids to the given `nodes` of the `traxelgraph`, see `computeLineage`,
+        where the arcs between them are given by the indices of their `sources` and `targets` in `nodes`.
+        """
+        numNodes = len(nodes)
+        sources = np.array(sources, dtype=np.int64)
+        targets = np.array(targets, dtype=np.int64)
+
+        # every arc that has a value counts for the incoming objects, only active ones for the outgoing objects
+        hasValue = np.array([v is not None for v in arcValues], dtype=bool)
+        arcValues = np.array([0 if v is None else v for v in arcValues], dtype=np.float64)
+        active = np.logical_and(hasValue, arcValues > 0)
+        numIncomingObjects = np.bincount(targets[hasValue], weights=arcValues[hasValue], minlength=numNodes)
+        numOutgoingObjects = np.bincount(sources[active], weights=arcValues[active], minlength=numNodes)
+        numOutgoingArcs = np.bincount(sources[active], minlength=numNodes)
+
+        # active successors of every node in CSR format, in the order of the node's out edges
+        activeSources = sources[active]
+        order = np.argsort(activeSources, kind='mergesort')
+        successors = targets[active][order].tolist()
+        successorPointers = np.concatenate([[0], np.cumsum(numOutgoingArcs)]).tolist()
+
+        nodeValues = np.array([0 if v is None else v for v in traxelgraph._getNodeAttributes(nodes, 'value', None)])
+        isDivision = [bool(v) for v in traxelgraph._getNodeAttributes(nodes, 'divisionValue', False)]
+        isStart = np.logical_and.reduce([numIncomingObjects == 0, nodeValues > 0, numOutgoingObjects > 0])
+        starts = np.flatnonzero(isStart)
+
+        lineageIds = [None] * numNodes
+        trackIds = [None] * numNodes
+        updateStack = zip(starts.tolist(),
+                          range(firstLineageId, firstLineageId + len(starts)),
+                          range(firstTrackId, firstTrackId + len(starts)))
+        maxTrackId = firstTrackId + len(starts)
+        numSkippedNodes = 0
+        divisions = []
+
+        while len(updateStack) > 0:
+            currentNode, lineageId, trackId = updateStack.pop()
+            while True:
+                # if we did not run merger resolving, it can happen that we reach a node several times,
+                # and would propagate the new lineage+track IDs to all descendants again! We simply
+                # stop propagating in that case and just use the lineageID that reached the node first.
+                if trackIds[currentNode] is not None:
+                    numSkippedNodes += 1
+                    break
+
+                lineageIds[currentNode] = lineageId
+                trackIds[currentNode] = trackId
+                begin = successorPointers[currentNode]
+                end = successorPointers[currentNode + 1]
+
+                if isDivision[currentNode]:
+                    assert(end - begin == 2)
+                    divisions.append((currentNode, successors[begin:end]))
+                    for child in successors[begin:end]:
+                        updateStack.append((child, lineageId, maxTrackId))
+                        maxTrackId += 1
+                    break
+                elif end - begin == 1:
+                    # continue along the chain, as the only successor would be popped right away anyway
+                    currentNode = successors[begin]
+                else:
+                    updateStack.extend((child, lineageId, trackId) for child in successors[begin:end])
+                    break
+
+        if numSkippedNodes > 0:
+            getLogger().debug("Several tracks are merging at {} nodes, stopped the later ones".format(numSkippedNodes))
+        reached = np.array([t is not None for t in trackIds], dtype=bool)
+        if np.any(numOutgoingObjects[reached] != numOutgoingArcs[reached]):
+            getLogger().warning("running lineage computation on unresolved graphs depends on a race condition")
+
+        traxelgraph._setNodeAttributes(nodes, 'lineageId', lineageIds)
+        traxelgraph._setNodeAttributes(nodes, 'trackId', trackIds)
+        for parent, children in divisions:
+            traxelgraph._graph.node[nodes[parent]]['children'] = [nodes[c] for c in children]
+            for c in children:
+                traxelgraph._graph.node[nodes[c]]['parent'] = nodes[parent]
 
     def pruneGraphToSolution(self, distanceToSolution=0):
         '''
@@ -657,7 +1262,7 @@ class HypothesesGraph(object):
         distanceToSolution = 0: only include negative edges that connect used objects
         distanceToSolution = 1: additionally include edges that connect used objects with unlabeled objects
         '''
-        prunedGraph = HypothesesGraph()
+        prunedGraph = HypothesesGraph(compactGraph=isinstance(self._graph, CompactDiGraph))
         for n in self.nodeIterator():
             if 'value' in self._graph.node[n] and self._graph.node[n]['value'] > 0:
                 prunedGraph._graph.add_node(n,**self._graph.node[n])
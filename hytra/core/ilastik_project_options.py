@@ -23,6 +23,7 @@ class IlastikProjectOptions:
         self.rawImageAxes = None
         self.imageProviderName = 'LocalImageLoader'
         self.featureSerializerName = 'LocalFeatureSerializer'
+        self.featureCacheFilename = None  # set to a HDF5 filename to cache region features across runs
         self.sizeFilter = None  # set to tuple with min,max pixel count
 
 def extractWeightDictFromIlastikProject(ilpFilename):
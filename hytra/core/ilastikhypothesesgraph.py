@@ -1,6 +1,6 @@
 import logging
 import numpy as np
-from hytra.core.hypothesesgraph import HypothesesGraph, getTraxelFeatureVector, negLog, listify
+from hytra.core.hypothesesgraph import HypothesesGraph, getTraxelFeatureVector, getTraxelFeatureMatrix, negLog, listify
 import hytra.core.jsongraph
 from hytra.util.progressbar import ProgressBar
 
@@ -24,11 +24,12 @@ class IlastikHypothesesGraph(HypothesesGraph):
                  borderAwareWidth=10,
                  maxNeighborDistance=200,
                  transitionParameter=5.0,
-                 transitionClassifier=None):
+                 transitionClassifier=None,
+                 compactGraph=None):
         '''
         Constructor
         '''
-        super(IlastikHypothesesGraph, self).__init__()
+        super(IlastikHypothesesGraph, self).__init__(compactGraph=compactGraph)
 
         # store values
         self.probabilityGenerator = probabilityGenerator
@@ -57,28 +58,25 @@ class IlastikHypothesesGraph(HypothesesGraph):
 
         See the documentation of `hytra.core.hypothesesgraph` for details on how the features are stored.
         """
-        # define wrapper functions
-        def detectionProbabilityFunc(traxel):
-            return self.getDetectionFeatures(traxel, self.maxNumObjects + 1)
+        # define wrapper functions, which all work on lists of traxels at once
+        def detectionProbabilityFunc(traxels):
+            return self.getDetectionFeaturesForTraxels(traxels, self.maxNumObjects + 1)
 
-        def transitionProbabilityFunc(srcTraxel, destTraxel):
+        def transitionProbabilityFunc(srcTraxels, destTraxels):
             if self.transitionClassifier is None:
-                return self.getTransitionFeaturesDist(srcTraxel, destTraxel, self.transitionParameter, self.maxNumObjects + 1)
+                return self.getTransitionFeaturesDistForTraxels(srcTraxels, destTraxels, self.transitionParameter, self.maxNumObjects + 1)
             else:
-                return self.getTransitionFeaturesRF(srcTraxel, destTraxel, self.transitionClassifier, self.probabilityGenerator, self.maxNumObjects + 1)
-
-        def boundaryCostMultiplierFunc(traxel):
-            return self.getBoundaryCostMultiplier(traxel, self.fieldOfView, self.borderAwareWidth, self.timeRange[0], self.timeRange[-1])
-
-        def divisionProbabilityFunc(traxel):
-            try:
-                divisionFeatures = self.getDivisionFeatures(traxel)
-                if divisionFeatures[0] > self.divisionThreshold:
-                    divisionFeatures = list(reversed(divisionFeatures))
-                else:
-                    divisionFeatures = None
-            except:
-                divisionFeatures = None
+                return self.getTransitionFeaturesRFForTraxels(srcTraxels, destTraxels, self.transitionClassifier, self.probabilityGenerator, self.maxNumObjects + 1)
+
+        def boundaryCostMultiplierFunc(traxels):
+            return self.getBoundaryCostMultipliersForTraxels(traxels, self.fieldOfView, self.borderAwareWidth, self.timeRange[0], self.timeRange[-1])
+
+        def divisionProbabilityFunc(traxels):
+            # rows of NaN mean that there is no division hypothesis for this traxel
+            divisionFeatures = self.getDivisionFeaturesForTraxels(traxels)
+            hasDivision = divisionFeatures[:, 0] > self.divisionThreshold
+            divisionFeatures[hasDivision] = divisionFeatures[hasDivision, ::-1]
+            divisionFeatures[np.logical_not(hasDivision)] = np.nan
             return divisionFeatures
 
         super(IlastikHypothesesGraph, self).insertEnergies(
@@ -86,7 +84,8 @@ class IlastikHypothesesGraph(HypothesesGraph):
             detectionProbabilityFunc,
             transitionProbabilityFunc,
             boundaryCostMultiplierFunc,
-            divisionProbabilityFunc)
+            divisionProbabilityFunc,
+            batched=True)
 
     def getDetectionFeatures(self, traxel, max_state):
         """
@@ -123,6 +122,69 @@ class IlastikHypothesesGraph(HypothesesGraph):
         return [probs[0]] + [probs[1]] * (max_state - 1)
 
 
+    def getDetectionFeaturesForTraxels(self, traxels, max_state):
+        """
+        Batched version of `getDetectionFeatures`, returns a matrix with one row per traxel
+        """
+        return getTraxelFeatureMatrix(traxels, "detProb", max_state)
+
+
+    def getDivisionFeaturesForTraxels(self, traxels):
+        """
+        Batched version of `getDivisionFeatures`, returns a matrix with one row `[1.0 - prob, prob]` per traxel.
+        Traxels without a division probability yield a row of `NaN`.
+        """
+        prob = getTraxelFeatureMatrix(traxels, "divProb", 1, missingValue=np.nan)[:, 0]
+        return np.column_stack([1.0 - prob, prob])
+
+
+    def getTransitionFeaturesDistForTraxels(self, traxelsA, traxelsB, transitionParam, max_state):
+        """
+        Batched version of `getTransitionFeaturesDist`, returns a matrix with one row per pair of traxels
+        """
+        dist = np.linalg.norm(self._getTraxelPositions(traxelsA) - self._getTraxelPositions(traxelsB), axis=1)
+        prob = np.exp(-dist / transitionParam)
+        return np.column_stack([1.0 - prob] + [prob] * (max_state - 1))
+
+
+    def getTransitionFeaturesRFForTraxels(self, traxelsA, traxelsB, transitionClassifier, probabilityGenerator, max_state):
+        """
+        Batched version of `getTransitionFeaturesRF`, which builds the feature matrix of all pairs of traxels
+        with the vectorized transition feature plugins and predicts their probabilities with a single call to the classifier
+        """
+        feats = [probabilityGenerator.getStackedTraxelFeatureDict([t.Timestep for t in traxels],
+                                                                  [t.Id for t in traxels],
+                                                                  transitionClassifier.selectedFeatures)
+                 for traxels in [traxelsA, traxelsB]]
+        featMatrix = probabilityGenerator.getTransitionFeatureMatrix(feats[0], feats[1], transitionClassifier.selectedFeatures)
+        probs = transitionClassifier.predictProbabilities(featMatrix)
+        return np.column_stack([probs[:, 0]] + [probs[:, 1]] * (max_state - 1))
+
+
+    def getBoundaryCostMultipliersForTraxels(self, traxels, fov, margin, t0, t1):
+        """
+        Batched version of `getBoundaryCostMultiplier`, returns an array with one multiplier per traxel
+        """
+        timesteps = np.array([t.Timestep for t in traxels])
+        dist = fov.spatial_distances_to_border(self._getTraxelPositions(traxels), False)
+        if margin > 0:
+            multipliers = np.where(dist > margin, 1.0, dist / float(margin))
+        else:
+            multipliers = np.ones(len(traxels))
+        multipliers[(timesteps <= t0) | (timesteps >= t1 - 1)] = 0.0
+        return multipliers
+
+
+    def _getTraxelPositions(self, traxels):
+        """
+        Stack the x,y,z coordinates of the given traxels into a (N,3) matrix, Z is zero for 2D data
+        """
+        positions = getTraxelFeatureMatrix(traxels, "com")
+        if positions.shape[1] < 3:
+            positions = np.hstack([positions, np.zeros((positions.shape[0], 3 - positions.shape[1]))])
+        return positions[:, :3]
+
+
     def getBoundaryCostMultiplier(self, traxel, fov, margin, t0, t1):
         """
         A traxel's appearance and disappearance probability decrease linearly within a `margin` to the image border
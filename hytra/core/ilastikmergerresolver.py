@@ -1,8 +1,10 @@
 import os
 import numpy as np
 import logging
+import threading
 import hytra.core.mergerresolver
 from hytra.core.probabilitygenerator import Traxel
+from hytra.util.objectindex import LabelImageObjectIndex
 
 def getLogger():
     ''' logger to be used in this module '''
@@ -19,12 +21,15 @@ class IlastikMergerResolver(hytra.core.mergerresolver.MergerResolver):
         self.model = trackingGraph.model
         self.result = hypothesesGraph.getSolutionDictionary()
         self.hypothesesGraph = hypothesesGraph
+        self._objectIndices = {}
+        self._objectIndicesLock = threading.Lock()
         
         # Find mergers in the given model and result
-        traxelIdPerTimestepToUniqueIdMap, uuidToTraxelMap = hytra.core.jsongraph.getMappingsBetweenUUIDsAndTraxels(self.model)
+        traxelIdPerTimestepToUniqueIdMap = self.model['traxelToUniqueId']
         timesteps = [t for t in traxelIdPerTimestepToUniqueIdMap.keys()]
 
-        mergers, detections, links, divisions = hytra.core.jsongraph.getMergersDetectionsLinksDivisions(self.result, uuidToTraxelMap)
+        traxelIndex = hytra.core.jsongraph.getTraxelIndex(self.model)
+        mergers, detections, links, divisions = hytra.core.jsongraph.getMergersDetectionsLinksDivisions(self.result, traxelIndex)
 
         self.mergersPerTimestep = hytra.core.jsongraph.getMergersPerTimestep(mergers, timesteps)
         self.detectionsPerTimestep = hytra.core.jsongraph.getDetectionsPerTimestep(detections, timesteps)
@@ -49,10 +54,11 @@ class IlastikMergerResolver(hytra.core.mergerresolver.MergerResolver):
 
         **Returns** a nested dictionary, indexed first by time, then object Id, containing a list of new segmentIDs per merger
         """
-        traxelIdPerTimestepToUniqueIdMap, uuidToTraxelMap = hytra.core.jsongraph.getMappingsBetweenUUIDsAndTraxels(self.model)
+        traxelIdPerTimestepToUniqueIdMap = self.model['traxelToUniqueId']
+        traxelIndex = hytra.core.jsongraph.getTraxelIndex(self.model)
         timesteps = [t for t in traxelIdPerTimestepToUniqueIdMap.keys()]
 
-        mergers, detections, links, divisions = hytra.core.jsongraph.getMergersDetectionsLinksDivisions(self.result, uuidToTraxelMap)
+        mergers, detections, links, divisions = hytra.core.jsongraph.getMergersDetectionsLinksDivisions(self.result, traxelIndex)
         
         # compute new object features
         objectFeatures = self._computeObjectFeatures(timesteps)
@@ -77,20 +83,9 @@ class IlastikMergerResolver(hytra.core.mergerresolver.MergerResolver):
         #     a) how do we deal with the smaller number of states?
         #        Does it matter as we're done with tracking anyway..?
 
-        def mergerNodeFilter(jsonNode):
-            uuid = int(jsonNode['id'])
-            traxels = uuidToTraxelMap[uuid]
-            return not any(t[1] in self.mergersPerTimestep[str(t[0])] for t in traxels)
+        mergerNodeFilter, mergerLinkFilter = self._getMergerFilters(traxelIndex, mergers)
 
-        def mergerLinkFilter(jsonLink):
-            srcUuid = int(jsonLink['src'])
-            destUuid = int(jsonLink['dest'])
-            srcTraxels = uuidToTraxelMap[srcUuid]
-            destTraxels = uuidToTraxelMap[destUuid]
-            # return True if there was no traxel in either source or target node that was a merger.
-            return not (any(t[1] in self.mergersPerTimestep[str(t[0])] for t in srcTraxels) or any(t[1] in self.mergersPerTimestep[str(t[0])] for t in destTraxels))
-
-        self.model = self._refineModel(uuidToTraxelMap,
+        self.model = self._refineModel(traxelIndex,
                                        traxelIdPerTimestepToUniqueIdMap,
                                        mergerNodeFilter,
                                        mergerLinkFilter)
@@ -112,11 +107,28 @@ class IlastikMergerResolver(hytra.core.mergerresolver.MergerResolver):
 
         return mergerDict
  
-    def getCoordinatesForObjectId(self, coordinatesForObjectIds, labelImage, objectId):
+    def getCoordinatesForObjectId(self, coordinatesForObjectIds, labelImage, objectId, timestep=None):
         '''
         Get coordinate for object IDs in labelImage.
+
+        If the `timestep` of the `labelImage` is given, the objects of the frame are indexed on the first call
+        for this timestep, and all further calls only look up the object in that index. The index is dropped
+        by `fitAndRefineNodesForTimestep`, so the label image must not be modified before.
+        Without a `timestep`, the whole label image is searched for the object.
         '''
-        coordinatesForObjectIds[objectId] = np.transpose(np.vstack(np.where(labelImage == objectId)))
+        if timestep is None:
+            coordinatesForObjectIds[objectId] = np.transpose(np.vstack(np.where(labelImage == objectId)))
+        else:
+            coordinatesForObjectIds[objectId] = self._getObjectIndex(labelImage, timestep).coordinates(objectId)
+
+    def _getObjectIndex(self, labelImage, timestep):
+        '''
+        **returns** the `LabelImageObjectIndex` of the given timestep, which is built from the `labelImage` if needed
+        '''
+        with self._objectIndicesLock:
+            if int(timestep) not in self._objectIndices:
+                self._objectIndices[int(timestep)] = LabelImageObjectIndex(labelImage)
+            return self._objectIndices[int(timestep)]
  
     def fitAndRefineNodesForTimestep(self, coordinatesForObjectIds, timestep):
         '''
@@ -129,6 +141,10 @@ class IlastikMergerResolver(hytra.core.mergerresolver.MergerResolver):
         loading the full volume in _fitAndRefineNodes()
         '''
  
+        # the coordinates of all objects of this frame are known, so its object index is not needed anymore
+        with self._objectIndicesLock:
+            self._objectIndices.pop(int(timestep), None)
+
         # use image provider plugin to load labelimage
         nextObjectId = max(coordinatesForObjectIds.keys()) + 1
  
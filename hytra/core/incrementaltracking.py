@@ -0,0 +1,228 @@
+'''
+Incremental re-tracking after local edits of a tracking model, e.g. when a curator corrected a few links or segments.
+
+Instead of solving the whole movie again, only the detections that are at most `numFrames` links away from the
+modified hypotheses are solved again, while the rest of the previous solution is kept fixed. Every active link between
+this region and the rest of the graph is replaced by a virtual detection that is pinned to the previous value of the
+link, so that exactly as many objects enter and leave the region as before.
+The result of the region is spliced back into the previous solution afterwards,
+see `HypothesesGraph.retrack` and `JsonTrackingGraph.retrack`.
+'''
+
+import itertools
+import logging
+import numpy as np
+from hytra.core.jsongraph import convexifyHypotheses, segmentationFeatureKeys, listify
+from hytra.core.slidingwindowtracking import flowSolver
+
+
+def getLogger():
+    ''' logger to be used in this module '''
+    return logging.getLogger(__name__)
+
+
+def findRegion(seeds, neighborsOf, numFrames):
+    '''
+    **returns** the set of all nodes that are at most `numFrames` links away from one of the `seeds`,
+    where `neighborsOf(node)` yields all predecessors and successors of a node
+    '''
+    region = set(seeds)
+    front = list(region)
+    for _ in range(numFrames):
+        nextFront = []
+        for node in front:
+            for neighbor in neighborsOf(node):
+                if neighbor not in region:
+                    region.add(neighbor)
+                    nextFront.append(neighbor)
+        front = nextFront
+    return region
+
+
+def resolveSolver(solver, convexify):
+    '''
+    **returns** the tuple `(solver, convexify)` to use, where `solver=None` means `flowSolver`,
+    and `convexify=None` means to convexify exactly when the flow solver is used, as it needs convex costs
+    '''
+    if convexify is None:
+        convexify = solver is None or solver is flowSolver
+    if solver is None:
+        solver = flowSolver
+    return solver, convexify
+
+
+def _pinnedFeatures(value, costPerObject, numDimensions):
+    ''' convex feature vector with states `0..value`, whose cost vanishes only in the last state '''
+    return [[costPerObject * (value - k)] + [0.0] * (numDimensions - 1) for k in range(value + 1)]
+
+
+def buildRegionModel(detections, links, boundaryLinks, weights, exclusions=(), settings=None, convexify=False):
+    '''
+    Assemble the model of a region of a tracking graph, whose surroundings are fixed.
+
+    **Parameters:**
+
+    * `detections`: the segmentation hypotheses of all detections of the region
+    * `links`: the linking hypotheses between detections of the region
+    * `boundaryLinks`: `(uuid, incoming, value)` tuples describing the active links between a detection of the region
+      and the rest of the graph, which keep their `value`
+    * `weights`: the weight dictionary the model will be solved with, needed to make the pinned virtual detections
+      more expensive than anything else
+    * `exclusions`: lists of UUIDs of the region that exclude each other
+    * `convexify`: convexify the costs of the region, e.g. for the flow solver
+
+    **returns** the model dictionary
+    '''
+    detections = [dict(d) for d in detections]
+    links = [dict(l) for l in links]
+    if convexify:
+        convexifyHypotheses(detections, 0.000001, keys=segmentationFeatureKeys)
+        convexifyHypotheses(links, 0.000001)
+
+    model = {'segmentationHypotheses': detections,
+             'linkingHypotheses': links,
+             'divisionHypotheses': [],
+             'exclusions': [list(e) for e in exclusions],
+             'settings': settings or {}}
+    boundaryLinks = [b for b in boundaryLinks if b[2] > 0]
+    if len(boundaryLinks) == 0:
+        return model
+
+    # pinning must dominate the weighted energies of all hypotheses of the region
+    numLinkDimensions = len(links[0]['features'][0]) if len(links) > 0 else 1
+    numDetectionDimensions = len(detections[0]['features'][0])
+    weights = np.asarray(weights['weights'], dtype=np.float64)
+    if weights[numLinkDimensions] <= 0:
+        raise ValueError("Detections need a positive weight to fix the boundary of the region")
+    totalEnergy = 0.0
+    for h in itertools.chain(detections, links):
+        for key in ('features',) + segmentationFeatureKeys[1:] + ('divisionFeatures',):
+            if key in h:
+                totalEnergy += np.abs(np.asarray(h[key], dtype=np.float64)).max()
+    costPerObject = (np.abs(weights).max() * totalEnergy + 1.0) / weights[numLinkDimensions]
+
+    nextUuid = max(int(d['id']) for d in detections) + 1
+    for uuid, incoming, value in boundaryLinks:
+        virtual = {'id': nextUuid, 'features': _pinnedFeatures(value, costPerObject, numDetectionDimensions)}
+        link = {'features': [[0.0] * numLinkDimensions for _ in range(value + 1)]}
+        if incoming:
+            virtual['appearanceFeatures'] = listify([0.0] * (value + 1))
+            link['src'], link['dest'] = nextUuid, uuid
+        else:
+            virtual['disappearanceFeatures'] = listify([0.0] * (value + 1))
+            link['src'], link['dest'] = uuid, nextUuid
+        detections.append(virtual)
+        links.append(link)
+        nextUuid += 1
+    return model
+
+
+def solveRegion(solver, weights, detections, links, boundaryLinks, exclusions=(), forcedInactive=(), settings=None,
+                convexify=False):
+    '''
+    Solve a region given as for `buildRegionModel`, where the detections in `forcedInactive` (and their links)
+    are left out, because they are excluded by an active detection outside of the region.
+
+    **returns** a result dictionary with the values of all given detections, links and divisions
+    '''
+    forcedInactive = set(forcedInactive)
+    allowed = lambda uuid: uuid not in forcedInactive
+    model = buildRegionModel([d for d in detections if allowed(d['id'])],
+                             [l for l in links if allowed(l['src']) and allowed(l['dest'])],
+                             [b for b in boundaryLinks if allowed(b[0])],
+                             weights,
+                             [e for e in exclusions if all(allowed(uuid) for uuid in e)],
+                             settings,
+                             convexify)
+    if len(model['segmentationHypotheses']) == 0:
+        regionResult = {'detectionResults': [], 'linkingResults': [], 'divisionResults': None}
+    else:
+        regionResult = solver(model, weights)
+
+    detectionValues = dict((d['id'], d['value']) for d in regionResult['detectionResults'])
+    linkValues = dict(((l['src'], l['dest']), l['value']) for l in regionResult['linkingResults'] or [])
+    result = {'detectionResults': [{'id': d['id'], 'value': detectionValues.get(d['id'], 0)} for d in detections],
+              'linkingResults': [{'src': l['src'], 'dest': l['dest'], 'value': linkValues.get((l['src'], l['dest']), 0)}
+                                 for l in links],
+              'divisionResults': None}
+    if regionResult.get('divisionResults', None) is not None:
+        divisionValues = dict((d['id'], d['value']) for d in regionResult['divisionResults'])
+        result['divisionResults'] = [{'id': d['id'], 'value': divisionValues.get(d['id'], 0)}
+                                     for d in detections if 'divisionFeatures' in d]
+    return result
+
+
+def spliceResult(result, regionResult):
+    '''
+    **returns** a copy of the `result` dictionary, in which the values of all detections, links and divisions
+    of the `regionResult` are replaced (or added)
+    '''
+    def splice(entries, newEntries, key):
+        if newEntries is None:
+            return entries
+        entries = entries or []
+        replaced = dict((key(e), e) for e in newEntries)
+        spliced = [replaced.pop(key(e), e) for e in entries]
+        return spliced + [e for e in newEntries if key(e) in replaced]
+
+    byId = lambda e: e['id']
+    byLink = lambda e: (e['src'], e['dest'])
+    return {'detectionResults': splice(result['detectionResults'], regionResult['detectionResults'], byId),
+            'linkingResults': splice(result.get('linkingResults', None), regionResult['linkingResults'], byLink),
+            'divisionResults': splice(result.get('divisionResults', None), regionResult['divisionResults'], byId)}
+
+
+def retrackModel(model, result, weights, modifiedDetections, modifiedLinks=(), numFrames=2, solver=None,
+                 convexify=None):
+    '''
+    Solve the part of a JSON `model` again that is affected by the given modified detections (UUIDs) and
+    links (`(src, dest)` tuples), keeping the rest of the previous `result` fixed.
+    The region is solved with `solver(model, weights)`, by default with the flow solver, see `resolveSolver`
+    for when its costs are convexified. Pass `convexify=False` only for a solver that handles non-convex costs,
+    or if the model was convexified already.
+
+    **returns** a tuple of the result dictionary of the affected region and the set of its detection UUIDs
+    '''
+    detectionsById = dict((d['id'], d) for d in model['segmentationHypotheses'])
+    neighbors = {}
+    for l in model['linkingHypotheses']:
+        neighbors.setdefault(l['src'], []).append(l['dest'])
+        neighbors.setdefault(l['dest'], []).append(l['src'])
+    # conflicting detections are neighbors as well, such that their exclusion can be resolved either way
+    for exclusion in model.get('exclusions', None) or []:
+        for uuid in exclusion:
+            neighbors.setdefault(uuid, []).extend(other for other in exclusion if other != uuid)
+    seeds = list(modifiedDetections) + [uuid for link in modifiedLinks for uuid in link]
+    region = findRegion([uuid for uuid in seeds if uuid in detectionsById], lambda uuid: neighbors.get(uuid, []),
+                        numFrames)
+
+    detectionValues = dict((d['id'], d['value']) for d in result['detectionResults'])
+    linkValues = dict(((l['src'], l['dest']), l['value']) for l in result.get('linkingResults', None) or [])
+    links = []
+    boundaryLinks = []
+    for l in model['linkingHypotheses']:
+        srcInside = l['src'] in region
+        destInside = l['dest'] in region
+        if srcInside and destInside:
+            links.append(l)
+        elif srcInside or destInside:
+            boundaryLinks.append((l['dest'] if destInside else l['src'], destInside,
+                                  linkValues.get((l['src'], l['dest']), 0)))
+
+    exclusions = []
+    forcedInactive = set()
+    for exclusion in model.get('exclusions', None) or []:
+        inside = [uuid for uuid in exclusion if uuid in region]
+        if len(inside) == 0:
+            continue
+        if any(detectionValues.get(uuid, 0) > 0 for uuid in exclusion if uuid not in region):
+            forcedInactive.update(inside)
+        elif len(inside) > 1:
+            exclusions.append(inside)
+
+    solver, convexify = resolveSolver(solver, convexify)
+    detections = [detectionsById[uuid] for uuid in sorted(region)]
+    getLogger().debug("Re-tracking {} of {} detections".format(len(detections), len(detectionsById)))
+    regionResult = solveRegion(solver, weights, detections, links, boundaryLinks, exclusions, forcedInactive,
+                               model.get('settings', None), convexify)
+    return regionResult, region
@@ -3,10 +3,14 @@ Utilities that help with loading / saving as well as constructing and parsing
 hypotheses graphs stored in our json (or python dictionary) format.
 '''
 
+import collections
+import itertools
 import logging
 import numpy as np
 import commentjson as json
-from hytra.util.progressbar import ProgressBar
+from json import JSONDecoder
+from hytra.core.hdf5graph import isHDF5Filename, readFromHDF5, writeToHDF5
+from hytra.core.traxelindex import TraxelIndex
 
 # ----------------------------------------------------------------------------
 # Utility functions
@@ -15,15 +19,244 @@ def getLogger():
     ''' logger to be used in this module '''
     return logging.getLogger(__name__)
 
-def readFromJSON(filename):
-    ''' Read a dictionary from JSON '''
+def readFromJSON(filename, streaming=False):
+    '''
+    Read a dictionary from JSON.
+
+    If `streaming` is `True`, a `JsonStreamReader` is returned instead, which iterates over the entries of lists
+    (like the hypotheses of a model) without loading the whole file. Comments are only supported if not streaming.
+    '''
+    if streaming:
+        return JsonStreamReader(filename)
     with open(filename, 'r') as f:
         return json.load(f)
 
 def writeToFormattedJSON(filename, dictionary):
     ''' Write a dictionary to JSON, but use proper readable formatting  '''
+    writeToJSON(filename, dictionary, compact=False)
+
+def readFromFile(filename):
+    '''
+    Read a dictionary (model, result or weights) from a JSON file,
+    or from a binary HDF5 file if the filename ends with `.h5` or `.hdf5` (see `hytra.core.hdf5graph`).
+    '''
+    if isHDF5Filename(filename):
+        return readFromHDF5(filename)
+    return readFromJSON(filename)
+
+def writeToFile(filename, dictionary, compact=False):
+    '''
+    Write a dictionary (model, result or weights) to a JSON file, formatted nicely unless `compact` is `True`,
+    or to a binary HDF5 file if the filename ends with `.h5` or `.hdf5` (see `hytra.core.hdf5graph`).
+    Streamed values (see `writeToJSON`) are collected completely before writing HDF5.
+    '''
+    if isHDF5Filename(filename):
+        dictionary = dict(dictionary)
+        for key, value in dictionary.iteritems():
+            if isinstance(value, StreamedDict):
+                dictionary[key] = dict(value.items)
+            elif isinstance(value, collections.Iterator):
+                dictionary[key] = list(value)
+        writeToHDF5(filename, dictionary)
+    else:
+        writeToJSON(filename, dictionary, compact=compact)
+
+class StreamedDict(object):
+    '''
+    Marks an iterable of (key, value) pairs that should be written as JSON object by `writeToJSON`,
+    without building the dictionary in memory.
+    '''
+    def __init__(self, items):
+        self.items = items
+
+def writeToJSON(filename, dictionary, compact=False):
+    '''
+    Write a dictionary to JSON incrementally. Values of the top-level dictionary can be iterators (e.g. generators),
+    which are written as JSON list one element at a time, or `StreamedDict`s, so the complete model never needs to
+    be held in memory. With `compact=False` the output is identical to `writeToFormattedJSON`,
+    `compact=True` writes all without indentation and whitespace, which is much smaller.
+    '''
+    if compact:
+        separators = (',', ':')
+        indent = None
+        newline = ''
+        itemIndent = ''
+    else:
+        separators = (',', ': ')
+        indent = 4
+        newline = '\n'
+        itemIndent = ' ' * 4
+
+    def dumps(value, level):
+        text = json.dumps(value, indent=indent, separators=separators)
+        if indent is not None:
+            text = text.replace('\n', '\n' + itemIndent * level)
+        return text
+
+    def writeSequence(f, openBracket, closeBracket, entries, level):
+        f.write(openBracket)
+        empty = True
+        for entry in entries:
+            f.write(('' if empty else ',') + newline + itemIndent * level + entry)
+            empty = False
+        if not empty:
+            f.write(newline + itemIndent * (level - 1))
+        f.write(closeBracket)
+
+    def topLevelEntries():
+        # streamed values are written to the file directly when the next entry is requested
+        for key, value in dictionary.iteritems():
+            prefix = dumps(key, 1) + separators[1]
+            if isinstance(value, StreamedDict):
+                yield prefix
+                writeSequence(f, '{', '}', (dumps(k, 2) + separators[1] + dumps(v, 2) for k, v in value.items), 2)
+            elif isinstance(value, collections.Iterator):
+                yield prefix
+                writeSequence(f, '[', ']', (dumps(v, 2) for v in value), 2)
+            else:
+                yield prefix + dumps(value, 1)
+
     with open(filename, 'w') as f:
-        json.dump(dictionary, f, indent=4, separators=(',', ': '))
+        writeSequence(f, '{', '}', topLevelEntries(), 1)
+
+class JsonStreamReader(object):
+    '''
+    Read-only dictionary-like access to the top-level entries of a JSON file, which does not load the whole file.
+    Entries that are lists are returned as iterators that parse one element at a time while scanning through the file,
+    all other entries are parsed completely. Every access scans the file from its beginning.
+
+    Example: `for s in JsonStreamReader('model.json')['segmentationHypotheses']: ...`
+    '''
+    def __init__(self, filename, chunkSize=1 << 20):
+        self.filename = filename
+        self.chunkSize = chunkSize
+
+    def _scan(self, f):
+        ''' yield (key, tokenizer) for every top-level entry, with the tokenizer positioned at the start of the value '''
+        tokenizer = _JsonTokenizer(f, self.chunkSize)
+        tokenizer.expect('{')
+        if tokenizer.peek() == '}':
+            return
+        while True:
+            key = tokenizer.readValue()
+            tokenizer.expect(':')
+            yield key, tokenizer
+            if tokenizer.next() == '}':
+                return
+
+    def keys(self):
+        with open(self.filename, 'r') as f:
+            keys = []
+            for key, tokenizer in self._scan(f):
+                keys.append(key)
+                tokenizer.skipValue()
+            return keys
+
+    def __contains__(self, key):
+        return key in self.keys()
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def __getitem__(self, key):
+        f = open(self.filename, 'r')
+        try:
+            for k, tokenizer in self._scan(f):
+                if k != key:
+                    tokenizer.skipValue()
+                elif tokenizer.peek() == '[':
+                    return self._iterList(f, tokenizer)
+                else:
+                    value = tokenizer.readValue()
+                    f.close()
+                    return value
+        except:
+            f.close()
+            raise
+        f.close()
+        raise KeyError(key)
+
+    @staticmethod
+    def _iterList(f, tokenizer):
+        with f:
+            for value in tokenizer.iterList():
+                yield value
+
+class _JsonTokenizer(object):
+    ''' Reads JSON values one at a time from a file, and keeps only a small part of the file in memory '''
+    def __init__(self, f, chunkSize):
+        self.f = f
+        self.chunkSize = chunkSize
+        self.buffer = ''
+        self.pos = 0
+        self.eof = False
+        self.decoder = JSONDecoder()
+
+    def _fill(self):
+        ''' drop the consumed part of the buffer and read (at least as much as is still buffered) from the file '''
+        self.buffer = self.buffer[self.pos:]
+        self.pos = 0
+        data = self.f.read(max(self.chunkSize, len(self.buffer)))
+        if len(data) == 0:
+            self.eof = True
+        self.buffer += data
+
+    def peek(self):
+        ''' **returns** the next non-whitespace character without consuming it, or '' at the end of the file '''
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos] in ' \t\n\r':
+                self.pos += 1
+            if self.pos < len(self.buffer) or self.eof:
+                return self.buffer[self.pos:self.pos + 1]
+            self._fill()
+
+    def next(self):
+        c = self.peek()
+        self.pos += 1
+        return c
+
+    def expect(self, c):
+        if self.next() != c:
+            raise ValueError("Invalid JSON, expected '{}' at position {} in {}".format(c, self.pos, self.f.name))
+
+    def readValue(self):
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.pos)
+                # numbers could continue in the part of the file that was not read yet,
+                # a value is only complete if it is followed by a delimiter
+                if self.eof or (end < len(self.buffer) and self.buffer[end] in ' \t\n\r,]}:'):
+                    self.pos = end
+                    return value
+            except ValueError:
+                if self.eof:
+                    raise
+            self._fill()
+
+    def iterList(self):
+        self.expect('[')
+        if self.peek() == ']':
+            self.next()
+            return
+        while True:
+            yield self.readValue()
+            c = self.next()
+            if c == ']':
+                return
+            elif c != ',':
+                raise ValueError("Invalid JSON, expected ',' or ']' at position {} in {}".format(self.pos, self.f.name))
+
+    def skipValue(self):
+        ''' skip the next value, where lists are skipped element by element '''
+        if self.peek() == '[':
+            for _ in self.iterList():
+                pass
+        else:
+            self.readValue()
 
 def getMappingsBetweenUUIDsAndTraxels(model):
     '''
@@ -31,141 +264,238 @@ def getMappingsBetweenUUIDsAndTraxels(model):
     create a reverse mapping, and return both.
     '''
 
-    # create reverse mapping from json uuid to (timestep,ID)
+    # create reverse mapping from json uuid to (timestep,ID), sorted by timesteps
     traxelIdPerTimestepToUniqueIdMap = model['traxelToUniqueId']
-    timesteps = [t for t in traxelIdPerTimestepToUniqueIdMap.keys()]
-    uuidToTraxelMap = {}
-    for t in timesteps:
-        for i in traxelIdPerTimestepToUniqueIdMap[t].keys():
-            uuid = traxelIdPerTimestepToUniqueIdMap[t][i]
-            if uuid not in uuidToTraxelMap:
-                uuidToTraxelMap[uuid] = []
-            uuidToTraxelMap[uuid].append((int(t), int(i)))
+    uuidToTraxelMap = getTraxelIndex(model).toUuidToTraxelMap()
+    return traxelIdPerTimestepToUniqueIdMap, uuidToTraxelMap
+
+def getTraxelIndex(model):
+    '''
+    **returns** a `hytra.core.traxelindex.TraxelIndex` built from the "traxelToUniqueId" mapping of the model,
+    which can look up the uuids of traxels and the traxels of uuids with array operations.
+    '''
+    return TraxelIndex.fromTraxelToUniqueIdMap(model['traxelToUniqueId'])
 
-    # sort the list of traxels per UUID by their timesteps
-    for v in uuidToTraxelMap.values():
-        v.sort(key=lambda timestepIdTuple: timestepIdTuple[0])
+# structured array types of the events decoded from a result, see `getMergersDetectionsLinksDivisions`
+mergerDtype = np.dtype([('timestep', np.int64), ('id', np.int64), ('count', np.int64)])
+detectionDtype = np.dtype([('timestep', np.int64), ('id', np.int64)])
+linkDtype = np.dtype([('srcTimestep', np.int64), ('src', np.int64), ('timestep', np.int64), ('dest', np.int64)])
 
-    return traxelIdPerTimestepToUniqueIdMap, uuidToTraxelMap
+def _eventArray(dtype, *columns):
+    ''' create a structured array of the given dtype, filled column by column '''
+    events = np.empty(len(columns[0]), dtype=dtype)
+    for name, column in zip(dtype.names, columns):
+        events[name] = column
+    return events
+
+def _traxelKeys(timesteps, ids):
+    return (np.asarray(timesteps, dtype=np.int64) << 32) + np.asarray(ids, dtype=np.int64)
+
+def _timestepRanges(sortedTimesteps):
+    ''' **returns** a dictionary `{timestep: (start, stop)}` of the ranges of each timestep in the sorted array '''
+    uniqueTimesteps, starts, counts = np.unique(sortedTimesteps, return_index=True, return_counts=True)
+    return dict(zip(uniqueTimesteps.tolist(), zip(starts.tolist(), (starts + counts).tolist())))
+
+class EventList(collections.Sequence):
+    '''
+    Read-only list of mergers `(timestep, id, count)`, detections or divisions `(timestep, id)`
+    or links `((srcTimestep, srcId), (timestep, destId))`, backed by the structured numpy array `events`.
+    The python tuples are only created when the list is accessed element-wise.
+    '''
+    def __init__(self, events):
+        self.events = events
+        self._list = None
+
+    def _getList(self):
+        if self._list is None:
+            columns = [self.events[name].tolist() for name in self.events.dtype.names]
+            if self.events.dtype == linkDtype:
+                self._list = zip(zip(columns[0], columns[1]), zip(columns[2], columns[3]))
+            else:
+                self._list = zip(*columns)
+        return self._list
+
+    def __getitem__(self, index):
+        return self._getList()[index]
+
+    def __len__(self):
+        return len(self.events)
+
+    def __iter__(self):
+        return iter(self._getList())
+
+    def __eq__(self, other):
+        return list(self) == list(other)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __repr__(self):
+        return repr(self._getList())
+
+class EventsPerTimestep(collections.Mapping):
+    '''
+    Read-only dictionary `{str(timestep): events}` for all given `timesteps`, backed by the structured numpy array
+    `events` sorted by its `timestep` field. The python container of a timestep is built by `convert` from
+    the respective slice of `events` when it is accessed for the first time.
+    '''
+    def __init__(self, events, timesteps, convert):
+        self._timesteps = list(timesteps)
+        self._timestepSet = set(self._timesteps)
+        events = events[np.in1d(events['timestep'], [int(t) for t in self._timesteps])]
+        self.events = events[np.argsort(events['timestep'], kind='mergesort')]
+        self._ranges = _timestepRanges(self.events['timestep'])
+        self._convert = convert
+        self._cache = {}
+
+    def eventsAt(self, timestep):
+        ''' **returns** the slice of `events` that belongs to the given timestep '''
+        start, stop = self._ranges.get(int(timestep), (0, 0))
+        return self.events[start:stop]
+
+    def __getitem__(self, timestep):
+        if timestep not in self._cache:
+            if timestep not in self._timestepSet:
+                raise KeyError(timestep)
+            self._cache[timestep] = self._convert(self.eventsAt(timestep))
+        return self._cache[timestep]
+
+    def __contains__(self, timestep):
+        return timestep in self._timestepSet
+
+    def __iter__(self):
+        return iter(self._timesteps)
+
+    def __len__(self):
+        return len(self._timesteps)
+
+def getMergersDetectionsLinksDivisions(result, traxelIndex):
+    '''
+    Decode the detections, links and divisions of a result into traxels, using the `traxelIndex`
+    (a `hytra.core.traxelindex.TraxelIndex`, or the `uuidToTraxelMap` dictionary).
+
+    ** Returns: a tuple of `EventList`s **
+
+    * `mergers`: `(timestep, id, count)` of all traxels with a value larger than one
+    * `detections`: `(timestep, id)` of all active traxels
+    * `links`: `((srcTimestep, srcId), (timestep, destId))` of all active links and all links inside tracklets
+    * `divisions`: `(timestep, id)` of all dividing traxels, or `None` if the result contains no divisions
+    '''
+    if not isinstance(traxelIndex, TraxelIndex):
+        traxelIndex = TraxelIndex.fromUuidToTraxelMap(traxelIndex)
+
+    detectionIds = np.array([int(entry['id']) for entry in result['detectionResults']], dtype=np.int64)
+    detectionValues = np.array([entry['value'] for entry in result['detectionResults']], dtype=np.int64)
+
+    active = detectionValues > 1
+    timesteps, ids, counts = traxelIndex.traxelsOf(detectionIds[active])
+    mergers = EventList(_eventArray(mergerDtype, timesteps, ids, np.repeat(detectionValues[active], counts)))
+
+    timesteps, ids, _ = traxelIndex.traxelsOf(detectionIds[detectionValues > 0])
+    detections = EventList(_eventArray(detectionDtype, timesteps, ids))
 
-def getMergersDetectionsLinksDivisions(result, uuidToTraxelMap):
-    # load results and map indices
-    mergers = [timestepIdTuple + (entry['value'],) for entry in result['detectionResults'] if entry['value'] > 1 for timestepIdTuple in uuidToTraxelMap[int(entry['id'])]]
-    detections = [timestepIdTuple for entry in result['detectionResults'] if entry['value'] > 0 for timestepIdTuple in uuidToTraxelMap[int(entry['id'])]]
     if 'divisionResults' in result and result['divisionResults'] is not None:
-        divisions = [uuidToTraxelMap[int(entry['id'])][-1] for entry in result['divisionResults'] if entry['value'] == True]
+        dividing = [int(entry['id']) for entry in result['divisionResults'] if entry['value'] == True]
+        divisions = EventList(_eventArray(detectionDtype, *traxelIndex.lastTraxelOf(dividing)))
     else:
         divisions = None
-    links = [(uuidToTraxelMap[int(entry['src'])][-1], uuidToTraxelMap[int(entry['dest'])][0]) for entry in result['linkingResults'] if entry['value'] > 0]
+
+    activeLinks = [entry for entry in result['linkingResults'] if entry['value'] > 0]
+    srcTimesteps, srcIds = traxelIndex.lastTraxelOf([int(entry['src']) for entry in activeLinks])
+    destTimesteps, destIds = traxelIndex.firstTraxelOf([int(entry['dest']) for entry in activeLinks])
 
     # add all internal links of tracklets
-    for v in uuidToTraxelMap.values():
-        prev = None
-        for timestepIdTuple in v:
-            if prev is not None:
-                links.append((prev, timestepIdTuple))
-            prev = timestepIdTuple
+    internalLinks = traxelIndex.internalLinks()
+    links = EventList(_eventArray(linkDtype,
+                                  np.concatenate([srcTimesteps, internalLinks[0]]),
+                                  np.concatenate([srcIds, internalLinks[1]]),
+                                  np.concatenate([destTimesteps, internalLinks[2]]),
+                                  np.concatenate([destIds, internalLinks[3]])))
 
     return mergers, detections, links, divisions
 
+def _asEventArray(events, dtype):
+    ''' **returns** the structured array of an `EventList`, or converts a list of event tuples '''
+    if isinstance(events, EventList):
+        return events.events
+    if dtype == linkDtype:
+        events = [source + target for source, target in events]
+    return np.array([tuple(e) for e in events], dtype=dtype)
+
+def _asLinkArray(linksPerTimestep, timesteps):
+    ''' **returns** the links of a `linksPerTimestep` dictionary as structured array '''
+    if isinstance(linksPerTimestep, EventsPerTimestep):
+        return linksPerTimestep.events
+    return np.array([(int(t) - 1, a, int(t), b) for t in timesteps for a, b in linksPerTimestep[t]], dtype=linkDtype)
+
+def _asMergerArray(mergersPerTimestep):
+    ''' **returns** the mergers of a `mergersPerTimestep` dictionary as structured array '''
+    if isinstance(mergersPerTimestep, EventsPerTimestep):
+        return mergersPerTimestep.events
+    return np.array([(int(t), idx, count) for t, mergers in mergersPerTimestep.items() for idx, count in mergers.items()],
+                    dtype=mergerDtype)
+
 def getMergersPerTimestep(mergers, timesteps):
     ''' returns mergersPerTimestep = { "<timestep>": {<idx>: <count>, <idx>: <count>, ...}, "<timestep>": {...}, ... } '''
-    
-    '''
-    TODO: We're storing all the mergers in a dict in order to increase speed at the expense of efficiency. 
-    This could certainly be done faster and memory-efficient if we just return the merger dict for all times, without using the timestep loop.
-    '''
-    
-    mergersDict = {} 
-    for time, id, count in mergers:
-        time = str(time)
-        if time in mergersDict:
-            mergersDict[time][id] = count
-        else:
-            mergersDict[time] = {}
-            mergersDict[time][id] = count  
-    
-    mergersPerTimestep = {}       
-    for time in timesteps:
-        if time in mergersDict:
-            mergersPerTimestep[time] = mergersDict[time]
-        else:
-            mergersPerTimestep[time] = {}
-    
-    return mergersPerTimestep
+    return EventsPerTimestep(_asEventArray(mergers, mergerDtype),
+                             timesteps,
+                             lambda events: dict(zip(events['id'].tolist(), events['count'].tolist())))
 
 def getDetectionsPerTimestep(detections, timesteps):
     ''' returns detectionsPerTimestep = { "<timestep>": [<idx>, <idx>, ...], "<timestep>": [...], ...} '''
-    
-    '''
-    TODO: We're storing all the detections in a dict in order to increase speed at the expense of efficiency. 
-    This could certainly be done faster and memory-efficient if we just return the detections dict for all times, without using the timestep loop.
-    '''
-    
-    detectionsDict = {}
-    for time, id in detections:
-        time = str(time)
-        if time in detectionsDict:
-            detectionsDict[time].append(id)
-        else:
-            detectionsDict[time] = [id]
-
-    detectionsPerTimestep = {}
-    for time in timesteps:
-        if time in detectionsDict:
-            detectionsPerTimestep[time] = detectionsDict[time]
-        else:
-            detectionsPerTimestep[time] = []
+    return EventsPerTimestep(_asEventArray(detections, detectionDtype),
+                             timesteps,
+                             lambda events: events['id'].tolist())
 
-    return detectionsPerTimestep
-    
 def getLinksPerTimestep(links, timesteps):
     ''' returns linksPerTimestep = { "<timestep>": [(<idxA> (at previous timestep), <idxB> (at timestep)), (<idxA>, <idxB>), ...], ...} '''
-    
-    '''
-    TODO: We're storing all the links in a dict in order to increase speed at the expense of efficiency. 
-    This could certainly be done faster and memory-efficient if we just return the links dict for all times, without using the timestep loop.
-    '''
-    
-    linksDict = {}
-    for source, target in links:
-        time = str(target[0])
-        if time in linksDict:
-            linksDict[time].append((source[1], target[1]))
-        else:
-            linksDict[time] = [(source[1], target[1])]
-    
-    linksPerTimestep = {}        
-    for time in timesteps:
-        if time in linksDict:
-            linksPerTimestep[time] = linksDict[time]
-        else:
-            linksPerTimestep[time] = []
-    
-    return linksPerTimestep
+    return EventsPerTimestep(_asEventArray(links, linkDtype),
+                             timesteps,
+                             lambda events: zip(events['src'].tolist(), events['dest'].tolist()))
 
 def getMergerLinks(linksPerTimestep, mergersPerTimestep, timesteps):
     """ returns merger links as triplets [("timestep", (sourceIdAtTMinus1, destIdAtT)), (), ...]"""
     # filter links: at least one of the two incident nodes must be a merger 
     # for it to be added to the merger resolving graph
-    mergerLinks = [(t,(a, b)) for t in timesteps for a, b in linksPerTimestep[t] if a in mergersPerTimestep[str(int(t)-1)] or b in mergersPerTimestep[t]]
+    links = _asLinkArray(linksPerTimestep, timesteps)
+    mergers = _asMergerArray(mergersPerTimestep)
+    mergerKeys = _traxelKeys(mergers['timestep'], mergers['id'])
+    isMergerLink = np.in1d(_traxelKeys(links['timestep'] - 1, links['src']), mergerKeys) \
+        | np.in1d(_traxelKeys(links['timestep'], links['dest']), mergerKeys)
+
+    # links are grouped by timestep, keep the order of the given timesteps
+    links = links[isMergerLink]
+    order = np.argsort(links['timestep'], kind='mergesort')
+    sources = links['src'][order].tolist()
+    targets = links['dest'][order].tolist()
+    ranges = _timestepRanges(links['timestep'][order])
+    mergerLinks = []
+    for t in timesteps:
+        start, stop = ranges.get(int(t), (0, 0))
+        mergerLinks.extend((t, link) for link in zip(sources[start:stop], targets[start:stop]))
     return mergerLinks
 
 def getDivisionsPerTimestep(divisions, linksPerTimestep, timesteps):
     ''' returns divisionsPerTimestep = { "<timestep>": {<parentIdx>: [<childIdx>, <childIdx>], ...}, "<timestep>": {...}, ... } '''
+    divisionsPerTimestep = dict([(t, {}) for t in timesteps])
     if divisions is not None:
-        # find children of divisions by looking for the active links
-        divisionsPerTimestep = {}
-        for t in timesteps:
-            divisionsPerTimestep[t] = {}
-            for div_timestep, div_idx in divisions:
-                if div_timestep == int(t) - 1:
-                    # we have an active division of the mother cell "div_idx" in the previous frame
-                    children = [b for a,b in linksPerTimestep[t] if a == div_idx]
-                    assert(len(children) == 2)
-                    divisionsPerTimestep[t][div_idx] = children
-    else:
-        divisionsPerTimestep = dict([(t,{}) for t in timesteps])
+        divisions = _asEventArray(divisions, detectionDtype)
+        timestepKeys = dict([(int(t), t) for t in timesteps])
+        divisions = divisions[np.in1d(divisions['timestep'] + 1, timestepKeys.keys())]
+
+        # find children of divisions by looking for the active links in the next timestep
+        links = _asLinkArray(linksPerTimestep, timesteps)
+        linkKeys = _traxelKeys(links['timestep'], links['src'])
+        order = np.argsort(linkKeys, kind='mergesort')
+        linkKeys = linkKeys[order]
+        children = links['dest'][order].tolist()
+        divisionKeys = _traxelKeys(divisions['timestep'] + 1, divisions['id'])
+        starts = np.searchsorted(linkKeys, divisionKeys, side='left')
+        stops = np.searchsorted(linkKeys, divisionKeys, side='right')
+        assert(np.all(stops - starts == 2))
+
+        for t, idx, start, stop in zip(divisions['timestep'].tolist(), divisions['id'].tolist(), starts.tolist(), stops.tolist()):
+            divisionsPerTimestep[timestepKeys[t + 1]][idx] = children[start:stop]
 
     return divisionsPerTimestep
 
@@ -175,6 +505,12 @@ def negLog(features):
     fa[fa < 0.0000000001] = 0.0000000001
     return list(np.log(fa) * -1.0)
 
+def negLogArray(features):
+    ''' compute the (clamped) negative log of every entry of an array of arbitrary shape, returns a numpy array '''
+    fa = np.array(features, dtype=np.float64)
+    fa[fa < 0.0000000001] = 0.0000000001
+    return np.log(fa) * -1.0
+
 def listify(l):
     ''' put every element of the list in it's own list, and thus extends the depth of nested lists by one '''
     return [[e] for e in l]
@@ -185,37 +521,121 @@ def checkForConvexity(feats):
     for i in range(len(grad) - 1):
         assert(grad[i+1] > grad[i])
 
-def convexify(listOfNumbers, eps):
-    features = np.array(listOfNumbers)
-    if features.shape[1] != 1:
-        raise ValueError('This script can only convexify feature vectors with one feature per state!')
+def areConvex(features):
+    ''' vectorized `checkForConvexity`: **returns** which rows of the 2D array `features` have strictly increasing gradients '''
+    return np.all(np.diff(features, n=2, axis=1) > 0, axis=1)
 
-    # Note from Numpy Docs: In case of multiple occurrences of the minimum values, the indices corresponding to the first occurrence are returned.
-    bestState = np.argmin(features)
-
-    for direction in [-1, 1]:
-        pos = bestState + direction
-        previousGradient = 0
-        while pos >= 0 and pos < features.shape[0]:
-            newGradient = features[pos] - features[pos-direction]
-            if np.abs(newGradient - previousGradient) < eps:
-                # cost function's derivative is roughly constant, add epsilon
-                previousGradient += eps
-                features[pos] = features[pos-direction] + previousGradient
-            elif newGradient < previousGradient:
-                # cost function got too flat, set feature value to match old slope
-                previousGradient += eps
-                features[pos] = features[pos-direction] + previousGradient
-            else:
-                # all good, continue with new slope
-                previousGradient = newGradient
+def _needsConvexification(features, eps):
+    '''
+    **returns** which rows of the 2D array `features` would be changed by `convexifyArray`:
+    all rows whose gradient does not increase by at least `eps` from state to state,
+    or away from the best state (where the gradient starts at 0)
+    '''
+    numStates = features.shape[1]
+    rows = np.arange(features.shape[0])
+    gradients = np.diff(features, axis=1)
+    needed = np.any(np.diff(gradients, axis=1) < eps, axis=1)
+    bestState = np.argmin(features, axis=1)
+    hasRight = bestState < numStates - 1
+    needed[hasRight] |= gradients[rows[hasRight], bestState[hasRight]] < eps
+    hasLeft = bestState > 0
+    needed[hasLeft] |= -gradients[rows[hasLeft], bestState[hasLeft] - 1] < eps
+    return needed
+
+def convexifyArray(features, eps):
+    '''
+    Convexify every row of the 2D float array `features` (one cost vector per row) in place:
+    starting at the best state, walk to both sides and raise every cost that would make the gradient
+    increase by less than `eps` (or decrease), such that it increases by `eps` instead.
+
+    The walk is done for all rows at once, one state after the other. Rows that are already convex
+    (with a margin of `eps`) are skipped.
 
-            pos += direction
+    **returns** the `features` array
+    '''
+    needed = np.flatnonzero(_needsConvexification(features, eps))
+    if len(needed) > 0:
+        costs = features[needed]
+        numRows, numStates = costs.shape
+        rows = np.arange(numRows)
+        # Note from Numpy Docs: In case of multiple occurrences of the minimum values, the indices corresponding to the first occurrence are returned.
+        bestState = np.argmin(costs, axis=1)
+
+        for direction in [-1, 1]:
+            previousGradient = np.zeros(numRows)
+            for step in range(1, numStates):
+                pos = bestState + direction * step
+                valid = np.flatnonzero(np.logical_and(pos >= 0, pos < numStates))
+                if len(valid) == 0:
+                    break
+                pos = pos[valid]
+                previousCosts = costs[valid, pos - direction]
+                newGradient = costs[valid, pos] - previousCosts
+                oldGradient = previousGradient[valid]
+                # cost function's derivative is roughly constant or got too flat, add epsilon to the old slope
+                tooFlat = np.logical_or(np.abs(newGradient - oldGradient) < eps, newGradient < oldGradient)
+                gradient = np.where(tooFlat, oldGradient + eps, newGradient)
+                costs[valid[tooFlat], pos[tooFlat]] = previousCosts[tooFlat] + gradient[tooFlat]
+                previousGradient[valid] = gradient
+        features[needed] = costs
+
+    for row in np.flatnonzero(~areConvex(features)):
+        getLogger().warning("Failed convexifying {}".format(features[row]))
+    return features
+
+def _featureMatrix(listsOfFeatures):
+    ''' stack feature vectors of the form `[[cost], [cost], ...]` into a matrix with one row per vector '''
     try:
-        checkForConvexity(features)
-    except:
-        getLogger().warning("Failed convexifying {}".format(features))
-    return listify(features.flatten())
+        features = np.array(listsOfFeatures, dtype=np.float64)
+    except ValueError:
+        features = None
+    if features is None or features.ndim != 3 or features.shape[2] != 1:
+        raise ValueError('This script can only convexify feature vectors with one feature per state!')
+    return features[:, :, 0]
+
+def convexify(listOfNumbers, eps):
+    ''' convexify a single feature vector of the form `[[cost], [cost], ...]`, see `convexifyArray` '''
+    features = convexifyArray(_featureMatrix([listOfNumbers]), eps)
+    return listify(features[0].tolist())
+
+def convexifyHypotheses(hypotheses, eps, keys=('features',)):
+    '''
+    Convexify the feature vectors stored under the given `keys` of all `hypotheses` (in place!).
+    All vectors with the same number of states are convexified at once with `convexifyArray`.
+    '''
+    for key in keys:
+        hypothesesPerNumStates = {}
+        for h in hypotheses:
+            if key in h:
+                hypothesesPerNumStates.setdefault(len(h[key]), []).append(h)
+
+        for group in hypothesesPerNumStates.itervalues():
+            features = _featureMatrix([h[key] for h in group])
+            convexified = convexifyArray(features.copy(), eps)
+            # only the vectors that changed need to be converted back to lists
+            changed = np.flatnonzero(np.any(convexified != features, axis=1))
+            for i, row in itertools.izip(changed.tolist(), convexified[changed].tolist()):
+                group[i][key] = listify(row)
+    return hypotheses
+
+segmentationFeatureKeys = ('features', 'appearanceFeatures', 'disappearanceFeatures')
+
+def convexifySegmentationHypothesis(seg, epsilon):
+    ''' convexify the detection, appearance and disappearance features of a single detection (in place!) '''
+    for f in segmentationFeatureKeys:
+        if f in seg:
+            try:
+                seg[f] = convexify(seg[f], epsilon)
+            except:
+                getLogger().warning("Convexification failed for feature {} of :{}".format(f, seg))
+                exit(0)
+    # division features are always convex (2 values defines just a line)
+    return seg
+
+def convexifyLinkingHypothesis(link, epsilon):
+    ''' convexify the features of a single link or division hypothesis (in place!) '''
+    link['features'] = convexify(link['features'], epsilon)
+    return link
 
 # ----------------------------------------------------------------------------
 # helper class for graph-dictionaries
@@ -264,15 +684,15 @@ class JsonTrackingGraph(object):
         # load from file if specified
         if model_filename is not None:
             getLogger().debug("Loading model file: " + model_filename)
-            self.model = readFromJSON(model_filename)
+            self.model = readFromFile(model_filename)
 
         if weights_filename is not None:
             getLogger().debug("Loading weights file: " + weights_filename)
-            self.weights = readFromJSON(weights_filename)
+            self.weights = readFromFile(weights_filename)
 
         if result_filename is not None:
             getLogger().debug("Loading result file: " + result_filename)
-            self.result = readFromJSON(result_filename)
+            self.result = readFromFile(result_filename)
 
         # further initializations
         if model is not None or model_filename is not None:
@@ -369,25 +789,46 @@ class JsonTrackingGraph(object):
         else:
             divisionHypotheses = []
 
-        progressBar = ProgressBar(stop=(len(segmentationHypotheses) + len(linkingHypotheses) + len(divisionHypotheses)))
-        for seg in segmentationHypotheses:
-            for f in ['features', 'appearanceFeatures', 'disappearanceFeatures']:
-                if f in seg:
-                    try:
-                        seg[f] = convexify(seg[f], epsilon)
-                    except:
-                        getLogger().warning("Convexification failed for feature {} of :{}".format(f, seg))
-                        exit(0)
-            # division features are always convex (2 values defines just a line)
-            progressBar.show()
-
-        for link in linkingHypotheses:
-            link['features'] = convexify(link['features'], epsilon)
-            progressBar.show()
-
-        for division in divisionHypotheses:
-            division['features'] = convexify(division['features'], epsilon)
-            progressBar.show()
+        # division features are always convex (2 values defines just a line)
+        convexifyHypotheses(segmentationHypotheses, epsilon, keys=segmentationFeatureKeys)
+        convexifyHypotheses(linkingHypotheses, epsilon)
+        convexifyHypotheses(divisionHypotheses, epsilon)
+
+    def writeModel(self, filename, compact=False):
+        '''
+        Write the model to a JSON file incrementally, see `writeToJSON`, or to HDF5 depending on the extension.
+        With `compact=True` no whitespace is used, otherwise the file is formatted like `writeToFormattedJSON`.
+        '''
+        writeToFile(filename, self.model, compact=compact)
+
+    def writeResult(self, filename, compact=False):
+        '''
+        Write the result to a JSON file, or to HDF5 if the filename ends with `.h5` or `.hdf5`.
+        '''
+        writeToFile(filename, self.result, compact=compact)
+
+    def retrack(self, modifiedDetections, modifiedLinks=(), numFrames=2, solver=None, convexify=None):
+        '''
+        Track again after a few detections or links of the model were modified (e.g. by a curator), keeping the
+        previous result fixed outside of the neighborhood of `numFrames` links around the modified hypotheses.
+        The result is updated in place, see `hytra.core.incrementaltracking.retrackModel` for the parameters.
+        The costs of the region are convexified for the default flow solver, pass `convexify=False` to skip that
+        if the model was convexified already.
+
+        **returns** the set of UUIDs of all detections that were solved again
+        '''
+        import hytra.core.incrementaltracking as incrementaltracking
+        assert(self.result is not None and self.weights is not None)
+        regionResult, region = incrementaltracking.retrackModel(self.model,
+                                                                self.result,
+                                                                self.weights,
+                                                                modifiedDetections,
+                                                                modifiedLinks,
+                                                                numFrames,
+                                                                solver,
+                                                                convexify)
+        self.result = incrementaltracking.spliceResult(self.result, regionResult)
+        return region
 
     def toHypothesesGraph(self):
         '''
@@ -23,8 +23,9 @@ class JsonMergerResolver(hytra.core.mergerresolver.MergerResolver):
                  raw_path,
                  raw_axes,
                  pluginPaths=[os.path.abspath('../hytra/plugins')],
-                 verbose=False):
-        super(JsonMergerResolver, self).__init__(pluginPaths, verbose)
+                 verbose=False,
+                 useMultiprocessing=True):
+        super(JsonMergerResolver, self).__init__(pluginPaths, verbose, useMultiprocessing)
 
         # copy model and result because we will modify it here
         assert(isinstance(jsonTrackingGraph, JsonTrackingGraph))
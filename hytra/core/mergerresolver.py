@@ -3,7 +3,9 @@ import itertools
 import os
 import numpy as np
 import networkx as nx
+import concurrent.futures
 from hytra.pluginsystem.plugin_manager import TrackingPluginManager
+from hytra.util.objectindex import LabelImageObjectIndex
 import hytra.core.probabilitygenerator as probabilitygenerator
 import hytra.core.jsongraph
 from hytra.core.jsongraph import negLog, listify, JsonTrackingGraph
@@ -13,6 +15,45 @@ def getLogger():
     ''' logger to be used in this module '''
     return logging.getLogger(__name__)
 
+def fitMergerChain(mergerResolverPlugin, chain):
+    '''
+    Fit all nodes of a connected part of the unresolved graph, given as `chain` of tuples
+    `(node, count, coordinates, predecessors)` sorted by time, where the fits of all `predecessors` of a node
+    are used as initialization of its own fit.
+
+    **returns** a list of `(node, fits)` tuples
+    '''
+    fitsPerNode = {}
+    for node, count, coordinates, predecessors in chain:
+        # collect initializations from incoming
+        initializations = []
+        for predecessor in predecessors:
+            initializations.extend(fitsPerNode[predecessor])
+        # TODO: what shall we do if e.g. a 2-merger and a single object merge to 2 + 1,
+        # so there are 3 initializations for the 2-merger, and two initializations for the 1 merger?
+        # What does pgmlink do in that case?
+
+        # use merger resolving plugin to fit `count` objects
+        getLogger().debug("Fitting node {} with count {}".format(node, count))
+        fitsPerNode[node] = mergerResolverPlugin.resolveMergerForCoords(coordinates, count, initializations)
+        assert(len(fitsPerNode[node]) == count)
+    return fitsPerNode.items()
+
+_workerMergerResolverPlugins = {}
+''' merger resolver plugins of this process, see `fitMergerChainInSeparateProcess` '''
+
+def fitMergerChainInSeparateProcess(pluginPaths, mergerResolverName, chain):
+    '''
+    Run `fitMergerChain` in a worker process of a `concurrent.futures.ProcessPoolExecutor`,
+    the merger resolver plugin is only loaded on the first job of every process.
+    '''
+    key = (tuple(pluginPaths), mergerResolverName)
+    if key not in _workerMergerResolverPlugins:
+        pluginManager = TrackingPluginManager(pluginPaths=pluginPaths, verbose=False)
+        pluginManager.setMergerResolver(mergerResolverName)
+        _workerMergerResolverPlugins[key] = pluginManager.getMergerResolver()
+    return fitMergerChain(_workerMergerResolverPlugins[key], chain)
+
 
 class MergerResolver(object):
     """
@@ -20,7 +61,10 @@ class MergerResolver(object):
     that handle reading/writing data to the respective sources.
     """
 
-    def __init__(self, pluginPaths=[os.path.abspath('../hytra/plugins')], verbose=False):
+    def __init__(self, pluginPaths=[os.path.abspath('../hytra/plugins')], verbose=False, useMultiprocessing=True):
+        """
+        If `useMultiprocessing` is `True`, independent mergers are fitted in parallel processes.
+        """
         self.unresolvedGraph = None
         self.resolvedGraph = None
         self.mergersPerTimestep = None
@@ -28,6 +72,8 @@ class MergerResolver(object):
         self.pluginManager = TrackingPluginManager(
             verbose=verbose, pluginPaths=pluginPaths)
         self.mergerResolverPlugin = self.pluginManager.getMergerResolver()
+        self.pluginPaths = pluginPaths
+        self.useMultiprocessing = useMultiprocessing
 
         # should be filled by constructors of derived classes!
         self.model = None
@@ -47,11 +93,13 @@ class MergerResolver(object):
         def target(timestep, link):
             return int(timestep), link[1]
 
+        if divisionsPerTimestep is not None:
+            lastframe = max(divisionsPerTimestep.keys(), key=int)
+
         def addNode(node):
             ''' add a node to the unresolved graph and fill in the properties `division` and `count` '''
             intT, idx = node
 
-            lastframe = max(divisionsPerTimestep.keys(), key=int)
             if divisionsPerTimestep is not None and int(intT) < int(lastframe):
                 division = idx in divisionsPerTimestep[str(intT + 1)] # +1 screams for lastframe condition.
             else:
@@ -118,57 +166,78 @@ class MergerResolver(object):
         intTimesteps = [int(t) for t in timesteps]
         intTimesteps.sort()
 
-        for intT in intTimesteps:
-            t = str(intT)
-            # use image provider plugin to load labelimage
-            labelImage = self._readLabelImage(int(t))
-            nextObjectId = labelImage.max() + 1
-
-            for idx in detectionsPerTimestep[t]:
-                node = (intT, idx)
-                if node not in self.resolvedGraph:
-                    continue
-
-                count = 1
-                if idx in mergersPerTimestep[t]:
-                    count = mergersPerTimestep[t][idx]
-                getLogger().debug("Looking at node {} in timestep {} with count {}".format(idx, t, count))
-                
-                # collect initializations from incoming
-                initializations = []
-                for predecessor, _ in self.unresolvedGraph.in_edges(node):
-                    initializations.extend(self.unresolvedGraph.node[predecessor]['fits'])
-                # TODO: what shall we do if e.g. a 2-merger and a single object merge to 2 + 1,
-                # so there are 3 initializations for the 2-merger, and two initializations for the 1 merger?
-                # What does pgmlink do in that case?
-
-                # use merger resolving plugin to fit `count` objects, also updates labelimage!
-                fittedObjects = self.mergerResolverPlugin.resolveMerger(labelImage, idx, nextObjectId, count, initializations)
-                assert(len(fittedObjects) == count)
-
-                # split up node if count > 1, duplicate incoming and outgoing arcs
-                if count > 1:
-                    for idx in range(nextObjectId, nextObjectId + count):
-                        newNode = (intT, idx)
-                        self.resolvedGraph.add_node(newNode, division=False, count=1, origin=node)
-
-                        for e in self.unresolvedGraph.out_edges(node):
-                            self.resolvedGraph.add_edge(newNode, e[1])
-                        for e in self.unresolvedGraph.in_edges(node):
-                            if 'newIds' in self.unresolvedGraph.node[e[0]]:
-                                for newId in self.unresolvedGraph.node[e[0]]['newIds']:
-                                    self.resolvedGraph.add_edge((e[0][0], newId), newNode)
-                            else:
-                                self.resolvedGraph.add_edge(e[0], newNode)
-
-                    self.resolvedGraph.remove_node(node)
-                    self.unresolvedGraph.node[node]['newIds'] = range(nextObjectId, nextObjectId + count)
-                    nextObjectId += count
-
-                # each unresolved node stores its fitted shape(s) to be used
-                # as initialization in the next frame, this way division duplicates
-                # and de-merged nodes in the resolved graph do not need to store a fit as well
-                self.unresolvedGraph.node[node]['fits'] = fittedObjects
+        # Only the initialization of a fit depends on the fits of the predecessors, so every connected part of
+        # the unresolved graph can be fitted independently once the coordinates of all its nodes are known.
+        lastTimestepOfChain = {}
+        for nodes in nx.weakly_connected_components(self.unresolvedGraph):
+            lastTimestepOfChain.setdefault(max(n[0] for n in nodes), []).append(nodes)
+        coordinatesPerNode = {}
+
+        if self.useMultiprocessing:
+            # use ProcessPoolExecutor, which instanciates as many processes as there CPU cores by default
+            executor = concurrent.futures.ProcessPoolExecutor()
+            def submit(chain):
+                return executor.submit(fitMergerChainInSeparateProcess,
+                                       self.pluginPaths,
+                                       self.pluginManager.chosen_merger_resolver,
+                                       chain)
+        else:
+            executor = probabilitygenerator.DummyExecutor()
+            def submit(chain):
+                return executor.submit(fitMergerChain, self.mergerResolverPlugin, chain)
+
+        jobs = []
+        with executor:
+            for intT in intTimesteps:
+                t = str(intT)
+                # use image provider plugin to load labelimage
+                labelImage = self._readLabelImage(int(t))
+                objectIndex = LabelImageObjectIndex(labelImage)
+                nextObjectId = objectIndex.maxLabel + 1
+
+                nodes = [(intT, idx) for idx in detectionsPerTimestep[t] if (intT, idx) in self.resolvedGraph]
+                for node in nodes:
+                    idx = node[1]
+                    coordinatesPerNode[node] = objectIndex.coordinates(idx)
+                    count = 1
+                    if idx in mergersPerTimestep[t]:
+                        count = mergersPerTimestep[t][idx]
+                    getLogger().debug("Looking at node {} in timestep {} with count {}".format(idx, t, count))
+
+                    # split up node if count > 1, duplicate incoming and outgoing arcs
+                    if count > 1:
+                        for newIdx in range(nextObjectId, nextObjectId + count):
+                            newNode = (intT, newIdx)
+                            self.resolvedGraph.add_node(newNode, division=False, count=1, origin=node)
+
+                            for e in self.unresolvedGraph.out_edges(node):
+                                self.resolvedGraph.add_edge(newNode, e[1])
+                            for e in self.unresolvedGraph.in_edges(node):
+                                if 'newIds' in self.unresolvedGraph.node[e[0]]:
+                                    for newId in self.unresolvedGraph.node[e[0]]['newIds']:
+                                        self.resolvedGraph.add_edge((e[0][0], newId), newNode)
+                                else:
+                                    self.resolvedGraph.add_edge(e[0], newNode)
+
+                        self.resolvedGraph.remove_node(node)
+                        self.unresolvedGraph.node[node]['newIds'] = range(nextObjectId, nextObjectId + count)
+                        nextObjectId += count
+
+                # all chains ending in this frame are complete now and can be fitted
+                for chainNodes in lastTimestepOfChain.pop(intT, []):
+                    chain = [(n,
+                              self.unresolvedGraph.node[n]['count'],
+                              coordinatesPerNode.pop(n),
+                              [p for p, _ in self.unresolvedGraph.in_edges(n)])
+                             for n in sorted(chainNodes, key=lambda n: n[0]) if n in coordinatesPerNode]
+                    jobs.append(submit(chain))
+
+            # each unresolved node stores its fitted shape(s) to be used
+            # as initialization in the next frame, this way division duplicates
+            # and de-merged nodes in the resolved graph do not need to store a fit as well
+            for job in concurrent.futures.as_completed(jobs):
+                for node, fittedObjects in job.result():
+                    self.unresolvedGraph.node[node]['fits'] = fittedObjects
 
         # import matplotlib.pyplot as plt
         # nx.draw_networkx(resolvedGraph)
@@ -177,7 +246,7 @@ class MergerResolver(object):
     def _minCostMaxFlowMergerResolving(self, objectFeatures, transitionClassifier=None, transitionParameter=5.0):
         """
         Find the optimal assignments within the `resolvedGraph` by running min-cost max-flow from the
-        `dpct` module.
+        `dpct` module (or `hytra.core.mincostflow` if it is not installed).
 
         Converts the `resolvedGraph` to our JSON model structure, predicts the transition probabilities
         either using the given transitionClassifier, or using distance-based probabilities.
@@ -197,35 +266,38 @@ class MergerResolver(object):
             uuid = trackingGraph.addDetectionHypotheses([[0], [1]], **additionalFeatures)
             self.resolvedGraph.node[node]['id'] = uuid
 
-        for edge in self.resolvedGraph.edges_iter():
-            src = self.resolvedGraph.node[edge[0]]['id']
-            dest = self.resolvedGraph.node[edge[1]]['id']
-
-            featuresAtSrc = objectFeatures[edge[0]]
-            featuresAtDest = objectFeatures[edge[1]]
-
-            if transitionClassifier is not None:
-                try:
-                    featVec = self.pluginManager.applyTransitionFeatureVectorConstructionPlugins(
-                        featuresAtSrc, featuresAtDest, transitionClassifier.selectedFeatures)
-                except:
-                    getLogger().error("Could not compute transition features of link {}->{}:".format(src, dest))
-                    getLogger().error(featuresAtSrc)
-                    getLogger().error(featuresAtDest)
-                    raise
-                featVec = np.expand_dims(np.array(featVec), axis=0)
-                probs = transitionClassifier.predictProbabilities(featVec)[0]
-            else:
-                dist = np.linalg.norm(featuresAtDest['RegionCenter'] - featuresAtSrc['RegionCenter'])
+        edges = self.resolvedGraph.edges()
+        if transitionClassifier is not None and len(edges) > 0:
+            # build the feature matrix of all links at once and predict all transition probabilities in one go
+            featuresAtSrc = self.pluginManager.stackFeatureDicts([objectFeatures[edge[0]] for edge in edges],
+                                                                 transitionClassifier.selectedFeatures)
+            featuresAtDest = self.pluginManager.stackFeatureDicts([objectFeatures[edge[1]] for edge in edges],
+                                                                  transitionClassifier.selectedFeatures)
+            try:
+                featMatrix = self.pluginManager.applyTransitionFeatureMatrixConstructionPlugins(
+                    featuresAtSrc, featuresAtDest, transitionClassifier.selectedFeatures)
+            except:
+                getLogger().error("Could not compute transition features of links {}:".format(edges))
+                getLogger().error(featuresAtSrc)
+                getLogger().error(featuresAtDest)
+                raise
+            probsPerEdge = transitionClassifier.predictProbabilities(featMatrix)
+        else:
+            probsPerEdge = []
+            for edge in edges:
+                dist = np.linalg.norm(objectFeatures[edge[1]]['RegionCenter'] - objectFeatures[edge[0]]['RegionCenter'])
                 prob = np.exp(-dist / transitionParameter)
-                probs = [1.0 - prob, prob]
+                probsPerEdge.append([1.0 - prob, prob])
 
+        for edge, probs in zip(edges, probsPerEdge):
+            src = self.resolvedGraph.node[edge[0]]['id']
+            dest = self.resolvedGraph.node[edge[1]]['id']
             trackingGraph.addLinkingHypotheses(src, dest, listify(negLog(probs)))
 
         # track
-        import dpct
+        from hytra.core.mincostflow import importFlowSolver
         weights = {"weights": [1, 1, 1, 1]}
-        mergerResult = dpct.trackMaxFlow(trackingGraph.model, weights)
+        mergerResult = importFlowSolver().trackMaxFlow(trackingGraph.model, weights)
 
         # transform results to dictionaries that can be indexed by id or (src,dest)
         nodeFlowMap = dict([(int(d['id']), int(d['value'])) for d in mergerResult['detectionResults']])
@@ -233,8 +305,26 @@ class MergerResolver(object):
 
         return nodeFlowMap, arcFlowMap
 
+    def _getMergerFilters(self, traxelIndex, mergers):
+        """
+        **Returns** the methods `mergerNodeFilter` and `mergerLinkFilter`, which return `False` for all detections
+        and links (in JSON format) that contain a merger traxel, where `mergers` is a list of `(timestep, id, count)` tuples.
+        """
+        mergerTimesteps = np.array([m[0] for m in mergers], dtype=np.int64)
+        mergerIds = np.array([m[1] for m in mergers], dtype=np.int64)
+        mergerUuids = set(traxelIndex.uuidOf(mergerTimesteps, mergerIds).tolist())
+
+        def mergerNodeFilter(jsonNode):
+            return int(jsonNode['id']) not in mergerUuids
+
+        def mergerLinkFilter(jsonLink):
+            # return True if there was no traxel in either source or target node that was a merger.
+            return int(jsonLink['src']) not in mergerUuids and int(jsonLink['dest']) not in mergerUuids
+
+        return mergerNodeFilter, mergerLinkFilter
+
     def _refineModel(self,
-                     uuidToTraxelMap,
+                     traxelIndex,
                      traxelIdPerTimestepToUniqueIdMap,
                      mergerNodeFilter,
                      mergerLinkFilter):
@@ -256,7 +346,7 @@ class MergerResolver(object):
         self.model['linkingHypotheses'] = [link for link in self.model['linkingHypotheses'] if mergerLinkFilter(link)]
 
         # insert new nodes and update UUID to traxel map
-        nextUuid = max(uuidToTraxelMap.keys()) + 1
+        nextUuid = traxelIndex.uuids.max() + 1
         for node in self.unresolvedGraph.nodes_iter():
             if self.unresolvedGraph.node[node]['count'] > 1:
                 newIds = self.unresolvedGraph.node[node]['newIds']
@@ -357,10 +447,11 @@ class MergerResolver(object):
         **Returns** a nested dictionary, indexed first by time, then object Id, containing a list of new segmentIDs per merger
         """
 
-        traxelIdPerTimestepToUniqueIdMap, uuidToTraxelMap = hytra.core.jsongraph.getMappingsBetweenUUIDsAndTraxels(self.model)
+        traxelIdPerTimestepToUniqueIdMap = self.model['traxelToUniqueId']
+        traxelIndex = hytra.core.jsongraph.getTraxelIndex(self.model)
         timesteps = [t for t in traxelIdPerTimestepToUniqueIdMap.keys()]
 
-        mergers, detections, links, divisions = hytra.core.jsongraph.getMergersDetectionsLinksDivisions(self.result, uuidToTraxelMap)
+        mergers, detections, links, divisions = hytra.core.jsongraph.getMergersDetectionsLinksDivisions(self.result, traxelIndex)
 
 
         # ------------------------------------------------------------
@@ -413,20 +504,9 @@ class MergerResolver(object):
             #     a) how do we deal with the smaller number of states?
             #        Does it matter as we're done with tracking anyway..?
 
-            def mergerNodeFilter(jsonNode):
-                uuid = int(jsonNode['id'])
-                traxels = uuidToTraxelMap[uuid]
-                return not any(t[1] in self.mergersPerTimestep[str(t[0])] for t in traxels)
-
-            def mergerLinkFilter(jsonLink):
-                srcUuid = int(jsonLink['src'])
-                destUuid = int(jsonLink['dest'])
-                srcTraxels = uuidToTraxelMap[srcUuid]
-                destTraxels = uuidToTraxelMap[destUuid]
-                # return True if there was no traxel in either source or target node that was a merger.
-                return not (any(t[1] in self.mergersPerTimestep[str(t[0])] for t in srcTraxels) or any(t[1] in self.mergersPerTimestep[str(t[0])] for t in destTraxels))
+            mergerNodeFilter, mergerLinkFilter = self._getMergerFilters(traxelIndex, mergers)
 
-            self.model = self._refineModel(uuidToTraxelMap,
+            self.model = self._refineModel(traxelIndex,
                                            traxelIdPerTimestepToUniqueIdMap,
                                            mergerNodeFilter,
                                            mergerLinkFilter)
@@ -460,6 +540,8 @@ class MergerResolver(object):
         t = str(time)
         
         if self.detectionsPerTimestep is not None and t in self.detectionsPerTimestep:
+            # index the objects of this frame once, so that only the pixels of the mergers are touched
+            objectIndex = None
             for idx in self.detectionsPerTimestep[t]:
                 node = (time, idx)
 
@@ -471,6 +553,8 @@ class MergerResolver(object):
                 newIds = self.unresolvedGraph.node[node]['newIds']
                 
                 # use merger resolving plugin to update labelImage with merger IDs
-                self.mergerResolverPlugin.updateLabelImage(labelImage, idx, fits, newIds)
+                if objectIndex is None:
+                    objectIndex = LabelImageObjectIndex(labelImage)
+                self.mergerResolverPlugin.updateLabelImage(labelImage, idx, fits, newIds, objectIndex=objectIndex)
           
         return labelImage
\ No newline at end of file
@@ -0,0 +1,680 @@
+'''
+Built-in min-cost flow solver for our tracking models, which is used whenever the `dpct` module is not available.
+
+The functions `trackFlowBased` and `trackMaxFlow` have the same interface as their counterparts in `dpct`:
+they take a model with convex costs (see `hytra.core.jsongraph.convexifyCosts`) and a weight dictionary,
+and return a result dictionary with `detectionResults`, `linkingResults` and `divisionResults`.
+Additionally, a previous result can be passed as `initialResult`, e.g. after changing the weights slightly,
+which is then only corrected instead of tracking from scratch.
+
+The model is converted to an array based `FlowGraph`, in which objects are sent from a source to a target node
+along successive shortest paths (Dijkstra with node potentials on a CSR adjacency list).
+Divisions and exclusion constraints are handled by enabling and disabling arcs depending on the current flow,
+as in `dpct`, and a warm start first cancels all negative cycles of the given flow with Bellman-Ford.
+'''
+
+import sys
+import heapq
+import logging
+import collections
+import numpy as np
+
+
+def getLogger():
+    ''' logger to be used in this module '''
+    return logging.getLogger(__name__)
+
+
+def importFlowSolver():
+    '''
+    **returns** the `dpct` module if it is installed, and this module otherwise,
+    which provides `trackFlowBased` and `trackMaxFlow` with the same interface
+    '''
+    try:
+        import dpct
+        return dpct
+    except ImportError:
+        getLogger().info("dpct is not available, using the built-in min-cost flow solver")
+        return sys.modules[__name__]
+
+
+def trackFlowBased(model, weights, initialResult=None):
+    '''
+    Find the tracking result of minimal energy for the given model and weights, where every detection, link,
+    appearance, disappearance and division contributes the weighted features of its state.
+
+    If `initialResult` is given, the flow of this result is used as starting point.
+
+    **returns** a result dictionary with the values of all detections, links and divisions
+    '''
+    return FlowGraph(model, weights).solve(initialResult)
+
+
+def trackMaxFlow(model, weights, initialResult=None):
+    '''
+    Like `trackFlowBased`, but sends as many objects as possible from appearances to disappearances
+    (regardless of the cost), and finds the flow of minimal energy among those.
+    '''
+    return FlowGraph(model, weights, maxFlow=True).solve(initialResult)
+
+
+# node indices of the source and target of the flow graph
+SOURCE = 0
+TARGET = 1
+
+# the kinds of the arcs of the flow graph
+DETECTION, APPEARANCE, DISAPPEARANCE, LINK, DIVISION, DIVISIONLINK = range(6)
+
+# costs are considered negative only if they are below this threshold, to prevent augmenting numerical noise
+EPSILON = 1e-9
+
+
+def _splitWeights(model, weights):
+    '''
+    **returns** a tuple of the weight vectors of links, detections, divisions, appearances and disappearances,
+    where the division weights are `None` if the weights do not contain any
+    '''
+    weights = np.asarray(weights['weights'], dtype=np.float64)
+
+    def numFeatures(hypotheses, key):
+        for h in hypotheses:
+            if key in h:
+                return len(h[key][0])
+        return 1
+
+    segmentationHypotheses = model['segmentationHypotheses']
+    sizes = [numFeatures(model['linkingHypotheses'], 'features'),
+             numFeatures(segmentationHypotheses, 'features'),
+             numFeatures(segmentationHypotheses, 'divisionFeatures'),
+             numFeatures(segmentationHypotheses, 'appearanceFeatures'),
+             numFeatures(segmentationHypotheses, 'disappearanceFeatures')]
+    if len(weights) == sum(sizes):
+        withDivisions = True
+    elif len(weights) == sum(sizes) - sizes[2]:
+        withDivisions = False
+        sizes[2] = 0
+    else:
+        raise ValueError("Expected {} or {} weights, but got {}".format(sum(sizes), sum(sizes) - sizes[2], len(weights)))
+
+    offsets = np.cumsum([0] + sizes)
+    result = [weights[offsets[i]:offsets[i + 1]] for i in range(5)]
+    if not withDivisions:
+        result[2] = None
+    return tuple(result)
+
+
+def _energies(features, weights):
+    ''' **returns** the list of weighted energies of all states '''
+    return np.dot(np.asarray(features, dtype=np.float64), weights).tolist()
+
+
+class FlowGraph(object):
+    '''
+    Flow graph of a tracking model with a source and a target node, an in- and an out-node per detection,
+    and one more node for each detection that can divide, which provides the second object of the dividing cell.
+
+    Every state `k > 0` of a detection, link, appearance and disappearance is represented by an arc of capacity one
+    whose cost is the energy difference to state `k - 1`, which is why the energies must be convex.
+    A division is an arc from the source to the division node of the parent, from which the second object
+    has to be passed on to another child than the first one.
+
+    The flow of arc `a` is stored in `flow[a]`. It has the residual arcs `2a` (forward, usable while the flow is 0)
+    and `2a + 1` (backward, usable while the flow is 1), which are stored in CSR adjacency lists sorted by their tail.
+    '''
+
+    def __init__(self, model, weights, maxFlow=False):
+        self.maxFlow = maxFlow
+        linkWeights, detectionWeights, divisionWeights, appearanceWeights, disappearanceWeights = \
+            _splitWeights(model, weights)
+        self.withDivisions = divisionWeights is not None
+
+        detections = model['segmentationHypotheses']
+        links = model['linkingHypotheses']
+        self.detectionIds = [int(d['id']) for d in detections]
+        self.linkIds = [(int(l['src']), int(l['dest'])) for l in links]
+        indexOfDetection = dict((uuid, i) for i, uuid in enumerate(self.detectionIds))
+
+        tails, heads, costs, kinds, owners = [], [], [], [], []
+
+        def addArcs(tail, head, energies, kind, owner):
+            for k in range(1, len(energies)):
+                tails.append(tail)
+                heads.append(head)
+                costs.append(energies[k] - energies[k - 1])
+                kinds.append(kind)
+                owners.append(owner)
+
+        self.constantEnergy = 0.0
+        numNodes = 2 + 2 * len(detections)
+        self.divisionDetections = []
+        for i, d in enumerate(detections):
+            energies = _energies(d['features'], detectionWeights)
+            self.constantEnergy += energies[0]
+            addArcs(2 + 2 * i, 3 + 2 * i, energies, DETECTION, i)
+            if 'appearanceFeatures' in d:
+                energies = _energies(d['appearanceFeatures'], appearanceWeights)
+                self.constantEnergy += energies[0]
+                addArcs(SOURCE, 2 + 2 * i, energies, APPEARANCE, i)
+            if 'disappearanceFeatures' in d:
+                energies = _energies(d['disappearanceFeatures'], disappearanceWeights)
+                self.constantEnergy += energies[0]
+                addArcs(3 + 2 * i, TARGET, energies, DISAPPEARANCE, i)
+            if self.withDivisions and 'divisionFeatures' in d:
+                energies = _energies(d['divisionFeatures'], divisionWeights)
+                self.constantEnergy += energies[0]
+                addArcs(SOURCE, numNodes, energies[:2], DIVISION, i)
+                self.divisionDetections.append(i)
+                numNodes += 1
+
+        divisionNodes = dict((i, 2 + 2 * len(detections) + j) for j, i in enumerate(self.divisionDetections))
+        for l, (src, dest) in enumerate(self.linkIds):
+            src = indexOfDetection[src]
+            dest = indexOfDetection[dest]
+            energies = _energies(links[l]['features'], linkWeights)
+            self.constantEnergy += energies[0]
+            addArcs(3 + 2 * src, 2 + 2 * dest, energies, LINK, l)
+            if src in divisionNodes:
+                addArcs(divisionNodes[src], 2 + 2 * dest, energies[:2], DIVISIONLINK, l)
+
+        self.numNodes = numNodes
+        self.tails = np.array(tails, dtype=np.int64)
+        self.heads = np.array(heads, dtype=np.int64)
+        self.costs = np.array(costs, dtype=np.float64)
+        self.kinds = np.array(kinds, dtype=np.int64)
+        self.owners = np.array(owners, dtype=np.int64)
+        numArcs = len(tails)
+        self.flow = bytearray(numArcs)
+
+        # residual arcs in CSR format
+        residualTails = np.empty(2 * numArcs, dtype=np.int64)
+        residualTails[0::2] = self.tails
+        residualTails[1::2] = self.heads
+        residualHeads = np.empty(2 * numArcs, dtype=np.int64)
+        residualHeads[0::2] = self.heads
+        residualHeads[1::2] = self.tails
+        residualCosts = np.empty(2 * numArcs, dtype=np.float64)
+        residualCosts[0::2] = self.costs
+        residualCosts[1::2] = -self.costs
+        order = np.argsort(residualTails, kind='mergesort')
+        self._residualTails = residualTails
+        self._residualHeads = residualHeads
+        self._residualCosts = residualCosts
+        self._csrStart = np.searchsorted(residualTails[order], np.arange(numNodes + 1)).tolist()
+        self._csrArcs = order.tolist()
+        self._tailList = residualTails.tolist()
+        self._headList = residualHeads.tolist()
+        self._costList = residualCosts.tolist()
+
+        # residual arcs that are disabled by constraints, and arcs that are never used again
+        self.blocked = bytearray(2 * numArcs)
+        self.banned = bytearray(2 * numArcs)
+
+        # node potentials, such that the reduced costs of all usable arcs are non-negative,
+        # except for the arcs in `_negativeArcs` that were enabled since the potentials were computed
+        self.potentials = [0.0] * numNodes
+        self._negativeArcs = []
+
+        self._initializeConstraints(model, indexOfDetection)
+
+    def _initializeConstraints(self, model, indexOfDetection):
+        ''' index the arcs of all detections that take part in divisions or exclusion constraints '''
+        def arcsPerOwner(kind, numOwners):
+            arcs = [[] for _ in range(numOwners)]
+            for a in np.flatnonzero(self.kinds == kind).tolist():
+                arcs[self.owners[a]].append(a)
+            return arcs
+
+        numDetections = len(self.detectionIds)
+        self.detectionArcs = arcsPerOwner(DETECTION, numDetections)
+        self.disappearanceArcs = arcsPerOwner(DISAPPEARANCE, numDetections)
+        self.linkArcs = arcsPerOwner(LINK, len(self.linkIds))
+        self.linkSources = [indexOfDetection[src] for src, _ in self.linkIds]
+        self.divisionArc = {}
+        for a in np.flatnonzero(self.kinds == DIVISION).tolist():
+            self.divisionArc[int(self.owners[a])] = a
+        self.divisionLinkArc = {}
+        for a in np.flatnonzero(self.kinds == DIVISIONLINK).tolist():
+            self.divisionLinkArc[int(self.owners[a])] = a
+        self.outgoingLinks = dict((i, []) for i in self.divisionDetections)
+        for l, (src, dest) in enumerate(self.linkIds):
+            src = indexOfDetection[src]
+            if src in self.outgoingLinks:
+                self.outgoingLinks[src].append(l)
+
+        self.exclusions = [[indexOfDetection[int(uuid)] for uuid in exclusion]
+                           for exclusion in model.get('exclusions', None) or []]
+        self.exclusionsOfDetection = {}
+        for e, exclusion in enumerate(self.exclusions):
+            for i in exclusion:
+                self.exclusionsOfDetection.setdefault(i, []).append(e)
+
+        self._constrainedDetections = set(self.divisionDetections) | set(self.exclusionsOfDetection.keys())
+        self._updateConstraints(self._constrainedDetections)
+
+    # ------------------------------------------------------------------
+    # constraints
+
+    def _sumFlow(self, arcs):
+        flow = self.flow
+        return sum(flow[a] for a in arcs)
+
+    def _setBlocked(self, residualArc, blocked):
+        '''
+        Block or unblock a residual arc, and remember it if it got enabled with a negative reduced cost
+        '''
+        blocked = blocked or self.banned[residualArc]
+        if self.blocked[residualArc] == blocked:
+            return
+        self.blocked[residualArc] = blocked
+        if not blocked and self.flow[residualArc >> 1] == (residualArc & 1):
+            tail = self._tailList[residualArc]
+            head = self._headList[residualArc]
+            if tail != TARGET and head != SOURCE and \
+                    self._costList[residualArc] + self.potentials[tail] - self.potentials[head] < -EPSILON:
+                self._negativeArcs.append(residualArc)
+
+    def _divisionState(self, i):
+        '''
+        **returns** `(isDividing, numObjects, numDisappearing, childLinksOfFirstObject, childLinkOfSecondObject)`
+        of a detection `i` that can divide
+        '''
+        flow = self.flow
+        firstChildren = [l for l in self.outgoingLinks[i] if self._sumFlow(self.linkArcs[l]) > 0]
+        secondChildren = [l for l in self.outgoingLinks[i] if flow[self.divisionLinkArc[l]] > 0]
+        return (flow[self.divisionArc[i]] > 0,
+                self._sumFlow(self.detectionArcs[i]),
+                self._sumFlow(self.disappearanceArcs[i]),
+                firstChildren,
+                secondChildren)
+
+    def _updateConstraints(self, detections):
+        ''' enable or disable the arcs of the given detections according to the current flow '''
+        for i in detections:
+            if i not in self._constrainedDetections:
+                continue
+
+            excluded = False
+            for e in self.exclusionsOfDetection.get(i, []):
+                excluded |= any(self._sumFlow(self.detectionArcs[j]) > 0 for j in self.exclusions[e] if j != i)
+
+            dividing = False
+            if i in self.divisionArc:
+                dividing, numObjects, _, firstChildren, secondChildren = self._divisionState(i)
+                # a cell can only divide if it contains a single object that goes on to a child
+                self._setBlocked(2 * self.divisionArc[i], dividing or numObjects != 1 or len(firstChildren) != 1)
+                for l in self.outgoingLinks[i]:
+                    self._setBlocked(2 * self.divisionLinkArc[l], l in firstChildren)
+                    # the first object must not follow the second one
+                    for a in self.linkArcs[l]:
+                        self._setBlocked(2 * a, dividing and l in secondChildren)
+                for a in self.disappearanceArcs[i]:
+                    self._setBlocked(2 * a, dividing)
+
+            # the number of objects of dividing cells is fixed, and excluded detections cannot become active
+            for a in self.detectionArcs[i]:
+                self._setBlocked(2 * a, dividing or excluded)
+                self._setBlocked(2 * a + 1, dividing)
+
+    def _isValid(self, detections):
+        ''' check whether the divisions and exclusions of the given detections are consistent '''
+        for i in detections:
+            if i in self.divisionArc:
+                dividing, numObjects, numDisappearing, firstChildren, secondChildren = self._divisionState(i)
+                if dividing and (numObjects != 1 or numDisappearing != 0 or len(firstChildren) != 1
+                                 or len(secondChildren) != 1 or firstChildren == secondChildren):
+                    return False
+            for e in self.exclusionsOfDetection.get(i, []):
+                if sum(self._sumFlow(self.detectionArcs[j]) > 0 for j in self.exclusions[e]) > 1:
+                    return False
+        return True
+
+    def _detectionsOfArcs(self, arcs):
+        ''' the constrained detections whose state depends on the given arcs '''
+        detections = set()
+        for a in arcs:
+            owner = int(self.owners[a])
+            if self.kinds[a] in (LINK, DIVISIONLINK):
+                owner = self.linkSources[owner]
+            if owner in self._constrainedDetections:
+                detections.add(owner)
+            for e in self.exclusionsOfDetection.get(owner, []):
+                detections.update(self.exclusions[e])
+        return detections
+
+    def _apply(self, residualArcs):
+        '''
+        Push one unit of flow along the given residual arcs (a path or cycle, where artificial arcs are negative).
+        If that violates the constraints, the change is reverted and the first arc involved is banned.
+
+        **returns** `True` if the flow was changed
+        '''
+        arcs = [r >> 1 for r in residualArcs if r >= 0]
+        for r in residualArcs:
+            if r >= 0:
+                self.flow[r >> 1] = 1 - (r & 1)
+        detections = self._detectionsOfArcs(arcs)
+        if self._isValid(detections):
+            self._updateConstraints(detections)
+            return True
+
+        for r in residualArcs:
+            if r >= 0:
+                self.flow[r >> 1] = r & 1
+        for r in residualArcs:
+            if r >= 0 and self._detectionsOfArcs([r >> 1]) & detections:
+                self.banned[r] = 1
+                self.blocked[r] = 1
+                break
+        return False
+
+    # ------------------------------------------------------------------
+    # shortest paths
+
+    def _repairPotentials(self):
+        '''
+        Lower the potentials of the nodes behind arcs with negative reduced costs (and of their successors),
+        until all reduced costs are non-negative again. Falls back to `_cancelNegativeCycles` if that
+        does not converge quickly, which happens if the enabled arcs closed a negative cycle.
+        '''
+        flow = self.flow
+        blocked = self.blocked
+        tails = self._tailList
+        heads = self._headList
+        costs = self._costList
+        csrStart = self._csrStart
+        csrArcs = self._csrArcs
+        potentials = self.potentials
+
+        queue = collections.deque()
+        for r in self._negativeArcs:
+            if not blocked[r] and flow[r >> 1] == (r & 1):
+                queue.append(r)
+        self._negativeArcs = []
+
+        numRelaxations = 0
+        while len(queue) > 0:
+            r = queue.popleft()
+            u = tails[r]
+            v = heads[r]
+            if potentials[u] + costs[r] >= potentials[v] - 1e-12:
+                continue
+            potentials[v] = potentials[u] + costs[r]
+            numRelaxations += 1
+            if numRelaxations > 4 * self.numNodes + 1000:
+                self._cancelNegativeCycles(withReturnArc=False)
+                return
+            if v == TARGET:
+                continue
+            for r in csrArcs[csrStart[v]:csrStart[v + 1]]:
+                if not blocked[r] and flow[r >> 1] == (r & 1) and heads[r] != SOURCE:
+                    queue.append(r)
+
+    def _findShortestPath(self):
+        '''
+        Find the cheapest path from source to target in the residual graph with Dijkstra's algorithm,
+        using costs that are reduced by the node potentials, and update the potentials afterwards.
+
+        **returns** a tuple of the list of residual arcs of the path and its cost, or `(None, None)`
+        '''
+        if len(self._negativeArcs) > 0:
+            self._repairPotentials()
+
+        flow = self.flow
+        blocked = self.blocked
+        heads = self._headList
+        costs = self._costList
+        csrStart = self._csrStart
+        csrArcs = self._csrArcs
+        potentials = self.potentials
+
+        distances = {SOURCE: 0.0}
+        predecessors = {}
+        heap = [(0.0, SOURCE)]
+        while len(heap) > 0:
+            distance, u = heapq.heappop(heap)
+            if distance > distances[u]:
+                continue
+            if u == TARGET:
+                break
+            potential = potentials[u]
+            for r in csrArcs[csrStart[u]:csrStart[u + 1]]:
+                if blocked[r] or flow[r >> 1] != (r & 1):
+                    continue
+                v = heads[r]
+                if v == SOURCE:
+                    continue
+                d = distance + costs[r] + potential - potentials[v]
+                if d < distances.get(v, float('inf')) - 1e-12:
+                    distances[v] = d
+                    predecessors[v] = r
+                    heapq.heappush(heap, (d, v))
+
+        if TARGET not in distances:
+            return None, None
+
+        targetDistance = distances[TARGET]
+        pathCost = targetDistance + potentials[TARGET] - potentials[SOURCE]
+        path = []
+        v = TARGET
+        while v != SOURCE:
+            r = predecessors[v]
+            path.append(r)
+            v = self._tailList[r]
+        path.reverse()
+
+        # nodes that are further away than the target keep their potential, which keeps reduced costs non-negative
+        for v, d in distances.iteritems():
+            if d < targetDistance:
+                potentials[v] += d - targetDistance
+        return path, pathCost
+
+    def _usableResidualArcs(self):
+        ''' **returns** the indices of all residual arcs that are not blocked and have free capacity '''
+        flow = np.frombuffer(self.flow, dtype=np.uint8)
+        blocked = np.frombuffer(self.blocked, dtype=np.uint8)
+        residualArcs = np.arange(2 * len(flow), dtype=np.int64)
+        return np.flatnonzero(np.logical_and(blocked == 0, np.repeat(flow, 2) == (residualArcs & 1)))
+
+    def _bellmanFord(self, withReturnArc):
+        '''
+        Compute shortest distances in the residual graph from a virtual root node that is connected to all nodes,
+        with vectorized Bellman-Ford iterations. If `withReturnArc` is `True`, the target is connected back
+        to the source, such that flow can also be removed.
+
+        **returns** a tuple `(distances, cycle)`, where `cycle` is a list of residual arcs forming a negative cycle
+        (artificial arcs are -1), or `None` if there is none and the distances are valid potentials
+        '''
+        arcs = self._usableResidualArcs()
+        tails = self._residualTails[arcs]
+        heads = self._residualHeads[arcs]
+        costs = self._residualCosts[arcs]
+        if withReturnArc:
+            hasFlow = any(self.flow[a] for a in np.flatnonzero(self.heads == TARGET).tolist())
+            returnArcs = [(TARGET, SOURCE)] + ([(SOURCE, TARGET)] if hasFlow else [])
+            arcs = np.concatenate([arcs, -np.ones(len(returnArcs), dtype=np.int64)])
+            tails = np.concatenate([tails, [t for t, _ in returnArcs]]).astype(np.int64)
+            heads = np.concatenate([heads, [h for _, h in returnArcs]]).astype(np.int64)
+            costs = np.concatenate([costs, np.zeros(len(returnArcs))])
+
+        distances = np.zeros(self.numNodes)
+        predecessors = -np.ones(self.numNodes, dtype=np.int64)
+        for iteration in range(self.numNodes + 1):
+            candidates = distances[tails] + costs
+            improving = candidates < distances[heads] - EPSILON
+            if not np.any(improving):
+                return distances, None
+            improving = np.flatnonzero(improving)
+            np.minimum.at(distances, heads[improving], candidates[improving])
+            winners = improving[candidates[improving] == distances[heads[improving]]]
+            predecessors[heads[winners]] = winners
+
+            if iteration % 8 == 7 or iteration == self.numNodes:
+                cycle = self._findPredecessorCycle(predecessors, tails)
+                if cycle is not None and costs[cycle].sum() < -EPSILON:
+                    return distances, [int(arcs[i]) for i in cycle]
+        raise RuntimeError("Bellman-Ford did not converge")
+
+    def _findPredecessorCycle(self, predecessors, tails):
+        ''' **returns** the arcs of a cycle in the graph of predecessor arcs, or `None` '''
+        predecessors = predecessors.tolist()
+        tails = tails.tolist()
+        state = [0] * self.numNodes  # 0 = unvisited, 1 = on the current walk, 2 = done
+        for start in range(self.numNodes):
+            v = start
+            walk = []
+            while v >= 0 and state[v] == 0:
+                state[v] = 1
+                walk.append(v)
+                arc = predecessors[v]
+                v = tails[arc] if arc >= 0 else -1
+            if v >= 0 and state[v] == 1:
+                cycle = []
+                u = v
+                while True:
+                    cycle.append(predecessors[u])
+                    u = tails[predecessors[u]]
+                    if u == v:
+                        break
+                cycle.reverse()
+                return cycle
+            for u in walk:
+                state[u] = 2
+        return None
+
+    def _cancelNegativeCycles(self, withReturnArc):
+        '''
+        Improve the current flow by pushing flow around negative cycles of the residual graph until there are none,
+        and use the final Bellman-Ford distances as potentials. With `withReturnArc`, these cycles can also
+        add or remove flow from source to target.
+
+        **returns** the number of canceled cycles
+        '''
+        numCanceled = 0
+        while True:
+            distances, cycle = self._bellmanFord(withReturnArc)
+            if cycle is None:
+                self.potentials = distances.tolist()
+                self._negativeArcs = []
+                return numCanceled
+            if self._apply(cycle):
+                numCanceled += 1
+
+    # ------------------------------------------------------------------
+    # solving
+
+    def setFlow(self, result):
+        '''
+        Set the flow to the one of a previous result dictionary.
+        Raises a `ValueError` if the result is inconsistent with this graph.
+        '''
+        self.flow[:] = bytearray(len(self.flow))
+        flow = self.flow
+
+        def fill(arcs, value):
+            if value > len(arcs) or value < 0:
+                raise ValueError("Value {} is out of range".format(value))
+            for a in arcs[:value]:
+                flow[a] = 1
+
+        indexOfDetection = dict((uuid, i) for i, uuid in enumerate(self.detectionIds))
+        indexOfLink = dict((link, l) for l, link in enumerate(self.linkIds))
+        numObjects = np.zeros(len(self.detectionIds), dtype=np.int64)
+        for d in result['detectionResults']:
+            i = indexOfDetection[int(d['id'])]
+            numObjects[i] = int(d['value'])
+            fill(self.detectionArcs[i], numObjects[i])
+
+        linkValues = np.zeros(len(self.linkIds), dtype=np.int64)
+        for link in result.get('linkingResults', None) or []:
+            linkValues[indexOfLink[(int(link['src']), int(link['dest']))]] = int(link['value'])
+
+        for division in result.get('divisionResults', None) or []:
+            i = indexOfDetection[int(division['id'])]
+            if int(division['value']) > 0:
+                if i not in self.divisionArc:
+                    raise ValueError("Detection {} cannot divide".format(division['id']))
+                # the second active child receives the object provided by the division
+                children = [l for l in self.outgoingLinks[i] if linkValues[l] > 0]
+                if len(children) != 2:
+                    raise ValueError("Division of {} does not have two children".format(division['id']))
+                flow[self.divisionArc[i]] = 1
+                flow[self.divisionLinkArc[children[1]]] = 1
+                linkValues[children[1]] -= 1
+
+        for l, value in enumerate(linkValues.tolist()):
+            fill(self.linkArcs[l], value)
+
+        # appearances and disappearances make up for the difference of the flow in and out of each detection
+        flowArray = np.frombuffer(flow, dtype=np.uint8).astype(np.int64)
+        def netFlow(nodes, kinds, sign):
+            arcs = np.flatnonzero(np.in1d(self.kinds, kinds))
+            return np.bincount(nodes[arcs], weights=sign * flowArray[arcs], minlength=self.numNodes).astype(np.int64)
+        inflow = netFlow(self.heads, [LINK, DIVISIONLINK], 1)
+        outflow = netFlow(self.tails, [LINK], 1)
+        appearanceArcs = [[] for _ in self.detectionIds]
+        for a in np.flatnonzero(self.kinds == APPEARANCE).tolist():
+            appearanceArcs[self.owners[a]].append(a)
+        for i in range(len(self.detectionIds)):
+            fill(appearanceArcs[i], numObjects[i] - inflow[2 + 2 * i])
+            fill(self.disappearanceArcs[i], numObjects[i] - outflow[3 + 2 * i])
+
+        if not self._isValid(self._constrainedDetections):
+            raise ValueError("The divisions or exclusions of the result are inconsistent")
+        self._updateConstraints(self._constrainedDetections)
+
+    def solve(self, initialResult=None):
+        '''
+        Compute the min-cost flow, starting from `initialResult` if given.
+
+        **returns** the result dictionary
+        '''
+        if initialResult is not None:
+            try:
+                self.setFlow(initialResult)
+            except (ValueError, KeyError) as e:
+                getLogger().warning("Cannot start from the given result ({}), tracking from scratch".format(e))
+                self.flow[:] = bytearray(len(self.flow))
+                self._updateConstraints(self._constrainedDetections)
+
+        # a warm start first reroutes the given flow, such that the potentials can be computed afterwards
+        numCanceled = self._cancelNegativeCycles(withReturnArc=False)
+        numPaths = 0
+        while True:
+            path, cost = self._findShortestPath()
+            if path is None or (not self.maxFlow and cost > -EPSILON):
+                # successive shortest paths are optimal without constraints, otherwise the last
+                # cycles that remove or reroute flow through the source or target are canceled here
+                canceled = 0 if self.maxFlow else self._cancelNegativeCycles(withReturnArc=True)
+                numCanceled += canceled
+                if canceled == 0:
+                    break
+            elif self._apply(path):
+                numPaths += 1
+
+        result = self.getResult()
+        getLogger().debug("Found {} augmenting paths and canceled {} cycles, energy: {}".format(
+            numPaths, numCanceled, self.getEnergy()))
+        return result
+
+    def getEnergy(self):
+        ''' **returns** the energy of the current flow '''
+        return self.constantEnergy + float(np.dot(np.frombuffer(self.flow, dtype=np.uint8), self.costs))
+
+    def getResult(self):
+        ''' **returns** the result dictionary of the current flow '''
+        flow = np.frombuffer(self.flow, dtype=np.uint8).astype(np.int64)
+
+        def valuesOf(kinds, numOwners):
+            arcs = np.flatnonzero(np.in1d(self.kinds, kinds))
+            return np.bincount(self.owners[arcs], weights=flow[arcs], minlength=numOwners).astype(np.int64).tolist()
+
+        detectionValues = valuesOf([DETECTION], len(self.detectionIds))
+        linkValues = valuesOf([LINK, DIVISIONLINK], len(self.linkIds))
+        result = {'detectionResults': [{'id': uuid, 'value': v} for uuid, v in zip(self.detectionIds, detectionValues)],
+                  'linkingResults': [{'src': src, 'dest': dest, 'value': v}
+                                     for (src, dest), v in zip(self.linkIds, linkValues)],
+                  'divisionResults': None}
+        if self.withDivisions:
+            result['divisionResults'] = [{'id': self.detectionIds[i], 'value': int(flow[self.divisionArc[i]])}
+                                         for i in self.divisionDetections]
+        return result
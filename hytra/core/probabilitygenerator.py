@@ -1,6 +1,10 @@
 import numpy as np
 import logging
 import time
+import os
+import hashlib
+import json
+import multiprocessing
 import concurrent.futures
 
 import hytra.core.divisionfeatures
@@ -8,6 +12,7 @@ from hytra.util.progressbar import ProgressBar
 from hytra.pluginsystem.plugin_manager import TrackingPluginManager
 from hytra.core.random_forest_classifier import RandomForestClassifier
 from hytra.core.ilastik_project_options import IlastikProjectOptions
+from hytra.core.traxelstore import TraxelStore
 
 def getLogger():
     return logging.getLogger("ProbabilityGenerator")
@@ -71,6 +76,163 @@ class Traxel(object):
         return "Traxel(Timestep={},Id={})".format(self.Timestep, self.Id)
 
 
+_workerPluginManagers = {}
+''' plugin managers of this process, built once per configuration by `getWorkerPluginManager` '''
+
+def getWorkerPluginManager(pluginPaths,
+                           turnOffFeatures=[],
+                           imageProviderPluginName='LocalImageLoader',
+                           featureSerializerPluginName='LocalFeatureSerializer'):
+    '''
+    Get the plugin manager for the given configuration in this (worker) process.
+
+    The plugin manager is only built, and the plugins are only discovered, on the first call in every process.
+    All subsequent jobs reuse it, as well as the HDF5 files its image provider keeps open.
+    The `futures` backport for python 2 does not support an `initializer` for process pools,
+    so this takes its place by initializing the worker lazily on its first job.
+    '''
+    key = (tuple(pluginPaths), tuple(sorted(turnOffFeatures)), imageProviderPluginName, featureSerializerPluginName)
+    if key not in _workerPluginManagers:
+        pluginManager = TrackingPluginManager(pluginPaths=pluginPaths, turnOffFeatures=turnOffFeatures, verbose=False)
+        pluginManager.setImageProvider(imageProviderPluginName)
+        pluginManager.setFeatureSerializer(featureSerializerPluginName)
+        pluginManager.getImageProvider().keepFilesOpen = True
+        _workerPluginManagers[key] = pluginManager
+    return _workerPluginManagers[key]
+
+def closeWorkerFiles():
+    '''
+    Close all files kept open by the plugin managers of this process,
+    needed if the jobs were run in the main process (e.g. with the `DummyExecutor`)
+    '''
+    for pluginManager in _workerPluginManagers.values():
+        pluginManager.getImageProvider().closeOpenFiles()
+
+def _computeRegionFeaturesOfFrame(pluginManager,
+                                  frame,
+                                  rawImageFilename,
+                                  rawImagePath,
+                                  rawImageAxes,
+                                  labelImageFilename,
+                                  labelImagePath):
+    '''
+    Load the raw and label image of one frame with the image provider of the `pluginManager`
+    and compute the region features of all objects with its object feature computation plugins.
+
+    **returns** the feature dictionary of this frame and the label image as it was loaded
+    '''
+    # load raw and label image (depending on chosen plugin this works via DVID or locally)
+    rawImage = pluginManager.getImageProvider().getImageDataAtTimeFrame(
+        rawImageFilename, rawImagePath, rawImageAxes, frame)
+    loadedLabelImage = pluginManager.getImageProvider().getLabelImageForFrame(
+        labelImageFilename, labelImagePath, frame)
+
+    # untwist axes, if just x and y are messed up
+    labelImage = loadedLabelImage
+    if rawImage.shape[0] == labelImage.shape[1] and rawImage.shape[1] == labelImage.shape[0]:
+        labelImage = np.transpose(labelImage, axes=[1, 0])
+
+    # compute features
+    moreFeats, ignoreNames = pluginManager.applyObjectFeatureComputationPlugins(
+        len(labelImage.shape), rawImage, labelImage, frame, rawImageFilename)
+
+    # combine into one dictionary
+    # WARNING: if there are multiple features with the same name, they will be overwritten!
+    frameFeatureItems = []
+    for f in moreFeats:
+        frameFeatureItems = frameFeatureItems + f.items()
+    frameFeatures = dict(frameFeatureItems)
+
+    # delete all ignored features
+    for k in ignoreNames:
+        if k in frameFeatures.keys():
+            del frameFeatures[k]
+
+    return frameFeatures, loadedLabelImage
+
+def packFeatureDict(features):
+    '''
+    Pack all numeric arrays of a feature dictionary into one contiguous byte buffer,
+    which is much cheaper to send between processes than many small arrays.
+
+    **returns** a tuple of the layout (name, dtype, shape, offset per array), the buffer, and a dictionary
+    holding all values that are no numeric arrays (e.g. polygons)
+    '''
+    layout = []
+    others = {}
+    offset = 0
+    for name, value in features.iteritems():
+        if isinstance(value, np.ndarray) and value.dtype.kind in 'biuf':
+            layout.append((name, value.dtype.str, value.shape, offset))
+            offset += value.nbytes
+        else:
+            others[name] = value
+
+    buf = np.empty(offset, dtype=np.uint8)
+    for name, dtype, shape, start in layout:
+        value = np.ascontiguousarray(features[name])
+        buf[start:start + value.nbytes] = value.view(np.uint8).reshape(-1)
+    return layout, buf, others
+
+def unpackFeatureDict(packedFeatures):
+    '''
+    Inverse of `packFeatureDict`, the returned arrays are views into the buffer
+    '''
+    layout, buf, others = packedFeatures
+    features = dict(others)
+    for name, dtype, shape, start in layout:
+        dtype = np.dtype(dtype)
+        count = int(np.prod(shape))
+        features[name] = np.frombuffer(buf, dtype=dtype, count=count, offset=start).reshape(shape)
+    return features
+
+def computeFeaturesOfFrameRangeOnCloud(frames,
+                                       rawImageFilename,
+                                       rawImagePath,
+                                       rawImageAxes,
+                                       labelImageFilename,
+                                       labelImagePath,
+                                       turnOffFeatures,
+                                       pluginPaths=['hytra/plugins'],
+                                       divisionFeatureNames=None,
+                                       numDimensions=None,
+                                       imageProviderPluginName='LocalImageLoader'):
+    '''
+    Compute the region features of a range of contiguous `frames` in one worker process.
+    If `divisionFeatureNames` are given, the division features of every frame whose successor is also part of
+    the range are computed as well, reusing the successor's region features and label image
+    instead of sending them between processes again.
+
+    **returns** a tuple of the list of frames, a dictionary of packed region features per frame,
+    and a dictionary of packed division features per frame (see `packFeatureDict`)
+    '''
+    pluginManager = getWorkerPluginManager(pluginPaths, turnOffFeatures, imageProviderPluginName)
+
+    regionFeatures = {}
+    labelImages = {}
+    for frame in frames:
+        regionFeatures[frame], labelImages[frame] = _computeRegionFeaturesOfFrame(pluginManager,
+                                                                                  frame,
+                                                                                  rawImageFilename,
+                                                                                  rawImagePath,
+                                                                                  rawImageAxes,
+                                                                                  labelImageFilename,
+                                                                                  labelImagePath)
+
+    divisionFeatures = {}
+    if divisionFeatureNames is not None:
+        fm = hytra.core.divisionfeatures.FeatureManager(ndim=numDimensions)
+        for frame in frames:
+            if frame + 1 in regionFeatures:
+                divisionFeatures[frame] = packFeatureDict(fm.computeFeatures_at(regionFeatures[frame],
+                                                                               regionFeatures[frame + 1],
+                                                                               labelImages[frame + 1],
+                                                                               divisionFeatureNames,
+                                                                               labelImageFilename))
+
+    packedRegionFeatures = dict((frame, packFeatureDict(feats)) for frame, feats in regionFeatures.iteritems())
+    return frames, packedRegionFeatures, divisionFeatures
+
 def computeRegionFeaturesOnCloud(frame,
                                  rawImageFilename,
                                  rawImagePath,
@@ -101,37 +263,15 @@ def computeRegionFeaturesOnCloud(frame,
     and `featuresPerFrame == None`.
     '''
 
-    # set up plugin manager
-    from hytra.pluginsystem.plugin_manager import TrackingPluginManager
-    pluginManager = TrackingPluginManager(pluginPaths=pluginPaths, turnOffFeatures=turnOffFeatures, verbose=False)
-    pluginManager.setImageProvider(imageProviderPluginName)
-    pluginManager.setFeatureSerializer(featureSerializerPluginName)
-
-    # load raw and label image (depending on chosen plugin this works via DVID or locally)
-    rawImage = pluginManager.getImageProvider().getImageDataAtTimeFrame(
-        rawImageFilename, rawImagePath, rawImageAxes, frame)
-    labelImage = pluginManager.getImageProvider().getLabelImageForFrame(
-        labelImageFilename, labelImagePath, frame)
-
-    # untwist axes, if just x and y are messed up
-    if rawImage.shape[0] == labelImage.shape[1] and rawImage.shape[1] == labelImage.shape[0]:
-        labelImage = np.transpose(labelImage, axes=[1, 0])
-
-    # compute features
-    moreFeats, ignoreNames = pluginManager.applyObjectFeatureComputationPlugins(
-        len(labelImage.shape), rawImage, labelImage, frame, rawImageFilename)
-
-    # combine into one dictionary
-    # WARNING: if there are multiple features with the same name, they will be overwritten!
-    frameFeatureItems = []
-    for f in moreFeats:
-        frameFeatureItems = frameFeatureItems + f.items()
-    frameFeatures = dict(frameFeatureItems)
-
-    # delete all ignored features
-    for k in ignoreNames:
-        if k in frameFeatures.keys():
-            del frameFeatures[k]
+    # get the plugin manager of this process
+    pluginManager = getWorkerPluginManager(pluginPaths, turnOffFeatures, imageProviderPluginName, featureSerializerPluginName)
+    frameFeatures, _ = _computeRegionFeaturesOfFrame(pluginManager,
+                                                     frame,
+                                                     rawImageFilename,
+                                                     rawImagePath,
+                                                     rawImageAxes,
+                                                     labelImageFilename,
+                                                     labelImagePath)
 
     # return or save features
     if featuresPerFrame is None and featureSerializerPluginName is 'LocalFeatureSerializer':
@@ -237,8 +377,18 @@ class IlpProbabilityGenerator(ProbabilityGenerator):
                  turnOffFeatures=[], 
                  useMultiprocessing=True, 
                  pluginPaths=['hytra/plugins'],
-                 verbose=False):
+                 verbose=False,
+                 numClassifierWorkers=None):
+        """
+        Set up the probability generator for the given ilastik project options.
+
+        `numClassifierWorkers` configures how many threads evaluate the random forests of each classifier concurrently.
+        If it is `None`, all cores are used when `useMultiprocessing=True`, and a single thread otherwise.
+        """
         self._useMultiprocessing = useMultiprocessing
+        if numClassifierWorkers is None:
+            numClassifierWorkers = multiprocessing.cpu_count() if useMultiprocessing else 1
+        self._numClassifierWorkers = numClassifierWorkers
         self._options = ilpOptions
         self._pluginPaths = pluginPaths
         self._pluginManager = TrackingPluginManager(turnOffFeatures=turnOffFeatures, 
@@ -269,20 +419,24 @@ class IlpProbabilityGenerator(ProbabilityGenerator):
         self.z_scale = 1.0
         self.divisionProbabilityFeatureName = 'divProb'
         self.detectionProbabilityFeatureName = 'detProb'
+        self.featureExtractionChunkSize = None  # number of contiguous frames per feature extraction job, None = automatic
 
         self.TraxelsPerFrame = {}
-        ''' this public variable contains all traxels if we're not using pgmlink '''
+        ''' this public variable contains all traxels (as `TraxelStore`) if we're not using pgmlink '''
     
     def _loadClassifiers(self):
         if self._options.objectCountClassifierPath != None and self._options.objectCountClassifierFilename != None:
             self._countClassifier = RandomForestClassifier(self._options.objectCountClassifierPath,
-                                                           self._options.objectCountClassifierFilename, self._options)
+                                                           self._options.objectCountClassifierFilename, self._options,
+                                                           numWorkers=self._numClassifierWorkers)
         if self._options.divisionClassifierPath != None and self._options.divisionClassifierFilename != None:
             self._divisionClassifier = RandomForestClassifier(self._options.divisionClassifierPath,
-                                                              self._options.divisionClassifierFilename, self._options)
+                                                              self._options.divisionClassifierFilename, self._options,
+                                                              numWorkers=self._numClassifierWorkers)
         if self._options.transitionClassifierPath != None and self._options.transitionClassifierFilename != None:
             self._transitionClassifier = RandomForestClassifier(self._options.transitionClassifierPath,
-                                                                self._options.transitionClassifierFilename, self._options)
+                                                                self._options.transitionClassifierFilename, self._options,
+                                                                numWorkers=self._numClassifierWorkers)
     
     def __getstate__(self):
         '''
@@ -408,6 +562,156 @@ class IlpProbabilityGenerator(ProbabilityGenerator):
 
         return timeframe, feats
 
+    def _getFeatureCache(self, labelImageFilename, labelImagePath):
+        """
+        **returns** the feature cache plugin set up for the given label image,
+        or `None` if no `featureCacheFilename` is configured in the ilastik project options
+        """
+        if getattr(self._options, 'featureCacheFilename', None) is None:
+            return None
+        featureCache = self._pluginManager.getFeatureCache()
+        featureCache.cache_filename = self._options.featureCacheFilename
+        featureCache.cache_namespace = hashlib.sha1(json.dumps([labelImageFilename, labelImagePath])).hexdigest()
+        return featureCache
+
+    def _getFeatureCacheKey(self, frame, labelImageFilename, labelImagePath, turnOffFeatures):
+        """
+        Build a key that changes whenever the region features of this frame would change: it covers the frame,
+        the raw and label image files (path, size and modification time) and datasets, as well as the
+        enabled feature computation plugins and `turnOffFeatures`.
+        """
+        def fileChecksum(filename):
+            if filename is not None and os.path.isfile(filename):
+                stat = os.stat(filename)
+                return [os.path.abspath(filename), stat.st_size, stat.st_mtime]
+            return [filename]
+
+        pluginNames = [n for n in self._pluginManager.getObjectFeatureComputationPluginNames() if n not in turnOffFeatures]
+        keyItems = [frame,
+                    fileChecksum(self._options.rawImageFilename),
+                    self._options.rawImagePath,
+                    self._options.rawImageAxes,
+                    fileChecksum(labelImageFilename),
+                    labelImagePath,
+                    pluginNames,
+                    sorted(turnOffFeatures)]
+        return hashlib.sha1(json.dumps(keyItems)).hexdigest()
+
+    def _splitIntoChunksOfContiguousFrames(self, frames):
+        """
+        Split the given sorted list of frames into chunks of contiguous frames with at most
+        `self.featureExtractionChunkSize` frames each. If that is `None`, the chunk size is chosen
+        such that every worker process gets about four chunks.
+        """
+        chunkSize = self.featureExtractionChunkSize
+        if chunkSize is None:
+            numWorkers = multiprocessing.cpu_count() if self._useMultiprocessing else 1
+            chunkSize = max(1, int(np.ceil(len(frames) / (4.0 * numWorkers))))
+
+        chunks = []
+        for frame in frames:
+            if len(chunks) > 0 and chunks[-1][-1] == frame - 1 and len(chunks[-1]) < chunkSize:
+                chunks[-1].append(frame)
+            else:
+                chunks.append([frame])
+        return chunks
+
+    def _computeFeaturesOfAllFrames(self,
+                                    executor,
+                                    labelImageFilename,
+                                    labelImagePath,
+                                    turnOffFeatures,
+                                    progressBar,
+                                    withDivisionFeatures=False):
+        """
+        Compute the region features of all frames in `self.timeRange` for the given label image using the `executor`,
+        and the division features of all but the last frame if `withDivisionFeatures=True`.
+
+        Contiguous frames are sent to the workers in chunks (see `_splitIntoChunksOfContiguousFrames`), which compute
+        region and division features within their chunk and send them back as packed buffers. Only the division
+        features at the borders of the chunks need the region features to be sent to a worker again.
+
+        If a feature cache is configured (see `IlastikProjectOptions.featureCacheFilename`), the region features of
+        all frames whose inputs did not change are loaded from there one frame at a time, and only stale frames
+        are recomputed and written back to the cache.
+
+        **returns** a dictionary with the feature dictionary of each frame
+        """
+        featuresPerFrame = {}
+        framesToCompute = range(self.timeRange[0], self.timeRange[1])
+        cacheKeys = {}
+
+        featureCache = self._getFeatureCache(labelImageFilename, labelImagePath)
+        if featureCache is not None:
+            framesToCompute = []
+            for frame in range(self.timeRange[0], self.timeRange[1]):
+                cacheKeys[frame] = self._getFeatureCacheKey(frame, labelImageFilename, labelImagePath, turnOffFeatures)
+                featureCache.cache_key = cacheKeys[frame]
+                if featureCache.hasFeaturesForFrame(frame):
+                    featuresPerFrame[frame] = featureCache.loadFeaturesForFrame(None, frame)
+                    progressBar.show()
+                else:
+                    framesToCompute.append(frame)
+            getLogger().info("Loaded features of {} frames from cache, computing {} frames".format(
+                len(featuresPerFrame), len(framesToCompute)))
+
+        # region features, and division features within each chunk of frames
+        divisionFeaturesPerFrame = {}
+        jobs = []
+        for frames in self._splitIntoChunksOfContiguousFrames(framesToCompute):
+            jobs.append(executor.submit(computeFeaturesOfFrameRangeOnCloud,
+                                        frames,
+                                        self._options.rawImageFilename,
+                                        self._options.rawImagePath,
+                                        self._options.rawImageAxes,
+                                        labelImageFilename,
+                                        labelImagePath,
+                                        turnOffFeatures,
+                                        self._pluginPaths,
+                                        self._divisionFeatureNames if withDivisionFeatures else None,
+                                        self.getNumDimensions(),
+                                        self._options.imageProviderName
+            ))
+        for job in concurrent.futures.as_completed(jobs):
+            frames, packedRegionFeatures, packedDivisionFeatures = job.result()
+            for frame in frames:
+                progressBar.show()
+                featuresPerFrame[frame] = unpackFeatureDict(packedRegionFeatures[frame])
+            for frame, packedFeatures in packedDivisionFeatures.iteritems():
+                progressBar.show()
+                divisionFeaturesPerFrame[frame] = unpackFeatureDict(packedFeatures)
+
+        if featureCache is not None:
+            for frame in framesToCompute:
+                featureCache.cache_key = cacheKeys[frame]
+                featureCache.storeFeaturesForFrame(featuresPerFrame[frame], frame)
+
+        # division features at the borders of the chunks and of cached frames
+        if withDivisionFeatures:
+            jobs = []
+            for frame in range(self.timeRange[0], self.timeRange[1] - 1):
+                if frame in divisionFeaturesPerFrame:
+                    continue
+                jobs.append(executor.submit(computeDivisionFeaturesOnCloud,
+                                            frame,
+                                            featuresPerFrame[frame],
+                                            featuresPerFrame[frame + 1],
+                                            self._pluginManager.getImageProvider(),
+                                            labelImageFilename,
+                                            labelImagePath,
+                                            self.getNumDimensions(),
+                                            self._divisionFeatureNames
+                ))
+            for job in concurrent.futures.as_completed(jobs):
+                progressBar.show()
+                frame, feats = job.result()
+                divisionFeaturesPerFrame[frame] = feats
+
+            for frame, feats in divisionFeaturesPerFrame.iteritems():
+                featuresPerFrame[frame].update(feats)
+
+        return featuresPerFrame
+
     def _extractAllFeatures(self, dispyNodeIps=[], turnOffFeatures=[]):
         """
         Extract the features of all frames. 
@@ -445,47 +749,12 @@ class IlpProbabilityGenerator(ProbabilityGenerator):
             progressBar.show(increase=0)
 
             with ExecutorType() as executor:
-                # 1st pass for region features
-                jobs = []
-                for frame in range(self.timeRange[0], self.timeRange[1]):
-                    jobs.append(executor.submit(computeRegionFeaturesOnCloud,
-                                                frame,
-                                                self._options.rawImageFilename, 
-                                                self._options.rawImagePath,
-                                                self._options.rawImageAxes,
-                                                self._options.labelImageFilename,
-                                                self._options.labelImagePath,
-                                                turnOffFeatures,
-                                                self._pluginPaths
-                    ))
-                for job in concurrent.futures.as_completed(jobs):
-                    progressBar.show()
-                    frame, feats = job.result()
-                    featuresPerFrame[frame] = feats
-
-                # 2nd pass for division features
-                if self._divisionClassifier is not None:
-                    jobs = []
-                    for frame in range(self.timeRange[0], self.timeRange[1] - 1):
-                        jobs.append(executor.submit(computeDivisionFeaturesOnCloud,
-                                                    frame,
-                                                    featuresPerFrame[frame],
-                                                    featuresPerFrame[frame + 1],
-                                                    self._pluginManager.getImageProvider(),
-                                                    self._options.labelImageFilename,
-                                                    self._options.labelImagePath,
-                                                    self.getNumDimensions(),
-                                                    self._divisionFeatureNames
-                        ))
-
-                    for job in concurrent.futures.as_completed(jobs):
-                        progressBar.show()
-                        frame, feats = job.result()
-                        featuresPerFrame[frame].update(feats)
-
-            # # serialize features??
-            # for frame in range(self.timeRange[0], self.timeRange[1]):
-            #     featureSerializer.storeFeaturesForFrame(featuresPerFrame[frame], frame)
+                featuresPerFrame = self._computeFeaturesOfAllFrames(executor,
+                                                                    self._options.labelImageFilename,
+                                                                    self._options.labelImagePath,
+                                                                    turnOffFeatures,
+                                                                    progressBar,
+                                                                    withDivisionFeatures=self._divisionClassifier is not None)
         else:
 
             import logging
@@ -524,7 +793,10 @@ class IlpProbabilityGenerator(ProbabilityGenerator):
             #     for frame in range(self.timeRange[0], self.timeRange[1]):
             #         progressBar.show()
             #         featuresPerFrame[frame].update(self._extractDivisionFeaturesForFrame(frame, featuresPerFrame)[1])
-        
+
+        # release the files that were kept open if the jobs ran in this process
+        closeWorkerFiles()
+
         t1 = time.time()
         getLogger().info("Feature computation took {} secs".format(t1 - t0))
         
@@ -538,6 +810,18 @@ class IlpProbabilityGenerator(ProbabilityGenerator):
         for i, v in enumerate(featureArray):
             traxel.set_feature_value(name, i, float(v))
 
+    def _getValidObjectIds(self, features):
+        '''
+        Return the ids of all objects (excluding the background) of a frame that are present
+        and pass the size filter, given the frame's feature dictionary.
+        '''
+        pixelSizes = np.asarray(features['Count']).flatten()
+        valid = pixelSizes != 0
+        if self._options.sizeFilter is not None:
+            valid &= (pixelSizes >= self._options.sizeFilter[0]) & (pixelSizes <= self._options.sizeFilter[1])
+        valid[0] = False
+        return np.flatnonzero(valid)
+
     def fillTraxels(self, usePgmlink=True, ts=None, fs=None, dispyNodeIps=[], turnOffFeatures=[]):
         """
         Compute all the features and predict object count as well as division probabilities.
@@ -548,7 +832,9 @@ class IlpProbabilityGenerator(ProbabilityGenerator):
         ts: an initial pgmlink.TraxelStore (only used if usePgmlink=True)
         fs: an initial pgmlink.FeatureStore (only used if usePgmlink=True)
 
-        returns (ts, fs) but only if usePgmlink=True, otherwise it fills self.TraxelsPerFrame
+        returns (ts, fs) but only if usePgmlink=True, otherwise it fills self.TraxelsPerFrame with a
+        `hytra.core.traxelstore.TraxelStore`, which shares the feature matrices of all frames instead of
+        copying them into one `Traxel` per object.
         """
         if usePgmlink:
             import pgmlink
@@ -565,6 +851,10 @@ class IlpProbabilityGenerator(ProbabilityGenerator):
         progressBar = ProgressBar(stop=len(self._featuresPerFrame))
         progressBar.show(increase=0)
 
+        if not usePgmlink:
+            self.TraxelsPerFrame = TraxelStore()
+            self.TraxelsPerFrame.scale = np.array([self.x_scale, self.y_scale, self.z_scale])
+
         for frame, features in self._featuresPerFrame.iteritems():
             # predict random forests
             if self._countClassifier is not None:
@@ -575,21 +865,23 @@ class IlpProbabilityGenerator(ProbabilityGenerator):
                 divisionProbabilities = self._divisionClassifier.predictProbabilities(
                     features=None, featureDict=features)
 
-            # create traxels for all objects
-            for objectId in range(1, features.values()[0].shape[0]):
-                # print("Frame {} Object {}".format(frame, objectId))
-                pixelSize = features['Count'][objectId]
-                if pixelSize == 0 or (self._options.sizeFilter is not None \
-                        and (pixelSize < self._options.sizeFilter[0] \
-                                     or pixelSize > self._options.sizeFilter[1])):
-                    continue
+            if not usePgmlink:
+                # store feature matrices of the whole frame, traxels are only views into these
+                self.TraxelsPerFrame.addFrame(frame, features, self._getValidObjectIds(features))
+                if self._countClassifier is not None:
+                    self.TraxelsPerFrame.addFeatureMatrix(
+                        frame, self.detectionProbabilityFeatureName, objectCountProbabilities)
+                if self._divisionClassifier is not None and frame + 1 < self.timeRange[1]:
+                    self.TraxelsPerFrame.addFeatureMatrix(
+                        frame, self.divisionProbabilityFeatureName, divisionProbabilities)
+                progressBar.show()
+                continue
 
+            # create traxels for all objects
+            for objectId in self._getValidObjectIds(features):
                 # create traxel
-                if usePgmlink:
-                    traxel = pgmlink.Traxel()
-                else:
-                    traxel = Traxel()
-                traxel.Id = objectId
+                traxel = pgmlink.Traxel()
+                traxel.Id = int(objectId)
                 traxel.Timestep = frame
 
                 # add raw features
@@ -633,11 +925,8 @@ class IlpProbabilityGenerator(ProbabilityGenerator):
                 traxel.set_y_scale(self.y_scale)
                 traxel.set_z_scale(self.z_scale)
 
-                if usePgmlink:
-                    # add to pgmlink's traxelstore
-                    ts.add(fs, traxel)
-                else:
-                    self.TraxelsPerFrame.setdefault(frame, {})[objectId] = traxel
+                # add to pgmlink's traxelstore
+                ts.add(fs, traxel)
             progressBar.show()
 
         if usePgmlink:
@@ -656,6 +945,53 @@ class IlpProbabilityGenerator(ProbabilityGenerator):
                 traxelFeatureDict[k] = v[objectId, ...]
         return traxelFeatureDict
 
+    def getStackedTraxelFeatureDict(self, frames, objectIds, featureNames=None):
+        """
+        Getter method for the features of many traxels at once. Returns one dictionary where row `i` of each feature
+        belongs to traxel (`frames[i]`, `objectIds[i]`), gathering all rows of a frame with one indexing operation.
+        Only the features in `featureNames` are extracted if that is given.
+        """
+        assert self._featuresPerFrame != None
+        frames = np.asarray(frames, dtype=np.int64)
+        objectIds = np.asarray(objectIds, dtype=np.int64)
+        uniqueFrames = np.unique(frames)
+        if len(uniqueFrames) == 0:
+            return {}
+
+        keys = set(self._featuresPerFrame[int(uniqueFrames[0])].keys())
+        for frame in uniqueFrames[1:]:
+            keys.intersection_update(self._featuresPerFrame[int(frame)].keys())
+        if featureNames is not None:
+            keys.intersection_update(featureNames)
+
+        rowsPerFrame = [np.flatnonzero(frames == frame) for frame in uniqueFrames]
+        order = np.concatenate(rowsPerFrame)
+        inverseOrder = np.empty_like(order)
+        inverseOrder[order] = np.arange(len(order))
+
+        stackedFeatureDict = {}
+        for k in keys:
+            if 'Polygon' in k:
+                values = [None] * len(frames)
+                for frame, rows in zip(uniqueFrames, rowsPerFrame):
+                    v = self._featuresPerFrame[int(frame)][k]
+                    for row in rows:
+                        values[row] = v[objectIds[row]]
+                stackedFeatureDict[k] = values
+            else:
+                parts = [self._featuresPerFrame[int(frame)][k][objectIds[rows], ...]
+                         for frame, rows in zip(uniqueFrames, rowsPerFrame)]
+                stackedFeatureDict[k] = np.concatenate(parts)[inverseOrder]
+        return stackedFeatureDict
+
+    def getTransitionFeatureMatrix(self, featureDictsObjectA, featureDictsObjectB, selectedFeatures):
+        """
+        Batched version of `getTransitionFeatureVector`, working on stacked feature dictionaries
+        (see `getStackedTraxelFeatureDict`). Returns a matrix with one row per transition.
+        """
+        return self._pluginManager.applyTransitionFeatureMatrixConstructionPlugins(
+            featureDictsObjectA, featureDictsObjectB, selectedFeatures)
+
     def getTransitionFeatureVector(self, featureDictObjectA, featureDictObjectB, selectedFeatures):
         """
         Return component wise difference and product of the selected features as input for the TransitionClassifier
@@ -706,6 +1042,8 @@ if __name__ == '__main__':
     parser.add_argument('--disable-multiprocessing', dest='disableMultiprocessing', action='store_true',
                         help='Do not use multiprocessing to speed up computation',
                         default=False)
+    parser.add_argument('--num-classifier-workers', dest='numClassifierWorkers', type=int, default=None,
+                        help='Number of threads that evaluate the random forests, defaults to all cores')
 
     args = parser.parse_args()
 
@@ -735,6 +1073,8 @@ if __name__ == '__main__':
     ilpOptions.divisionClassifierFilename = args.ilpFilename
     ilpOptions.rawImageFilename = args.rawFilename
 
-    probabilityGenerator = IlpProbabilityGenerator(ilpOptions=ilpOptions, useMultiprocessing=not args.disableMultiprocessing)
+    probabilityGenerator = IlpProbabilityGenerator(ilpOptions=ilpOptions,
+                                                   useMultiprocessing=not args.disableMultiprocessing,
+                                                   numClassifierWorkers=args.numClassifierWorkers)
     probabilityGenerator.timeRange = (0, 3)
     probabilityGenerator.fillTraxels(usePgmlink=False)
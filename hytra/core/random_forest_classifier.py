@@ -3,6 +3,7 @@ import numpy as np
 import h5py
 import os
 import logging
+import concurrent.futures
 from hytra.pluginsystem.plugin_manager import TrackingPluginManager
 from hytra.core.ilastik_project_options import IlastikProjectOptions
 
@@ -16,11 +17,17 @@ class RandomForestClassifier:
     and allows to read the RFs trained by ilastik, as well as which features were selected.
     """
 
-    def __init__(self, classifierPath=None, ilpFilename=None, ilpOptions=IlastikProjectOptions(), selectedFeatures=[]):
+    def __init__(self, classifierPath=None, ilpFilename=None, ilpOptions=IlastikProjectOptions(), selectedFeatures=[],
+                 numWorkers=1, chunkSize=20000):
         """
         Construct a random forest by either loading it from file (`classifierPath` and `ilpFilename` must be given),
-        or an empty untrained random forest with specified `selectedFeatures`
+        or an empty untrained random forest with specified `selectedFeatures`.
+
+        Prediction evaluates all forests and chunks of `chunkSize` rows concurrently in a pool of `numWorkers` threads
+        (vigra releases the GIL during prediction), `numWorkers=1` predicts everything sequentially.
         """
+        self.numWorkers = numWorkers
+        self.chunkSize = chunkSize
         self._options = ilpOptions
         self._classifierPath = classifierPath
         self._ilpFilename = ilpFilename
@@ -126,10 +133,29 @@ class RandomForestClassifier:
             print(features)
             raise AssertionError()
 
-        # predict by summing the probabilities of all the given random forests (not in parallel - not optimized for speed)
-        probabilities = np.zeros((features.shape[0], self._randomForests[0].labelCount()))
-        for rf in self._randomForests:
-            probabilities += rf.predictProbabilities(features.astype('float32'))
+        # predict every chunk of rows with every forest, in parallel if more than one worker is configured
+        features = features.astype('float32')
+        numRows = features.shape[0]
+        chunks = [(start, min(start + self.chunkSize, numRows)) for start in range(0, numRows, self.chunkSize)]
+        if len(chunks) == 0:
+            chunks = [(0, 0)]
+
+        def predictChunk(rf, start, stop):
+            return rf.predictProbabilities(features[start:stop])
+
+        if self.numWorkers > 1 and len(self._randomForests) * len(chunks) > 1:
+            with concurrent.futures.ThreadPoolExecutor(max_workers=self.numWorkers) as executor:
+                jobs = [[executor.submit(predictChunk, rf, start, stop) for start, stop in chunks]
+                        for rf in self._randomForests]
+                predictionsPerForest = [[job.result() for job in forestJobs] for forestJobs in jobs]
+        else:
+            predictionsPerForest = [[predictChunk(rf, start, stop) for start, stop in chunks]
+                                    for rf in self._randomForests]
+
+        # sum the probabilities of all the given random forests, in the order of the forests
+        probabilities = np.zeros((numRows, self._randomForests[0].labelCount()))
+        for predictions in predictionsPerForest:
+            probabilities += np.vstack(predictions)
 
         return probabilities
 
@@ -0,0 +1,397 @@
+'''
+Tracking of long videos in overlapping time windows, such that a solver only ever sees the hypotheses of one window.
+
+The hypotheses of a model are distributed to the windows in a single (streaming) pass and spooled to temporary files.
+Every window is then solved independently in a worker process, and the results of consecutive windows are stitched
+together at a frame in their overlap where both agree, see `SlidingWindowTracker`.
+Apart from the final result, the memory needed is bounded by the size of a few windows instead of the whole video.
+'''
+
+import os
+import shutil
+import logging
+import tempfile
+import cPickle as pickle
+import numpy as np
+from hytra.core.traxelindex import TraxelIndex
+from hytra.core.jsongraph import convexify, listify
+from hytra.util.frameexport import mapFrames
+
+
+def getLogger():
+    ''' logger to be used in this module '''
+    return logging.getLogger(__name__)
+
+
+def flowSolver(model, weights):
+    ''' solve a model with the flow based tracking of `dpct` or its built-in fallback (needs convexified costs) '''
+    from hytra.core.mincostflow import importFlowSolver
+    return importFlowSolver().trackFlowBased(model, weights)
+
+
+def ilpSolver(model, weights):
+    ''' solve a model with the ILP based tracking of `multiHypoTracking` (using CPLEX or Gurobi) '''
+    try:
+        import multiHypoTracking_with_cplex as mht
+    except ImportError:
+        try:
+            import multiHypoTracking_with_gurobi as mht
+        except ImportError:
+            raise ImportError("No version of ILP solver found")
+    return mht.track(model, weights)
+
+
+def computeWindows(firstTimestep, lastTimestep, windowSize, overlap):
+    '''
+    **returns** a list of half-open time ranges `(start, stop)` with `windowSize` frames each (except for the last one),
+    where consecutive windows share `overlap` frames, that together cover all frames from `firstTimestep` to `lastTimestep`.
+    '''
+    if not 0 < overlap < windowSize:
+        raise ValueError("The overlap must be at least one frame and smaller than the window size")
+    windows = []
+    start = firstTimestep
+    while True:
+        stop = min(start + windowSize, lastTimestep + 1)
+        windows.append((start, stop))
+        if stop > lastTimestep:
+            return windows
+        start += windowSize - overlap
+
+
+class TimeSpans(object):
+    '''
+    First and last timestep of every UUID of a model, as the node of a tracklet spans several frames.
+    '''
+
+    def __init__(self, traxelIndex):
+        self.uuids = traxelIndex.uniqueUuids
+        self.firstTimesteps = traxelIndex.firstTraxelOf(self.uuids)[0]
+        self.lastTimesteps = traxelIndex.lastTraxelOf(self.uuids)[0]
+
+    def of(self, uuids):
+        ''' **returns** a tuple of arrays `(firstTimesteps, lastTimesteps)` of the given `uuids` '''
+        uuids = np.asarray(uuids, dtype=np.int64)
+        if len(self.uuids) == 0:
+            positions = np.zeros(uuids.shape, dtype=np.int64)
+            found = np.zeros(uuids.shape, dtype=bool)
+        else:
+            positions = np.minimum(np.searchsorted(self.uuids, uuids), len(self.uuids) - 1)
+            found = self.uuids[positions] == uuids
+        if not np.all(found):
+            raise KeyError("UUIDs {} are not in the traxelToUniqueId mapping".format(uuids[~found][:10].tolist()))
+        return self.firstTimesteps[positions], self.lastTimesteps[positions]
+
+    def commonSpan(self, uuids):
+        '''
+        **returns** `(latestStart, earliestEnd)` of the given `uuids`,
+        a window contains all of them if it starts before or at `earliestEnd` and ends after `latestStart`
+        '''
+        firstTimesteps, lastTimesteps = self.of(uuids)
+        return int(firstTimesteps.max()), int(lastTimesteps.min())
+
+
+class _WindowSpool(object):
+    '''
+    One temporary file per window, to which pickled `(kind, span, item)` tuples are appended.
+    Items are buffered in memory, but at most `bufferSize` at a time for all windows together.
+    '''
+
+    def __init__(self, directory, windows, bufferSize):
+        self.windows = windows
+        self.bufferSize = bufferSize
+        self.filenames = [os.path.join(directory, 'window{}.pickle'.format(i)) for i in range(len(windows))]
+        self._buffers = [[] for _ in windows]
+        self._numBuffered = 0
+        self._starts = np.array([w[0] for w in windows], dtype=np.int64)
+        self._stops = np.array([w[1] for w in windows], dtype=np.int64)
+
+    def windowsOf(self, latestStart, earliestEnd):
+        ''' **returns** the indices of all windows that contain the time span '''
+        return np.flatnonzero(np.logical_and(self._starts <= earliestEnd, self._stops > latestStart)).tolist()
+
+    def add(self, kind, span, item):
+        for w in self.windowsOf(*span):
+            self._buffers[w].append((kind, span, item))
+            self._numBuffered += 1
+        if self._numBuffered >= self.bufferSize:
+            self.flush()
+
+    def addToWindow(self, w, kind, span, item):
+        self._buffers[w].append((kind, span, item))
+        self._numBuffered += 1
+
+    def flush(self):
+        for filename, buf in zip(self.filenames, self._buffers):
+            if len(buf) > 0:
+                with open(filename, 'ab') as f:
+                    pickler = pickle.Pickler(f, pickle.HIGHEST_PROTOCOL)
+                    for entry in buf:
+                        pickler.dump(entry)
+                del buf[:]
+        self._numBuffered = 0
+
+
+def _readSpool(filename):
+    ''' **yields** all `(kind, span, item)` tuples stored in a spool file '''
+    if not os.path.exists(filename):
+        return
+    with open(filename, 'rb') as f:
+        unpickler = pickle.Unpickler(f)
+        while True:
+            try:
+                yield unpickler.load()
+            except EOFError:
+                return
+
+
+def _zeroCosts(features):
+    ''' convex cost vector of the same length as `features` that is (almost) zero for all states '''
+    return convexify(listify([0.0] * len(features)), 0.000001)
+
+
+def buildWindowModel(spoolFilenames, window, timeRange, settings):
+    '''
+    Assemble the model of all hypotheses stored in the given spool files that lie completely within the `window`.
+    Objects that are present in the first (last) frame of a window, which is not the first (last) frame of the
+    whole video, can appear (disappear) for free, as if the window boundary was the boundary of the video.
+    '''
+    start, stop = window
+    model = {'segmentationHypotheses': [],
+             'linkingHypotheses': [],
+             'divisionHypotheses': [],
+             'exclusions': [],
+             'settings': settings}
+    seen = set()
+    traxelColumns = []
+
+    for filename in spoolFilenames:
+        for kind, span, item in _readSpool(filename):
+            latestStart, earliestEnd = span
+            if kind == 'traxels':
+                traxelColumns.append(item)
+                continue
+            if latestStart >= stop or earliestEnd < start:
+                continue
+            if kind == 'segmentationHypotheses':
+                key = (kind, item['id'])
+            elif kind == 'linkingHypotheses':
+                key = (kind, item['src'], item['dest'])
+            else:
+                key = (kind, tuple(item))
+            if key in seen:
+                continue
+            seen.add(key)
+
+            if kind == 'segmentationHypotheses':
+                item = dict(item)
+                if latestStart <= start and start > timeRange[0] and 'appearanceFeatures' in item:
+                    item['appearanceFeatures'] = _zeroCosts(item['appearanceFeatures'])
+                if earliestEnd >= stop - 1 and stop - 1 < timeRange[1] and 'disappearanceFeatures' in item:
+                    item['disappearanceFeatures'] = _zeroCosts(item['disappearanceFeatures'])
+            model[kind].append(item)
+
+    # mapping between uuids and traxels of the contained detections
+    uuids = np.array(sorted(k[1] for k in seen if k[0] == 'segmentationHypotheses'), dtype=np.int64)
+    if len(traxelColumns) > 0:
+        timesteps, traxelIds, traxelUuids = [np.concatenate(c) for c in zip(*traxelColumns)]
+        contained = np.in1d(traxelUuids, uuids)
+        traxelIndex = TraxelIndex(timesteps[contained], traxelIds[contained], traxelUuids[contained])
+        _, unique = np.unique(TraxelIndex._traxelKey(traxelIndex.timesteps, traxelIndex.traxelIds), return_index=True)
+        traxelIndex = TraxelIndex(traxelIndex.timesteps[unique], traxelIndex.traxelIds[unique], traxelIndex.uuids[unique])
+    else:
+        traxelIndex = TraxelIndex([], [], [])
+    model['traxelToUniqueId'] = traxelIndex.toTraxelToUniqueIdMap()
+    return model
+
+
+class WindowSolution(object):
+    '''
+    The result of a single window, with `detections` and `divisions` as `{uuid: value}`
+    and `links` as `{(src, dest): value}` dictionaries. `divisions` is `None` if the solver did not return any.
+    '''
+
+    def __init__(self, window, result):
+        self.window = window
+        self.detections = dict((int(d['id']), d['value']) for d in result['detectionResults'])
+        self.links = dict(((int(l['src']), int(l['dest'])), l['value']) for l in result.get('linkingResults', None) or [])
+        if result.get('divisionResults', None) is None:
+            self.divisions = None
+        else:
+            self.divisions = dict((int(d['id']), d['value']) for d in result['divisionResults'])
+
+
+def solveWindow(solver, weights, spoolFilenames, window, timeRange, settings):
+    '''
+    Build the model of a window from the spool files and solve it with `solver(model, weights)`,
+    meant to be run in a worker process.
+
+    **returns** a `WindowSolution`
+    '''
+    model = buildWindowModel(spoolFilenames, window, timeRange, settings)
+    getLogger().debug("Solving window {} with {} detections and {} links".format(
+        window, len(model['segmentationHypotheses']), len(model['linkingHypotheses'])))
+    return WindowSolution(window, solver(model, weights))
+
+
+class SlidingWindowTracker(object):
+    '''
+    Track a model in overlapping time windows of `windowSize` frames, where consecutive windows share `overlap` frames.
+
+    The windows are solved independently (in parallel processes if `useMultiprocessing` is `True`)
+    by `solver(model, weights)`, which must return a result dictionary like `flowSolver` or `ilpSolver`
+    and be a module-level function so that it can be sent to worker processes.
+
+    Two consecutive windows are stitched at a frame `t` in their overlap where both solutions agree on the number of
+    objects in every detection that is present at `t`, preferring frames close to the middle of the overlap.
+    Detections starting at or before `t`, links ending at or before `t` and divisions of detections ending before `t`
+    are taken from the earlier window, everything else from the later one, which keeps the flow of objects consistent.
+    If the two windows do not agree on any frame, a bridging window centered on the overlap is solved in addition,
+    and if that does not help either, the frame with the fewest disagreements is used and a warning is logged.
+    '''
+
+    def __init__(self, solver, windowSize=50, overlap=10, useMultiprocessing=True, maxWorkers=None, bufferSize=100000):
+        self.solver = solver
+        self.windowSize = windowSize
+        self.overlap = overlap
+        self.useMultiprocessing = useMultiprocessing
+        self.maxWorkers = maxWorkers
+        self.bufferSize = bufferSize
+
+    def _spoolModel(self, model, spool, timeSpans):
+        ''' distribute all hypotheses of the model to the windows they are contained in '''
+        for h in model['segmentationHypotheses']:
+            spool.add('segmentationHypotheses', timeSpans.commonSpan([h['id']]), h)
+        for h in model['linkingHypotheses']:
+            spool.add('linkingHypotheses', timeSpans.commonSpan([h['src'], h['dest']]), h)
+        for exclusion in model.get('exclusions', None) or []:
+            spool.add('exclusions', timeSpans.commonSpan(exclusion), exclusion)
+        if len(model.get('divisionHypotheses', None) or []) > 0:
+            raise ValueError("Separate division hypotheses are not supported by the sliding window tracker")
+        spool.flush()
+
+    def _spoolTraxels(self, traxelIndex, spool, timeSpans):
+        ''' store the `traxelToUniqueId` rows of every window as arrays '''
+        firstTimesteps, lastTimesteps = timeSpans.of(traxelIndex.uuids)
+        for w, (start, stop) in enumerate(spool.windows):
+            rows = np.logical_and(lastTimesteps >= start, firstTimesteps < stop)
+            spool.addToWindow(w, 'traxels', (start, stop - 1),
+                              (traxelIndex.timesteps[rows], traxelIndex.traxelIds[rows], traxelIndex.uuids[rows]))
+        spool.flush()
+
+    def _findCut(self, previous, following, timeSpans):
+        '''
+        **returns** `(t, numDisagreements)` for the frame `t` in the overlap of two window solutions
+        where they agree on most of the detections present at `t`
+        '''
+        frames = np.arange(following.window[0], previous.window[1])
+        uuids = np.array(sorted(set(previous.detections) | set(following.detections)), dtype=np.int64)
+        if len(uuids) == 0:
+            return int(frames[len(frames) // 2]), 0
+        firstTimesteps, lastTimesteps = timeSpans.of(uuids)
+        differs = np.array([previous.detections.get(u, 0) != following.detections.get(u, 0) for u in uuids.tolist()])
+        present = np.logical_and(firstTimesteps[np.newaxis, :] <= frames[:, np.newaxis],
+                                 lastTimesteps[np.newaxis, :] >= frames[:, np.newaxis])
+        disagreements = np.sum(np.logical_and(present, differs[np.newaxis, :]), axis=1)
+
+        # prefer frames close to the middle of the overlap, which are furthest away from the window boundaries
+        distanceToMiddle = np.abs(2 * frames - (frames[0] + frames[-1]))
+        best = np.lexsort((distanceToMiddle, disagreements))[0]
+        return int(frames[best]), int(disagreements[best])
+
+    def _appendPiece(self, result, solution, lowCut, highCut, timeSpans):
+        ''' add everything the given solution is responsible for, between the two cut frames, to the result '''
+        def owned(uuids, timeOf):
+            if len(uuids) == 0:
+                return np.zeros(0, dtype=bool)
+            times = timeOf(np.array(uuids, dtype=np.int64))
+            return np.logical_and(times > lowCut, times <= highCut)
+
+        firstOf = lambda uuids: timeSpans.of(uuids)[0]
+        detections = solution.detections.items()
+        for (uuid, value), isOwned in zip(detections, owned([d[0] for d in detections], firstOf)):
+            if isOwned:
+                result['detectionResults'].append({'id': uuid, 'value': value})
+
+        links = solution.links.items()
+        for ((src, dest), value), isOwned in zip(links, owned([l[0][1] for l in links], firstOf)):
+            if isOwned:
+                result['linkingResults'].append({'src': src, 'dest': dest, 'value': value})
+
+        if solution.divisions is not None:
+            if result['divisionResults'] is None:
+                result['divisionResults'] = []
+            divisions = solution.divisions.items()
+            afterLastOf = lambda uuids: timeSpans.of(uuids)[1] + 1
+            for (uuid, value), isOwned in zip(divisions, owned([d[0] for d in divisions], afterLastOf)):
+                if isOwned:
+                    result['divisionResults'].append({'id': uuid, 'value': value})
+
+    def track(self, model, weights):
+        '''
+        Track the `model`, which can be a dictionary or a `hytra.core.jsongraph.JsonStreamReader`
+        (see `readFromJSON(filename, streaming=True)`), with the given `weights`.
+
+        **returns** the stitched result dictionary with `detectionResults`, `linkingResults` and `divisionResults`
+        '''
+        traxelToUniqueId = model['traxelToUniqueId']
+        traxelIndex = TraxelIndex.fromTraxelToUniqueIdMap(traxelToUniqueId)
+        del traxelToUniqueId
+        result = {'detectionResults': [], 'linkingResults': [], 'divisionResults': None}
+        if len(traxelIndex) == 0:
+            return result
+
+        timeSpans = TimeSpans(traxelIndex)
+        timeRange = (int(traxelIndex.timesteps.min()), int(traxelIndex.timesteps.max()))
+        windows = computeWindows(timeRange[0], timeRange[1], self.windowSize, self.overlap)
+        getLogger().info("Tracking frames {} to {} in {} windows".format(timeRange[0], timeRange[1], len(windows)))
+        settings = model.get('settings', {})
+
+        spoolDirectory = tempfile.mkdtemp(prefix='hytra-windows-')
+        try:
+            spool = _WindowSpool(spoolDirectory, windows, self.bufferSize)
+            self._spoolModel(model, spool, timeSpans)
+            self._spoolTraxels(traxelIndex, spool, timeSpans)
+            del traxelIndex
+
+            jobs = ((self.solver, weights, [filename], window, timeRange, settings)
+                    for filename, window in zip(spool.filenames, windows))
+            solutions = mapFrames(solveWindow, jobs, useMultiprocessing=self.useMultiprocessing,
+                                  maxWorkers=self.maxWorkers)
+
+            previous = None
+            lowCut = -np.inf
+            for i, solution in enumerate(solutions):
+                if previous is None:
+                    previous = solution
+                    continue
+
+                cut, numDisagreements = self._findCut(previous, solution, timeSpans)
+                if numDisagreements > 0:
+                    # re-solve the region around the overlap, with the window boundaries far away
+                    middle = (solution.window[0] + previous.window[1]) // 2
+                    start = max(timeRange[0], min(middle - self.windowSize // 2, timeRange[1] + 1 - self.windowSize))
+                    bridgeWindow = (start, min(timeRange[1] + 1, start + self.windowSize))
+                    getLogger().debug("Windows {} and {} disagree, solving bridging window {}".format(
+                        previous.window, solution.window, bridgeWindow))
+                    bridge = solveWindow(self.solver, weights, spool.filenames[i - 1:i + 1], bridgeWindow, timeRange, settings)
+                    firstCut, firstDisagreements = self._findCut(previous, bridge, timeSpans)
+                    secondCut, secondDisagreements = self._findCut(bridge, solution, timeSpans)
+                    if firstDisagreements == 0 and secondDisagreements == 0 and lowCut < firstCut < secondCut:
+                        self._appendPiece(result, previous, lowCut, firstCut, timeSpans)
+                        self._appendPiece(result, bridge, firstCut, secondCut, timeSpans)
+                        lowCut = secondCut
+                        previous = solution
+                        continue
+                    getLogger().warning("Windows {} and {} disagree on {} detections at frame {}, "
+                                        "the stitched result might be inconsistent there".format(
+                                            previous.window, solution.window, numDisagreements, cut))
+
+                self._appendPiece(result, previous, lowCut, cut, timeSpans)
+                lowCut = cut
+                previous = solution
+
+            self._appendPiece(result, previous, lowCut, np.inf, timeSpans)
+        finally:
+            shutil.rmtree(spoolDirectory, ignore_errors=True)
+
+        return result
@@ -0,0 +1,324 @@
+'''
+Tracking of huge fields of view in overlapping spatial tiles, such that the hypotheses graph and the model
+are only ever built for the objects of one tile and its surroundings.
+
+The field of view is partitioned into a regular grid of tiles, see `SpatialTiling`. Each tile is extended by
+a halo, the hypotheses graph of all objects in the extended region is built and solved in a worker process,
+and the tile keeps only the decisions about the objects it owns. These are merged into one result, where
+a final reconciliation step resolves the (rare) disagreements of neighboring tiles about links crossing their border,
+see `SpatialTilingTracker`.
+'''
+
+import logging
+import numpy as np
+from hytra.core.fieldofview import FieldOfView
+from hytra.core.probabilitygenerator import ProbabilityGenerator
+from hytra.core.ilastikhypothesesgraph import IlastikHypothesesGraph
+from hytra.core.traxelindex import TraxelIndex
+from hytra.util.frameexport import mapFrames
+
+
+def getLogger():
+    ''' logger to be used in this module '''
+    return logging.getLogger(__name__)
+
+
+def getTraxelPositions(traxelStore, frame, objectIds=None):
+    '''
+    **returns** the x,y,z coordinates of the centers of the given traxels of one frame (all if `objectIds` is `None`)
+    as (N,3) matrix, Z is zero for 2D data
+    '''
+    positions = np.array(traxelStore.getFeatureMatrix(frame, 'com', objectIds), dtype=np.float64)
+    positions = positions.reshape((positions.shape[0], -1))
+    if positions.shape[1] < 3:
+        positions = np.hstack([positions, np.zeros((positions.shape[0], 3 - positions.shape[1]))])
+    return positions[:, :3]
+
+
+class SpatialTiling(object):
+    '''
+    Regular grid of tiles with the given `tileSize` (a scalar or one value for each of x,y,z)
+    over the spatial extent of a `hytra.core.fieldofview.FieldOfView`.
+
+    A tile owns all objects whose center lies inside its grid cell. As the cells partition space
+    (objects outside of the field of view belong to the closest cell), every object is owned by exactly one tile,
+    also if it lies on the border between tiles. Every tile is tracked together with the objects inside its halo,
+    the cell extended by `haloWidth` in each direction, so that its solver sees what happens beyond the border.
+    '''
+
+    def __init__(self, fieldOfView, tileSize, haloWidth):
+        self.lowerBound = np.asarray(fieldOfView.lower_bound(), dtype=np.float64)
+        self.upperBound = np.asarray(fieldOfView.upper_bound(), dtype=np.float64)
+        self.tileSize = np.ones(3) * np.asarray(tileSize, dtype=np.float64)
+        self.haloWidth = float(haloWidth)
+        if np.any(self.tileSize <= 0):
+            raise ValueError("The tile size must be positive")
+        if self.haloWidth < 0:
+            raise ValueError("The halo width must not be negative")
+
+        extent = self.upperBound[1:] - self.lowerBound[1:]
+        self.shape = tuple(np.maximum(1, np.ceil(extent / self.tileSize)).astype(np.int64).tolist())
+
+    def __len__(self):
+        ''' number of tiles '''
+        return int(np.prod(self.shape))
+
+    def ownerOf(self, positions):
+        ''' **returns** the index of the tile that owns each of the given (N,3) x,y,z `positions` '''
+        positions = np.asarray(positions, dtype=np.float64).reshape((-1, 3))
+        cells = np.floor((positions - self.lowerBound[1:]) / self.tileSize).astype(np.int64)
+        cells = np.clip(cells, 0, np.array(self.shape) - 1)
+        return np.ravel_multi_index(tuple(cells.T), self.shape)
+
+    def tileBounds(self, tile):
+        ''' **returns** the lower and upper x,y,z corners of the grid cell of the given tile '''
+        lower = self.lowerBound[1:] + np.array(np.unravel_index(tile, self.shape)) * self.tileSize
+        return lower, np.minimum(lower + self.tileSize, self.upperBound[1:])
+
+    def haloBounds(self, tile):
+        ''' **returns** the lower and upper x,y,z corners of the given tile extended by its halo '''
+        lower, upper = self.tileBounds(tile)
+        return (np.maximum(lower - self.haloWidth, self.lowerBound[1:]),
+                np.minimum(upper + self.haloWidth, self.upperBound[1:]))
+
+    def insideHalo(self, tile, positions):
+        ''' **returns** a boolean array that is `True` for all `positions` inside the given tile or its halo '''
+        positions = np.asarray(positions, dtype=np.float64).reshape((-1, 3))
+        lower, upper = self.haloBounds(tile)
+        # objects outside of the field of view belong to the closest tiles
+        outside = np.logical_or(positions < self.lowerBound[1:], positions > self.upperBound[1:])
+        positions = np.where(outside, np.clip(positions, self.lowerBound[1:], self.upperBound[1:]), positions)
+        return np.all(np.logical_and(positions >= lower, positions <= upper), axis=1)
+
+    def fieldOfViewOf(self, tile):
+        '''
+        **returns** the field of view covering the given tile and its halo, such that objects at the border
+        of the halo can appear and disappear as cheaply as at the border of the whole field of view
+        '''
+        lower, upper = self.haloBounds(tile)
+        return FieldOfView(self.lowerBound[0], lower[0], lower[1], lower[2],
+                           self.upperBound[0], upper[0], upper[1], upper[2])
+
+
+class TileSolution(object):
+    '''
+    The part of the solution a tile is responsible for, on the level of single traxels with their original ids:
+
+    * `timesteps`, `objectIds`, `values` and `divisionValues` of all traxels owned by the tile,
+      where the division value is -1 for traxels without division hypothesis
+    * `linkTimesteps` (of the source), `linkSources`, `linkTargets` and `linkValues` of all links
+      whose target traxel is owned by the tile
+    '''
+
+    def __init__(self, timesteps, objectIds, values, divisionValues, linkTimesteps, linkSources, linkTargets, linkValues):
+        self.timesteps = np.asarray(timesteps, dtype=np.int64)
+        self.objectIds = np.asarray(objectIds, dtype=np.int64)
+        self.values = np.asarray(values, dtype=np.int64)
+        self.divisionValues = np.asarray(divisionValues, dtype=np.int64)
+        self.linkTimesteps = np.asarray(linkTimesteps, dtype=np.int64)
+        self.linkSources = np.asarray(linkSources, dtype=np.int64)
+        self.linkTargets = np.asarray(linkTargets, dtype=np.int64)
+        self.linkValues = np.asarray(linkValues, dtype=np.int64)
+
+
+def trackTile(tiling, tile, traxelStore, originalIdsPerFrame, timeRange, graphParameters, withTracklets, convexify,
+              solver, weights):
+    '''
+    Build the hypotheses graph of the traxels of one tile and its halo (given as a `TraxelStore` with renumbered
+    objects, see `TraxelStore.extractTraxels`), solve it with `solver(model, weights)` and **return** the
+    `TileSolution` of everything the tile owns. Meant to be run in a worker process.
+    '''
+    numTraxels = traxelStore.countTraxels()
+    getLogger().debug("Tracking tile {} of {} with {} traxels".format(tile, len(tiling), numTraxels))
+    if numTraxels == 0:
+        return TileSolution(*([[]] * 8))
+
+    probabilityGenerator = ProbabilityGenerator()
+    probabilityGenerator.TraxelsPerFrame = traxelStore
+    hypothesesGraph = IlastikHypothesesGraph(probabilityGenerator=probabilityGenerator,
+                                             timeRange=timeRange,
+                                             fieldOfView=tiling.fieldOfViewOf(tile),
+                                             **graphParameters)
+    if withTracklets:
+        hypothesesGraph = hypothesesGraph.generateTrackletGraph()
+    hypothesesGraph.insertEnergies()
+    trackingGraph = hypothesesGraph.toTrackingGraph()
+    if convexify:
+        trackingGraph.convexifyCosts()
+    hypothesesGraph.insertSolution(solver(trackingGraph.model, weights))
+    del trackingGraph
+
+    traxelGraph = hypothesesGraph.referenceTraxelGraph if withTracklets else hypothesesGraph
+    nodes = traxelGraph._graph.nodes()
+    timesteps = np.array([n[0] for n in nodes], dtype=np.int64)
+    objectIds = np.array([n[1] for n in nodes], dtype=np.int64)
+    owned = np.zeros(len(nodes), dtype=bool)
+    for frame in np.unique(timesteps).tolist():
+        inFrame = np.flatnonzero(timesteps == frame)
+        owned[inFrame] = tiling.ownerOf(getTraxelPositions(traxelStore, frame, objectIds[inFrame])) == tile
+    values = np.array(traxelGraph._getNodeAttributes(nodes, 'value', 0), dtype=np.int64)
+    divisionValues = np.array([-1 if v is None else v for v in traxelGraph._getNodeAttributes(nodes, 'divisionValue', None)],
+                              dtype=np.int64)
+
+    edges = traxelGraph._graph.edges()
+    isOwned = dict(zip(nodes, owned.tolist()))
+    edges = [e for e in edges if isOwned[e[1]]]
+    linkValues = np.array(traxelGraph._getEdgeAttributes(edges, 'value', 0), dtype=np.int64)
+
+    def originalIds(frames, ids):
+        return np.array([originalIdsPerFrame[f][i] for f, i in zip(frames, ids)], dtype=np.int64)
+
+    return TileSolution(timesteps[owned],
+                        originalIds(timesteps[owned].tolist(), objectIds[owned].tolist()),
+                        values[owned],
+                        divisionValues[owned],
+                        [e[0][0] for e in edges],
+                        originalIds([e[0][0] for e in edges], [e[0][1] for e in edges]),
+                        originalIds([e[1][0] for e in edges], [e[1][1] for e in edges]),
+                        linkValues)
+
+
+def _reduceToCapacity(linkValues, linkNodes, capacities):
+    '''
+    Lower the values of links (in place, starting with the last ones) until the sum of the values of all links
+    at each node (given by `linkNodes`) does not exceed its capacity.
+
+    **returns** the number of links whose value was changed
+    '''
+    excess = np.bincount(linkNodes, weights=linkValues, minlength=len(capacities)).astype(np.int64) - capacities
+    numChanged = 0
+    for link in np.flatnonzero(excess[linkNodes] > 0)[::-1].tolist():
+        node = linkNodes[link]
+        if excess[node] > 0 and linkValues[link] > 0:
+            reduction = min(excess[node], linkValues[link])
+            linkValues[link] -= reduction
+            excess[node] -= reduction
+            numChanged += 1
+    return numChanged
+
+
+def mergeTileSolutions(tileSolutions):
+    '''
+    Combine the `TileSolution`s of all tiles into a consistent solution of the whole field of view.
+
+    Neighboring tiles decide about the two ends of the links crossing their border independently, so they can
+    disagree about them in rare cases. This is reconciled by lowering link values until no link carries more objects
+    than its source and target contain, only dividing traxels have two outgoing objects, and divisions have exactly
+    two active children. A warning is logged if that was necessary.
+
+    **returns** a tuple of `(traxelIndex, result)`, where every traxel got its own UUID in the `TraxelIndex`,
+    and the result dictionary refers to these UUIDs
+    '''
+    def concatenate(name):
+        return np.concatenate([getattr(s, name) for s in tileSolutions] + [np.zeros(0, dtype=np.int64)])
+
+    keys = TraxelIndex._traxelKey(concatenate('timesteps'), concatenate('objectIds'))
+    order = np.argsort(keys)
+    keys = keys[order]
+    timesteps = concatenate('timesteps')[order]
+    objectIds = concatenate('objectIds')[order]
+    values = concatenate('values')[order]
+    divisionValues = concatenate('divisionValues')[order]
+    assert(len(np.unique(keys)) == len(keys)), "Every traxel must be owned by exactly one tile"
+
+    # links to traxels that are not part of any tile solution cannot carry any objects
+    linkTimesteps = concatenate('linkTimesteps')
+    sourceKeys = TraxelIndex._traxelKey(linkTimesteps, concatenate('linkSources'))
+    targetKeys = TraxelIndex._traxelKey(linkTimesteps + 1, concatenate('linkTargets'))
+    sources = np.minimum(np.searchsorted(keys, sourceKeys), max(len(keys) - 1, 0))
+    targets = np.minimum(np.searchsorted(keys, targetKeys), max(len(keys) - 1, 0))
+    valid = np.logical_and(keys[sources] == sourceKeys, keys[targets] == targetKeys) if len(keys) > 0 \
+        else np.zeros(len(sourceKeys), dtype=bool)
+    sources, targets = sources[valid], targets[valid]
+    linkValues = concatenate('linkValues')[valid]
+
+    clampedValues = np.minimum(linkValues, np.minimum(values[sources], values[targets]))
+    numChanged = np.count_nonzero(clampedValues != linkValues)
+    linkValues = clampedValues
+    numChanged += _reduceToCapacity(linkValues, targets, values)
+
+    # a division needs a single object that is passed on to exactly two children
+    activeChildren = np.bincount(sources[linkValues > 0], minlength=len(keys))
+    brokenDivisions = np.logical_and(divisionValues > 0, np.logical_or(values != 1, activeChildren != 2))
+    numChanged += np.count_nonzero(brokenDivisions)
+    divisionValues[brokenDivisions] = 0
+    numChanged += _reduceToCapacity(linkValues, sources, np.where(divisionValues > 0, 2, values))
+    if numChanged > 0:
+        getLogger().warning("Tiles disagreed about {} traxels or links at their borders, "
+                            "consider using a larger halo".format(numChanged))
+
+    uuids = np.arange(len(keys), dtype=np.int64)
+    hasDivision = divisionValues >= 0
+    result = {'detectionResults': [{'id': u, 'value': v} for u, v in zip(uuids.tolist(), values.tolist())],
+              'linkingResults': [{'src': s, 'dest': t, 'value': v}
+                                 for s, t, v in zip(sources.tolist(), targets.tolist(), linkValues.tolist())],
+              'divisionResults': [{'id': u, 'value': v}
+                                  for u, v in zip(uuids[hasDivision].tolist(), divisionValues[hasDivision].tolist())]}
+    return TraxelIndex(timesteps, objectIds, uuids), result
+
+
+class SpatialTilingTracker(object):
+    '''
+    Track the traxels of a huge field of view in spatial tiles of `tileSize` with a halo of `haloWidth` around each,
+    see `SpatialTiling`. The hypotheses graph (an `IlastikHypothesesGraph` configured by the keyword arguments
+    in `graphParameters`, optionally contracted to tracklets) and the model of every tile are built and solved
+    by `solver(model, weights)` in a worker process (if `useMultiprocessing` is `True`), see e.g.
+    `hytra.core.slidingwindowtracking.flowSolver`, which needs `convexify=True`.
+
+    The halo should be at least as wide as the maximal distance of a link (`maxNeighborDistance`),
+    otherwise links crossing tile borders can be missed. Transition classifiers are not supported,
+    because the tiles only see the traxel features, not the probability generator.
+    '''
+
+    def __init__(self, solver, tileSize, haloWidth, graphParameters, withTracklets=True, convexify=False,
+                 useMultiprocessing=True, maxWorkers=None):
+        if graphParameters.get('transitionClassifier', None) is not None:
+            raise ValueError("Transition classifiers are not supported when tracking in tiles")
+        self.solver = solver
+        self.tileSize = tileSize
+        self.haloWidth = haloWidth
+        self.graphParameters = graphParameters
+        self.withTracklets = withTracklets
+        self.convexify = convexify
+        self.useMultiprocessing = useMultiprocessing
+        self.maxWorkers = maxWorkers
+
+    def track(self, traxelStore, fieldOfView, timeRange, weights):
+        '''
+        Track all traxels of the `traxelStore` (see `hytra.core.traxelstore.TraxelStore`) inside the `fieldOfView`.
+
+        **returns** a tuple `(model, result)`, where the result has one detection per traxel, and the model
+        contains the structure of the hypotheses of the result (without features) and the `traxelToUniqueId` mapping
+        '''
+        tiling = SpatialTiling(fieldOfView, self.tileSize, self.haloWidth)
+        if self.haloWidth < self.graphParameters.get('maxNeighborDistance', 200):
+            getLogger().warning("The halo ({}) is smaller than the maximal link distance, "
+                                "links across tile borders might be missed".format(self.haloWidth))
+        getLogger().info("Tracking {} traxels in {} tiles".format(traxelStore.countTraxels(), len(tiling)))
+
+        positionsPerFrame = dict((frame, getTraxelPositions(traxelStore, frame)) for frame in traxelStore.keys())
+
+        def jobs():
+            for tile in range(len(tiling)):
+                objectIdsPerFrame = dict((frame, traxelStore.getObjectIds(frame)[tiling.insideHalo(tile, positions)])
+                                         for frame, positions in positionsPerFrame.iteritems())
+                tileStore, originalIdsPerFrame = traxelStore.extractTraxels(objectIdsPerFrame)
+                yield (tiling, tile, tileStore, originalIdsPerFrame, timeRange, self.graphParameters,
+                       self.withTracklets, self.convexify, self.solver, weights)
+
+        tileSolutions = list(mapFrames(trackTile, jobs(), useMultiprocessing=self.useMultiprocessing,
+                                       maxWorkers=self.maxWorkers))
+        traxelIndex, result = mergeTileSolutions(tileSolutions)
+
+        model = {'segmentationHypotheses': [{'id': d['id']} for d in result['detectionResults']],
+                 'linkingHypotheses': [{'src': l['src'], 'dest': l['dest']} for l in result['linkingResults']],
+                 'divisionHypotheses': [],
+                 'exclusions': [],
+                 'traxelToUniqueId': traxelIndex.toTraxelToUniqueIdMap(),
+                 'settings': {'statesShareWeights': True,
+                              'allowPartialMergerAppearance': False,
+                              'requireSeparateChildrenOfDivision': True,
+                              'optimizerEpGap': 0.01,
+                              'optimizerVerbose': True,
+                              'optimizerNumThreads': 1}}
+        return model, result
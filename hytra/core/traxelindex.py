@@ -0,0 +1,176 @@
+'''
+Array based mapping between the unique IDs (UUIDs) of the nodes of a tracking graph and the traxels
+(pairs of timestep and label image ID) they represent. A node contains several traxels if it is a tracklet.
+
+In the JSON files this mapping is stored as `traxelToUniqueId` dictionary `{str(timestep): {str(traxelId): uuid}}`.
+The `TraxelIndex` keeps it in sorted numpy arrays instead, such that the UUIDs of many traxels
+or the traxels of many UUIDs can be looked up at once, without any per-traxel dictionary access.
+'''
+
+import itertools
+import numpy as np
+
+
+class TraxelIndex(object):
+    '''
+    Mapping between UUIDs and traxels, stored as three columns `timesteps`, `traxelIds` and `uuids`
+    (one row per traxel, sorted by timestep and traxel id).
+
+    Use `uuidOf` to find the UUIDs of traxels and `traxelsOf`, `firstTraxelOf` or `lastTraxelOf`
+    to find the traxels of UUIDs, where the traxels of one UUID are always ordered by time.
+    '''
+
+    def __init__(self, timesteps, traxelIds, uuids):
+        timesteps = np.asarray(timesteps, dtype=np.int64).ravel()
+        traxelIds = np.asarray(traxelIds, dtype=np.int64).ravel()
+        uuids = np.asarray(uuids, dtype=np.int64).ravel()
+        assert(len(timesteps) == len(traxelIds) == len(uuids))
+
+        order = np.lexsort((traxelIds, timesteps))
+        self.timesteps = timesteps[order]
+        self.traxelIds = traxelIds[order]
+        self.uuids = uuids[order]
+        self._traxelKeys = self._traxelKey(self.timesteps, self.traxelIds)
+
+        # traxels ordered by uuid and time, with the range of traxels for each of the (sorted) unique uuids
+        self._uuidOrder = np.lexsort((self.timesteps, self.uuids))
+        self.uniqueUuids, self._uuidStarts, self._uuidCounts = np.unique(
+            self.uuids[self._uuidOrder], return_index=True, return_counts=True)
+
+    @staticmethod
+    def _traxelKey(timesteps, traxelIds):
+        return (np.asarray(timesteps, dtype=np.int64) << 32) + np.asarray(traxelIds, dtype=np.int64)
+
+    @classmethod
+    def fromTraxelToUniqueIdMap(cls, traxelIdPerTimestepToUniqueIdMap):
+        '''
+        Create the index from the `{str(timestep): {str(traxelId): uuid}}` dictionary stored in our JSON models
+        '''
+        timesteps = []
+        traxelIds = []
+        uuids = []
+        for timestep, idMap in traxelIdPerTimestepToUniqueIdMap.iteritems():
+            timesteps.extend([int(timestep)] * len(idMap))
+            traxelIds.extend(int(i) for i in idMap.iterkeys())
+            uuids.extend(idMap.itervalues())
+        return cls(timesteps, traxelIds, uuids)
+
+    @classmethod
+    def fromUuidToTraxelMap(cls, uuidToTraxelMap):
+        '''
+        Create the index from a `{uuid: [(timestep, traxelId), ...]}` dictionary
+        '''
+        timesteps = []
+        traxelIds = []
+        uuids = []
+        for uuid, traxels in uuidToTraxelMap.iteritems():
+            timesteps.extend(t for t, _ in traxels)
+            traxelIds.extend(i for _, i in traxels)
+            uuids.extend([uuid] * len(traxels))
+        return cls(timesteps, traxelIds, uuids)
+
+    def __len__(self):
+        ''' number of traxels in the index '''
+        return len(self.uuids)
+
+    def containsTraxels(self, timesteps, traxelIds):
+        ''' **returns** a boolean array telling which of the given traxels are part of the index '''
+        keys = self._traxelKey(*np.broadcast_arrays(timesteps, traxelIds))
+        if len(self._traxelKeys) == 0:
+            return np.zeros(keys.shape, dtype=bool)
+        positions = np.minimum(np.searchsorted(self._traxelKeys, keys), len(self._traxelKeys) - 1)
+        return self._traxelKeys[positions] == keys
+
+    def uuidOf(self, timesteps, traxelIds, default=None):
+        '''
+        **returns** an array with the UUIDs of the traxels given by `timesteps` and `traxelIds`,
+        which can be arrays or scalars that are broadcast against each other.
+
+        Raises a `KeyError` if a traxel is not part of the index, unless a `default` UUID is given.
+        '''
+        keys = self._traxelKey(*np.broadcast_arrays(timesteps, traxelIds))
+        found = self.containsTraxels(timesteps, traxelIds)
+        result = np.empty(keys.shape, dtype=np.int64)
+        result[found] = self.uuids[np.searchsorted(self._traxelKeys, keys[found])]
+        if not np.all(found):
+            if default is None:
+                raise KeyError("Traxels {} are not in the index".format(
+                    zip(*np.broadcast_arrays(timesteps, traxelIds))[:10]))
+            result[~found] = default
+        return result
+
+    def _uuidPositions(self, uuids):
+        uuids = np.asarray(uuids, dtype=np.int64)
+        if len(self.uniqueUuids) == 0:
+            if uuids.size > 0:
+                raise KeyError("UUIDs {} are not in the index".format(uuids.ravel()[:10].tolist()))
+            return uuids
+        positions = np.minimum(np.searchsorted(self.uniqueUuids, uuids), len(self.uniqueUuids) - 1)
+        found = self.uniqueUuids[positions] == uuids
+        if not np.all(found):
+            raise KeyError("UUIDs {} are not in the index".format(uuids[~found][:10].tolist()))
+        return positions
+
+    def traxelsOf(self, uuids):
+        '''
+        **returns** a tuple `(timesteps, traxelIds, counts)`, where `timesteps` and `traxelIds` contain
+        the traxels of all given `uuids` after each other (each ordered by time),
+        and `counts` tells how many traxels belong to each of the `uuids`.
+        '''
+        positions = self._uuidPositions(np.asarray(uuids).ravel())
+        starts = self._uuidStarts[positions]
+        counts = self._uuidCounts[positions]
+        offsets = np.cumsum(counts) - counts
+        indices = self._uuidOrder[np.repeat(starts - offsets, counts) + np.arange(counts.sum())]
+        return self.timesteps[indices], self.traxelIds[indices], counts
+
+    def firstTraxelOf(self, uuids):
+        ''' **returns** a tuple `(timesteps, traxelIds)` with the first traxel (in time) of each of the given `uuids` '''
+        indices = self._uuidOrder[self._uuidStarts[self._uuidPositions(uuids)]]
+        return self.timesteps[indices], self.traxelIds[indices]
+
+    def lastTraxelOf(self, uuids):
+        ''' **returns** a tuple `(timesteps, traxelIds)` with the last traxel (in time) of each of the given `uuids` '''
+        positions = self._uuidPositions(uuids)
+        indices = self._uuidOrder[self._uuidStarts[positions] + self._uuidCounts[positions] - 1]
+        return self.timesteps[indices], self.traxelIds[indices]
+
+    def internalLinks(self):
+        '''
+        **returns** a tuple `(srcTimesteps, srcIds, destTimesteps, destIds)` with the links between consecutive
+        traxels inside every tracklet, ordered by UUID and time
+        '''
+        sortedUuids = self.uuids[self._uuidOrder]
+        sameUuid = sortedUuids[1:] == sortedUuids[:-1]
+        src = self._uuidOrder[:-1][sameUuid]
+        dest = self._uuidOrder[1:][sameUuid]
+        return self.timesteps[src], self.traxelIds[src], self.timesteps[dest], self.traxelIds[dest]
+
+    def iterTraxelToUniqueIdItems(self):
+        '''
+        **yields** the items `(str(timestep), {str(traxelId): uuid})` of the legacy `traxelToUniqueId` dictionary,
+        one timestep at a time
+        '''
+        boundaries = np.flatnonzero(np.diff(self.timesteps)) + 1
+        for t, i, u in itertools.izip(np.split(self.timesteps, boundaries),
+                                      np.split(self.traxelIds, boundaries),
+                                      np.split(self.uuids, boundaries)):
+            if len(t) > 0:
+                yield str(t[0]), dict(itertools.izip([str(x) for x in i.tolist()], u.tolist()))
+
+    def toTraxelToUniqueIdMap(self):
+        '''
+        **returns** the legacy dictionary `{str(timestep): {str(traxelId): uuid}}` as stored in our JSON files
+        '''
+        return dict(self.iterTraxelToUniqueIdItems())
+
+    def toUuidToTraxelMap(self):
+        '''
+        **returns** the legacy dictionary `{uuid: [(timestep, traxelId), ...]}` with the traxels of each uuid sorted by time
+        '''
+        timesteps = self.timesteps[self._uuidOrder].tolist()
+        traxelIds = self.traxelIds[self._uuidOrder].tolist()
+        uuidToTraxelMap = {}
+        for uuid, start, count in itertools.izip(self.uniqueUuids.tolist(), self._uuidStarts.tolist(), self._uuidCounts.tolist()):
+            uuidToTraxelMap[uuid] = zip(timesteps[start:start + count], traxelIds[start:start + count])
+        return uuidToTraxelMap
@@ -0,0 +1,453 @@
+'''
+Columnar storage of the traxels of all frames.
+
+Instead of creating one `hytra.core.probabilitygenerator.Traxel` with its own dictionary of small
+numpy arrays per object, the `TraxelStore` keeps one 2D matrix per feature and frame (indexed by the object id),
+and hands out lightweight `TraxelView`s that provide the same interface as a `Traxel`.
+'''
+
+import logging
+import numpy as np
+
+
+def getLogger():
+    ''' logger to be used in this module '''
+    return logging.getLogger(__name__)
+
+
+class TraxelFeatureView(object):
+    """
+    Dictionary-like access to the features of a single traxel inside a `TraxelStore`.
+
+    Reading a feature returns the traxel's row of the respective feature matrix as flat `float64` array,
+    just like the `Features` dictionary of a `Traxel`. Assigning a feature that does not exist as column
+    in the store (e.g. `JaccardScores`) stores it for this traxel only.
+    """
+    __slots__ = ['_store', '_frame', '_objectId']
+
+    def __init__(self, store, frame, objectId):
+        self._store = store
+        self._frame = frame
+        self._objectId = objectId
+
+    def __getitem__(self, name):
+        return self._store.getFeatureValues(self._frame, self._objectId, name)
+
+    def __setitem__(self, name, value):
+        self._store.setFeatureValues(self._frame, self._objectId, name, value)
+
+    def __contains__(self, name):
+        return self._store.hasFeature(self._frame, self._objectId, name)
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self.keys())
+
+    def get(self, name, default=None):
+        if name in self:
+            return self[name]
+        return default
+
+    def keys(self):
+        return self._store.getFeatureNames(self._frame, self._objectId)
+
+    def values(self):
+        return [self[k] for k in self.keys()]
+
+    def items(self):
+        return [(k, self[k]) for k in self.keys()]
+
+    def iteritems(self):
+        for k in self.keys():
+            yield k, self[k]
+
+
+class TraxelView(object):
+    """
+    A lightweight proxy with the interface of a `hytra.core.probabilitygenerator.Traxel`
+    (`Id`, `Timestep`, `Features`, `X`/`Y`/`Z`, `get_feature_value`, ...),
+    whose data lives in the columns of a `TraxelStore`.
+
+    Views do not hold any state apart from their position in the store, so they can be created on demand.
+    """
+    __slots__ = ['_store', 'Id', 'Timestep']
+
+    def __init__(self, store, frame, objectId):
+        self._store = store
+        self.Timestep = frame
+        self.Id = objectId
+
+    @property
+    def Features(self):
+        return TraxelFeatureView(self._store, self.Timestep, self.Id)
+
+    @property
+    def conflictingTraxelIds(self):
+        ''' conflicting traxel ids in the same frame '''
+        return self._store.getConflictingTraxelIds(self.Timestep, self.Id)
+
+    @conflictingTraxelIds.setter
+    def conflictingTraxelIds(self, value):
+        self._store.setConflictingTraxelIds(self.Timestep, self.Id, value)
+
+    @property
+    def idInSegmentation(self):
+        return self._store.getPerObjectValue(self.Timestep, self.Id, 'id')
+
+    @property
+    def segmentationFilename(self):
+        return self._store.getPerObjectValue(self.Timestep, self.Id, 'filename')
+
+    def set_x_scale(self, val):
+        self._store.scale[0] = val
+
+    def set_y_scale(self, val):
+        self._store.scale[1] = val
+
+    def set_z_scale(self, val):
+        self._store.scale[2] = val
+
+    def X(self):
+        return self.Features['com'][0]
+
+    def Y(self):
+        return self.Features['com'][1]
+
+    def Z(self):
+        try:
+            return self.Features['com'][2]
+        except:
+            return 0.0
+
+    def add_feature_array(self, name, length):
+        self.Features[name] = np.zeros(length)
+
+    def set_feature_value(self, name, index, value):
+        assert name in self.Features
+        self._store.setFeatureValue(self.Timestep, self.Id, name, index, value)
+
+    def get_feature_value(self, name, index):
+        assert name in self.Features
+        return self.Features[name][index]
+
+    def print_available_features(self):
+        print(self.Features.keys())
+
+    def __eq__(self, other):
+        return isinstance(other, TraxelView) and other._store is self._store \
+            and other.Timestep == self.Timestep and other.Id == self.Id
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash((id(self._store), self.Timestep, self.Id))
+
+    def __repr__(self):
+        return "Traxel(Timestep={},Id={})".format(self.Timestep, self.Id)
+
+
+class FrameTraxels(object):
+    """
+    Dictionary-like mapping from object id to `TraxelView` for all valid objects of one frame,
+    as returned by `TraxelStore[frame]`.
+    """
+    __slots__ = ['_store', '_frame']
+
+    def __init__(self, store, frame):
+        self._store = store
+        self._frame = frame
+
+    @property
+    def objectIds(self):
+        ''' sorted numpy array of the ids of all traxels in this frame '''
+        return self._store.getObjectIds(self._frame)
+
+    def __getitem__(self, objectId):
+        if objectId not in self:
+            raise KeyError(objectId)
+        return TraxelView(self._store, self._frame, int(objectId))
+
+    def __contains__(self, objectId):
+        ids = self.objectIds
+        pos = np.searchsorted(ids, objectId)
+        return pos < len(ids) and ids[pos] == objectId
+
+    def __len__(self):
+        return len(self.objectIds)
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def keys(self):
+        return self.objectIds.tolist()
+
+    def values(self):
+        return [TraxelView(self._store, self._frame, o) for o in self.keys()]
+
+    def items(self):
+        return [(o, TraxelView(self._store, self._frame, o)) for o in self.keys()]
+
+    def iteritems(self):
+        for o in self.keys():
+            yield o, TraxelView(self._store, self._frame, o)
+
+
+class TraxelStore(object):
+    """
+    Columnar traxel store: holds one matrix per feature and frame, where row `i` contains the (flattened)
+    feature values of the object with id `i`. Only the objects listed in the frame's `objectIds` are
+    exposed as traxels, which allows to filter objects (e.g. by size) without copying the feature matrices.
+
+    Access works as for the nested dictionaries of `Traxel`s it replaces: `store[frame][objectId]`
+    yields a `TraxelView`, and `store[frame].iteritems()` iterates over all traxels of a frame.
+    Whole feature matrices can be retrieved with `getFeatureMatrix()` for vectorized processing.
+    """
+
+    perObjectValueNames = ['id', 'filename']
+    ''' list-valued entries of the feature dicts that are not exposed as features but as traxel attributes '''
+
+    def __init__(self):
+        self._featuresPerFrame = {}
+        self._objectIdsPerFrame = {}
+        self._perObjectValuesPerFrame = {}
+        self._additionalFeaturesPerFrame = {}
+        self._conflictingTraxelIdsPerFrame = {}
+        self.scale = np.array([1.0, 1.0, 1.0])
+
+    @staticmethod
+    def _toColumn(values):
+        ''' bring the given per-object feature values into the shape of a 2D matrix without copying if possible '''
+        if isinstance(values, list):
+            # polygon features are given as lists with one entry per object
+            return values
+        values = np.asarray(values)
+        return values.reshape((values.shape[0], -1))
+
+    def addFrame(self, frame, features, objectIds):
+        """
+        Add all traxels of a frame.
+
+        **Parameters:**
+
+        * `frame`: the timestep
+        * `features`: dictionary of feature name -> array (or list) with one row per object id, including the background.
+          The arrays are referenced, not copied, whenever possible.
+        * `objectIds`: ids of all objects of this frame that should be exposed as traxels
+        """
+        columns = {}
+        perObjectValues = {}
+        for name, values in features.iteritems():
+            if name in self.perObjectValueNames:
+                perObjectValues[name] = values
+            else:
+                columns[name] = self._toColumn(values)
+
+        # the center of mass is known as 'com' to all consumers of traxels
+        if 'RegionCenter' in columns and 'com' not in columns:
+            columns['com'] = columns['RegionCenter']
+
+        self._featuresPerFrame[frame] = columns
+        self._perObjectValuesPerFrame[frame] = perObjectValues
+        self._objectIdsPerFrame[frame] = np.unique(np.asarray(objectIds, dtype=np.int64))
+        self._additionalFeaturesPerFrame[frame] = {}
+        self._conflictingTraxelIdsPerFrame[frame] = {}
+
+    def addFeatureMatrix(self, frame, name, values):
+        """
+        Add a feature matrix (one row per object id) for all objects of a frame,
+        e.g. the probabilities predicted by a random forest.
+        """
+        self._featuresPerFrame[frame][name] = self._toColumn(values)
+
+    def getFeatureMatrix(self, frame, name, objectIds=None):
+        """
+        Return the matrix of the feature `name` in `frame`, restricted to the rows of the given `objectIds`
+        (or of all traxels of the frame if `objectIds` is None).
+        """
+        if objectIds is None:
+            objectIds = self._objectIdsPerFrame[frame]
+        column = self._featuresPerFrame[frame][name]
+        if isinstance(column, list):
+            return [column[o] for o in objectIds]
+        return column[objectIds]
+
+    def gatherFeatureRows(self, timesteps, objectIds, name, numColumns=None, missingValue=None):
+        """
+        Return a `float64` matrix whose `i`-th row contains the feature `name` of the traxel
+        (`timesteps[i]`, `objectIds[i]`), gathering all rows of one frame with a single indexing operation.
+
+        Only the first `numColumns` entries of the feature are returned if that is given. Traxels that
+        do not have this feature yield a row of `missingValue`, or raise a `KeyError` if that is `None`.
+        """
+        timesteps = np.asarray(timesteps, dtype=np.int64)
+        objectIds = np.asarray(objectIds, dtype=np.int64)
+        rowsAndValues = []
+        for frame in np.unique(timesteps):
+            rows = np.flatnonzero(timesteps == frame)
+            frame = int(frame)
+            if name in self._featuresPerFrame[frame]:
+                values = np.array(self.getFeatureMatrix(frame, name, objectIds[rows]), dtype=np.float64)
+                rowsAndValues.append((rows, values.reshape((len(rows), -1))))
+
+            # features that were assigned to single traxels override the columns
+            additional = self._additionalFeaturesPerFrame[frame].get(name, {})
+            for row in rows:
+                if objectIds[row] in additional:
+                    values = np.asarray(additional[objectIds[row]], dtype=np.float64).reshape((1, -1))
+                    rowsAndValues.append((np.array([row]), values))
+
+        if numColumns is None:
+            numColumns = max([v.shape[1] for _, v in rowsAndValues] + [1])
+        result = np.zeros((len(timesteps), numColumns))
+        found = np.zeros(len(timesteps), dtype=bool)
+        for rows, values in rowsAndValues:
+            if values.shape[1] < numColumns:
+                raise ValueError('Feature {} has only {} entries, but {} were requested'.format(
+                    name, values.shape[1], numColumns))
+            result[rows] = values[:, :numColumns]
+            found[rows] = True
+
+        missing = np.logical_not(found)
+        if np.any(missing):
+            if missingValue is None:
+                raise KeyError('Feature {} is not available for traxel (Timestep={},Id={})'.format(
+                    name, timesteps[missing][0], objectIds[missing][0]))
+            result[missing] = missingValue
+        return result
+
+    def getObjectIds(self, frame):
+        ''' sorted numpy array of the ids of all traxels in `frame` '''
+        return self._objectIdsPerFrame[frame]
+
+    def countTraxels(self):
+        return sum(len(ids) for ids in self._objectIdsPerFrame.values())
+
+    def extractTraxels(self, objectIdsPerFrame, featureNames=None):
+        """
+        Create a new store that only contains the given traxels (and all frames, possibly empty),
+        whose feature matrices only hold the rows of these traxels. To that end the objects of each frame
+        are renumbered consecutively, starting at 1 in the order of their original ids.
+
+        **Parameters:**
+
+        * `objectIdsPerFrame`: dictionary frame -> ids of the traxels to keep, frames that are not listed are empty
+        * `featureNames`: names of the features to copy, all of them if `None`
+
+        **returns** a tuple of the new store and a dictionary `{frame: originalIds}`,
+        where `originalIds[i]` is the original id of the object with the new id `i` (and `originalIds[0] == 0`)
+        """
+        store = TraxelStore()
+        store.scale = self.scale.copy()
+        originalIdsPerFrame = {}
+        for frame in self.keys():
+            objectIds = np.intersect1d(np.asarray(objectIdsPerFrame.get(frame, []), dtype=np.int64),
+                                       self._objectIdsPerFrame[frame])
+            rows = np.concatenate([[0], objectIds]).astype(np.int64)
+            newIds = dict(zip(objectIds.tolist(), range(1, len(rows))))
+
+            features = {}
+            for name, column in self._featuresPerFrame[frame].iteritems():
+                if featureNames is None or name in featureNames or name == 'com':
+                    features[name] = [column[r] for r in rows] if isinstance(column, list) else column[rows]
+            for name, values in self._perObjectValuesPerFrame[frame].iteritems():
+                features[name] = values[rows] if isinstance(values, np.ndarray) else [values[r] for r in rows]
+            store.addFrame(frame, features, np.arange(1, len(rows)))
+
+            for name, values in self._additionalFeaturesPerFrame[frame].iteritems():
+                if featureNames is None or name in featureNames:
+                    store._additionalFeaturesPerFrame[frame][name] = dict(
+                        (newIds[o], v) for o, v in values.iteritems() if o in newIds)
+            # conflicts with objects that were not extracted are dropped
+            for o, conflicting in self._conflictingTraxelIdsPerFrame[frame].iteritems():
+                if o in newIds and conflicting is not None:
+                    store._conflictingTraxelIdsPerFrame[frame][newIds[o]] = [newIds[c] for c in conflicting if c in newIds]
+            originalIdsPerFrame[frame] = rows
+        return store, originalIdsPerFrame
+
+    # ------------------------------------------------------------------
+    # per traxel access used by `TraxelView` and `TraxelFeatureView`
+
+    def getFeatureValues(self, frame, objectId, name):
+        additional = self._additionalFeaturesPerFrame[frame].get(name)
+        if additional is not None and objectId in additional:
+            return additional[objectId]
+        column = self._featuresPerFrame[frame][name]
+        if isinstance(column, list):
+            return np.array(column[objectId], dtype=np.float64).flatten()
+        if column.dtype == np.float64:
+            return column[objectId]
+        return column[objectId].astype(np.float64)
+
+    def setFeatureValues(self, frame, objectId, name, value):
+        columns = self._featuresPerFrame[frame]
+        if name in columns and not isinstance(columns[name], list):
+            value = np.asarray(value)
+            if value.size == columns[name].shape[1] and np.can_cast(value.dtype, columns[name].dtype, 'same_kind'):
+                columns[name][objectId] = value.flatten()
+                return
+        self._additionalFeaturesPerFrame[frame].setdefault(name, {})[objectId] = value
+
+    def setFeatureValue(self, frame, objectId, name, index, value):
+        additional = self._additionalFeaturesPerFrame[frame].get(name)
+        if additional is not None and objectId in additional:
+            additional[objectId][index] = value
+        else:
+            self._featuresPerFrame[frame][name][objectId, index] = value
+
+    def hasFeature(self, frame, objectId, name):
+        if name in self._featuresPerFrame[frame]:
+            return True
+        additional = self._additionalFeaturesPerFrame[frame].get(name)
+        return additional is not None and objectId in additional
+
+    def getFeatureNames(self, frame, objectId):
+        names = list(self._featuresPerFrame[frame].keys())
+        for name, values in self._additionalFeaturesPerFrame[frame].iteritems():
+            if objectId in values and name not in self._featuresPerFrame[frame]:
+                names.append(name)
+        return names
+
+    def getPerObjectValue(self, frame, objectId, name):
+        try:
+            return self._perObjectValuesPerFrame[frame][name][objectId]
+        except KeyError:
+            raise AttributeError('Traxel (Timestep={},Id={}) has no {}'.format(frame, objectId, name))
+
+    def getConflictingTraxelIds(self, frame, objectId):
+        return self._conflictingTraxelIdsPerFrame[frame].get(objectId, None)
+
+    def setConflictingTraxelIds(self, frame, objectId, value):
+        self._conflictingTraxelIdsPerFrame[frame][objectId] = value
+
+    # ------------------------------------------------------------------
+    # dictionary interface over frames
+
+    def __getitem__(self, frame):
+        if frame not in self._objectIdsPerFrame:
+            raise KeyError(frame)
+        return FrameTraxels(self, frame)
+
+    def __contains__(self, frame):
+        return frame in self._objectIdsPerFrame
+
+    def __len__(self):
+        return len(self._objectIdsPerFrame)
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def keys(self):
+        return sorted(self._objectIdsPerFrame.keys())
+
+    def values(self):
+        return [self[f] for f in self.keys()]
+
+    def items(self):
+        return [(f, self[f]) for f in self.keys()]
+
+    def iteritems(self):
+        for f in self.keys():
+            yield f, self[f]
@@ -4,11 +4,50 @@ import time
 import concurrent.futures
 
 from hytra.core.probabilitygenerator import IlpProbabilityGenerator, computeDivisionFeaturesOnCloud, computeRegionFeaturesOnCloud, DummyExecutor
+from hytra.core.probabilitygenerator import getWorkerPluginManager, closeWorkerFiles
 from hytra.util.progressbar import ProgressBar
 
 def getLogger():
     return logging.getLogger(__name__)
 
+def computeLabelOverlaps(labelImageA, labelImageB):
+    """
+    Count the overlapping pixels of all pairs of objects in two label images of the same shape
+    in one pass, by building the joint histogram of (labelA, labelB) pairs. Background (label 0)
+    in either image is ignored.
+
+    **returns** three arrays of the same length, sorted by labelA and then labelB:
+    the labels in A, the labels in B, and the number of pixels they share
+    """
+    a = np.asarray(labelImageA).ravel().astype(np.int64)
+    b = np.asarray(labelImageB).ravel().astype(np.int64)
+    assert(a.shape == b.shape)
+    foreground = np.logical_and(a != 0, b != 0)
+    a = a[foreground]
+    b = b[foreground]
+    if len(a) == 0:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+
+    # compact the labels of B if the combined keys could overflow
+    labelsB = None
+    if a.max() >= np.iinfo(np.int64).max // (b.max() + 1):
+        labelsB, b = np.unique(b, return_inverse=True)
+    numLabelsB = b.max() + 1
+
+    keys, counts = np.unique(a * numLabelsB + b, return_counts=True)
+    overlapLabelsA = keys // numLabelsB
+    overlapLabelsB = keys % numLabelsB
+    if labelsB is not None:
+        overlapLabelsB = labelsB[overlapLabelsB]
+    return overlapLabelsA, overlapLabelsB, counts
+
+def computeLabelSizes(labelImage):
+    """
+    **returns** the sorted object labels (without background) of the label image and their number of pixels
+    """
+    labels, counts = np.unique(np.asarray(labelImage), return_counts=True)
+    return labels[labels != 0], counts[labels != 0]
+
 def findConflictingHypothesesInSeparateProcess(frame,
                                                labelImageFilenames,
                                                labelImagePaths,
@@ -22,27 +61,27 @@ def findConflictingHypothesesInSeparateProcess(frame,
     Meant to be run in its own process using `concurrent.futures.ProcessPoolExecutor`
     """
 
-    # set up plugin manager
-    from hytra.pluginsystem.plugin_manager import TrackingPluginManager
-    pluginManager = TrackingPluginManager(pluginPaths=pluginPaths, verbose=False)
-    pluginManager.setImageProvider(imageProviderPluginName)
+    # get the plugin manager of this process
+    pluginManager = getWorkerPluginManager(pluginPaths, imageProviderPluginName=imageProviderPluginName)
+
+    # load every segmentation hypothesis of this frame only once
+    labelImages = [pluginManager.getImageProvider().getLabelImageForFrame(filename, path, frame)
+                   for filename, path in zip(labelImageFilenames, labelImagePaths)]
 
     overlaps = {} # overlap dict: key=globalId, value=[list of globalIds]
 
     for labelImageIndexA in range(len(labelImageFilenames)):
-        labelImageA = pluginManager.getImageProvider().getLabelImageForFrame(labelImageFilenames[labelImageIndexA],
-                                                                                    labelImagePaths[labelImageIndexA],
-                                                                                    frame)
+        labelImageA = labelImages[labelImageIndexA]
+        objectIdsA, _ = computeLabelSizes(labelImageA)
         for labelImageIndexB in range(labelImageIndexA + 1, len(labelImageFilenames)):
-            labelImageB = pluginManager.getImageProvider().getLabelImageForFrame(labelImageFilenames[labelImageIndexB],
-                                                                                        labelImagePaths[labelImageIndexB],
-                                                                                        frame)
             # check for overlaps - even a 1-pixel overlap is enough to be mutually exclusive!
-            for objectIdA in np.unique(labelImageA):
-                if objectIdA == 0:
-                    continue
-                overlapping = set(np.unique(labelImageB[labelImageA == objectIdA])) - set([0])
-                overlappingGlobalIds = [labelImageFrameIdToGlobalId[(labelImageFilenames[labelImageIndexB], frame, o)] for o in overlapping]
+            overlapIdsA, overlapIdsB, _ = computeLabelOverlaps(labelImageA, labelImages[labelImageIndexB])
+            overlapStarts = np.searchsorted(overlapIdsA, objectIdsA, side='left')
+            overlapStops = np.searchsorted(overlapIdsA, objectIdsA, side='right')
+
+            for objectIdA, start, stop in zip(objectIdsA, overlapStarts, overlapStops):
+                overlappingGlobalIds = [labelImageFrameIdToGlobalId[(labelImageFilenames[labelImageIndexB], frame, o)]
+                                        for o in overlapIdsB[start:stop]]
                 globalIdA = labelImageFrameIdToGlobalId[(labelImageFilenames[labelImageIndexA], frame, objectIdA)]
                 overlaps.setdefault(globalIdA, []).extend(overlappingGlobalIds)
                 for globalIdB in overlappingGlobalIds:
@@ -67,41 +106,37 @@ def computeJaccardScoresOnCloud(frame,
     Meant to be run in its own process using `concurrent.futures.ProcessPoolExecutor`
     """
 
-    # set up plugin manager
-    from hytra.pluginsystem.plugin_manager import TrackingPluginManager
-    pluginManager = TrackingPluginManager(pluginPaths=pluginPaths, verbose=False)
-    pluginManager.setImageProvider(imageProviderPluginName)
+    # get the plugin manager of this process
+    pluginManager = getWorkerPluginManager(pluginPaths, imageProviderPluginName=imageProviderPluginName)
 
     scores = {}
     gtToGlobalIdMap = {}
 
     groundTruthLabelImage = pluginManager.getImageProvider().getLabelImageForFrame(groundTruthFilename, groundTruthPath, frame)
+    gtLabels, gtSizes = computeLabelSizes(groundTruthLabelImage)
+    gtSizes = dict(zip(gtLabels, gtSizes))
 
     for labelImageIndexA in range(len(labelImageFilenames)):
         labelImageA = pluginManager.getImageProvider().getLabelImageForFrame(labelImageFilenames[labelImageIndexA],
                                                                                     labelImagePaths[labelImageIndexA],
                                                                                     frame)
-        # check for overlaps - even a 1-pixel overlap is enough to be mutually exclusive!
-        for objectIdA in np.unique(labelImageA):
-            if objectIdA == 0:
-                continue
+        objectIdsA, objectSizesA = computeLabelSizes(labelImageA)
+        objectSizesA = dict(zip(objectIdsA, objectSizesA))
+
+        # intersections from the joint histogram, unions from the sizes of both objects
+        overlapIdsA, overlapGtLabels, intersectingPixels = computeLabelOverlaps(labelImageA, groundTruthLabelImage)
+        for objectIdA, gtLabel, intersection in zip(overlapIdsA, overlapGtLabels, intersectingPixels):
             globalIdA = labelImageFrameIdToGlobalId[(labelImageFilenames[labelImageIndexA], frame, objectIdA)]
-            overlap = groundTruthLabelImage[labelImageA == objectIdA]
-            overlappingGtElements = set(np.unique(overlap)) - set([0])
-            
-            for gtLabel in overlappingGtElements:
-                # compute Jaccard scores
-                intersectingPixels = np.sum(overlap == gtLabel)
-                unionPixels = np.sum(np.logical_or(groundTruthLabelImage == gtLabel, labelImageA == objectIdA))
-                jaccardScore = float(intersectingPixels) / float(unionPixels) 
+            unionPixels = objectSizesA[objectIdA] + gtSizes[gtLabel] - intersection
+            jaccardScore = float(intersection) / float(unionPixels)
 
-                # append to object's score list
-                scores.setdefault(globalIdA, []).append( (gtLabel, jaccardScore) )
+            # append to object's score list
+            scores.setdefault(globalIdA, []).append( (gtLabel, jaccardScore) )
 
-                # store this as GT mapping if there was no better object for this GT label yet
-                if jaccardScore > groundTruthMinJaccardScore and \
-                    ((frame, gtLabel) not in gtToGlobalIdMap or gtToGlobalIdMap[(frame, gtLabel)][-1][1] < jaccardScore):
-                    gtToGlobalIdMap.setdefault((frame, gtLabel), []).append((globalIdA, jaccardScore))
+            # store this as GT mapping if there was no better object for this GT label yet
+            if jaccardScore > groundTruthMinJaccardScore and \
+                ((frame, gtLabel) not in gtToGlobalIdMap or gtToGlobalIdMap[(frame, gtLabel)][-1][1] < jaccardScore):
+                gtToGlobalIdMap.setdefault((frame, gtLabel), []).append((globalIdA, jaccardScore))
 
     # sort all gt mappings by ascending jaccard score
     for _, v in gtToGlobalIdMap.iteritems():
@@ -190,13 +225,16 @@ class ConflictingSegmentsProbabilityGenerator(IlpProbabilityGenerator):
         progressBar = ProgressBar(stop=self.timeRange[1] - self.timeRange[0])
         progressBar.show(increase=0)
 
+        # only send the part of the id mapping to each job that belongs to its frame
+        labelImageFrameIdToGlobalIdPerFrame = self._splitLabelImageFrameIdToGlobalIdByFrame()
+
         with ExecutorType() as executor:
             for frame in range(self.timeRange[0], self.timeRange[1]):
                 jobs.append(executor.submit(findConflictingHypothesesInSeparateProcess,
                                             frame,
                                             self._labelImageFilenames,
                                             self._labelImagePaths,
-                                            self._labelImageFrameIdToGlobalId,
+                                            labelImageFrameIdToGlobalIdPerFrame.get(frame, {}),
                                             self._pluginPaths
                 ))
             for job in concurrent.futures.as_completed(jobs):
@@ -206,7 +244,10 @@ class ConflictingSegmentsProbabilityGenerator(IlpProbabilityGenerator):
                     if self.TraxelsPerFrame[frame][objectId].conflictingTraxelIds is None:
                         self.TraxelsPerFrame[frame][objectId].conflictingTraxelIds = []
                     self.TraxelsPerFrame[frame][objectId].conflictingTraxelIds.extend(overlapIds)
-        
+
+        # release the files that were kept open if the jobs ran in this process
+        closeWorkerFiles()
+
         t1 = time.time()
         getLogger().info("Finding overlaps took {} secs".format(t1 - t0))
 
@@ -249,13 +290,16 @@ class ConflictingSegmentsProbabilityGenerator(IlpProbabilityGenerator):
         progressBar.show(increase=0)
         gtFrameIdToGlobalIdsWithScoresMap = {}
 
+        # only send the part of the id mapping to each job that belongs to its frame
+        labelImageFrameIdToGlobalIdPerFrame = self._splitLabelImageFrameIdToGlobalIdByFrame()
+
         with ExecutorType() as executor:
             for frame in range(self.timeRange[0], self.timeRange[1]):
                 jobs.append(executor.submit(computeJaccardScoresOnCloud,
                                             frame,
                                             self._labelImageFilenames,
                                             self._labelImagePaths,
-                                            self._labelImageFrameIdToGlobalId,
+                                            labelImageFrameIdToGlobalIdPerFrame.get(frame, {}),
                                             groundTruthSegmentationFilename,
                                             groundTruthSegmentationPath,
                                             groundTruthMinJaccardScore,
@@ -267,7 +311,10 @@ class ConflictingSegmentsProbabilityGenerator(IlpProbabilityGenerator):
                 for objectId, individualScores in scores.iteritems():
                     self.TraxelsPerFrame[frame][objectId].Features['JaccardScores'] = individualScores
                 gtFrameIdToGlobalIdsWithScoresMap.update(frameGtToGlobalIdMap)
-        
+
+        # release the files that were kept open if the jobs ran in this process
+        closeWorkerFiles()
+
         t1 = time.time()
         getLogger().info("Finding jaccard scores took {} secs".format(t1 - t0))
 
@@ -419,6 +466,15 @@ class ConflictingSegmentsProbabilityGenerator(IlpProbabilityGenerator):
             else:
                 originalDict[k].extend(v[1:])
 
+    def _splitLabelImageFrameIdToGlobalIdByFrame(self):
+        """
+        **returns** a dictionary that holds the part of `self._labelImageFrameIdToGlobalId` of each frame
+        """
+        labelImageFrameIdToGlobalIdPerFrame = {}
+        for key, globalId in self._labelImageFrameIdToGlobalId.iteritems():
+            labelImageFrameIdToGlobalIdPerFrame.setdefault(key[1], {})[key] = globalId
+        return labelImageFrameIdToGlobalIdPerFrame
+
     def _storeBackwardMapping(self, featuresPerFrame):
         """
         populates the `self._labelImageFrameIdToGlobalId` dictionary
@@ -457,21 +513,12 @@ class ConflictingSegmentsProbabilityGenerator(IlpProbabilityGenerator):
         with ExecutorType() as executor:
             # 1st pass for region features, once per segmentation hypotheses
             for filename, path in zip(self._labelImageFilenames, self._labelImagePaths):
-                jobs = []
-                for frame in range(self.timeRange[0], self.timeRange[1]):
-                    jobs.append(executor.submit(computeRegionFeaturesOnCloud,
-                                                frame,
-                                                self._options.rawImageFilename, 
-                                                self._options.rawImagePath,
-                                                self._options.rawImageAxes,
-                                                filename,
-                                                path,
-                                                turnOffFeatures,
-                                                self._pluginPaths
-                    ))
-                for job in concurrent.futures.as_completed(jobs):
-                    progressBar.show()
-                    frame, feats = job.result()
+                featuresOfSegmentation = self._computeFeaturesOfAllFrames(executor,
+                                                                          filename,
+                                                                          path,
+                                                                          turnOffFeatures,
+                                                                          progressBar)
+                for frame, feats in featuresOfSegmentation.iteritems():
                     self._insertFilenameAndIdToFeatures(feats, filename)
                     if frame not in featuresPerFrame:
                         featuresPerFrame[frame] = feats
@@ -506,6 +553,9 @@ class ConflictingSegmentsProbabilityGenerator(IlpProbabilityGenerator):
 
         self._storeBackwardMapping(featuresPerFrame)
 
+        # release the files that were kept open if the jobs ran in this process
+        closeWorkerFiles()
+
         t1 = time.time()
         getLogger().info("Feature computation took {} secs".format(t1 - t0))
         
@@ -0,0 +1,65 @@
+from hytra.pluginsystem import feature_serializer_plugin
+import numpy as np
+import h5py
+import os
+import cPickle as pickle
+
+class Hdf5FeatureCache(feature_serializer_plugin.FeatureSerializerPlugin):
+    """
+    Caches the features of each frame in a local HDF5 file (`cache_filename`), together with the `cache_key`
+    that describes the inputs they were computed from. Entries whose key does not match are considered stale.
+    """
+
+    def _entryName(self, timeframe):
+        namespace = self.cache_namespace if self.cache_namespace is not None else 'features'
+        return '{}/frame-{:06d}'.format(namespace, timeframe)
+
+    def hasFeaturesForFrame(self, timeframe):
+        """
+        Check whether the cache holds up-to-date features for this frame
+        """
+        assert(self.cache_filename is not None)
+        assert(self.cache_key is not None)
+        if not os.path.isfile(self.cache_filename):
+            return False
+        with h5py.File(self.cache_filename, 'r') as h5file:
+            entryName = self._entryName(timeframe)
+            return entryName in h5file and h5file[entryName].attrs.get('key') == self.cache_key
+
+    def storeFeaturesForFrame(self, features, timeframe):
+        """
+        Stores feature data, replacing a previous entry of this frame
+        """
+        assert(self.cache_filename is not None)
+        assert(self.cache_key is not None)
+        with h5py.File(self.cache_filename, 'a') as h5file:
+            entryName = self._entryName(timeframe)
+            if entryName in h5file:
+                del h5file[entryName]
+            group = h5file.create_group(entryName)
+            for i, (name, value) in enumerate(sorted(features.items())):
+                # feature names can contain slashes, so we store them as attributes
+                if isinstance(value, np.ndarray) and value.dtype.kind in 'biuf':
+                    dataset = group.create_dataset('f{}'.format(i), data=value)
+                    dataset.attrs['pickled'] = False
+                else:
+                    dataset = group.create_dataset('f{}'.format(i), data=np.void(pickle.dumps(value, 2)))
+                    dataset.attrs['pickled'] = True
+                dataset.attrs['name'] = name
+            # write the key last, so that interrupted writes leave a stale entry
+            group.attrs['key'] = self.cache_key
+
+    def loadFeaturesForFrame(self, features, timeframe):
+        """
+        loads feature data, raises a `KeyError` if there are no up-to-date features for this frame
+        """
+        if not self.hasFeaturesForFrame(timeframe):
+            raise KeyError("No cached features for frame {} with key {}".format(timeframe, self.cache_key))
+        loadedFeatures = {}
+        with h5py.File(self.cache_filename, 'r') as h5file:
+            for dataset in h5file[self._entryName(timeframe)].values():
+                if dataset.attrs['pickled']:
+                    loadedFeatures[dataset.attrs['name']] = pickle.loads(dataset[()].tostring())
+                else:
+                    loadedFeatures[dataset.attrs['name']] = dataset[...]
+        return loadedFeatures
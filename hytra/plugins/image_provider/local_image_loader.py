@@ -3,6 +3,7 @@ import hytra.util.axesconversion
 import numpy as np
 import h5py
 import logging
+import contextlib
 
 class LocalImageLoader(image_provider_plugin.ImageProviderPlugin):
     """
@@ -10,6 +11,35 @@ class LocalImageLoader(image_provider_plugin.ImageProviderPlugin):
     """
 
     shape = None
+    _openFiles = None
+    _shapes = None
+
+    @contextlib.contextmanager
+    def _openForReading(self, Resource):
+        """
+        Open the given HDF5 file for reading. If `keepFilesOpen` is set, the file handle
+        is cached and reused by all subsequent calls until `closeOpenFiles` is called.
+        """
+        if not self.keepFilesOpen:
+            with h5py.File(Resource, 'r') as h5file:
+                yield h5file
+        else:
+            if self._openFiles is None:
+                self._openFiles = {}
+            if Resource not in self._openFiles:
+                logging.getLogger("LocalImageLoader").debug("keeping {} open".format(Resource))
+                self._openFiles[Resource] = h5py.File(Resource, 'r')
+            yield self._openFiles[Resource]
+
+    def closeOpenFiles(self):
+        """
+        close all files that were kept open because of `keepFilesOpen`
+        """
+        if self._openFiles is not None:
+            for h5file in self._openFiles.values():
+                h5file.close()
+            self._openFiles = None
+        self._shapes = None
 
     def getImageDataAtTimeFrame(self, Resource, PathInResource, axes, timeframe):
         """
@@ -18,7 +48,7 @@ class LocalImageLoader(image_provider_plugin.ImageProviderPlugin):
         Return numpy array of image data at timeframe.
         """
         logging.getLogger("LocalImageLoader").debug("opening {}".format(Resource))
-        with h5py.File(Resource, 'r') as rawH5:
+        with self._openForReading(Resource) as rawH5:
             logging.getLogger("LocalImageLoader").debug("PathInResource {}".format(timeframe))
             rawImage = rawH5[PathInResource][hytra.util.axesconversion.getFrameSlicing(axes, timeframe)]
             remainingAxes = axes.replace('t', '')
@@ -31,12 +61,9 @@ class LocalImageLoader(image_provider_plugin.ImageProviderPlugin):
         PathInResource provides the internal image path 
         Return numpy array of image data at timeframe.
         """
-
-        if (self.shape == None):
-            self.getImageShape(Resource, PathInResource)
-
-        with h5py.File(Resource, 'r') as h5file:
-            internalPath = PathInResource % (timeframe, timeframe + 1, self.shape[0], self.shape[1], self.shape[2])
+        shape = self._getCachedImageShape(Resource, PathInResource)
+        with self._openForReading(Resource) as h5file:
+            internalPath = PathInResource % (timeframe, timeframe + 1, shape[0], shape[1], shape[2])
             logging.getLogger("LocalImageLoader").debug("Opening label image at {}".format(internalPath))
             labelImage = h5file[internalPath][0, ..., 0].squeeze().astype(np.uint32)
             return labelImage
@@ -48,11 +75,22 @@ class LocalImageLoader(image_provider_plugin.ImageProviderPlugin):
         PathInResource provides the internal image path 
         Return list with image dimensions
         """
-        with h5py.File(Resource, 'r') as h5file:
+        with self._openForReading(Resource) as h5file:
             shape = h5file['/'.join(PathInResource.split('/')[:-1])].values()[0].shape[1:4]
             self.shape = shape
             return shape
 
+    def _getCachedImageShape(self, Resource, PathInResource):
+        """
+        Like `getImageShape`, but the shape is only derived once per file and dataset path,
+        until `closeOpenFiles` is called
+        """
+        if self._shapes is None:
+            self._shapes = {}
+        if (Resource, PathInResource) not in self._shapes:
+            self._shapes[(Resource, PathInResource)] = self.getImageShape(Resource, PathInResource)
+        return self._shapes[(Resource, PathInResource)]
+
 
     def getTimeRange(self, Resource, PathInResource):
         """
@@ -61,7 +99,7 @@ class LocalImageLoader(image_provider_plugin.ImageProviderPlugin):
         PathInResource provides the internal image path 
         Return tuple of (first frame, last frame)
         """
-        with h5py.File(Resource, 'r') as h5file:
+        with self._openForReading(Resource) as h5file:
             maxTime = len(h5file['/'.join(PathInResource.split('/')[:-1])].keys())
             return (0,maxTime)
 
@@ -69,8 +107,12 @@ class LocalImageLoader(image_provider_plugin.ImageProviderPlugin):
         """
         export labelimage of timeframe
         """
+        # the output file may not contain any label image yet, so the exported image determines the shape
+        shape = tuple(labelimage.shape) + (1,) * (3 - len(labelimage.shape))
+        # a file cannot be opened for writing while it is still open for reading
+        self.closeOpenFiles()
         with h5py.File(Resource, 'r+') as h5file:
-            internalPath = PathInResource % (timeframe, timeframe + 1, self.shape[0], self.shape[1], self.shape[2])
+            internalPath = PathInResource % (timeframe, timeframe + 1, shape[0], shape[1], shape[2])
             if(len(labelimage.shape) == 3):
                 h5file.create_dataset(internalPath, data=labelimage[np.newaxis, :, :, :, np.newaxis], dtype='u2', compression='gzip')
             elif(len(labelimage.shape) == 2):
@@ -1,4 +1,5 @@
 from hytra.pluginsystem import merger_resolver_plugin
+from hytra.util.objectindex import LabelImageObjectIndex
 import numpy as np
 
 from sklearn import mixture
@@ -42,40 +43,39 @@ class GMMMergerResolver(merger_resolver_plugin.MergerResolverPlugin):
         return self.getObjectInitializationList(gmm)
 
 
-    def resolveMerger(self, labelImage, objectId, nextId, mergerCount, initializations=[]):
+    def resolveMerger(self, labelImage, objectId, nextId, mergerCount, initializations=[], objectIndex=None):
         """
         Resolve the object with the ID `objectId` in the `labelImage` into `mergerCount`
         new segments by fitting some kind of model. The `initializations` provide fits
         in the preceding frame of all possible incomings (list may be empty, but could
         also be more than `mergerCount`).
   
-        `labelImage` is used read-only, use `updateLabelImage` to refine the segmentation
+        `labelImage` is used read-only, use `updateLabelImage` to refine the segmentation.
+        `objectIndex` can be a `LabelImageObjectIndex` of the `labelImage` that is shared by all calls for this frame.
   
         **returns** a list of fitted objects
         """
-  
-        # fit GMM to label image data
-        coordinates = np.transpose(np.vstack(np.where(labelImage == objectId)))
-        gmm = self.initGMM(mergerCount, initializations)
-        gmm.fit(coordinates)
-        assert(gmm.converged_)
-  
-        return self.getObjectInitializationList(gmm)
+        if objectIndex is None:
+            objectIndex = LabelImageObjectIndex(labelImage)
+        return self.resolveMergerForCoords(objectIndex.coordinates(objectId), mergerCount, initializations)
 
-    def updateLabelImage(self, labelImage, objectId, fits, newIds):
+    def updateLabelImage(self, labelImage, objectId, fits, newIds, objectIndex=None):
         """
         Resolve the object with the ID `objectId` in the `labelImage` into the fitted models with the given new IDs.
         `labelImage` should be updated by replacing all pixels that were labelled with `objectId`
         to get a new Id depending on the fit.
+        `objectIndex` can be a `LabelImageObjectIndex` of the `labelImage` that is shared by all calls for this frame.
         """
         
         if len(fits) > 1:
             assert(len(fits) == len(newIds))
+            if objectIndex is None:
+                objectIndex = LabelImageObjectIndex(labelImage)
             # edit labelimage in-place
-            coordinates = np.transpose(np.vstack(np.where(labelImage == objectId)))
+            coordinates = objectIndex.coordinates(objectId)
             gmm = self.initGMM(len(fits), fits)
             responsibilities = gmm.predict(coordinates)
             assert(len(np.unique(responsibilities)) == len(fits))
             newIds = np.array(newIds)
             newObjectIds = newIds[responsibilities]
-            labelImage[labelImage == objectId] = newObjectIds
\ No newline at end of file
+            objectIndex.relabel(objectId, newObjectIds)
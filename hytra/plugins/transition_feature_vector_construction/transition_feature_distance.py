@@ -14,6 +14,15 @@ class TransitionFeaturesDistance(transition_feature_vector_construction_plugin.T
                     np.linalg.norm(featureDictObjectA[key] * featureDictObjectB[key])]
         return []
 
+    def constructFeatureMatrix(self, featureDictsObjectA, featureDictsObjectB, selectedFeatures):
+        key = 'RegionCenter'
+        numTransitions = len(featureDictsObjectA.values()[0]) if len(featureDictsObjectA) > 0 else 0
+        if key in selectedFeatures and numTransitions > 0:
+            a = np.asarray(featureDictsObjectA[key]).reshape((numTransitions, -1))
+            b = np.asarray(featureDictsObjectB[key]).reshape((numTransitions, -1))
+            return np.column_stack([np.linalg.norm(a - b, axis=1), np.linalg.norm(a * b, axis=1)])
+        return np.zeros((numTransitions, 0))
+
     def getFeatureNames(self, featureDictObjectA, featureDictObjectB, selectedFeatures):
         key = 'RegionCenter'
         if key in selectedFeatures:
@@ -31,6 +31,35 @@ class TransitionFeaturesMultiplication(transition_feature_vector_construction_pl
 
         return features
 
+    def constructFeatureMatrix(self, featureDictsObjectA, featureDictsObjectB, selectedFeatures):
+        assert ("Global<Maximum >" not in selectedFeatures)
+        assert ("Global<Minimum >" not in selectedFeatures)
+        assert ("Histrogram" not in selectedFeatures)
+        assert ("Polygon" not in selectedFeatures)
+
+        numTransitions = len(featureDictsObjectA.values()[0]) if len(featureDictsObjectA) > 0 else 0
+        columns = [np.zeros((numTransitions, 0))]
+        if numTransitions == 0:
+            return columns[0]
+
+        for key in selectedFeatures:
+            if key == 'RegionCenter':
+                continue
+            else:
+                a = np.asarray(featureDictsObjectA[key]).reshape((numTransitions, -1))
+                b = np.asarray(featureDictsObjectB[key]).reshape((numTransitions, -1))
+                if a.shape[1] == 1:
+                    columns.append(a.astype('float64') * b.astype('float64'))
+                else:
+                    columns.append(a.astype('float32') * b.astype('float32'))
+
+        features = np.hstack(columns).astype('float64')
+
+        # there should be no nans or infs
+        assert (np.all(np.isfinite(features)))
+
+        return features
+
     def getFeatureNames(self, featureDictObjectA, featureDictObjectB, selectedFeatures):
         assert ("Global<Maximum >" not in selectedFeatures)
         assert ("Global<Minimum >" not in selectedFeatures)
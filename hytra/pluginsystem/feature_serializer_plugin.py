@@ -15,6 +15,15 @@ class FeatureSerializerPlugin(IPlugin):
     features_per_frame = None
     ''' dictionary of features per frame (only used by local serializer plugin) '''
 
+    cache_filename = None
+    ''' file that holds the cached features (only used by the feature cache plugin) '''
+
+    cache_key = None
+    ''' string describing the inputs of the features, entries with a different key are stale (only used by the feature cache plugin) '''
+
+    cache_namespace = None
+    ''' group of cache entries, e.g. one per label image (only used by the feature cache plugin) '''
+
     def activate(self):
         """
         Activation of plugin could do something, but not needed here
@@ -27,6 +36,12 @@ class FeatureSerializerPlugin(IPlugin):
         """
         pass
 
+    def hasFeaturesForFrame(self, timeframe):
+        """
+        Check whether features for this frame are available
+        """
+        return False
+
     def storeFeaturesForFrame(self, features, timeframe):
         """
         Stores feature data
@@ -6,6 +6,9 @@ class ImageProviderPlugin(IPlugin):
     This is the base class for all plugins that load images from a given location
     """
 
+    keepFilesOpen = False
+    ''' if `True`, image providers may keep files open for reading and reuse them in subsequent calls '''
+
     def activate(self):
         """
         Activation of plugin could do something, but not needed here
@@ -53,4 +56,10 @@ class ImageProviderPlugin(IPlugin):
         export labelimage of timeframe
         """
         raise NotImplementedError()
-        return []
\ No newline at end of file
+        return []
+
+    def closeOpenFiles(self):
+        """
+        close all files that were kept open because of `keepFilesOpen`
+        """
+        pass
@@ -37,14 +37,16 @@ class MergerResolverPlugin(IPlugin):
 
         return []
 
-    def resolveMerger(self, labelImage, objectId, nextId, mergerCount, initializations=[]):
+    def resolveMerger(self, labelImage, objectId, nextId, mergerCount, initializations=[], objectIndex=None):
         """
         Resolve the object with the ID `objectId` in the `labelImage` into `mergerCount`
         new segments by fitting some kind of model. The `initializations` provide fits
         in the preceding frame of all possible incomings (list may be empty, but could
         also be more than `mergerCount`).
 
-        `labelImage` is used read-only, use `updateLabelImage` to refine the segmentation
+        `labelImage` is used read-only, use `updateLabelImage` to refine the segmentation.
+        `objectIndex` is an optional `hytra.util.objectindex.LabelImageObjectIndex` of the `labelImage`,
+        which allows to access the pixels of the object without searching the whole image.
 
         **returns** a list of fitted objects
         """
@@ -52,10 +54,11 @@ class MergerResolverPlugin(IPlugin):
 
         return []
     
-    def updateLabelImage(self, labelImage, objectId, fits, newIds):
+    def updateLabelImage(self, labelImage, objectId, fits, newIds, objectIndex=None):
         """
         Resolve the object with the ID `objectId` in the `labelImage` into the fitted models with the given new IDs.
         `labelImage` should be updated by replacing all pixels that were labelled with `objectId`
         to get a new Id depending on the fit.
+        If the optional `objectIndex` of the `labelImage` is given, it should be used to relabel the pixels.
         """
         raise NotImplementedError()
\ No newline at end of file
@@ -1,6 +1,7 @@
 from yapsy.PluginManager import PluginManager
 from yapsy.FilteredPluginManager import FilteredPluginManager
 import logging
+import numpy as np
 from hytra.pluginsystem.object_feature_computation_plugin import ObjectFeatureComputationPlugin
 from hytra.pluginsystem.transition_feature_vector_construction_plugin import TransitionFeatureVectorConstructionPlugin
 from hytra.pluginsystem.image_provider_plugin import ImageProviderPlugin
@@ -25,6 +26,7 @@ class TrackingPluginManager(object):
 
         self.chosen_data_provider = "LocalImageLoader"
         self.chosen_feature_serializer = "LocalFeatureSerializer"
+        self.chosen_feature_cache = "Hdf5FeatureCache"
         self.chosen_merger_resolver = 'GMMMergerResolver'
 
     def __getstate__(self):
@@ -117,6 +119,40 @@ class TrackingPluginManager(object):
 
         return featureVector
 
+    def applyTransitionFeatureMatrixConstructionPlugins(self, featureDictsObjectA, featureDictsObjectB, selectedFeatures):
+        """
+        constructs the transition feature vectors of many transitions at once, and returns them as a matrix
+        with one row per transition. The feature dictionaries must contain the stacked features of all objects
+        (see `stackFeatureDicts`), such that row `i` of both dictionaries describes the objects of transition `i`.
+        """
+        featureMatrices = []
+        def appendFeatures(plugin):
+            f = plugin.constructFeatureMatrix(featureDictsObjectA, featureDictsObjectB, selectedFeatures)
+            featureMatrices.append(np.asarray(f, dtype=np.float64))
+
+        self._applyToAllPluginsOfCategory(appendFeatures, "TransitionFeatureVectorConstruction")
+
+        numTransitions = len(featureDictsObjectA.values()[0]) if len(featureDictsObjectA) > 0 else 0
+        featureMatrices = [f.reshape((numTransitions, -1)) if f.size > 0 else np.zeros((numTransitions, 0))
+                           for f in featureMatrices]
+        return np.hstack([np.zeros((numTransitions, 0))] + featureMatrices)
+
+    @staticmethod
+    def stackFeatureDicts(featureDicts, selectedFeatures=None):
+        """
+        Turn a list of per object feature dictionaries into one dictionary holding the stacked features,
+        where the first axis of each entry indexes the objects in the order of the list.
+        Only the `selectedFeatures` are stacked if those are given.
+        """
+        if len(featureDicts) == 0:
+            return {}
+        keys = set(featureDicts[0].keys())
+        for d in featureDicts[1:]:
+            keys.intersection_update(d.keys())
+        if selectedFeatures is not None:
+            keys.intersection_update(selectedFeatures)
+        return dict((k, np.array([d[k] for d in featureDicts])) for k in keys)
+
     def getTransitionFeatureNames(self, featureDictObjectA, featureDictObjectB, selectedFeatures):
         """
         returns a verbal description of each feature in the transition feature vector
@@ -146,6 +182,18 @@ class TrackingPluginManager(object):
         ''' get an instance of the selected feature serializer plugin '''
         return self._getPluginOfCategory(self.chosen_feature_serializer, "FeatureSerializer")
 
+    def setFeatureCache(self, featureCacheName):
+        ''' set the used feature cache plugin name '''
+        self.chosen_feature_cache = featureCacheName
+
+    def getFeatureCache(self):
+        ''' get an instance of the selected feature cache plugin (a feature serializer that supports `hasFeaturesForFrame`) '''
+        return self._getPluginOfCategory(self.chosen_feature_cache, "FeatureSerializer")
+
+    def getObjectFeatureComputationPluginNames(self):
+        ''' get the sorted names of all active object feature computation plugins '''
+        return sorted(pluginInfo.name for pluginInfo in self._yapsyPluginManager.getPluginsOfCategory("ObjectFeatureComputation"))
+
     def setMergerResolver(self, mergerResolverName):
         ''' set the used merger resolver plugin name '''
         self.chosen_merger_resolver = mergerResolverName
@@ -1,4 +1,5 @@
 from yapsy.IPlugin import IPlugin
+import numpy as np
 
 
 class TransitionFeatureVectorConstructionPlugin(IPlugin):
@@ -39,4 +40,26 @@ class TransitionFeatureVectorConstructionPlugin(IPlugin):
                     featureDictObjectA['meanIntensity']*featureDictObjectB['meanIntensity']]
         """
         raise NotImplementedError()
-        return []
\ No newline at end of file
+        return []
+
+    def constructFeatureMatrix(self, featureDictsObjectA, featureDictsObjectB, selectedFeatures):
+        """
+        Set up the feature vectors of many transitions at once. The given feature dictionaries contain
+        the stacked features of all objects, where row `i` of every feature in `featureDictsObjectA` and
+        `featureDictsObjectB` belongs to the two objects participating in transition `i`.
+
+        Return a numpy array with one row per transition, holding the same values as `constructFeatureVector`
+        would produce for every single transition.
+
+        This default implementation calls `constructFeatureVector` for every transition,
+        plugins should override it with a vectorized version.
+        """
+        numTransitions = len(featureDictsObjectA.values()[0]) if len(featureDictsObjectA) > 0 else 0
+        if numTransitions == 0:
+            return np.zeros((0, 0))
+        rows = []
+        for i in range(numTransitions):
+            featureDictObjectA = dict((k, v[i]) for k, v in featureDictsObjectA.iteritems())
+            featureDictObjectB = dict((k, v[i]) for k, v in featureDictsObjectB.iteritems())
+            rows.append(self.constructFeatureVector(featureDictObjectA, featureDictObjectB, selectedFeatures))
+        return np.array(rows, dtype=np.float64)
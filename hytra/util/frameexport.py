@@ -0,0 +1,81 @@
+"""
+This module provides the building blocks to export relabeled label images frame by frame:
+relabeling with a lookup table, which replaces all labels of a frame in a single pass,
+and a process pool that works on a bounded number of frames at a time, such that a video never
+has to be held in memory as a whole.
+"""
+
+import collections
+import multiprocessing
+import concurrent.futures
+import numpy as np
+from hytra.core.probabilitygenerator import DummyExecutor
+
+def createLookupTable(mapping, maxLabel, default=0, dtype=np.uint32):
+    '''
+    Create an array `lut` of length `maxLabel + 1` with `lut[label] = mapping[label]` for all labels in the `mapping`.
+    All other labels are mapped to `default`, except for the background label 0 which stays 0 unless it is mapped explicitly.
+    Labels in the mapping that are larger than `maxLabel` are ignored.
+    '''
+    lut = np.full(maxLabel + 1, default, dtype=dtype)
+    lut[0] = 0
+    if len(mapping) > 0:
+        labels = np.fromiter(mapping.iterkeys(), dtype=np.int64, count=len(mapping))
+        values = np.fromiter(mapping.itervalues(), dtype=np.int64, count=len(mapping))
+        valid = (labels >= 0) & (labels <= maxLabel)
+        lut[labels[valid]] = values[valid]
+    return lut
+
+def relabel(labelImage, mapping, default=0, dtype=None):
+    '''
+    **returns** a copy of the `labelImage` where every label is replaced by `mapping[label]`, and all labels
+    that are not part of the mapping by `default` (the background 0 stays 0 unless it is mapped explicitly).
+
+    ** Parameters: **
+
+    * `labelImage`: numpy array of non-negative integer labels
+    * `mapping`: dictionary `{oldLabel: newLabel}`
+    * `default`: the label of all objects that are not in the `mapping`
+    * `dtype`: type of the returned image, defaults to the type of the `labelImage`
+    '''
+    if dtype is None:
+        dtype = labelImage.dtype
+    if labelImage.size == 0:
+        return np.zeros(labelImage.shape, dtype=dtype)
+
+    maxLabel = int(labelImage.max())
+    if maxLabel <= max(labelImage.size, 1 << 20):
+        return createLookupTable(mapping, maxLabel, default, dtype)[labelImage]
+
+    # sparse huge labels would need a huge table, so only build one for the labels that are present
+    labels, inverse = np.unique(labelImage, return_inverse=True)
+    newLabels = np.array([mapping.get(l, 0 if l == 0 else default) for l in labels.tolist()], dtype=dtype)
+    return newLabels[inverse].reshape(labelImage.shape)
+
+def mapFrames(function, argumentsPerFrame, useMultiprocessing=True, maxWorkers=None, maxPendingFrames=None):
+    '''
+    Call `function(*arguments)` for every entry of `argumentsPerFrame` in a `concurrent.futures.ProcessPoolExecutor`
+    (or in this process if `useMultiprocessing` is `False`) and **yield** the results in the same order.
+
+    The arguments are consumed lazily, and at most `maxPendingFrames` (default: twice the number of workers)
+    results are computed ahead of the one that is yielded next. So no matter how many frames there are,
+    only a few of them are kept in memory at the same time.
+    '''
+    if maxWorkers is None:
+        maxWorkers = multiprocessing.cpu_count() if useMultiprocessing else 1
+    if maxPendingFrames is None:
+        maxPendingFrames = 2 * maxWorkers
+
+    if useMultiprocessing:
+        ExecutorType = concurrent.futures.ProcessPoolExecutor
+    else:
+        ExecutorType = DummyExecutor
+
+    with ExecutorType(max_workers=maxWorkers) as executor:
+        pendingJobs = collections.deque()
+        for arguments in argumentsPerFrame:
+            if len(pendingJobs) >= maxPendingFrames:
+                yield pendingJobs.popleft().result()
+            pendingJobs.append(executor.submit(function, *arguments))
+        while len(pendingJobs) > 0:
+            yield pendingJobs.popleft().result()
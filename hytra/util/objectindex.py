@@ -0,0 +1,66 @@
+"""
+This module provides an index of the objects in a label image, such that the pixels of single objects
+can be accessed and relabeled without comparing the whole image against their label.
+"""
+
+import numpy as np
+from scipy.ndimage import find_objects
+
+class LabelImageObjectIndex(object):
+    """
+    Index of all objects in a `labelImage`, built with a single pass of `scipy.ndimage.find_objects`.
+
+    For every label it knows the bounding box, and the flat indices of its pixels (in the whole image)
+    are computed from within that bounding box when they are first needed. Use `coordinates` to get the pixel
+    coordinates of an object and `relabel` to change its pixels in-place.
+    """
+
+    def __init__(self, labelImage):
+        self.labelImage = labelImage
+        self.boundingBoxes = find_objects(labelImage)
+        self._flatIndices = {}
+
+    @property
+    def maxLabel(self):
+        ''' the largest label in the image, 0 if it contains no objects '''
+        return len(self.boundingBoxes)
+
+    def boundingBox(self, label):
+        ''' **returns** a tuple of slices of the bounding box of the object, or `None` if the label is not present '''
+        if 0 < label <= len(self.boundingBoxes):
+            return self.boundingBoxes[label - 1]
+        return None
+
+    def flatIndices(self, label):
+        ''' **returns** the indices of all pixels of the object in the flattened label image, in C order '''
+        if label not in self._flatIndices:
+            boundingBox = self.boundingBox(label)
+            if boundingBox is None:
+                self._flatIndices[label] = np.zeros(0, dtype=np.intp)
+            else:
+                localCoordinates = np.nonzero(self.labelImage[boundingBox] == label)
+                coordinates = [c + s.start for c, s in zip(localCoordinates, boundingBox)]
+                self._flatIndices[label] = np.ravel_multi_index(coordinates, self.labelImage.shape)
+        return self._flatIndices[label]
+
+    def coordinates(self, label):
+        '''
+        **returns** the coordinates of all pixels of the object with one row per pixel,
+        in the same order as `np.transpose(np.where(labelImage == label))`
+        '''
+        return np.transpose(np.unravel_index(self.flatIndices(label), self.labelImage.shape))
+
+    def relabel(self, label, newLabels):
+        '''
+        Assign `newLabels` (a single label, or one label per pixel in the order of `coordinates`)
+        to all pixels of the object in-place. The new labels must not be used by other objects yet.
+        '''
+        indices = self.flatIndices(label)
+        self.labelImage.flat[indices] = newLabels
+
+        # keep the pixel lists of the old and new labels up to date
+        newLabels = np.broadcast_to(np.asarray(newLabels), indices.shape)
+        for newLabel in np.unique(newLabels).tolist():
+            self._flatIndices[newLabel] = indices[newLabels == newLabel]
+        if not np.any(newLabels == label):
+            self._flatIndices[label] = np.zeros(0, dtype=np.intp)
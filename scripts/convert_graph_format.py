@@ -0,0 +1,42 @@
+# pythonpath modification to make hytra available
+# for import without requiring it to be installed
+import os
+import sys
+sys.path.insert(0, os.path.abspath('..'))
+# standard imports
+import logging
+import argparse
+import time
+from hytra.core.jsongraph import readFromFile, writeToFile
+
+def getLogger():
+    return logging.getLogger('convert_graph_format.py')
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description='Convert a model, result or weights file between our JSON format and the binary HDF5 format. '
+                    'The format of each file is determined by its extension, .h5 and .hdf5 denote HDF5, '
+                    'everything else is treated as JSON.',
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument('--in-file', required=True, type=str, dest='in_filename',
+                        help='Filename of the model, result or weights to convert')
+    parser.add_argument('--out-file', required=True, type=str, dest='out_filename',
+                        help='Filename of the converted file')
+    parser.add_argument('--compact-json', dest='compact_json', action='store_true', default=False,
+                        help='Write JSON without indentation and whitespace')
+    parser.add_argument("--verbose", dest='verbose', action='store_true', default=False)
+
+    args = parser.parse_args()
+
+    if args.verbose:
+        logging.basicConfig(level=logging.DEBUG)
+    else:
+        logging.basicConfig(level=logging.INFO)
+
+    start = time.time()
+    dictionary = readFromFile(args.in_filename)
+    getLogger().info("Loaded {} in {:.1f} seconds".format(args.in_filename, time.time() - start))
+
+    start = time.time()
+    writeToFile(args.out_filename, dictionary, compact=args.compact_json)
+    getLogger().info("Saved {} in {:.1f} seconds".format(args.out_filename, time.time() - start))
@@ -6,11 +6,57 @@ sys.path.insert(0, os.path.abspath('..'))
 # standard imports
 import logging
 import configargparse as argparse
-from hytra.core.jsongraph import JsonTrackingGraph, writeToFormattedJSON
+import collections
+import itertools
+import tempfile
+import hytra.core.jsongraph
+from hytra.core.jsongraph import JsonTrackingGraph
 
 def getLogger():
     return logging.getLogger('convexify_costs.py')
 
+def convexifyStreaming(modelFilename, resultFilename, epsilon, compact, batchSize=100000):
+    '''
+    Convexify the costs of `batchSize` hypotheses at a time while streaming the model from one JSON file to the other,
+    such that the model never needs to be loaded into memory completely.
+    '''
+    model = hytra.core.jsongraph.readFromJSON(modelFilename, streaming=True)
+    if not model['settings']['statesShareWeights']:
+        raise ValueError('This script can only convexify feature vectors with shared weights!')
+
+    featureKeys = {
+        'segmentationHypotheses': hytra.core.jsongraph.segmentationFeatureKeys,
+        'linkingHypotheses': ('features',),
+        'divisionHypotheses': ('features',)
+    }
+    def convexifyAll(hypotheses, keys):
+        # convexify batches of hypotheses at once, but never keep more than one batch in memory
+        hypotheses = iter(hypotheses)
+        while True:
+            batch = list(itertools.islice(hypotheses, batchSize))
+            if len(batch) == 0:
+                break
+            for h in hytra.core.jsongraph.convexifyHypotheses(batch, epsilon, keys):
+                yield h
+
+    outModel = collections.OrderedDict()
+    for key in model.keys():
+        if key in featureKeys:
+            outModel[key] = convexifyAll(model[key], featureKeys[key])
+        else:
+            outModel[key] = model[key]
+
+    # the input file is still read while writing, so write to a temporary file first
+    outDir = os.path.dirname(os.path.abspath(resultFilename))
+    with tempfile.NamedTemporaryFile(dir=outDir, suffix='.json', delete=False) as f:
+        tmpFilename = f.name
+    try:
+        hytra.core.jsongraph.writeToJSON(tmpFilename, outModel, compact=compact)
+        os.rename(tmpFilename, resultFilename)
+    except:
+        os.remove(tmpFilename)
+        raise
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(
         description='(Strictly!) Convexify the costs of a model to allow a flow-based solution',
@@ -23,6 +69,13 @@ if __name__ == "__main__":
                         +' If None, it works in-place.')
     parser.add_argument('--epsilon', type=float, dest='epsilon', default=0.000001,
                         help='Epsilon is added to the gradient if the 1st derivative has a plateau.')
+    parser.add_argument('--streaming', dest='streaming', action='store_true', default=False,
+                        help='Convexify batches of hypotheses while reading and writing the JSON files, '
+                        + 'instead of loading the whole model into memory. The model must not contain comments.')
+    parser.add_argument('--streaming-batch-size', type=int, dest='batchSize', default=100000,
+                        help='Number of hypotheses that are convexified at once when streaming')
+    parser.add_argument('--compact-json', dest='compactJson', action='store_true', default=False,
+                        help='Write the JSON file without indentation and whitespace')
     parser.add_argument("--verbose", dest='verbose', action='store_true', default=False)
 
     # parse command line
@@ -34,10 +87,17 @@ if __name__ == "__main__":
         logging.basicConfig(level=logging.INFO)
     getLogger().debug("Ignoring unknown parameters: {}".format(unknown))
 
-    trackingGraph = JsonTrackingGraph(model_filename=args.model_filename)
-    trackingGraph.convexifyCosts(args.epsilon)
-
     if args.result_filename is None:
         args.result_filename = args.model_filename
 
-    writeToFormattedJSON(args.result_filename, trackingGraph.model)
+    if args.streaming and (hytra.core.jsongraph.isHDF5Filename(args.model_filename)
+                           or hytra.core.jsongraph.isHDF5Filename(args.result_filename)):
+        getLogger().warning("Streaming is only supported for JSON files, loading the whole model instead")
+        args.streaming = False
+
+    if args.streaming:
+        convexifyStreaming(args.model_filename, args.result_filename, args.epsilon, args.compactJson, args.batchSize)
+    else:
+        trackingGraph = JsonTrackingGraph(model_filename=args.model_filename)
+        trackingGraph.convexifyCosts(args.epsilon)
+        trackingGraph.writeModel(args.result_filename, compact=args.compactJson)
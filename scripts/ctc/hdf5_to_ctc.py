@@ -13,6 +13,7 @@ import time
 import glob
 import logging
 from skimage.external import tifffile
+from hytra.util.frameexport import relabel, mapFrames
 
 def get_num_frames(options):
     if len(options.input_files) == 1:
@@ -79,11 +80,17 @@ def remap_label_image(label_image, mapping):
     given a label image and a mapping, creates and 
     returns a new label image with remapped object pixel values 
     """
-    remapped_label_image = np.zeros(label_image.shape, dtype=label_image.dtype)
-    for dest, src in mapping.iteritems():
-        remapped_label_image[label_image == dest] = src
+    return relabel(label_image, mapping)
 
-    return remapped_label_image
+
+def get_frame_label_image_indices(timestep, options):
+    """ returns the sorted labels present in the label image of a frame, meant to be run in a worker process """
+    return np.unique(get_frame_label_image(timestep, options))
+
+
+def remap_and_save_frame(timestep, mapping, options):
+    """ load the label image of a frame, remap it and save it as tif, meant to be run in a worker process """
+    save_frame_to_tif(timestep, remap_label_image(get_frame_label_image(timestep, options), mapping), options)
 
 
 def convert_label_volume(options):
@@ -91,16 +98,22 @@ def convert_label_volume(options):
     if num_frames == 0:
         logging.getLogger('hdf5_to_ctc.py').error("Cannot work on empty set")
         return
+    use_multiprocessing = not options.disable_multiprocessing
+
+    # the track bookkeeping only needs to know which labels are present in every frame
+    label_image_indices_per_frame = list(mapFrames(get_frame_label_image_indices,
+                                                   ((frame, options) for frame in range(num_frames)),
+                                                   useMultiprocessing=use_multiprocessing))
 
     # for each track, indexed by first label, store [parent, begin, end]
     tracks = {}
     old_mapping = {} # mapping from label_id to track_id
+    mappings = [old_mapping] # the final mapping of every frame, frames are only written once all are known
     new_track_id = 1
 
     # handle frame 0 -> only add those nodes that are referenced from frame 1 events
-    label_image = get_frame_label_image(0, options)
-    label_image_indices = np.unique(label_image)
-    logging.getLogger('hdf5_to_ctc.py').debug("Processing frame 0 of shape {}".format(label_image.shape))
+    label_image_indices = label_image_indices_per_frame[0]
+    logging.getLogger('hdf5_to_ctc.py').debug("Processing frame 0")
 
     moves = get_frame_dataset(1, "Moves", options)
     splits = get_frame_dataset(1, "Splits", options)
@@ -121,18 +134,14 @@ def convert_label_volume(options):
         old_mapping[l] = new_track_id
         tracks[new_track_id] = [0, 0]
         new_track_id += 1
-    remapped_label_image = remap_label_image(label_image, old_mapping)
-    save_frame_to_tif(0, remapped_label_image, options)
     logging.getLogger('hdf5_to_ctc.py').debug("Tracks in first frame: {}".format(new_track_id))
 
     # handle all further frames by remapping their indices
     for frame in range(1, num_frames):
-        old_label_image = label_image
-        old_label_image_indices = np.unique(old_label_image)
+        old_label_image_indices = label_image_indices
         start_time = time.time()
-        label_image = get_frame_label_image(frame, options)
-        label_image_indices = np.unique(label_image)
-        logging.getLogger('hdf5_to_ctc.py').debug("Processing frame {} of shape {}".format(frame, label_image.shape))
+        label_image_indices = label_image_indices_per_frame[frame]
+        logging.getLogger('hdf5_to_ctc.py').debug("Processing frame {}".format(frame))
         mapping = {}
 
         moves = get_frame_dataset(frame, "Moves", options)
@@ -162,13 +171,12 @@ def convert_label_volume(options):
                 parent = 0
                 old_mapping[parent] = 0
             else:
-                # insert a track of length 1 as parent of the new track
+                # insert a track of length 1 as parent of the new track,
+                # which ends up in the label image of the previous frame as that is written later on
                 old_mapping[parent] = new_track_id
                 tracks[new_track_id] = [0, frame - 1, frame - 1]
                 new_track_id += 1
                 logging.getLogger('hdf5_to_ctc.py').warning("Adding single-node-track parent of division with id {}".format(new_track_id - 1))
-                remapped_label_image = remap_label_image(old_label_image, old_mapping)
-                save_frame_to_tif(frame-1, remapped_label_image, options)
 
             # create new tracks for all children
             for c in splits[s, 1:]:
@@ -184,15 +192,18 @@ def convert_label_volume(options):
         for idx in disappeared_indices:
             tracks[idx].append(frame - 1)
 
-        # create a new label image with remapped indices (only those of tracks) and save it
-        remapped_label_image = remap_label_image(label_image, mapping)
-        save_frame_to_tif(frame, remapped_label_image, options)
-
         # save for next iteration
+        mappings.append(mapping)
         old_mapping = mapping
         logging.getLogger('hdf5_to_ctc.py').debug("\tFrame done in {} secs".format(time.time() - start_time))
         logging.getLogger('hdf5_to_ctc.py').debug("Track count is now at {}".format(new_track_id))
 
+    # create new label images with remapped indices (only those of tracks) and save them
+    logging.getLogger('hdf5_to_ctc.py').info("Done processing tracks, saving relabeled frames...")
+    jobs = ((frame, mappings[frame], options) for frame in range(num_frames))
+    for _ in mapFrames(remap_and_save_frame, jobs, useMultiprocessing=use_multiprocessing):
+        pass
+
     logging.getLogger('hdf5_to_ctc.py').info("Done processing frames, saving track info...")
     # done, save tracks
     save_tracks(tracks, num_frames, options)
@@ -212,6 +223,8 @@ if __name__ == "__main__":
     parser.add_argument('--ctc-filename-zero-pad-length', type=int, dest='filename_zero_padding', default='3')
     parser.add_argument('--h5-group-zero-pad-length', type=int, dest='h5group_zero_padding', default='4')
     parser.add_argument("--verbose", dest='verbose', action='store_true', default=False)
+    parser.add_argument('--disable-multiprocessing', dest='disable_multiprocessing', action='store_true',
+                        help='Do not use multiprocessing to read, relabel and save the frames', default=False)
 
     # parse command line
     args, unknown = parser.parse_known_args()
@@ -14,6 +14,8 @@ import logging
 from skimage.external import tifffile
 from hytra.core.jsongraph import JsonTrackingGraph
 from hytra.pluginsystem.plugin_manager import TrackingPluginManager
+from hytra.core.probabilitygenerator import getWorkerPluginManager, closeWorkerFiles
+from hytra.util.frameexport import relabel, mapFrames
 
 def getLogger():
     return logging.getLogger(__name__)
@@ -56,11 +58,17 @@ def remap_label_image(label_image, mapping):
     given a label image and a mapping, creates and 
     returns a new label image with remapped object pixel values 
     """
-    remapped_label_image = np.zeros(label_image.shape, dtype=label_image.dtype)
-    for dest, src in mapping.iteritems():
-        remapped_label_image[label_image == dest] = src
+    return relabel(label_image, mapping)
 
-    return remapped_label_image
+
+def remap_and_save_frame(timeframe, mapping, options):
+    """
+    load the label image of a frame, remap it and save it as tif. 
+    Meant to be run in a worker process, which keeps its own plugin manager.
+    """
+    imageProvider = getWorkerPluginManager(options.pluginPaths).getImageProvider()
+    label_image = imageProvider.getLabelImageForFrame(options.label_image_filename, options.label_image_path, timeframe)
+    save_frame_to_tif(timeframe, remap_label_image(label_image, mapping), options)
 
 
 if __name__ == "__main__":
@@ -85,6 +93,8 @@ if __name__ == "__main__":
                         help='A list of paths to search for plugins for the tracking pipeline.')
     parser.add_argument("--is-ground-truth", dest='is_ground_truth', action='store_true', default=False)
     parser.add_argument("--verbose", dest='verbose', action='store_true', default=False)
+    parser.add_argument('--disable-multiprocessing', dest='disableMultiprocessing', action='store_true',
+                        help='Do not use multiprocessing to relabel and save the frames', default=False)
 
     # parse command line
     args, unknown = parser.parse_known_args()
@@ -143,7 +153,8 @@ if __name__ == "__main__":
     imageProvider = pluginManager.getImageProvider()
     timeRange = imageProvider.getTimeRange(args.label_image_filename, args.label_image_path)
 
-    for timeframe in range(timeRange[0], timeRange[1]):
-        label_image = imageProvider.getLabelImageForFrame(args.label_image_filename, args.label_image_path, timeframe)
-        remapped_label_image = remap_label_image(label_image, mappings[timeframe])
-        save_frame_to_tif(timeframe, remapped_label_image, args)
+    # every frame is loaded, relabeled and written by a worker process
+    jobs = ((timeframe, mappings[timeframe], args) for timeframe in range(timeRange[0], timeRange[1]))
+    for _ in mapFrames(remap_and_save_frame, jobs, useMultiprocessing=not args.disableMultiprocessing):
+        pass
+    closeWorkerFiles()
@@ -99,6 +99,14 @@ def getConfigAndCommandLineArguments():
                         help='Do not use multiprocessing to speed up computation',
                         default=False)
     parser.add_argument('--turn-off-features', dest='turnOffFeatures', type=str, nargs='+', default=[])
+    parser.add_argument('--feature-cache', dest='featureCacheFilename', type=str, default=None,
+                        help='HDF5 file to cache the region features in, so that they are only recomputed if the inputs changed')
+    parser.add_argument('--compact-graph', dest='compactGraph', action='store_true',
+                        help='Store the hypotheses graph in arrays instead of networkx, which needs much less memory for large graphs',
+                        default=False)
+    parser.add_argument('--compact-json', dest='compactJson', action='store_true',
+                        help='Write the JSON file without indentation and whitespace, which makes it much smaller',
+                        default=False)
     parser.add_argument('--verbose', dest='verbose', action='store_true',
                         help='Turn on verbose logging', default=False)
     parser.add_argument('--plugin-paths', dest='pluginPaths', type=str, nargs='+',
@@ -467,6 +475,7 @@ def loadProbabilityGenerator(options,
     ilpOptions.rawImageFilename = options.raw_filename
     ilpOptions.rawImageAxes = options.raw_axes
     ilpOptions.sizeFilter = [options.minsize, options.maxsize]
+    ilpOptions.featureCacheFilename = options.featureCacheFilename
     if options.label_image_file is not None:
         ilpOptions.labelImageFilename = options.label_image_file
     else:
@@ -576,7 +585,8 @@ def getHypothesesGraphAndIterators(options, shape, t0, t1, ts, probGenerator, tr
             borderAwareWidth=margin,
             maxNeighborDistance=options.mnd,
             transitionParameter=options.trans_par,
-            transitionClassifier=transitionClassifier)
+            transitionClassifier=transitionClassifier,
+            compactGraph=options.compactGraph)
 
         if not options.without_tracklets:
             hypotheses_graph = hypotheses_graph.generateTrackletGraph()
@@ -749,9 +759,9 @@ if __name__ == "__main__":
             transitionProbabilityFunc,
             boundaryCostMultiplierFunc,
             divisionProbabilityFunc)
+        # write everything to JSON
+        trackingGraph.writeModel(options.json_filename, compact=options.compactJson)
     else:
         hypotheses_graph.insertEnergies()
-        trackingGraph = hypotheses_graph.toTrackingGraph()
-
-    # write everything to JSON
-    hytra.core.jsongraph.writeToFormattedJSON(options.json_filename, trackingGraph.model)
+        # stream the model to JSON without building it in memory
+        hypotheses_graph.writeTrackingGraph(options.json_filename, compact=options.compactJson)
@@ -111,10 +111,11 @@ if __name__ == "__main__":
         logging.basicConfig(level=logging.INFO)
     logging.getLogger('json_result_to_events.py').debug("Ignoring unknown parameters: {}".format(unknown))
 
-    traxelIdPerTimestepToUniqueIdMap, uuidToTraxelMap = hytra.core.jsongraph.getMappingsBetweenUUIDsAndTraxels(model)
+    traxelIdPerTimestepToUniqueIdMap = model['traxelToUniqueId']
     timesteps = [t for t in traxelIdPerTimestepToUniqueIdMap.keys()]
 
-    mergers, detections, links, divisions = hytra.core.jsongraph.getMergersDetectionsLinksDivisions(result, uuidToTraxelMap)
+    traxelIndex = hytra.core.jsongraph.getTraxelIndex(model)
+    mergers, detections, links, divisions = hytra.core.jsongraph.getMergersDetectionsLinksDivisions(result, traxelIndex)
 
     # group by timestep for event creation
     mergersPerTimestep = hytra.core.jsongraph.getMergersPerTimestep(mergers, timesteps)
@@ -9,24 +9,9 @@ import logging
 import h5py
 import vigra
 from vigra import numpy as np
-import commentjson as json
 from hytra.util.progressbar import ProgressBar
-
-def get_uuid_to_traxel_map(traxelIdPerTimestepToUniqueIdMap):
-    timesteps = [t for t in traxelIdPerTimestepToUniqueIdMap.keys()]
-    uuidToTraxelMap = {}
-    for t in timesteps:
-        for i in traxelIdPerTimestepToUniqueIdMap[t].keys():
-            uuid = traxelIdPerTimestepToUniqueIdMap[t][i]
-            if uuid not in uuidToTraxelMap:
-                uuidToTraxelMap[uuid] = []
-            uuidToTraxelMap[uuid].append((int(t), int(i)))
-
-    # sort the list of traxels per UUID by their timesteps
-    for v in uuidToTraxelMap.values():
-        v.sort(key=lambda timestepIdTuple: timestepIdTuple[0])
-
-    return uuidToTraxelMap
+from hytra.util.frameexport import relabel, mapFrames
+from hytra.core.jsongraph import readFromFile, getTraxelIndex
 
 def getLabelImageForFrame(labelImageFilename, labelImagePath, timeframe, shape):
     """
@@ -44,25 +29,35 @@ def getShape(labelImageFilename, labelImagePath):
         shape = h5file['/'.join(labelImagePath.split('/')[:-1])].values()[0].shape[1:4]
         return shape
 
-def relabelImage(volume, replace):
+def computeColorMaps(linksPerTimestep, numTimesteps):
     """
-    Apply a set of label replacements to the given volume.
+    Label tracks from front to back in a distinct color, by propagating the color along the links.
 
-    Parameters:
-        volume - numpy array
-        replace - dictionary{[(oldValueInVolume)->(newValue), ...]}
+    Returns a list with one dictionary {objectId: color} per timestep.
+    Objects that are not part of any link are not contained and should get the color 0.
     """
-    mp = np.arange(0, np.amax(volume) + 1, dtype=volume.dtype)
-    mp[1:] = 1
-    labels = np.unique(volume)
-    for label in labels:
-        if label > 0:
-            try:
-                r = replace[label]
-                mp[label] = r
-            except:                
-                pass
-    return mp[volume]
+    colorMaps = [{} for t in range(numTimesteps)]
+    nextUnusedColor = 1
+    for t in range(1, numTimesteps):
+        lastFrameColorMap = colorMaps[t - 1]
+        thisFrameColorMap = colorMaps[t]
+        for a, b in linksPerTimestep[str(t)]:
+            # propagate color if possible, otherwise assign a new one
+            if a in lastFrameColorMap:
+                thisFrameColorMap[b] = lastFrameColorMap[a]
+            else:
+                thisFrameColorMap[b] = nextUnusedColor
+                lastFrameColorMap[a] = thisFrameColorMap[b]  # also store in last frame's color map as it must have been present to participate in a link
+                nextUnusedColor += 1
+    return colorMaps
+
+def relabelFrame(labelImageFilename, labelImagePath, timeframe, shape, colorMap):
+    """
+    Load the label image of one frame and color its objects, all objects without color become background.
+    Meant to be run in a worker process.
+    """
+    labelImage = getLabelImageForFrame(labelImageFilename, labelImagePath, timeframe, shape)
+    return relabel(labelImage, colorMap, default=0, dtype=np.uint32)
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description='Perform the segmentation as in ilastik for a new predicition map,'
@@ -80,6 +75,8 @@ if __name__ == "__main__":
                         help='Path inside result file to the label image',
                         default='/TrackingFeatureExtraction/LabelImage/0000/[[%d, 0, 0, 0, 0], [%d, %d, %d, %d, 1]]')
     parser.add_argument('--label-image-out', type=str, dest='out', required=True, help='Filename of the resulting HDF5 with relabeled objects')
+    parser.add_argument('--disable-multiprocessing', dest='disableMultiprocessing', action='store_true',
+                        help='Do not use multiprocessing to relabel the frames', default=False)
     
     args, unknown = parser.parse_known_args()
 
@@ -87,79 +84,49 @@ if __name__ == "__main__":
     shape = getShape(args.labelImageFilename, args.labelImagePath)
 
     # load json model and results
-    with open(args.modelFilename, 'r') as f:
-        model = json.load(f)
-
-    with open(args.resultFilename, 'r') as f:
-        result = json.load(f)
+    model = readFromFile(args.modelFilename)
+    result = readFromFile(args.resultFilename)
 
-    # load forward mapping and create reverse mapping from json uuid to (timestep,ID)
+    # index of the mapping between json uuids and (timestep,ID)
     traxelIdPerTimestepToUniqueIdMap = model['traxelToUniqueId']
-    uuidToTraxelMap = get_uuid_to_traxel_map(traxelIdPerTimestepToUniqueIdMap)
+    traxelIndex = getTraxelIndex(model)
 
-    # load links and map indices
-    links = [(uuidToTraxelMap[int(entry['src'])][-1], uuidToTraxelMap[int(entry['dest'])][0]) for entry in result['linkingResults'] if entry['value'] > 0]
+    # load active links and map indices
+    activeLinks = [entry for entry in result['linkingResults'] if entry['value'] > 0]
+    _, srcIds = traxelIndex.lastTraxelOf([int(entry['src']) for entry in activeLinks])
+    destTimesteps, destIds = traxelIndex.firstTraxelOf([int(entry['dest']) for entry in activeLinks])
 
     # add all internal links of tracklets
-    for v in uuidToTraxelMap.values():
-        prev = None
-        for timestepIdTuple in v:
-            if prev is not None:
-                links.append((prev, timestepIdTuple))
-            prev = timestepIdTuple
-
-    # group by timestep
+    internalLinks = traxelIndex.internalLinks()
+    srcIds = np.concatenate([srcIds, internalLinks[1]])
+    destTimesteps = np.concatenate([destTimesteps, internalLinks[2]])
+    destIds = np.concatenate([destIds, internalLinks[3]])
+
+    # group by timestep, keeping the order of links within each timestep
     timesteps = [t for t in traxelIdPerTimestepToUniqueIdMap.keys()]
-    linksPerTimestep = dict([(t, [(a[1], b[1]) for a, b in links if b[0] == int(t)]) for t in timesteps])
+    linksPerTimestep = dict([(t, []) for t in timesteps])
+    order = np.argsort(destTimesteps, kind='mergesort')
+    for t, a, b in zip(destTimesteps[order].tolist(), srcIds[order].tolist(), destIds[order].tolist()):
+        linksPerTimestep[str(t)].append((a, b))
     assert(len(linksPerTimestep['0']) == 0)
 
-    # create output array
-    resultVolume = np.zeros((len(timesteps),) + shape, dtype='uint32')
-    print("resulting volume shape: {}".format(resultVolume.shape))
-    progressBar = ProgressBar(stop=len(timesteps))
-    progressBar.show(0)
-
-    # iterate over timesteps and label tracks from front to back in a distinct color
-    nextUnusedColor = 1
-    lastFrameColorMap = {}
-    lastFrameLabelImage = getLabelImageForFrame(args.labelImageFilename, args.labelImagePath, 0, shape)
-    for t in range(1,len(timesteps)):
-        progressBar.show()
-        thisFrameColorMap = {}
-        thisFrameLabelImage = getLabelImageForFrame(args.labelImageFilename, args.labelImagePath, t, shape)
-        for a, b in linksPerTimestep[str(t)]:
-            # propagate color if possible, otherwise assign a new one
-            if a in lastFrameColorMap:
-                thisFrameColorMap[b] = lastFrameColorMap[a]
-            else:
-                thisFrameColorMap[b] = nextUnusedColor
-                lastFrameColorMap[a] = thisFrameColorMap[b]  # also store in last frame's color map as it must have been present to participate in a link
-                nextUnusedColor += 1
-
-        # see which objects have been assigned a color in the last frame. set all others to 0 (1?)
-        unusedLabels = set(np.unique(lastFrameLabelImage)) - set([0]) - set(lastFrameColorMap.keys())
-        for l in unusedLabels:
-            lastFrameColorMap[l] = 0
-
-        # write relabeled image
-        resultVolume[t-1,...,0] = relabelImage(lastFrameLabelImage, lastFrameColorMap)
-
-        # swap the color maps so that in the next frame we use "this" as "last"
-        lastFrameColorMap, thisFrameColorMap = thisFrameColorMap, lastFrameColorMap
-        lastFrameLabelImage = thisFrameLabelImage
+    # the colors only depend on the links, so they are assigned for all frames upfront
+    # and the label images can be relabeled independently of each other
+    colorMaps = computeColorMaps(linksPerTimestep, len(timesteps))
 
-    # handle last frame:
-    # see which objects have been assigned a color in the last frame. set all others to 0 (1?)
-    unusedLabels = set(np.unique(lastFrameLabelImage)) - set([0]) - set(lastFrameColorMap.keys())
-    for l in unusedLabels:
-        lastFrameColorMap[l] = 0
-
-    # write last frame relabeled image
-    resultVolume[t,...,0] = relabelImage(lastFrameLabelImage, lastFrameColorMap)
-    progressBar.show()
-
-    # save to disk
+    # create output dataset, which is written frame by frame
     if os.path.exists(args.out):
         os.remove(args.out)
-    vigra.impex.writeHDF5(resultVolume, args.out, 'exported_data', compression='gzip', chunks=True)
+    resultShape = (len(timesteps),) + shape
+    print("resulting volume shape: {}".format(resultShape))
+    progressBar = ProgressBar(stop=len(timesteps))
+    progressBar.show(0)
 
+    with h5py.File(args.out, 'w') as outFile:
+        resultVolume = outFile.create_dataset('exported_data', shape=resultShape, dtype='uint32',
+                                              compression='gzip', chunks=(1,) + shape)
+        jobs = ((args.labelImageFilename, args.labelImagePath, t, shape, colorMaps[t]) for t in range(len(timesteps)))
+        for t, relabeledImage in enumerate(mapFrames(relabelFrame, jobs, useMultiprocessing=not args.disableMultiprocessing)):
+            resultVolume[t,...,0] = relabeledImage
+            colorMaps[t] = None
+            progressBar.show()
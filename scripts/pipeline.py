@@ -61,18 +61,15 @@ def run_pipeline(options, unknown):
                         "-w", options.weight_filename,
                         "-o", options.result_filename])
         else:
-            import commentjson as json
-            import dpct
             import hytra.core.jsongraph
+            from hytra.core.mincostflow import importFlowSolver
 
-            with open(options.model_filename, 'r') as f:
-                model = json.load(f)
+            # model, weights and result can be JSON or HDF5 files
+            model = hytra.core.jsongraph.readFromFile(options.model_filename)
+            weights = hytra.core.jsongraph.readFromFile(options.weight_filename)
 
-            with open(options.weight_filename, 'r') as f:
-                weights = json.load(f)
-
-            result = dpct.trackFlowBased(model, weights)
-            hytra.core.jsongraph.writeToFormattedJSON(options.result_filename, result)
+            result = importFlowSolver().trackFlowBased(model, weights)
+            hytra.core.jsongraph.writeToFile(options.result_filename, result)
 
 
     extra_params = []
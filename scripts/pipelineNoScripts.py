@@ -10,7 +10,6 @@ sys.path.insert(0, os.path.abspath('..'))
 
 import logging
 import commentjson as json
-import dpct
 from subprocess import check_call
 import configargparse as argparse
 import hytra.core.ilastik_project_options
@@ -18,6 +17,7 @@ from hytra.core.jsongraph import JsonTrackingGraph
 from hytra.core.ilastikhypothesesgraph import IlastikHypothesesGraph
 from hytra.core.fieldofview import FieldOfView
 from hytra.core.jsonmergerresolver import JsonMergerResolver
+from hytra.core.mincostflow import importFlowSolver
 
 def convertToDict(unknown):
     indicesOfParameters = [i for i,p in enumerate(unknown) if p.startswith('--')]
@@ -133,7 +133,7 @@ def run_pipeline(options, unknown):
 
     if options.do_tracking:
         logging.info("Run tracking...")
-        result = dpct.trackFlowBased(model, weights)
+        result = importFlowSolver().trackFlowBased(model, weights)
         hytra.core.jsongraph.writeToFormattedJSON(options.result_filename, result)
 
         if hypotheses_graph:
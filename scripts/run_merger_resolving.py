@@ -6,7 +6,7 @@ sys.path.insert(0, os.path.abspath('..'))
 # standard imports
 import logging
 import configargparse as argparse
-from hytra.core.jsongraph import JsonTrackingGraph, writeToFormattedJSON
+from hytra.core.jsongraph import JsonTrackingGraph, writeToFile
 from hytra.core.jsonmergerresolver import JsonMergerResolver
 
 if __name__ == "__main__":
@@ -47,6 +47,8 @@ if __name__ == "__main__":
     parser.add_argument('--plugin-paths', dest='pluginPaths', type=str, nargs='+',
                         default=[os.path.abspath('../hytra/plugins')],
                         help='A list of paths to search for plugins for the tracking pipeline.')
+    parser.add_argument('--disable-multiprocessing', dest='disableMultiprocessing', action='store_true',
+                        help='Do not fit independent mergers in parallel processes', default=False)
     args, _ = parser.parse_known_args()
 
     if args.verbose:
@@ -64,11 +66,12 @@ if __name__ == "__main__":
         args.raw_path,
         args.raw_axes,
         args.pluginPaths,
-        args.verbose)
+        args.verbose,
+        not args.disableMultiprocessing)
     merger_resolver.run(
         args.transition_classifier_filename,
         args.transition_classifier_path)
 
     # save
-    writeToFormattedJSON(args.out_model_filename, merger_resolver.model)
-    writeToFormattedJSON(args.out_result, merger_resolver.result)
+    writeToFile(args.out_model_filename, merger_resolver.model)
+    writeToFile(args.out_result, merger_resolver.result)
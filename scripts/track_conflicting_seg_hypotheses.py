@@ -130,6 +130,7 @@ def setupGraph(options):
     ilpOptions.rawImageAxes = options.raw_data_axes
     
     ilpOptions.sizeFilter = [10, 100000]
+    ilpOptions.featureCacheFilename = options.featureCacheFilename
     ilpOptions.objectCountClassifierFilename = options.obj_count_classifier_file
     ilpOptions.objectCountClassifierPath = options.obj_count_classifier_path
     
@@ -211,8 +212,8 @@ def runTracking(options, trackingGraph, weights=None):
         getLogger().info("Using learned weights!")
 
     if options.use_flow_solver:
-        import dpct
-        result = dpct.trackFlowBased(trackingGraph.model, weights)
+        from hytra.core.mincostflow import importFlowSolver
+        result = importFlowSolver().trackFlowBased(trackingGraph.model, weights)
     else:
         try:
             import multiHypoTracking_with_cplex as mht
@@ -381,6 +382,8 @@ if __name__ == "__main__":
     parser.add_argument('--disable-multiprocessing', dest='disableMultiprocessing', action='store_true',
                         help='Do not use multiprocessing to speed up computation',
                         default=False)
+    parser.add_argument('--feature-cache', dest='featureCacheFilename', type=str, default=None,
+                        help='HDF5 file to cache the region features in, so that they are only recomputed if the inputs changed')
 
     # Raw Data:
     group = parser.add_argument_group('Input Images', 'Raw data and label images')
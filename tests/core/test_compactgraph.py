@@ -0,0 +1,83 @@
+import copy
+import numpy as np
+import networkx as nx
+from hytra.core.compactgraph import CompactDiGraph
+
+def assertSameGraph(a, b):
+    assert(sorted(a.nodes()) == sorted(b.nodes()))
+    assert(sorted(a.edges()) == sorted(b.edges()))
+    assert(a.number_of_nodes() == b.number_of_nodes())
+    assert(a.number_of_edges() == b.number_of_edges())
+    for n in a.nodes_iter():
+        assert(dict(a.node[n].items()) == dict(b.node[n].items()))
+        assert(sorted(a.out_edges(n)) == sorted(b.out_edges(n)))
+        assert(sorted(a.in_edges(n)) == sorted(b.in_edges(n)))
+        assert(a.in_degree(n) == b.in_degree(n))
+        assert(a.out_degree(n) == b.out_degree(n))
+        assert(sorted(a.successors(n)) == sorted(b.successors(n)))
+        assert(sorted(a.predecessors(n)) == sorted(b.predecessors(n)))
+    for u, v in a.edges_iter():
+        assert(b.has_edge(u, v))
+        assert(dict(a.edge[u][v].items()) == dict(b.edge[u][v].items()))
+
+def test_randomOperations():
+    np.random.seed(0)
+    reference = nx.DiGraph()
+    graph = CompactDiGraph()
+    for step in range(5000):
+        u = (np.random.randint(10), np.random.randint(30))
+        v = (u[0] + 1, np.random.randint(30))
+        operation = np.random.rand()
+        if operation < 0.6:
+            attributes = {'features': [[np.random.rand()], [np.random.rand()]], 'src': step}
+            reference.add_edge(u, v, **attributes)
+            graph.add_edge(u, v, **attributes)
+        elif operation < 0.65:
+            # bulk insertion with arcs that may already exist or occur several times
+            ebunch = [(u, v, {'src': step})] + [((u[0], np.random.randint(30)), v, {'dest': i}) for i in range(3)]
+            reference.add_edges_from(ebunch, value=1)
+            graph.add_edges_from(ebunch, value=1)
+        elif operation < 0.7:
+            reference.add_node(u, traxel=step, features=[[1.0], [2.0]])
+            graph.add_node(u, traxel=step, features=[[1.0], [2.0]])
+        elif operation < 0.8 and reference.has_edge(u, v):
+            reference.remove_edge(u, v)
+            graph.remove_edge(u, v)
+        elif operation < 0.85 and reference.has_node(u):
+            reference.remove_node(u)
+            graph.remove_node(u)
+        assert(graph.has_edge(u, v) == reference.has_edge(u, v))
+        if step % 1000 == 0:
+            assertSameGraph(graph, reference)
+    assertSameGraph(graph, reference)
+    assertSameGraph(graph.copy(), reference)
+
+def test_attributes():
+    g = CompactDiGraph()
+    g.add_path([(0, 1), (1, 1), (2, 1)])
+    g.node[(0, 1)]['features'] = [[0.5], [1.5]]
+    g.node[(1, 1)]['features'] = [[1, 2]]
+    g.node[(1, 1)]['tracklet'] = []
+    g.node[(1, 1)]['tracklet'].append(3)
+    g.edge[(0, 1)][(1, 1)]['features'] = np.array([[0.25], [0.75]])
+
+    assert(g.node[(0, 1)]['features'] == [[0.5], [1.5]])
+    assert(g.node[(1, 1)]['features'] == [[1, 2]])
+    assert(g.node[(1, 1)]['tracklet'] == [3])
+    assert('features' not in g.node[(2, 1)])
+    assert(g.edge[(0, 1)][(1, 1)]['features'] == [[0.25], [0.75]])
+    assert((2, 1) not in g.edge[(0, 1)])
+    del g.node[(0, 1)]['features']
+    assert('features' not in g.node[(0, 1)])
+
+    h = copy.deepcopy(g)
+    h.node[(1, 1)]['tracklet'].append(4)
+    assert(g.node[(1, 1)]['tracklet'] == [3])
+    assert('features' not in h.node[(2, 1)])
+
+    g.setNodeAttributes([(0, 1), (2, 1)], 'features', np.ones((2, 2, 1)))
+    assert(g.node[(2, 1)]['features'] == [[1.0], [1.0]])
+    g.setEdgeAttributes([((1, 1), (2, 1))], 'value', [1])
+    assert(g.edge[(1, 1)][(2, 1)]['value'] == 1)
+    assert(g.getNodeAttributes([(2, 1), (1, 1)], 'features') == [[[1.0], [1.0]], [[1, 2]]])
+    assert(g.getEdgeAttributes([((1, 1), (2, 1)), ((0, 1), (1, 1))], 'value', -1) == [1, -1])
@@ -12,7 +12,8 @@ except ImportError:
         import multiHypoTracking_with_gurobi as mht
     except ImportError:
         mht = None
-        import dpct
+        from hytra.core.mincostflow import importFlowSolver
+        dpct = importFlowSolver()
 
 
 def constructFov(shape, t0, t1, scale=[1, 1, 1]):
@@ -0,0 +1,62 @@
+import numpy as np
+from hytra.core.divisionfeatures import FeatureManager
+
+featureNames = ['ParentChildrenRatio_Count', 'ParentChildrenRatio_Mean', 'ChildrenRatio_Count', 'ChildrenRatio_Mean',
+                'ParentChildrenAngle_RegionCenter', 'ChildrenRatio_SquaredDistances']
+
+def computeExampleFeatures(labelImage):
+    numObjects = labelImage.max() + 1
+    features = {
+        'Count': np.zeros(numObjects, dtype=np.float32),
+        'Mean': np.zeros((numObjects, 1), dtype=np.float32),
+        'RegionCenter': np.zeros((numObjects, 2), dtype=np.float32)
+    }
+    for l in range(1, numObjects):
+        coordinates = np.array(np.where(labelImage == l), dtype=np.float32).T
+        features['Count'][l] = len(coordinates)
+        features['Mean'][l] = l % 3 + 0.5
+        features['RegionCenter'][l] = coordinates.mean(axis=0)
+    return features
+
+def constructExampleLabelImage(shape, numObjects, seed):
+    np.random.seed(seed)
+    labelImage = np.zeros(shape, dtype=np.uint32)
+    for l in range(1, numObjects + 1):
+        x, y = np.random.randint(0, shape[0] - 4), np.random.randint(0, shape[1] - 4)
+        w, h = np.random.randint(1, 5, size=2)
+        labelImage[x:x+w, y:y+h] = l
+    # make sure every label still exists after overlapping rectangles overwrote each other
+    _, labelImage = np.unique(labelImage, return_inverse=True)
+    return labelImage.reshape(shape).astype(np.uint32)
+
+def test_vectorizedDivisionFeatures():
+    for seed, templateSize in [(0, 50), (1, 10), (2, 20)]:
+        labelImageT = constructExampleLabelImage((80, 60), 40, seed)
+        labelImageTPlus1 = constructExampleLabelImage((80, 60), 45, seed + 10)
+        featuresT = computeExampleFeatures(labelImageT)
+        featuresTPlus1 = computeExampleFeatures(labelImageTPlus1)
+
+        reference = FeatureManager(ndim=2, template_size=templateSize, vectorized=False)
+        referenceFeatures = reference.computeFeatures_at(featuresT, featuresTPlus1, labelImageTPlus1, featureNames)
+        fm = FeatureManager(ndim=2, template_size=templateSize)
+        divisionFeatures = fm.computeFeatures_at(featuresT, featuresTPlus1, labelImageTPlus1, featureNames)
+
+        assert(sorted(divisionFeatures.keys()) == sorted(referenceFeatures.keys()))
+        for k in referenceFeatures.keys():
+            assert(divisionFeatures[k].shape == referenceFeatures[k].shape)
+            assert(np.array_equal(divisionFeatures[k], referenceFeatures[k]))
+
+def test_divisionFeaturesWithTies():
+    # objects on a regular grid have many neighbors at exactly the same distance
+    labelImage = np.zeros((40, 40), dtype=np.uint32)
+    for i, (x, y) in enumerate([(x, y) for x in range(2, 40, 6) for y in range(2, 40, 6)]):
+        labelImage[x:x+2, y:y+2] = i + 1
+    features = computeExampleFeatures(labelImage)
+
+    reference = FeatureManager(ndim=2, vectorized=False)
+    referenceFeatures = reference.computeFeatures_at(features, features, labelImage, featureNames)
+    divisionFeatures = FeatureManager(ndim=2).computeFeatures_at(features, features, labelImage, featureNames)
+    for k in referenceFeatures.keys():
+        assert(np.array_equal(divisionFeatures[k], referenceFeatures[k]))
+    assert(divisionFeatures['SquaredDistances_0'][1] == 0.0)
+    assert(divisionFeatures['SquaredDistances_1'][1] == 6.0)
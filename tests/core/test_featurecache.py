@@ -0,0 +1,46 @@
+import os
+import shutil
+import tempfile
+import numpy as np
+from hytra.pluginsystem.plugin_manager import TrackingPluginManager
+
+def test_hdf5FeatureCache():
+    tmpDir = tempfile.mkdtemp()
+    try:
+        pluginManager = TrackingPluginManager(pluginPaths=['hytra/plugins'], verbose=False)
+        featureCache = pluginManager.getFeatureCache()
+        featureCache.cache_filename = os.path.join(tmpDir, 'features.h5')
+        featureCache.cache_key = 'key-a'
+
+        features = {
+            'RegionCenter': np.array([[0.0, 0.0], [1.5, 2.5]], dtype=np.float32),
+            'Count': np.array([0, 12], dtype=np.uint32),
+            'Some/Feature': np.ones((2, 3)),
+            'Polygon': [None, [(1, 2), (3, 4)]]
+        }
+        assert(not featureCache.hasFeaturesForFrame(3))
+        featureCache.storeFeaturesForFrame(features, 3)
+        assert(featureCache.hasFeaturesForFrame(3))
+        assert(not featureCache.hasFeaturesForFrame(4))
+
+        loaded = featureCache.loadFeaturesForFrame(None, 3)
+        assert(set(loaded.keys()) == set(features.keys()))
+        for k in ['RegionCenter', 'Count', 'Some/Feature']:
+            assert(loaded[k].dtype == features[k].dtype)
+            assert(np.array_equal(loaded[k], features[k]))
+        assert(loaded['Polygon'] == features['Polygon'])
+
+        # entries with a different key are stale
+        featureCache.cache_key = 'key-b'
+        assert(not featureCache.hasFeaturesForFrame(3))
+        try:
+            featureCache.loadFeaturesForFrame(None, 3)
+            assert(False)
+        except KeyError:
+            pass
+
+        # overwriting replaces the entry
+        featureCache.storeFeaturesForFrame({'Count': np.array([5])}, 3)
+        assert(featureCache.loadFeaturesForFrame(None, 3).keys() == ['Count'])
+    finally:
+        shutil.rmtree(tmpDir)
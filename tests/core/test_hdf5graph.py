@@ -0,0 +1,61 @@
+import os
+import tempfile
+import hytra.core.jsongraph as jg
+from hytra.core.hdf5graph import isHDF5Filename, readFromHDF5, writeToHDF5
+
+def return_example_model():
+    return {
+        'segmentationHypotheses': [
+            {'id': 0, 'features': [[1.5], [0.25]], 'appearanceFeatures': [[0.0], [1.0]], 'timestep': [0, 1]},
+            {'id': 1, 'features': [[0.5], [1.25]], 'divisionFeatures': [[0.1], [2.3]], 'timestep': [1, 1]},
+            {'id': 2, 'features': [[0.5], [1.25], [3.0]], 'timestep': [2, 2]}
+        ],
+        'linkingHypotheses': [
+            {'src': 0, 'dest': 1, 'features': [[0.2], [1.2]]},
+            {'src': 1, 'dest': 2, 'features': [[0.3], [1.1]]}
+        ],
+        'divisionHypotheses': [],
+        'exclusions': [[0, 1], [0, 1, 2]],
+        'traxelToUniqueId': {'0': {'1': 0}, '1': {'1': 0, '3': 1}, '2': {'4': 2}},
+        'settings': {'statesShareWeights': True, 'optimizerEpGap': 0.01}
+    }
+
+def return_example_result():
+    return {
+        'detectionResults': [{'id': 0, 'value': 1}, {'id': 1, 'value': 2}, {'id': 2, 'value': 0}],
+        'linkingResults': [{'src': 0, 'dest': 1, 'value': 1}, {'src': 1, 'dest': 2, 'value': 0}],
+        'divisionResults': [{'id': 1, 'value': True}]
+    }
+
+def test_roundtrip():
+    assert(isHDF5Filename('model.h5'))
+    assert(isHDF5Filename('model.HDF5'))
+    assert(not isHDF5Filename('model.json'))
+
+    filename = tempfile.mktemp(suffix='.h5')
+    try:
+        for dictionary in [return_example_model(), return_example_result(), {'weights': [1.0, 2.0, 3.5]}]:
+            writeToHDF5(filename, dictionary)
+            assert(readFromHDF5(filename) == dictionary)
+        assert(readFromHDF5(filename)['weights'] == [1.0, 2.0, 3.5])
+
+        writeToHDF5(filename, return_example_result())
+        assert(readFromHDF5(filename)['divisionResults'][0]['value'] is True)
+    finally:
+        os.remove(filename)
+
+def test_trackingGraphFromHDF5():
+    filename = tempfile.mktemp(suffix='.h5')
+    resultFilename = tempfile.mktemp(suffix='.json')
+    try:
+        trackingGraph = jg.JsonTrackingGraph(model=return_example_model(), result=return_example_result())
+        trackingGraph.writeModel(filename)
+        trackingGraph.writeResult(resultFilename)
+
+        loaded = jg.JsonTrackingGraph(model_filename=filename, result_filename=resultFilename)
+        assert(loaded.model == return_example_model())
+        assert(loaded.result == return_example_result())
+        assert(loaded.uuidToTraxelMap == {0: [(0, 1), (1, 1)], 1: [(1, 3)], 2: [(2, 4)]})
+    finally:
+        os.remove(filename)
+        os.remove(resultFilename)
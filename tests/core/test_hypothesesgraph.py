@@ -1,4 +1,8 @@
+import os
+import json
+import tempfile
 import hytra.core.hypothesesgraph as hg
+from hytra.core.jsongraph import readFromJSON
 import hytra.core.probabilitygenerator as pg
 import networkx as nx
 import numpy as np
@@ -18,6 +22,37 @@ def test_trackletgraph():
     assert(t.countNodes() == 1)
     assert('tracklet' in t._graph.node[(0,1)])
 
+def test_trackletgraphWithDivision():
+    h = hg.HypothesesGraph()
+    h._graph.add_path([(0, 1), (1, 1), (2, 1), (3, 1), (4, 1)])
+    h._graph.add_path([(2, 1), (3, 2)])
+    h._graph.add_path([(0, 2), (1, 2), (2, 2)])
+    h._graph.add_edge((1, 2), (2, 3))
+    for uuid, n in enumerate(h._graph.nodes()):
+        t = Traxel()
+        t.Timestep = n[0]
+        t.Id = n[1]
+        h._graph.node[n]['traxel'] = t
+        h._graph.node[n]['id'] = uuid
+    h._graph.edge[(2, 1)][(3, 2)]['value'] = 1
+
+    t = h.generateTrackletGraph()
+    assert(t.withTracklets)
+    assert(t.referenceTraxelGraph is h)
+    assert(sorted(t._graph.nodes()) == [(0, 1), (0, 2), (2, 2), (2, 3), (3, 1), (3, 2)])
+    assert(sorted(t._graph.edges()) == [((0, 1), (3, 1)), ((0, 1), (3, 2)), ((0, 2), (2, 2)), ((0, 2), (2, 3))])
+    assert(t._graph.edge[(0, 1)][(3, 2)]['value'] == 1)
+    assert(t._graph.node[(0, 1)]['id'] == h._graph.node[(0, 1)]['id'])
+    assert('traxel' not in t._graph.node[(0, 1)])
+
+    tracklet = t._graph.node[(0, 1)]['tracklet']
+    assert(len(tracklet) == 3)
+    assert([(x.Timestep, x.Id) for x in tracklet] == [(0, 1), (1, 1), (2, 1)])
+    assert(tracklet[-1] is h._graph.node[(2, 1)]['traxel'])
+    assert(tracklet == [h._graph.node[n]['traxel'] for n in [(0, 1), (1, 1), (2, 1)]])
+    assert([(x.Timestep, x.Id) for x in t._graph.node[(3, 1)]['tracklet']] == [(3, 1), (4, 1)])
+    assert(len(t._graph.node[(2, 3)]['tracklet']) == 1)
+
 def test_computeLineagesAndPrune():
     h = hg.HypothesesGraph()
     h._graph.add_path([(0, 0),(1, 1),(2, 2)])
@@ -320,9 +355,132 @@ def test_insertEnergies():
         assert('features' in h._graph.edge[a[0]][a[1]])
         assert(h._graph.edge[a[0]][a[1]]['features'] == [[0.45867514538708193], [1.0]])
 
+    # the streamed model file must contain the same model as toTrackingGraph
+    model = h.toTrackingGraph().model
+    assert(model['traxelToUniqueId'] == {'0': {'1': 0}, '1': {'1': 1}, '2': {'1': 2}, '3': {'1': 3}})
+    filename = tempfile.mktemp(suffix='.json')
+    try:
+        for compact in [False, True]:
+            h.writeTrackingGraph(filename, compact=compact)
+            assert(readFromJSON(filename) == json.loads(json.dumps(model)))
+    finally:
+        os.remove(filename)
+
+def test_insertEnergiesBatched():
+    def buildGraph():
+        h = hg.HypothesesGraph()
+        h._graph.add_path([(0,1),(1,1),(2,1),(3,1)])
+        h._graph.add_path([(2,1),(3,2)])
+        for uuid, i in enumerate([(0,1),(1,1),(2,1),(3,1),(3,2)]):
+            t = Traxel()
+            t.Timestep = i[0]
+            t.Id = i[1]
+            t.Features['detProb'] = [0.3, 0.7]
+            if i[0] == 2:
+                t.Features['divProb'] = [0.1, 0.9]
+            t.Features['com'] = [float(i[0]) * 0.3, float(i[1])]
+            h._graph.node[i]['traxel'] = t
+            h._graph.node[i]['id'] = uuid
+        return h
+
+    def detProbFunc(traxel):
+        return traxel.Features['detProb']
+
+    def divProbFunc(traxel):
+        return traxel.Features.get('divProb', None)
+
+    def boundaryCostFunc(traxel):
+        return traxel.Timestep / 4.0
+
+    def transProbFunc(traxelA, traxelB):
+        dist = np.linalg.norm(np.array(traxelA.Features['com']) - np.array(traxelB.Features['com']))
+        return [1.0 - np.exp(-dist), np.exp(-dist)]
+
+    def divProbBatchFunc(traxels):
+        return np.array([divProbFunc(t) if 'divProb' in t.Features else [np.nan, np.nan] for t in traxels])
+
+    for withTracklets in [False, True]:
+        graphs = [buildGraph(), buildGraph()]
+        if withTracklets:
+            graphs = [g.generateTrackletGraph() for g in graphs]
+        graphs[0].insertEnergies(1, detProbFunc, transProbFunc, boundaryCostFunc, divProbFunc)
+        graphs[1].insertEnergies(1,
+                                 lambda ts: np.array([detProbFunc(t) for t in ts]),
+                                 lambda As, Bs: np.array([transProbFunc(a, b) for a, b in zip(As, Bs)]),
+                                 lambda ts: np.array([boundaryCostFunc(t) for t in ts]),
+                                 divProbBatchFunc,
+                                 batched=True)
+
+        assert(graphs[0].countNodes() == graphs[1].countNodes())
+        for n in graphs[0].nodeIterator():
+            for key in ['features', 'appearanceFeatures', 'disappearanceFeatures', 'timestep']:
+                assert(graphs[0]._graph.node[n][key] == graphs[1]._graph.node[n][key])
+            assert(('divisionFeatures' in graphs[0]._graph.node[n]) == ('divisionFeatures' in graphs[1]._graph.node[n]))
+            if 'divisionFeatures' in graphs[0]._graph.node[n]:
+                assert(graphs[0]._graph.node[n]['divisionFeatures'] == graphs[1]._graph.node[n]['divisionFeatures'])
+        for a in graphs[0].arcIterator():
+            for key in ['src', 'dest', 'features']:
+                assert(graphs[0]._graph.edge[a[0]][a[1]][key] == graphs[1]._graph.edge[a[0]][a[1]][key])
+
+def test_buildFromProbabilityGenerator():
+    class DummyProbabilityGenerator(object):
+        pass
+
+    def makeTraxel(frame, objectId, x, divProb):
+        t = Traxel()
+        t.Timestep = frame
+        t.Id = objectId
+        t.Features['com'] = np.array([x, 0.0])
+        t.Features['divProb'] = np.array([divProb, 1.0 - divProb])
+        return t
+
+    probabilityGenerator = DummyProbabilityGenerator()
+    probabilityGenerator.TraxelsPerFrame = {
+        0: {1: makeTraxel(0, 1, 0.0, 0.9), 2: makeTraxel(0, 2, 50.0, 0.0)},
+        1: {1: makeTraxel(1, 1, 1.0, 0.0), 2: makeTraxel(1, 2, 3.0, 0.0), 3: makeTraxel(1, 3, 40.0, 0.0), 4: makeTraxel(1, 4, 500.0, 0.0)}
+    }
+
+    h = hg.HypothesesGraph()
+    h.buildFromProbabilityGenerator(probabilityGenerator, maxNeighborDist=100, numNearestNeighbors=1, divisionThreshold=0.5)
+    assert(h.countNodes() == 6)
+    # the dividing object gets two successors, the others only their nearest neighbor,
+    # and the backward links connect every object of frame 1 that is close enough to its nearest predecessor
+    assert(sorted(h.arcIterator()) == [((0, 1), (1, 1)), ((0, 1), (1, 2)), ((0, 2), (1, 3))])
+    for src, dest in h.arcIterator():
+        assert(h._graph.edge[src][dest]['src'] == h._graph.node[src]['id'])
+        assert(h._graph.edge[src][dest]['dest'] == h._graph.node[dest]['id'])
+
+    h = hg.HypothesesGraph()
+    h.buildFromProbabilityGenerator(probabilityGenerator, maxNeighborDist=1000, numNearestNeighbors=1, withDivisions=False)
+    assert(sorted(h.arcIterator()) == [((0, 1), (1, 1)), ((0, 1), (1, 2)), ((0, 2), (1, 3)), ((0, 2), (1, 4))])
+
+def runWithCompactGraph(test):
+    hg.useCompactGraph = True
+    try:
+        test()
+    finally:
+        hg.useCompactGraph = False
+
+def test_compactGraphBackend():
+    # run all tests above again, with the array based graph backend instead of networkx
+    for test in [test_trackletgraph,
+                 test_trackletgraphWithDivision,
+                 test_computeLineagesAndPrune,
+                 test_computeLineagesWithMergers,
+                 test_insertAndExtractSolution,
+                 test_insertEnergies,
+                 test_insertEnergiesBatched,
+                 test_buildFromProbabilityGenerator]:
+        yield runWithCompactGraph, test
+
 if __name__ == "__main__":
     test_trackletgraph()
+    test_trackletgraphWithDivision()
     test_insertAndExtractSolution()
     test_computeLineagesAndPrune()
     test_computeLineagesWithMergers()
-    test_insertEnergies()
\ No newline at end of file
+    test_insertEnergies()
+    test_insertEnergiesBatched()
+    test_buildFromProbabilityGenerator()
+    for f, test in test_compactGraphBackend():
+        f(test)
@@ -0,0 +1,149 @@
+import copy
+import hytra.core.hypothesesgraph as hg
+from hytra.core.probabilitygenerator import Traxel
+from hytra.core.mincostflow import trackFlowBased, FlowGraph
+from hytra.core.incrementaltracking import findRegion, spliceResult
+
+weights = {'weights': [1.0, 1.0, 1.0, 1.0]}
+
+def return_example_graph(numTimesteps=8, detectionFeatures=[[0.0], [-5.0]]):
+    # two lanes of objects, where every object of the first lane could also move to the second one
+    numStates = len(detectionFeatures)
+    h = hg.HypothesesGraph(compactGraph=False)
+    for t in range(numTimesteps):
+        for i in [1, 2]:
+            traxel = Traxel()
+            traxel.Timestep = t
+            traxel.Id = i
+            h.addNodeFromTraxel(traxel)
+            node = h._graph.node[(t, i)]
+            node['features'] = detectionFeatures
+            node['appearanceFeatures'] = [[0.0 if t == 0 else 3.0 * k] for k in range(numStates)]
+            node['disappearanceFeatures'] = [[0.0 if t == numTimesteps - 1 else 3.0 * k] for k in range(numStates)]
+    for t in range(numTimesteps - 1):
+        h._graph.add_edge((t, 1), (t + 1, 1), features=[[-1.0 * k] for k in range(numStates)])
+        h._graph.add_edge((t, 2), (t + 1, 2), features=[[-1.0 * k] for k in range(numStates)])
+        h._graph.add_edge((t, 1), (t + 1, 2), features=[[1.0 * k] for k in range(numStates)])
+    for u, v in h.arcIterator():
+        h._graph.edge[u][v]['src'] = h._graph.node[u]['id']
+        h._graph.edge[u][v]['dest'] = h._graph.node[v]['id']
+    return h
+
+def activeArcs(h):
+    return set(a for a in h.arcIterator() if h._graph.edge[a[0]][a[1]]['value'] > 0)
+
+def test_findRegion():
+    neighbors = {0: [1], 1: [0, 2], 2: [1, 3], 3: [2, 4], 4: [3]}
+    assert(findRegion([2], lambda n: neighbors[n], 0) == set([2]))
+    assert(findRegion([2], lambda n: neighbors[n], 1) == set([1, 2, 3]))
+    assert(findRegion([0, 4], lambda n: neighbors[n], 1) == set([0, 1, 3, 4]))
+
+def test_retrackHypothesesGraph():
+    h = return_example_graph()
+    h.insertSolution(trackFlowBased(h.toTrackingGraph().model, weights))
+    h.computeLineage()
+    assert(len(activeArcs(h)) == 14)
+    firstLineage = h.getLineageId(0, 1)
+    secondLineage = h.getLineageId(0, 2)
+
+    # the curator forbids a link of the first lane
+    h._graph.edge[(4, 1)][(5, 1)]['features'] = [[0.0], [50.0]]
+    affected = h.retrack(weights, [], [((4, 1), (5, 1))], numFrames=1)
+    assert(set(affected) == set([(3, 1), (4, 1), (5, 1), (5, 2), (6, 1), (6, 2)]))
+
+    reference = copy.deepcopy(h)
+    reference.insertSolution(trackFlowBased(reference.toTrackingGraph().model, weights))
+    assert(activeArcs(h) == activeArcs(reference))
+    assert((4, 1) not in [a[0] for a in activeArcs(h)])
+
+    # the first lineage is split in two new ones, the second one is untouched
+    assert(h.getLineageId(0, 2) == secondLineage and h.getLineageId(7, 2) == secondLineage)
+    assert(h.getLineageId(0, 1) == h.getLineageId(4, 1))
+    assert(h.getLineageId(5, 1) == h.getLineageId(7, 1))
+    assert(h.getLineageId(0, 1) != h.getLineageId(5, 1))
+    assert(min(h.getLineageId(0, 1), h.getLineageId(5, 1)) > max(firstLineage, secondLineage))
+    assert(h.getTrackId(0, 1) != h.getTrackId(5, 1))
+
+def test_retrackJsonTrackingGraph():
+    h = return_example_graph()
+    trackingGraph = h.toTrackingGraph()
+    trackingGraph.weights = weights
+    trackingGraph.result = trackFlowBased(trackingGraph.model, weights)
+
+    # the curator wants the object of the first lane to move to the second lane, and removes the object there
+    src = h._graph.node[(3, 1)]['id']
+    dest = h._graph.node[(4, 2)]['id']
+    removed = h._graph.node[(3, 2)]['id']
+    for link in trackingGraph.model['linkingHypotheses']:
+        if (link['src'], link['dest']) == (src, dest):
+            link['features'] = [[0.0], [-20.0]]
+    for detection in trackingGraph.model['segmentationHypotheses']:
+        if detection['id'] == removed:
+            detection['features'] = [[0.0], [20.0]]
+    previous = trackingGraph.result
+    region = trackingGraph.retrack([removed], [(src, dest)], numFrames=2)
+    assert(len(region) < len(trackingGraph.model['segmentationHypotheses']))
+
+    reference = trackFlowBased(trackingGraph.model, weights)
+    assert(sorted(trackingGraph.result['detectionResults']) == sorted(reference['detectionResults']))
+    assert(sorted(trackingGraph.result['linkingResults']) == sorted(reference['linkingResults']))
+    assert(len(trackingGraph.result['linkingResults']) == len(previous['linkingResults']))
+    values = dict(((l['src'], l['dest']), l['value']) for l in trackingGraph.result['linkingResults'])
+    assert(values[(src, dest)] == 1)
+
+def test_spliceResult():
+    result = {'detectionResults': [{'id': 0, 'value': 1}, {'id': 1, 'value': 1}],
+              'linkingResults': [{'src': 0, 'dest': 1, 'value': 1}],
+              'divisionResults': None}
+    regionResult = {'detectionResults': [{'id': 1, 'value': 0}, {'id': 2, 'value': 1}],
+                    'linkingResults': [{'src': 0, 'dest': 1, 'value': 0}],
+                    'divisionResults': None}
+    spliced = spliceResult(result, regionResult)
+    assert(spliced['detectionResults'] == [{'id': 0, 'value': 1}, {'id': 1, 'value': 0}, {'id': 2, 'value': 1}])
+    assert(spliced['linkingResults'] == [{'src': 0, 'dest': 1, 'value': 0}])
+    assert(spliced['divisionResults'] is None)
+    assert(result['detectionResults'][1]['value'] == 1)
+
+def test_retrackWithExclusions():
+    h = return_example_graph()
+    h._graph.node[(5, 1)]['traxel'].conflictingTraxelIds = [2]
+    h._graph.node[(5, 2)]['traxel'].conflictingTraxelIds = [1]
+    h.insertSolution(trackFlowBased(h.toTrackingGraph().model, weights))
+    assert(h._graph.node[(5, 1)]['value'] + h._graph.node[(5, 2)]['value'] == 1)
+    previous = [(5, 1), (5, 2)][h._graph.node[(5, 1)]['value'] == 0]
+    other = [(5, 1), (5, 2)][h._graph.node[(5, 1)]['value'] > 0]
+
+    # the other detection is still excluded by the active one outside of the region
+    h._graph.node[other]['features'] = [[0.0], [-30.0]]
+    h.retrack(weights, [other], numFrames=0)
+    assert(h._graph.node[other]['value'] == 0)
+
+    # conflicting detections are part of the neighborhood, such that the exclusion can be resolved the other way
+    h.retrack(weights, [other], numFrames=1)
+    assert(h._graph.node[other]['value'] == 1 and h._graph.node[previous]['value'] == 0)
+
+def test_retrackNonConvexEnergies():
+    # with three states, the detection energies are not convex, which the flow solver cannot handle directly
+    def convexifiedModel(h):
+        trackingGraph = h.toTrackingGraph()
+        trackingGraph.convexifyCosts()
+        return trackingGraph.model
+
+    def energyOf(h, result):
+        graph = FlowGraph(convexifiedModel(h), weights)
+        graph.setFlow(result)
+        return graph.getEnergy()
+
+    for numFrames in [1, 20]:
+        h = return_example_graph(detectionFeatures=[[0.0], [1.0], [-10.0]])
+        h.insertSolution(trackFlowBased(convexifiedModel(h), weights))
+
+        h._graph.edge[(4, 1)][(5, 1)]['features'] = [[0.0], [50.0], [100.0]]
+        previousEnergy = energyOf(h, h.getSolutionDictionary())
+        h.retrack(weights, [], [((4, 1), (5, 1))], numFrames=numFrames)
+        energy = energyOf(h, h.getSolutionDictionary())
+        optimalEnergy = energyOf(h, trackFlowBased(convexifiedModel(h), weights))
+        assert(energy <= previousEnergy + 1e-6)
+        if numFrames == 20:
+            # the region contains the whole graph
+            assert(abs(energy - optimalEnergy) < 1e-6)
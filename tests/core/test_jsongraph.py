@@ -1,3 +1,7 @@
+import os
+import json
+import tempfile
+import numpy as np
 import hytra.core.jsongraph as jg
 
 def return_example_model():
@@ -440,6 +444,85 @@ def test_loading_no_divisions():
     mergerLinks = jg.getMergerLinks(linksPerTimestep, mergersPerTimestep, timesteps)
     assert(mergerLinks == [('1', (1, 1)), ('1', (2, 1)), ('3', (1, 2)), ('3', (1, 1)), ('2', (1, 1))])
 
+def test_loading_tracklets_and_divisions():
+    # uuid 0 is a tracklet of two traxels that divides, uuid 1 is a merger
+    model = {'traxelToUniqueId': {'0': {'1': 0}, '1': {'1': 0, '2': 1}, '2': {'1': 2, '2': 3, '3': 4}}}
+    result = {
+        'detectionResults': [{'id': 0, 'value': 1}, {'id': 1, 'value': 2}, {'id': 2, 'value': 1},
+                             {'id': 3, 'value': 1}, {'id': 4, 'value': 1}],
+        'linkingResults': [{'src': 0, 'dest': 2, 'value': 1}, {'src': 0, 'dest': 3, 'value': 1},
+                           {'src': 1, 'dest': 4, 'value': 2}],
+        'divisionResults': [{'id': 0, 'value': True}, {'id': 1, 'value': False}]
+    }
+
+    mergers, detections, links, divisions = jg.getMergersDetectionsLinksDivisions(result, jg.getTraxelIndex(model))
+    assert(mergers == [(1, 2, 2)])
+    assert(detections == [(0, 1), (1, 1), (1, 2), (2, 1), (2, 2), (2, 3)])
+    assert(links == [((1, 1), (2, 1)), ((1, 1), (2, 2)), ((1, 2), (2, 3)), ((0, 1), (1, 1))])
+    assert(divisions == [(1, 1)])
+    assert(links.events['timestep'].tolist() == [2, 2, 2, 1])
+
+    timesteps = ['0', '1', '2']
+    mergersPerTimestep = jg.getMergersPerTimestep(mergers, timesteps)
+    assert(mergersPerTimestep == {'0': {}, '1': {2: 2}, '2': {}})
+    linksPerTimestep = jg.getLinksPerTimestep(links, timesteps)
+    assert(linksPerTimestep == {'0': [], '1': [(1, 1)], '2': [(1, 1), (1, 2), (2, 3)]})
+    assert(jg.getDivisionsPerTimestep(divisions, linksPerTimestep, timesteps) == {'0': {}, '1': {}, '2': {1: [1, 2]}})
+    assert(jg.getMergerLinks(linksPerTimestep, mergersPerTimestep, timesteps) == [('2', (2, 3))])
+
+    # plain lists and dictionaries are still accepted
+    assert(jg.getDivisionsPerTimestep(list(divisions), dict(linksPerTimestep), timesteps) == {'0': {}, '1': {}, '2': {1: [1, 2]}})
+    assert(jg.getMergerLinks(dict(linksPerTimestep), dict(mergersPerTimestep), timesteps) == [('2', (2, 3))])
+
+def test_streamingJSON():
+    model = return_example_model()
+    filename = tempfile.mktemp(suffix='.json')
+    try:
+        # formatting is the same as dumping the whole dictionary
+        jg.writeToFormattedJSON(filename, model)
+        with open(filename, 'r') as f:
+            assert(f.read() == json.dumps(model, indent=4, separators=(',', ': ')))
+
+        # lists and dicts can be generated while writing
+        streamedModel = dict(model)
+        streamedModel['segmentationHypotheses'] = (s for s in model['segmentationHypotheses'])
+        streamedModel['traxelToUniqueId'] = jg.StreamedDict(model['traxelToUniqueId'].iteritems())
+        jg.writeToJSON(filename, streamedModel, compact=True)
+        with open(filename, 'r') as f:
+            text = f.read()
+            assert(' ' not in text and '\n' not in text)
+            assert(json.loads(text) == model)
+
+        # a tiny buffer makes sure that values crossing chunk boundaries are parsed correctly
+        reader = jg.readFromJSON(filename, streaming=True)
+        reader.chunkSize = 3
+        assert(sorted(reader.keys()) == sorted(model.keys()))
+        assert('exclusions' in reader)
+        assert('foo' not in reader)
+        assert(list(reader['linkingHypotheses']) == model['linkingHypotheses'])
+        assert(list(reader['exclusions']) == [])
+        assert(reader['traxelToUniqueId'] == model['traxelToUniqueId'])
+        assert(reader.get('foo', 1) == 1)
+    finally:
+        os.remove(filename)
+
+def test_convexify():
+    assert(jg.convexify([[1.0], [0.0], [0.0], [1.0]], 0.5) == [[1.0], [0.0], [0.5], [1.5]])
+
+    convex = [[2.0], [0.0], [1.0], [3.0]]
+    hypotheses = [{'features': [[1.0], [0.0], [0.0], [1.0]]}, {'features': convex}, {'features': [[0.0], [0.0]]}, {'src': 0}]
+    jg.convexifyHypotheses(hypotheses, 0.5)
+    assert(hypotheses[0]['features'] == [[1.0], [0.0], [0.5], [1.5]])
+    assert(hypotheses[1]['features'] is convex)
+    assert(hypotheses[2]['features'] == [[0.0], [0.5]])
+    assert(jg.areConvex(np.array([[1.0, 0.0, 0.5, 1.5], [1.0, 0.0, 1.0, 1.0]])).tolist() == [True, False])
+
+    try:
+        jg.convexifyHypotheses([{'features': [[0.0, 1.0], [1.0, 0.0]]}], 0.5)
+        assert(False)
+    except ValueError:
+        pass
+
 def test_toHypoGraph():
     model = return_example_model()
     result = return_example_result()
@@ -0,0 +1,37 @@
+import numpy as np
+from hytra.jst.conflictingsegmentsprobabilitygenerator import computeLabelOverlaps, computeLabelSizes
+
+def test_labelOverlaps():
+    np.random.seed(42)
+    labelImageA = np.random.randint(0, 5, size=(20, 30)).astype(np.uint32)
+    labelImageB = np.random.randint(0, 7, size=(20, 30)).astype(np.uint32)
+    labelImageB[labelImageB == 3] = 4000000000
+
+    labelsA, labelsB, counts = computeLabelOverlaps(labelImageA, labelImageB)
+    overlaps = dict(((a, b), c) for a, b, c in zip(labelsA, labelsB, counts))
+
+    reference = {}
+    for a in np.unique(labelImageA):
+        if a == 0:
+            continue
+        for b in set(np.unique(labelImageB[labelImageA == a])) - set([0]):
+            reference[(a, b)] = np.sum(np.logical_and(labelImageA == a, labelImageB == b))
+    assert(overlaps == reference)
+    assert(list(labelsA) == sorted(labelsA))
+
+    labels, sizes = computeLabelSizes(labelImageB)
+    assert(0 not in labels)
+    for l, s in zip(labels, sizes):
+        assert(s == np.sum(labelImageB == l))
+
+def test_labelOverlapsLargeLabels():
+    labelImageA = np.array([[0, 2**40, 2**40], [1, 1, 0]], dtype=np.uint64)
+    labelImageB = np.array([[5, 2**40, 0], [2**41, 2**41, 2**41]], dtype=np.uint64)
+    labelsA, labelsB, counts = computeLabelOverlaps(labelImageA, labelImageB)
+    assert(list(labelsA) == [1, 2**40])
+    assert(list(labelsB) == [2**41, 2**40])
+    assert(list(counts) == [2, 1])
+
+def test_noOverlaps():
+    labelsA, labelsB, counts = computeLabelOverlaps(np.zeros((3, 3)), np.ones((3, 3)))
+    assert(len(labelsA) == len(labelsB) == len(counts) == 0)
@@ -0,0 +1,89 @@
+import os
+import numpy as np
+import hytra.core.jsongraph as jg
+import hytra.core.hypothesesgraph as hg
+from hytra.core.probabilitygenerator import Traxel
+from hytra.core.mergerresolver import MergerResolver
+from hytra.core.ilastikmergerresolver import IlastikMergerResolver
+
+class FakeMergerResolverPlugin(object):
+    ''' stores how many pixels and initializations were used for every fit instead of fitting anything '''
+    def resolveMergerForCoords(self, coordinates, mergerCount, initializations=[]):
+        return [(len(coordinates), len(initializations))] * mergerCount
+
+class FrameMergerResolver(MergerResolver):
+    def __init__(self, labelImages):
+        pluginPaths = [os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'hytra', 'plugins')]
+        super(FrameMergerResolver, self).__init__(pluginPaths, useMultiprocessing=False)
+        self.mergerResolverPlugin = FakeMergerResolverPlugin()
+        self.labelImages = labelImages
+
+    def _readLabelImage(self, timeframe):
+        return self.labelImages[timeframe]
+
+def return_example_label_images():
+    labelImages = np.zeros((3, 6, 6), dtype=np.uint32)
+    labelImages[0, 0:2, 0:2] = 1
+    labelImages[0, 4:6, 4:6] = 2
+    labelImages[1, 0:3, 0:3] = 1
+    labelImages[1, 4:6, 4:6] = 2
+    labelImages[2, 0:2, 0:2] = 1
+    labelImages[2, 1:3, 3:5] = 2
+    return labelImages
+
+def test_fitAndRefineNodes():
+    # two objects merge in frame 1 and split up again in frame 2
+    timesteps = ['0', '1', '2']
+    mergers = jg.EventList(np.array([(1, 1, 2)], dtype=jg.mergerDtype))
+    detections = [(t, i) for t in range(3) for i in [1, 2]]
+    links = [((0, 1), (1, 1)), ((0, 2), (1, 1)), ((1, 1), (2, 1)), ((1, 1), (2, 2)), ((0, 2), (1, 2))]
+
+    resolver = FrameMergerResolver(return_example_label_images())
+    mergersPerTimestep = jg.getMergersPerTimestep(mergers, timesteps)
+    detectionsPerTimestep = jg.getDetectionsPerTimestep(detections, timesteps)
+    linksPerTimestep = jg.getLinksPerTimestep(links, timesteps)
+    mergerLinks = jg.getMergerLinks(linksPerTimestep, mergersPerTimestep, timesteps)
+    resolver._createUnresolvedGraph(dict((t, {}) for t in timesteps), mergersPerTimestep, mergerLinks)
+    resolver._prepareResolvedGraph()
+    resolver._fitAndRefineNodes(detectionsPerTimestep, mergersPerTimestep, timesteps)
+
+    fits = dict((n, resolver.unresolvedGraph.node[n]['fits']) for n in resolver.unresolvedGraph)
+    assert(fits == {(0, 1): [(4, 0)], (0, 2): [(4, 0)], (1, 1): [(9, 2), (9, 2)], (2, 1): [(4, 2)], (2, 2): [(4, 2)]})
+
+    # the merger got the new ids 3 and 4, which inherit all its links
+    assert(resolver.unresolvedGraph.node[(1, 1)]['newIds'] == [3, 4])
+    assert((1, 1) not in resolver.resolvedGraph)
+    assert(sorted(resolver.resolvedGraph.edges()) == sorted([((0, 1), (1, 3)), ((0, 2), (1, 3)), ((0, 1), (1, 4)), ((0, 2), (1, 4)),
+                                                             ((1, 3), (2, 1)), ((1, 3), (2, 2)), ((1, 4), (2, 1)), ((1, 4), (2, 2))]))
+
+def test_ilastikFitAndRefineNodesForTimestep():
+    # the same merger as above, but ilastik passes the coordinates of the objects frame by frame
+    h = hg.HypothesesGraph()
+    for t in range(3):
+        for i in [1, 2]:
+            traxel = Traxel()
+            traxel.Timestep = t
+            traxel.Id = i
+            h.addNodeFromTraxel(traxel, value=2 if (t, i) == (1, 1) else 1)
+    for u, v in [((0, 1), (1, 1)), ((0, 2), (1, 1)), ((1, 1), (2, 1)), ((1, 1), (2, 2)), ((0, 2), (1, 2))]:
+        h._graph.add_edge(u, v, value=1, src=h._graph.node[u]['id'], dest=h._graph.node[v]['id'])
+    pluginPaths = [os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'hytra', 'plugins')]
+    resolver = IlastikMergerResolver(h, pluginPaths=pluginPaths)
+    resolver.mergerResolverPlugin = FakeMergerResolverPlugin()
+
+    labelImages = return_example_label_images()
+    for t in range(3):
+        coordinatesForObjectIds = {}
+        for objectId in [1, 2]:
+            # every call gets a new array, the frame is only indexed once
+            resolver.getCoordinatesForObjectId(coordinatesForObjectIds, labelImages[t].copy(), objectId, t)
+            assert(len(resolver._objectIndices) == 1)
+            expected = {}
+            resolver.getCoordinatesForObjectId(expected, labelImages[t], objectId)
+            assert(np.array_equal(coordinatesForObjectIds[objectId], expected[objectId]))
+        resolver.fitAndRefineNodesForTimestep(coordinatesForObjectIds, t)
+        assert(len(resolver._objectIndices) == 0)
+
+    fits = dict((n, resolver.unresolvedGraph.node[n]['fits']) for n in resolver.unresolvedGraph)
+    assert(fits == {(0, 1): [(4, 0)], (0, 2): [(4, 0)], (1, 1): [(9, 2), (9, 2)], (2, 1): [(4, 2)], (2, 2): [(4, 2)]})
+    assert(resolver.unresolvedGraph.node[(1, 1)]['newIds'] == [3, 4])
@@ -0,0 +1,61 @@
+import os
+import shutil
+import tempfile
+import h5py
+import numpy as np
+import hytra.core.probabilitygenerator as pg
+
+def test_packFeatureDict():
+    features = {
+        'RegionCenter': np.array([[0.0, 1.0], [2.5, 3.5], [4.0, 5.0]], dtype=np.float32),
+        'Count': np.array([0, 7, 12], dtype=np.uint32),
+        'Mean': np.arange(6, dtype=np.float64).reshape((3, 2))[:, 1],  # not contiguous
+        'Polygon': [None, [(1, 2)], [(3, 4)]]
+    }
+    layout, buf, others = pg.packFeatureDict(features)
+    assert(buf.dtype == np.uint8)
+    assert(others.keys() == ['Polygon'])
+
+    unpacked = pg.unpackFeatureDict((layout, buf, others))
+    assert(set(unpacked.keys()) == set(features.keys()))
+    for k in ['RegionCenter', 'Count', 'Mean']:
+        assert(unpacked[k].dtype == features[k].dtype)
+        assert(np.array_equal(unpacked[k], features[k]))
+    assert(unpacked['Polygon'] == features['Polygon'])
+
+def test_splitIntoChunksOfContiguousFrames():
+    probabilityGenerator = object.__new__(pg.IlpProbabilityGenerator)
+    probabilityGenerator._useMultiprocessing = False
+    probabilityGenerator.featureExtractionChunkSize = 3
+    chunks = probabilityGenerator._splitIntoChunksOfContiguousFrames([0, 1, 2, 3, 4, 7, 8, 10])
+    assert(chunks == [[0, 1, 2], [3, 4], [7, 8], [10]])
+
+    probabilityGenerator.featureExtractionChunkSize = None
+    chunks = probabilityGenerator._splitIntoChunksOfContiguousFrames(range(8))
+    assert(chunks == [[0, 1], [2, 3], [4, 5], [6, 7]])
+
+def test_workerPluginManagerWithDifferentImageShapes():
+    # the worker plugin manager is reused for all jobs of a process, also for datasets of different shapes
+    labelImagePath = '/TrackingFeatureExtraction/LabelImage/0000/[[%d, 0, 0, 0, 0], [%d, %d, %d, %d, 1]]'
+    tmpDir = tempfile.mkdtemp()
+    try:
+        filenames = []
+        for shape in [(4, 5), (6, 3)]:
+            filename = os.path.join(tmpDir, 'segmentation{}x{}.h5'.format(*shape))
+            with h5py.File(filename, 'w') as h5file:
+                for t in range(2):
+                    labelImage = np.full(shape, t + 1, dtype=np.uint32)
+                    h5file.create_dataset(labelImagePath % (t, t + 1, shape[0], shape[1], 1),
+                                          data=labelImage[np.newaxis, :, :, np.newaxis, np.newaxis])
+            filenames.append((filename, shape))
+
+        pluginManager = pg.getWorkerPluginManager(['hytra/plugins'])
+        for filename, shape in filenames + filenames:
+            for t in range(2):
+                labelImage = pluginManager.getImageProvider().getLabelImageForFrame(filename, labelImagePath, t)
+                assert(labelImage.shape == shape)
+                assert(np.all(labelImage == t + 1))
+        assert(pg.getWorkerPluginManager(['hytra/plugins']) is pluginManager)
+    finally:
+        pg.closeWorkerFiles()
+        shutil.rmtree(tmpDir)
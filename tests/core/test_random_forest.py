@@ -4,3 +4,31 @@ def test_rf():
     rf = RandomForestClassifier('/CountClassification', 'tests/mergerResolvingTestDataset/tracking.ilp')
     assert(len(rf._randomForests) == 1)
     assert(len(rf.selectedFeatures) == 4)
+
+def test_parallelPrediction():
+    import numpy as np
+
+    class DummyForest(object):
+        ''' mimics the prediction interface of a vigra random forest '''
+        def __init__(self, weights):
+            self._weights = np.array(weights, dtype=np.float32)
+        def featureCount(self):
+            return len(self._weights)
+        def labelCount(self):
+            return 2
+        def predictProbabilities(self, features):
+            p = 1.0 / (1.0 + np.exp(-features.dot(self._weights)))
+            return np.column_stack([1.0 - p, p]).astype(np.float32)
+
+    features = np.random.rand(105, 3)
+    sequential = RandomForestClassifier(numWorkers=1)
+    parallel = RandomForestClassifier(numWorkers=4, chunkSize=10)
+    for rf in [sequential, parallel]:
+        rf._randomForests = [DummyForest([0.1, -0.5, 2.0]), DummyForest([1.0, 0.3, -0.2]), DummyForest([-1.0, 0.0, 0.7])]
+
+    expected = np.zeros((105, 2))
+    for forest in sequential._randomForests:
+        expected += forest.predictProbabilities(features.astype('float32'))
+
+    assert(np.array_equal(sequential.predictProbabilities(features), expected))
+    assert(np.array_equal(parallel.predictProbabilities(features), expected))
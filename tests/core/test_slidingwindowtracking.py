@@ -0,0 +1,66 @@
+import numpy as np
+from hytra.core.slidingwindowtracking import computeWindows, SlidingWindowTracker
+
+def greedySolver(model, weights):
+    ''' activates every detection and link whose state 1 is cheaper than state 0 '''
+    active = lambda h: h['features'][1][0] < h['features'][0][0]
+    return {'detectionResults': [{'id': h['id'], 'value': int(active(h))} for h in model['segmentationHypotheses']],
+            'linkingResults': [{'src': h['src'], 'dest': h['dest'], 'value': int(active(h))} for h in model['linkingHypotheses']],
+            'divisionResults': None}
+
+def boundaryShySolver(model, weights):
+    ''' like the greedy solver, but also deactivates all detections in the first and last frame of a window '''
+    result = greedySolver(model, weights)
+    timesteps = dict((uuid, int(t)) for t, idMap in model['traxelToUniqueId'].iteritems() for uuid in idMap.values())
+    first, last = min(timesteps.values()), max(timesteps.values())
+    for d in result['detectionResults']:
+        if timesteps[d['id']] in [first, last]:
+            d['value'] = 0
+    return result
+
+def return_example_model(numTimesteps):
+    # two objects per frame, the first one is always present, the second one only in odd frames
+    cost = lambda active: [[0.0], [-1.0 if active else 1.0]]
+    uuid = lambda t, i: 2 * t + i
+    model = {'segmentationHypotheses': [], 'linkingHypotheses': [], 'exclusions': [], 'settings': {},
+             'traxelToUniqueId': {}}
+    for t in range(numTimesteps):
+        model['traxelToUniqueId'][str(t)] = {'1': uuid(t, 0), '2': uuid(t, 1)}
+        for i in range(2):
+            model['segmentationHypotheses'].append({'id': uuid(t, i), 'features': cost(i == 0 or t % 2 == 1),
+                                                    'appearanceFeatures': [[0.0], [1.0]],
+                                                    'disappearanceFeatures': [[0.0], [1.0]]})
+        if t > 0:
+            model['linkingHypotheses'].append({'src': uuid(t - 1, 0), 'dest': uuid(t, 0), 'features': cost(True)})
+            model['linkingHypotheses'].append({'src': uuid(t - 1, 1), 'dest': uuid(t, 1), 'features': cost(False)})
+    return model
+
+def toSets(result):
+    return (set((d['id'], d['value']) for d in result['detectionResults']),
+            set((l['src'], l['dest'], l['value']) for l in result['linkingResults']))
+
+def test_computeWindows():
+    assert(computeWindows(0, 9, 4, 1) == [(0, 4), (3, 7), (6, 10)])
+    assert(computeWindows(0, 10, 4, 2) == [(0, 4), (2, 6), (4, 8), (6, 10), (8, 11)])
+    assert(computeWindows(5, 6, 10, 3) == [(5, 7)])
+
+def test_slidingWindowTracking():
+    model = return_example_model(20)
+    expected = toSets(greedySolver(model, []))
+    for windowSize, overlap in [(5, 2), (7, 3), (30, 5)]:
+        tracker = SlidingWindowTracker(greedySolver, windowSize, overlap, useMultiprocessing=False, bufferSize=7)
+        result = tracker.track(model, [])
+        assert(len(result['detectionResults']) == 40)
+        assert(len(result['linkingResults']) == 38)
+        assert(toSets(result) == expected)
+
+def test_stitchingAwayFromBoundaries():
+    # the windows are wrong at their boundaries, which must never end up in the stitched result
+    model = return_example_model(20)
+    expected = toSets(greedySolver(model, []))
+    expectedDetections = set((uuid, value if uuid // 2 not in [0, 19] else 0) for uuid, value in expected[0])
+    # with an overlap of two frames the windows never agree, so bridging windows have to be solved
+    for windowSize, overlap in [(8, 4), (5, 2)]:
+        tracker = SlidingWindowTracker(boundaryShySolver, windowSize, overlap, useMultiprocessing=False)
+        result = tracker.track(model, [])
+        assert(toSets(result) == (expectedDetections, expected[1]))
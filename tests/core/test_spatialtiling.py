@@ -0,0 +1,73 @@
+import numpy as np
+from hytra.core.fieldofview import FieldOfView
+from hytra.core.traxelstore import TraxelStore
+from hytra.core.traxelindex import TraxelIndex
+from hytra.core.probabilitygenerator import ProbabilityGenerator
+from hytra.core.ilastikhypothesesgraph import IlastikHypothesesGraph
+from hytra.core.spatialtiling import SpatialTiling, SpatialTilingTracker, TileSolution, mergeTileSolutions
+
+def greedySolver(model, weights):
+    ''' activates every detection whose state 1 is cheaper than state 0, and such links between active detections '''
+    active = lambda h: h['features'][1][0] < h['features'][0][0]
+    activeIds = set(h['id'] for h in model['segmentationHypotheses'] if active(h))
+    activeLink = lambda h: active(h) and h['src'] in activeIds and h['dest'] in activeIds
+    return {'detectionResults': [{'id': h['id'], 'value': int(h['id'] in activeIds)} for h in model['segmentationHypotheses']],
+            'linkingResults': [{'src': h['src'], 'dest': h['dest'], 'value': int(activeLink(h))} for h in model['linkingHypotheses']],
+            'divisionResults': None}
+
+def return_example_store(numTimesteps):
+    # a grid of 5x5 objects that move to the right, where every seventh object is a false detection
+    store = TraxelStore()
+    for t in range(numTimesteps):
+        centers = np.array([[0.0, 0.0]] + [[5.0 + 20 * x + t, 5.0 + 20 * y] for x in range(5) for y in range(5)])
+        detProb = np.array([[0.9, 0.1] if i % 7 == 0 else [0.1, 0.9] for i in range(len(centers))])
+        store.addFrame(t, {'RegionCenter': centers}, range(1, len(centers)))
+        store.addFeatureMatrix(t, 'detProb', detProb)
+    return store
+
+def activeTraxels(traxelToUniqueId, result):
+    uuidToTraxels = TraxelIndex.fromTraxelToUniqueIdMap(traxelToUniqueId).toUuidToTraxelMap()
+    detections = set(tuple(uuidToTraxels[d['id']][0]) for d in result['detectionResults'] if d['value'] > 0)
+    links = set((tuple(uuidToTraxels[l['src']][-1]), tuple(uuidToTraxels[l['dest']][0]))
+                for l in result['linkingResults'] if l['value'] > 0)
+    return detections, links
+
+def test_spatialTiling():
+    tiling = SpatialTiling(FieldOfView(0, 0, 0, 0, 4, 100, 50, 0), 30, 5)
+    assert(tiling.shape == (4, 2, 1))
+    assert(len(tiling) == 8)
+    # objects on the border between tiles and outside of the field of view are owned by exactly one tile
+    assert(tiling.ownerOf([[29.9, 0, 0], [30, 0, 0], [100, 50, 0], [-5, 60, 0]]).tolist() == [0, 2, 7, 1])
+    assert(tiling.insideHalo(0, [[34, 10, 0], [36, 10, 0], [-5, 10, 0]]).tolist() == [True, False, True])
+    lower, upper = tiling.haloBounds(3)
+    assert(lower.tolist() == [25, 25, 0] and upper.tolist() == [65, 50, 0])
+
+def test_spatialTilingTracker():
+    store = return_example_store(5)
+    fov = FieldOfView(0, 0, 0, 0, 4, 100, 100, 0)
+    graphParameters = {'maxNumObjects': 1, 'numNearestNeighbors': 1, 'maxNeighborDistance': 10, 'withDivisions': False}
+
+    # reference solution of the whole field of view
+    probabilityGenerator = ProbabilityGenerator()
+    probabilityGenerator.TraxelsPerFrame = store
+    hypothesesGraph = IlastikHypothesesGraph(probabilityGenerator, [0, 4], fieldOfView=fov, **graphParameters)
+    hypothesesGraph.insertEnergies()
+    trackingGraph = hypothesesGraph.toTrackingGraph()
+    expected = activeTraxels(trackingGraph.model['traxelToUniqueId'], greedySolver(trackingGraph.model, []))
+
+    for withTracklets in [False, True]:
+        tracker = SpatialTilingTracker(greedySolver, 30, 12, graphParameters, withTracklets=withTracklets,
+                                       useMultiprocessing=False)
+        model, result = tracker.track(store, fov, [0, 4], [])
+        assert(len(result['detectionResults']) == store.countTraxels())
+        assert(activeTraxels(model['traxelToUniqueId'], result) == expected)
+
+def test_mergeTileSolutions():
+    # the first tile activates traxel (0, 1) and its link to (1, 1), which is owned by the second tile that disagrees
+    first = TileSolution([0], [1], [1], [-1], [], [], [], [])
+    second = TileSolution([1, 1], [1, 2], [0, 1], [-1, -1], [0, 0], [1, 1], [1, 2], [1, 1])
+    traxelIndex, result = mergeTileSolutions([first, second])
+    assert(traxelIndex.uuidOf([0, 1, 1], [1, 1, 2]).tolist() == [0, 1, 2])
+    assert([d['value'] for d in result['detectionResults']] == [1, 0, 1])
+    assert(sorted((l['src'], l['dest'], l['value']) for l in result['linkingResults']) == [(0, 1, 0), (0, 2, 1)])
+    assert(result['divisionResults'] == [])
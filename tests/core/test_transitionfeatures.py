@@ -0,0 +1,34 @@
+import numpy as np
+from hytra.pluginsystem.plugin_manager import TrackingPluginManager
+
+def return_example_object_features(numObjects):
+    features = []
+    for i in range(numObjects):
+        features.append({
+            'RegionCenter': np.array([i * 1.5, 2.0 - i, 0.5 * i], dtype=np.float32),
+            'Count': np.array([10.0 + i], dtype=np.float32),
+            'Mean': np.float64(0.3 * i),
+            'Variance': np.array([1.0 + i, 2.0, 3.0 * i], dtype=np.float32)
+        })
+    return features
+
+def test_transitionFeatureMatrix():
+    pluginManager = TrackingPluginManager(pluginPaths=['hytra/plugins'], verbose=False)
+    selectedFeatures = ['RegionCenter', 'Count', 'Mean', 'Variance']
+    objectsA = return_example_object_features(4)
+    objectsB = return_example_object_features(4)[::-1]
+
+    featureMatrix = pluginManager.applyTransitionFeatureMatrixConstructionPlugins(
+        pluginManager.stackFeatureDicts(objectsA, selectedFeatures),
+        pluginManager.stackFeatureDicts(objectsB, selectedFeatures),
+        selectedFeatures)
+
+    # each row must be the same as the feature vector constructed for a single transition
+    assert(featureMatrix.shape[0] == 4)
+    for i in range(4):
+        featureVector = pluginManager.applyTransitionFeatureVectorConstructionPlugins(objectsA[i], objectsB[i], selectedFeatures)
+        assert(featureMatrix.shape[1] == len(featureVector))
+        assert(np.allclose(featureMatrix[i], featureVector))
+
+    emptyMatrix = pluginManager.applyTransitionFeatureMatrixConstructionPlugins({}, {}, selectedFeatures)
+    assert(emptyMatrix.shape[0] == 0)
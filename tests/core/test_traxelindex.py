@@ -0,0 +1,49 @@
+import numpy as np
+from hytra.core.traxelindex import TraxelIndex
+
+def return_example_mapping():
+    # uuid 0 is a tracklet spanning timesteps 0 to 2, uuid 3 one spanning timesteps 1 and 2
+    return {'0': {'1': 0, '2': 1},
+            '1': {'1': 0, '5': 2, '7': 3},
+            '2': {'1': 0, '3': 3}}
+
+def test_uuidOf():
+    index = TraxelIndex.fromTraxelToUniqueIdMap(return_example_mapping())
+    assert(len(index) == 7)
+    assert(index.uuidOf([0, 1, 2, 2], [2, 5, 1, 3]).tolist() == [1, 2, 0, 3])
+    assert(index.uuidOf(1, [1, 7]).tolist() == [0, 3])
+    assert(index.containsTraxels([0, 0, 3], [1, 3, 1]).tolist() == [True, False, False])
+    assert(index.uuidOf([0, 0], [1, 3], default=-1).tolist() == [0, -1])
+
+    try:
+        index.uuidOf([0], [3])
+        assert(False)
+    except KeyError:
+        pass
+
+def test_traxelsOf():
+    index = TraxelIndex.fromTraxelToUniqueIdMap(return_example_mapping())
+    timesteps, traxelIds, counts = index.traxelsOf([3, 0, 2])
+    assert(timesteps.tolist() == [1, 2, 0, 1, 2, 1])
+    assert(traxelIds.tolist() == [7, 3, 1, 1, 1, 5])
+    assert(counts.tolist() == [2, 3, 1])
+
+    assert([x.tolist() for x in index.firstTraxelOf([0, 3])] == [[0, 1], [1, 7]])
+    assert([x.tolist() for x in index.lastTraxelOf([0, 3])] == [[2, 2], [1, 3]])
+    assert([x.tolist() for x in index.internalLinks()] == [[0, 1, 1], [1, 1, 7], [1, 2, 2], [1, 1, 3]])
+
+    try:
+        index.traxelsOf([4])
+        assert(False)
+    except KeyError:
+        pass
+
+def test_legacyMappings():
+    index = TraxelIndex.fromTraxelToUniqueIdMap(return_example_mapping())
+    assert(index.toTraxelToUniqueIdMap() == return_example_mapping())
+    assert(index.toUuidToTraxelMap() == {0: [(0, 1), (1, 1), (2, 1)], 1: [(0, 2)], 2: [(1, 5)], 3: [(1, 7), (2, 3)]})
+
+    empty = TraxelIndex([], [], [])
+    assert(len(empty) == 0)
+    assert(empty.uuidOf(np.array([0]), np.array([1]), default=-1).tolist() == [-1])
+    assert(empty.toTraxelToUniqueIdMap() == {})
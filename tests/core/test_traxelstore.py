@@ -0,0 +1,131 @@
+import numpy as np
+import hytra.core.hypothesesgraph as hg
+from hytra.core.traxelstore import TraxelStore
+
+def return_example_features(numObjects, offset=0.0):
+    features = {
+        'Count': np.arange(numObjects, dtype=np.float32) * 10,
+        'RegionCenter': np.array([[i + offset, 2.0 * i, 0.0] for i in range(numObjects)], dtype=np.float32),
+        'Mean': np.ones((numObjects, 1), dtype=np.float32)
+    }
+    return features
+
+def test_traxelViews():
+    store = TraxelStore()
+    features = return_example_features(4)
+    store.addFrame(0, features, [1, 3])
+    store.addFeatureMatrix(0, 'detProb', np.array([[0.5, 0.5], [0.2, 0.8], [0.3, 0.7], [0.9, 0.1]]))
+
+    assert(len(store) == 1)
+    assert(len(store[0]) == 2)
+    assert(store[0].keys() == [1, 3])
+    assert(2 not in store[0])
+
+    traxel = store[0][3]
+    assert(traxel.Id == 3)
+    assert(traxel.Timestep == 0)
+    assert(traxel.X() == 3.0)
+    assert(traxel.Y() == 6.0)
+    assert(traxel.Z() == 0.0)
+    assert('com' in traxel.Features)
+    assert(traxel.Features['Count'].dtype == np.float64)
+    assert(list(traxel.Features['detProb']) == [0.9, 0.1])
+    assert(traxel.get_feature_value('detProb', 1) == 0.1)
+    assert(traxel.conflictingTraxelIds is None)
+
+    # views do not hold any state, everything is stored in the columns or side tables of the store
+    traxel.conflictingTraxelIds = []
+    store[0][3].conflictingTraxelIds.extend([1])
+    assert(store[0][3].conflictingTraxelIds == [1])
+
+    store[0][1].Features['JaccardScores'] = [(5, 0.7)]
+    assert('JaccardScores' in store[0][1].Features)
+    assert('JaccardScores' not in store[0][3].Features)
+
+    store[0][1].Features['detProb'] = [0.4, 0.6]
+    assert(list(store.getFeatureMatrix(0, 'detProb')[0]) == [0.4, 0.6])
+
+def test_buildGraphFromTraxelStore():
+    class DummyProbabilityGenerator(object):
+        pass
+
+    store = TraxelStore()
+    for frame in range(3):
+        store.addFrame(frame, return_example_features(3, offset=frame * 0.1), [1, 2])
+        store.addFeatureMatrix(frame, 'divProb', np.zeros((3, 2)))
+    probabilityGenerator = DummyProbabilityGenerator()
+    probabilityGenerator.TraxelsPerFrame = store
+
+    h = hg.HypothesesGraph()
+    h.buildFromProbabilityGenerator(probabilityGenerator, numNearestNeighbors=1)
+    assert(h.countNodes() == 6)
+    assert(h.countArcs() == 4)
+    assert(h.hasEdge((0, 1), (1, 1)))
+    assert(h.hasEdge((1, 2), (2, 2)))
+    assert(h._graph.node[(2, 2)]['traxel'].X() == np.float32(2.2))
+
+def test_ilastikEnergiesFromTraxelStore():
+    from hytra.core.ilastikhypothesesgraph import IlastikHypothesesGraph
+    from hytra.core.fieldofview import FieldOfView
+
+    class DummyProbabilityGenerator(object):
+        pass
+
+    store = TraxelStore()
+    for frame in range(4):
+        store.addFrame(frame, return_example_features(3, offset=frame * 0.5), [1, 2])
+        store.addFeatureMatrix(frame, 'detProb', np.array([[0.5, 0.5, 0.0], [0.3, 0.6, 0.1], [0.1, 0.2, 0.7]]))
+        if frame < 3:
+            store.addFeatureMatrix(frame, 'divProb', np.array([[0.0], [0.05], [0.6]]))
+    probabilityGenerator = DummyProbabilityGenerator()
+    probabilityGenerator.TraxelsPerFrame = store
+
+    fov = FieldOfView(0, 0, 0, 0, 4, 5, 5, 0)
+    h = IlastikHypothesesGraph(probabilityGenerator, [0, 4], 2, 2, fov, divisionThreshold=0.5, borderAwareWidth=2.0)
+    reference = IlastikHypothesesGraph(probabilityGenerator, [0, 4], 2, 2, fov, divisionThreshold=0.5, borderAwareWidth=2.0)
+    h.insertEnergies()
+
+    def divisionProbabilityFunc(traxel):
+        if 'divProb' not in traxel.Features:
+            return None
+        divisionFeatures = reference.getDivisionFeatures(traxel)
+        if divisionFeatures[0] > reference.divisionThreshold:
+            return list(reversed(divisionFeatures))
+        return None
+
+    hg.HypothesesGraph.insertEnergies(
+        reference,
+        2,
+        lambda t: reference.getDetectionFeatures(t, 3),
+        lambda a, b: reference.getTransitionFeaturesDist(a, b, reference.transitionParameter, 3),
+        lambda t: reference.getBoundaryCostMultiplier(t, fov, 2.0, 0, 4),
+        divisionProbabilityFunc)
+
+    numDivisions = 0
+    for n in h.nodeIterator():
+        for key in ['features', 'appearanceFeatures', 'disappearanceFeatures', 'divisionFeatures']:
+            assert((key in h._graph.node[n]) == (key in reference._graph.node[n]))
+            if key in h._graph.node[n]:
+                assert(np.allclose(h._graph.node[n][key], reference._graph.node[n][key]))
+        numDivisions += 'divisionFeatures' in h._graph.node[n]
+    assert(numDivisions == 3)
+    for a in h.arcIterator():
+        assert(np.allclose(h._graph.edge[a[0]][a[1]]['features'], reference._graph.edge[a[0]][a[1]]['features']))
+
+def test_extractTraxels():
+    store = TraxelStore()
+    for frame in range(2):
+        store.addFrame(frame, return_example_features(4, offset=frame * 0.5), [1, 2, 3])
+    store[0][3].conflictingTraxelIds = [1, 2]
+    store[1][2].Features['JaccardScores'] = [(5, 0.7)]
+
+    extracted, originalIds = store.extractTraxels({0: [3, 1], 1: [2]})
+    assert(len(extracted) == 2)
+    assert(originalIds[0].tolist() == [0, 1, 3] and originalIds[1].tolist() == [0, 2])
+    assert(extracted[0].keys() == [1, 2] and extracted[1].keys() == [1])
+    assert(extracted[0][2].X() == 3.0)
+    assert(extracted[1][1].X() == np.float32(2.5))
+    assert(extracted.getFeatureMatrix(0, 'Count').ravel().tolist() == [10.0, 30.0])
+    # conflicts with traxels that were not extracted are dropped
+    assert(extracted[0][2].conflictingTraxelIds == [1])
+    assert(extracted[1][1].Features['JaccardScores'] == [(5, 0.7)])
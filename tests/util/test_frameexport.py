@@ -0,0 +1,26 @@
+import numpy as np
+from hytra.util.frameexport import createLookupTable, relabel, mapFrames
+
+def test_createLookupTable():
+    lut = createLookupTable({2: 7, 3: 1, 9: 4}, 4, default=5)
+    assert(lut.tolist() == [0, 5, 7, 1, 5])
+
+def test_relabel():
+    labelImage = np.array([[0, 1, 1], [2, 0, 3]], dtype=np.uint16)
+    assert(relabel(labelImage, {1: 4, 3: 2}).tolist() == [[0, 4, 4], [0, 0, 2]])
+    assert(relabel(labelImage, {1: 4, 3: 2}, default=1).tolist() == [[0, 4, 4], [1, 0, 2]])
+    assert(relabel(labelImage, {}, dtype=np.uint32).dtype == np.uint32)
+
+    # huge labels are relabeled without building a lookup table for all of them
+    labelImage = labelImage.astype(np.uint32)
+    labelImage[1, 2] = 1 << 30
+    assert(relabel(labelImage, {1: 4, 1 << 30: 2}).tolist() == [[0, 4, 4], [0, 0, 2]])
+
+def _square(x):
+    return x * x
+
+def test_mapFrames():
+    for useMultiprocessing in [False, True]:
+        results = mapFrames(_square, ((i,) for i in range(10)), useMultiprocessing=useMultiprocessing,
+                            maxWorkers=2, maxPendingFrames=3)
+        assert(list(results) == [i * i for i in range(10)])
@@ -0,0 +1,30 @@
+import numpy as np
+from hytra.util.objectindex import LabelImageObjectIndex
+
+def test_coordinates():
+    labelImage = np.zeros((4, 5, 6), dtype=np.uint32)
+    labelImage[0:2, 1:3, 2:5] = 1
+    labelImage[3, 4, 0] = 3
+    labelImage[1, 0, 5] = 1
+    objectIndex = LabelImageObjectIndex(labelImage)
+    assert(objectIndex.maxLabel == 3)
+    assert(objectIndex.boundingBox(2) is None)
+    for label in [1, 2, 3, 7]:
+        assert(np.all(objectIndex.coordinates(label) == np.transpose(np.vstack(np.where(labelImage == label)))))
+        assert(objectIndex.coordinates(label).shape[1] == 3)
+
+def test_relabel():
+    labelImage = np.zeros((5, 5), dtype=np.uint32)
+    labelImage[1:4, 1:4] = 2
+    labelImage[0, 0] = 1
+    objectIndex = LabelImageObjectIndex(labelImage)
+
+    # split the object into its top row and the rest
+    newLabels = np.where(objectIndex.coordinates(2)[:, 0] == 1, 3, 4)
+    objectIndex.relabel(2, newLabels)
+    assert(not np.any(labelImage == 2))
+    assert(np.all(labelImage[1, 1:4] == 3))
+    assert(np.all(labelImage[2:4, 1:4] == 4))
+    assert(labelImage[0, 0] == 1)
+    assert(len(objectIndex.coordinates(2)) == 0)
+    assert(np.all(objectIndex.coordinates(4) == np.transpose(np.vstack(np.where(labelImage == 4)))))